@@ -45,6 +45,40 @@ class Settings(BaseSettings):
     # Timezone
     timezone: str = "America/Bogota"  # UTC-5 (Colombia)
     
+    # Renderizado de gráficas de informes (procesos en paralelo)
+    # 0 = automático (hasta 4 según CPUs), 1 = sin pool (en línea)
+    chart_render_workers: int = 0
+    # Caché de PNG por hash de la especificación (disco LRU + Redis si está disponible)
+    chart_cache_enabled: bool = True
+    chart_cache_dir: str = ""  # vacío = <tmp>/softone_chart_cache
+    chart_cache_max_entries: int = 500
+    # Membretes PDF preparados en memoria por proceso (app/services/plantillas_pdf.py)
+    plantillas_pdf_cache_max: int = 20
+    
+    # Nivel local (en memoria del proceso) delante de Redis en cache_manager
+    cache_local_enabled: bool = True
+    cache_local_max_entries: int = 1000
+    cache_local_ttl_segundos: int = 30  # Con Redis caído se usa el TTL completo
+    
+    # Cola de informes (app/services/informe_queue.py)
+    informes_worker_embebido: bool = False  # True solo si no corre el proceso worker dedicado (Procfile)
+    informes_worker_concurrencia: int = 2  # Informes simultáneos por proceso
+    informes_lease_segundos: int = 300  # Sin heartbeat en este tiempo → se reintenta
+    informes_poll_segundos: int = 5
+    informes_stop_segundos: int = 20  # Espera total al detener; menor que --graceful-timeout de gunicorn
+    
+    # Bandeja de salida de correos (app/services/email_outbox.py)
+    email_outbox_worker_embebido: bool = True  # False si corre el proceso worker dedicado
+    email_outbox_lote: int = 20  # Correos reclamados por ciclo
+    email_outbox_concurrencia: int = 5  # Envíos simultáneos a Zeptomail
+    email_outbox_poll_segundos: int = 10
+    email_outbox_lease_segundos: int = 120  # Sin resultado en este tiempo → se reintenta
+    
+    # Gateway de IA (app/services/ai_gateway.py)
+    ai_backend: str = "openai"  # openai, bedrock o stub (respuestas deterministas sin red)
+    ai_max_concurrencia: int = 4  # Llamadas simultáneas por backend y proceso
+    ai_timeout_segundos: int = 90
+    
     @property
     def cors_origins(self) -> List[str]:
         """Convierte la cadena de orígenes permitidos en una lista"""
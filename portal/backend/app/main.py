@@ -291,4 +291,65 @@ async def health_check_api():
     """Alias de /health bajo prefijo /api para compatibilidad con ALB y frontend"""
     return await health_check()
 
-# Seed en startup eliminado; usar endpoint /api/auth/init-superadmin si se necesita
\ No newline at end of file
+# Seed en startup eliminado; usar endpoint /api/auth/init-superadmin si se necesita
+@app.on_event("startup")
+def iniciar_worker_informes():
+    """Worker embebido de la cola de informes (desactivar si corre el proceso dedicado)"""
+    if settings.informes_worker_embebido:
+        from app.services.informe_queue import iniciar_worker
+        iniciar_worker()
+
+@app.on_event("shutdown")
+def cerrar_pool_graficas():
+    """Cierra los procesos de renderizado de gráficas de informes"""
+    from app.services.chart_renderer import shutdown_chart_pool
+    shutdown_chart_pool()
+
+@app.on_event("shutdown")
+def detener_worker_informes():
+    """Deja de reclamar informes; los que queden en curso se retoman al vencer su lease"""
+    from app.services.informe_queue import detener_worker
+    detener_worker()
+
+@app.on_event("startup")
+def iniciar_clientes_http():
+    """Pools de conexiones HTTP por upstream (datos.gov.co, Zeptomail)"""
+    from app.utils.http_clients import iniciar_clientes_http as iniciar
+    iniciar()
+
+@app.on_event("shutdown")
+async def cerrar_clientes_http():
+    """Cierra los pools de conexiones HTTP"""
+    from app.utils.http_clients import cerrar_clientes_http as cerrar
+    await cerrar()
+
+@app.on_event("startup")
+async def iniciar_invalidacion_cache():
+    """Suscripción a invalidaciones del caché local publicadas por otros workers"""
+    from app.utils.cache_manager import async_cache_manager
+    async_cache_manager.iniciar_invalidacion()
+
+@app.on_event("shutdown")
+async def cerrar_cache_async():
+    """Cierra el pool de conexiones async a Redis"""
+    from app.utils.cache_manager import async_cache_manager
+    await async_cache_manager.close()
+
+@app.on_event("startup")
+async def iniciar_worker_correos():
+    """Worker embebido de la bandeja de salida de correos"""
+    if settings.email_outbox_worker_embebido:
+        from app.services.email_outbox import iniciar_worker
+        iniciar_worker()
+
+@app.on_event("shutdown")
+async def detener_worker_correos():
+    """Los correos en envío se retoman al vencer su lease"""
+    from app.services.email_outbox import detener_worker
+    await detener_worker()
+
+@app.on_event("shutdown")
+def cerrar_gateway_ia():
+    """Cierra el cliente de IA y el event loop del gateway"""
+    from app.services.ai_gateway import ai_gateway
+    ai_gateway.cerrar()
@@ -18,7 +18,8 @@ from app.models.plan import (
 from app.models.pdm import (
     PdmProducto,
     PdmActividad,
-    PdmActividadEvidencia
+    PdmActividadEvidencia,
+    PdmProductoAvance
 )
 from app.models.funcionario import (
     Funcionario,
@@ -26,6 +27,8 @@ from app.models.funcionario import (
     RegistroAsistencia
 )
 from app.models.informe import InformeEstado
+from app.models.email_outbox import EmailOutbox
+from app.models.radicado_secuencia import RadicadoSecuencia
 from app.models.vias import ViaViaje, ViaTramo
 
 __all__ = [
@@ -47,10 +50,13 @@ __all__ = [
     "PdmProducto",
     "PdmActividad",
     "PdmActividadEvidencia",
+    "PdmProductoAvance",
     "Funcionario",
     "EquipoRegistro",
     "RegistroAsistencia",
     "InformeEstado",
+    "EmailOutbox",
+    "RadicadoSecuencia",
     "ViaViaje",
     "ViaTramo",
 ]
\ No newline at end of file
@@ -1,20 +1,42 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from app.config.database import Base
 
 
 class Alert(Base):
     __tablename__ = "alerts"
+    __table_args__ = (
+        # Campana: alertas propias sin leer / recientes
+        Index('ix_alerts_recipient_read_created', 'recipient_user_id', 'read_at', 'created_at'),
+        # Alertas de entidad (recipient_user_id NULL) recientes
+        Index('ix_alerts_entity_recipient_created', 'entity_id', 'recipient_user_id', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     entity_id = Column(Integer, ForeignKey("entities.id", ondelete="CASCADE"), nullable=True, index=True)
+    # NULL = alerta para toda la entidad (una sola fila; la lectura se registra en AlertRead)
     recipient_user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    # Solo en alertas de entidad: limita la audiencia a un rol ('admin', 'secretario'...)
+    recipient_role = Column(String(32), nullable=True)
     type = Column(String(64), nullable=False)  # NEW_PQRS, PQRS_ASSIGNED, etc.
     title = Column(String(256), nullable=False)
     message = Column(String(1024), nullable=True)
     data = Column(Text, nullable=True)  # JSON serializado opcional
     created_at = Column(DateTime, default=datetime.utcnow)
-    read_at = Column(DateTime, nullable=True)
+    read_at = Column(DateTime, nullable=True)  # Alertas con destinatario
 
     recipient = relationship("User", foreign_keys=[recipient_user_id])
+
+
+class AlertRead(Base):
+    """Confirmación de lectura por usuario de una alerta de entidad"""
+    __tablename__ = "alert_reads"
+    __table_args__ = (
+        UniqueConstraint('alert_id', 'user_id', name='uq_alert_read_alert_user'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    alert_id = Column(Integer, ForeignKey("alerts.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    read_at = Column(DateTime, nullable=False, default=datetime.utcnow)
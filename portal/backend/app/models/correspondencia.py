@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text, Date
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text, Date, Index
 from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -76,6 +76,13 @@ class Correspondencia(Base):
     Gestiona la correspondencia entrante y saliente de la entidad
     """
     __tablename__ = "correspondencia"
+    __table_args__ = (
+        # Listado de la entidad (más recientes primero)
+        Index('ix_correspondencia_entity_created', 'entity_id', 'created_at'),
+        # Secretarios: creadas O asignadas por ellos
+        Index('ix_correspondencia_created_by', 'created_by_id'),
+        Index('ix_correspondencia_assigned_to', 'assigned_to_id'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     
@@ -0,0 +1,43 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, JSON
+from app.config.database import Base
+
+
+class EmailOutbox(Base):
+    """
+    Bandeja de salida de correos (patrón outbox).
+    El correo se escribe en la misma transacción que el cambio que lo origina
+    y un worker async lo entrega (ver app/services/email_outbox.py).
+    """
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    entity_id = Column(Integer, ForeignKey("entities.id", ondelete="CASCADE"), nullable=True, index=True)
+    pqrs_id = Column(Integer, ForeignKey("pqrs.id", ondelete="SET NULL"), nullable=True, index=True)
+
+    # Tipo: 'pqrs_radicada', 'pqrs_respuesta'
+    tipo = Column(String(50), nullable=False)
+
+    # Mensaje ya renderizado
+    to_emails = Column(JSON, nullable=False)  # Lista de destinatarios
+    subject = Column(String(500), nullable=False)
+    html_body = Column(Text, nullable=False)
+    text_body = Column(Text, nullable=True)
+    from_name = Column(String(255), nullable=True)
+    reply_to = Column(String(255), nullable=True)
+
+    # Entrega
+    estado = Column(String(20), nullable=False, default='pending', index=True)  # pending, sending, sent, failed
+    intentos = Column(Integer, nullable=False, default=0)
+    max_intentos = Column(Integer, nullable=False, default=5)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    lease_token = Column(String(32), nullable=True, index=True)  # Lote del worker que lo reclamó
+    lease_expires_at = Column(DateTime, nullable=True)  # Mientras está en 'sending'
+    last_error = Column(String(500), nullable=True)
+    message_id = Column(String(255), nullable=True)  # Id del proveedor
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<EmailOutbox(id={self.id}, tipo={self.tipo}, estado={self.estado})>"
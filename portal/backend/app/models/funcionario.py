@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.config.database import Base
@@ -10,6 +10,10 @@ class Funcionario(Base):
     Cada funcionario pertenece a una entidad.
     """
     __tablename__ = "funcionarios"
+    __table_args__ = (
+        # Listados y estadísticas de asistencia filtran por entidad del funcionario
+        Index('ix_funcionarios_entity_id', 'entity_id'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     cedula = Column(String(20), unique=True, index=True, nullable=False)
@@ -64,6 +68,10 @@ class RegistroAsistencia(Base):
     Cada funcionario puede tener máximo 2 registros por día: entrada y salida.
     """
     __tablename__ = "registros_asistencia"
+    __table_args__ = (
+        # Registros del día de un funcionario y su historial
+        Index('ix_registros_asistencia_funcionario_fecha', 'funcionario_id', 'fecha_hora'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     
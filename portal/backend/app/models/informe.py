@@ -43,6 +43,20 @@ class InformeEstado(Base):
     # Errores
     error_message = Column(Text, nullable=True)
     
+    # Cola de trabajos (ver app/services/informe_queue.py)
+    params = Column(JSON, nullable=True)  # Parámetros del handler (slug, etc.)
+    prioridad = Column(Integer, nullable=False, default=50, index=True)  # Menor = se atiende antes
+    intentos = Column(Integer, nullable=False, default=0)
+    max_intentos = Column(Integer, nullable=False, default=3)
+    worker_id = Column(String(100), nullable=True)  # Worker que tiene el lease
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    
+    # Deduplicación: hash de la solicitud + versión de los datos de la entidad
+    fingerprint = Column(String(64), nullable=True, index=True)
+    # Solicitud idéntica en curso a la que se adjuntó este registro (no se encola)
+    duplicado_de = Column(Integer, ForeignKey("informes_estado.id", ondelete="SET NULL"), nullable=True, index=True)
+    
     # Metadata
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     started_at = Column(DateTime, nullable=True)
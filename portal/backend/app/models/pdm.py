@@ -161,6 +161,37 @@ class PdmActividadEvidencia(Base):
     actividad = relationship("PdmActividad", back_populates="evidencia")
 
 
+class PdmProductoAvance(Base):
+    """Resumen materializado de avance por producto y año.
+
+    Se mantiene al día desde las escrituras de actividades/evidencias
+    (ver app.services.pdm_avance_service) para que dashboards e informes lean
+    una fila por producto/año en lugar de re-agregar todas las actividades.
+    La meta programada NO se guarda aquí: se toma de PdmProducto.programacion_X
+    al leer, porque cambia con cada carga del Excel.
+    """
+    __tablename__ = "pdm_producto_avance"
+    __table_args__ = (
+        UniqueConstraint('entity_id', 'codigo_producto', 'anio', name='uq_pdm_producto_avance_entity_codigo_anio'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    entity_id = Column(Integer, ForeignKey("entities.id", ondelete="CASCADE"), nullable=False, index=True)
+    codigo_producto = Column(Text, nullable=False)
+    anio = Column(Integer, nullable=False)
+
+    total_actividades = Column(Integer, nullable=False, default=0)
+    actividades_completadas = Column(Integer, nullable=False, default=0)
+    actividades_con_evidencia = Column(Integer, nullable=False, default=0)
+
+    # Suma de meta_ejecutar de actividades COMPLETADAS (regla del dashboard)
+    meta_ejecutada = Column(Float, nullable=False, default=0)
+    # Suma de meta_ejecutar de actividades con evidencia (regla de los informes)
+    meta_ejecutada_con_evidencia = Column(Float, nullable=False, default=0)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
 class PdmArchivoExcel(Base):
     """Tabla para almacenar archivos Excel generados para PDM"""
     __tablename__ = "pdm_archivos_excel"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text, Boolean, Index
 from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -102,6 +102,10 @@ class MedioRespuesta(enum.Enum):
 class AsignacionAuditoria(Base):
     """Registro de auditoría para rastrear cambios de asignación de PQRS"""
     __tablename__ = "asignacion_auditoria"
+    __table_args__ = (
+        # Historial de asignaciones de una PQRS (más recientes primero)
+        Index('ix_asignacion_auditoria_pqrs_fecha', 'pqrs_id', 'fecha_asignacion'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     pqrs_id = Column(Integer, ForeignKey("pqrs.id", ondelete="CASCADE"), nullable=False)
@@ -119,6 +123,18 @@ class AsignacionAuditoria(Base):
 
 class PQRS(Base):
     __tablename__ = "pqrs"
+    __table_args__ = (
+        # Bandeja de la entidad ordenada por (created_at, id), también por estado
+        Index('ix_pqrs_entity_created', 'entity_id', 'created_at', 'id'),
+        Index('ix_pqrs_entity_estado_created', 'entity_id', 'estado', 'created_at'),
+        # PQRS asignadas (secretarios)
+        Index('ix_pqrs_assigned_created', 'assigned_to_id', 'created_at'),
+        # PQRS del ciudadano: created_by_id OR email_ciudadano (BitmapOr de ambos)
+        Index('ix_pqrs_created_by_created', 'created_by_id', 'created_at'),
+        Index('ix_pqrs_email_created', 'email_ciudadano', 'created_at'),
+        # Informes y analítica por período
+        Index('ix_pqrs_entity_fecha_solicitud', 'entity_id', 'fecha_solicitud'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     numero_radicado = Column(String, unique=True, index=True, nullable=False)
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, Date, UniqueConstraint
+from app.config.database import Base
+
+
+class RadicadoSecuencia(Base):
+    """
+    Consecutivo diario de radicados por entidad y tipo de documento.
+    generate_radicado() lo incrementa con un UPDATE ... RETURNING dentro de la
+    transacción que crea el documento: el número queda reservado hasta el
+    commit y vuelve a estar libre si la creación se revierte.
+    """
+    __tablename__ = "radicado_secuencias"
+    __table_args__ = (
+        UniqueConstraint('entity_id', 'prefijo', 'fecha', name='uq_radicado_secuencia'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    # 0 para consecutivos globales (CORR no incluye la entidad en el radicado)
+    entity_id = Column(Integer, nullable=False, default=0)
+    prefijo = Column(String(20), nullable=False)  # 'PQRS', 'CORR'
+    fecha = Column(Date, nullable=False)
+    ultimo = Column(Integer, nullable=False, default=0)  # Último consecutivo emitido
+
+    def __repr__(self):
+        return f"<RadicadoSecuencia({self.prefijo} entity={self.entity_id} {self.fecha}: {self.ultimo})>"
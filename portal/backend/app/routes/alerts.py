@@ -1,11 +1,20 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import insert, literal, select
+from sqlalchemy.exc import IntegrityError
 from typing import Optional
 from app.config.database import get_db
-from app.models.alert import Alert
+from app.models.alert import Alert, AlertRead
 from app.models.user import User
 from app.schemas.alert import AlertsListResponse, AlertResponse
+from app.services.alertas import (
+    SIN_LEER,
+    contar_no_leidas,
+    fijar_no_leidas,
+    filtros_visibles,
+    invalidar_no_leidas,
+    recibo_lectura,
+)
 from app.utils.auth import get_current_active_user
 from datetime import datetime
 
@@ -20,23 +29,15 @@ async def list_alerts(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    q = db.query(Alert).filter(
-        (Alert.recipient_user_id == current_user.id) | (Alert.recipient_user_id.is_(None))
+    q = db.query(Alert, AlertRead.read_at).outerjoin(AlertRead, recibo_lectura(current_user)).filter(
+        *filtros_visibles(current_user)
     )
-    if current_user.entity_id is not None:
-        q = q.filter((Alert.entity_id == current_user.entity_id) | (Alert.entity_id.is_(None)))
     if only_unread:
-        q = q.filter(Alert.read_at.is_(None))
+        q = q.filter(SIN_LEER)
     alerts = q.order_by(Alert.created_at.desc()).limit(limit).all()
 
-    # Unread count
-    unread_q = db.query(Alert).filter(
-        (Alert.recipient_user_id == current_user.id) | (Alert.recipient_user_id.is_(None))
-    )
-    if current_user.entity_id is not None:
-        unread_q = unread_q.filter((Alert.entity_id == current_user.entity_id) | (Alert.entity_id.is_(None)))
-    unread_q = unread_q.filter(Alert.read_at.is_(None))
-    unread_count = unread_q.count()
+    # Unread count (contador cacheado por usuario)
+    unread_count = contar_no_leidas(db, current_user)
 
     return AlertsListResponse(
         unread_count=unread_count,
@@ -50,13 +51,22 @@ async def list_alerts(
                 message=a.message,
                 data=a.data,
                 created_at=a.created_at.isoformat() if a.created_at else "",
-                read_at=a.read_at.isoformat() if a.read_at else None,
+                read_at=(a.read_at or leida_at).isoformat() if (a.read_at or leida_at) else None,
             )
-            for a in alerts
+            for a, leida_at in alerts
         ],
     )
 
 
+@router.get("/unread-count")
+async def unread_count(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Solo el contador de la campana: lo que consulta el polling periódico"""
+    return {"unread_count": contar_no_leidas(db, current_user)}
+
+
 @router.post("/{alert_id}/read")
 async def mark_alert_read(
     alert_id: int,
@@ -71,8 +81,21 @@ async def mark_alert_read(
         return {"ok": False, "message": "No autorizado"}
     if a.entity_id and current_user.entity_id and a.entity_id != current_user.entity_id:
         return {"ok": False, "message": "No autorizado"}
-    a.read_at = datetime.utcnow()
-    db.commit()
+    if a.recipient_user_id is None:
+        # Alerta de entidad: la lectura es de este usuario, no de la fila
+        if a.recipient_role and a.recipient_role != current_user.role.value:
+            return {"ok": False, "message": "No autorizado"}
+        try:
+            db.add(AlertRead(alert_id=a.id, user_id=current_user.id))
+            invalidar_no_leidas(db, [current_user.id])
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # Ya estaba marcada
+        return {"ok": True}
+    if a.read_at is None:
+        a.read_at = datetime.utcnow()
+        invalidar_no_leidas(db, [current_user.id])
+        db.commit()
     return {"ok": True}
 
 
@@ -81,14 +104,23 @@ async def mark_all_read(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
+    now = datetime.utcnow()
+    # Alertas propias: un solo UPDATE, sin cargar filas en memoria
     q = db.query(Alert).filter(
-        (Alert.recipient_user_id == current_user.id) | (Alert.recipient_user_id.is_(None))
+        Alert.recipient_user_id == current_user.id,
+        Alert.read_at.is_(None)
     )
     if current_user.entity_id is not None:
         q = q.filter((Alert.entity_id == current_user.entity_id) | (Alert.entity_id.is_(None)))
-    q = q.filter(Alert.read_at.is_(None))
-    now = datetime.utcnow()
-    for a in q.all():
-        a.read_at = now
+    q.update({Alert.read_at: now}, synchronize_session=False)
+
+    # Alertas de entidad: un recibo por cada una aún sin leer (INSERT ... SELECT)
+    db.execute(insert(AlertRead).from_select(
+        ["alert_id", "user_id", "read_at"],
+        select(Alert.id, literal(current_user.id), literal(now))
+        .outerjoin(AlertRead, recibo_lectura(current_user))
+        .where(Alert.recipient_user_id.is_(None), *filtros_visibles(current_user), SIN_LEER)
+    ))
     db.commit()
+    fijar_no_leidas(current_user.id, 0)
     return {"ok": True}
@@ -20,6 +20,7 @@ from app.schemas.funcionario import (
 )
 from app.routes.auth import get_current_active_user
 from app.models.user import User, UserRole
+from app.utils.imagenes import clave_miniatura, generar_miniatura
 
 router = APIRouter(prefix="/asistencia", tags=["Asistencia"])
 
@@ -84,6 +85,19 @@ def upload_foto_s3(foto_base64: str, prefix: str = "asistencia") -> str:
             ContentType='image/jpeg'
         )
         
+        # Miniatura para informes junto al original (no bloquea el registro)
+        miniatura = generar_miniatura(foto_data)
+        if miniatura:
+            try:
+                s3_client.put_object(
+                    Bucket=BUCKET_NAME,
+                    Key=clave_miniatura(file_name),
+                    Body=miniatura,
+                    ContentType='image/jpeg'
+                )
+            except Exception as e:
+                print(f"[WARNING] No se pudo subir miniatura de {file_name}: {str(e)}")
+        
         # Retornar URL pública
         url = f"https://{BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{file_name}"
         print(f"[DEBUG] URL generada: {url}")
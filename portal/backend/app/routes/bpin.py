@@ -4,7 +4,8 @@ from typing import Dict, Any, Optional
 from app.models.user import User
 from app.utils.auth import get_current_active_user
 from app.utils.rate_limiter import limiter, RATE_LIMITS
-from app.utils.cache_manager import cache_manager, CACHE_CONFIGS
+from app.utils.cache_manager import async_cache_manager, CACHE_CONFIGS
+from app.utils.http_clients import request_con_reintentos
 import logging
 
 logger = logging.getLogger(__name__)
@@ -32,32 +33,32 @@ async def get_bpin_details(
         cache_key = f"bpin:{bpin}"
         
         # Intentar obtener del caché
-        cached_data = cache_manager.get(cache_key)
+        cached_data = await async_cache_manager.get(cache_key)
         if cached_data:
             logger.info(f"📦 BPIN (cached) {bpin} - Usuario: {current_user.email}")
             return cached_data
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Query para buscar el BPIN específico
-            query = f'$where=caseless_one_of(`bpin`, "{bpin}")&$limit=1'
-            url = f"{DATOS_GOV_CO_API}?{query}"
-            
-            response = await client.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            if not data or len(data) == 0:
-                logger.warning(f"⚠️ BPIN no encontrado: {bpin} - Usuario: {current_user.email}")
-                return None
-            
-            result = data[0]
-            
-            # Cachear resultado (2 horas)
-            cache_manager.set(cache_key, result, ttl_seconds=7200)
-            
-            logger.info(f"✅ BPIN (fresh) {bpin} - Usuario: {current_user.email}")
-            return result
+        # Query para buscar el BPIN específico
+        query = f'$where=caseless_one_of(`bpin`, "{bpin}")&$limit=1'
+        url = f"{DATOS_GOV_CO_API}?{query}"
+        
+        # Cliente compartido (conexiones reutilizadas, con reintentos)
+        response = await request_con_reintentos("datos_gov", "GET", url)
+        response.raise_for_status()
+        
+        data = response.json()
+        
+        if not data or len(data) == 0:
+            logger.warning(f"⚠️ BPIN no encontrado: {bpin} - Usuario: {current_user.email}")
+            return None
+        
+        result = data[0]
+        
+        # Cachear resultado (2 horas)
+        await async_cache_manager.set(cache_key, result, ttl_seconds=7200)
+        
+        logger.info(f"✅ BPIN (fresh) {bpin} - Usuario: {current_user.email}")
+        return result
             
     except httpx.HTTPError as e:
         logger.error(f"❌ Error en BPIN {bpin} - Usuario: {current_user.email} - {str(e)}")
@@ -3,13 +3,16 @@ from typing import Optional, Dict, Any, List
 from pydantic import BaseModel
 from app.config.settings import settings
 import httpx
+import json
 from urllib.parse import urlencode
 from app.models.user import User
 from app.utils.auth import get_current_active_user
 from app.config.database import get_db
 from sqlalchemy.orm import Session
 from app.utils.rate_limiter import limiter, RATE_LIMITS
-from app.utils.cache_manager import cache_manager, CACHE_CONFIGS
+from app.utils.cache_manager import async_cache_manager, CACHE_CONFIGS
+from app.utils.http_clients import request_con_reintentos
+from app.services.ai_gateway import ai_gateway
 from app.utils.openai_logger import openai_logger, CostAnalyzer
 import logging
 
@@ -53,12 +56,6 @@ async def proxy_datos_gov(
         # Generar clave de caché
         cache_key = f"datos_gov:{query}"
         
-        # Intentar obtener del caché
-        cached_data = cache_manager.get(cache_key)
-        if cached_data:
-            logger.info(f"📦 Datos.gov proxy (cached) - Usuario: {current_user.email}")
-            return cached_data
-        
         params = {}
         if query:
             params["$query"] = query
@@ -68,18 +65,22 @@ async def proxy_datos_gov(
         if params:
             url = f"{url}?{urlencode(params)}"
         
-        # Hacer petición al API externo
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url)
+        async def consultar_api():
+            # Hacer petición al API externo (cliente compartido, con reintentos)
+            response = await request_con_reintentos("datos_gov", "GET", url)
             response.raise_for_status()
-            
-            data = response.json()
-            
-            # Cachear resultado (1 hora)
-            cache_manager.set(cache_key, data, ttl_seconds=3600)
-            
-            logger.info(f"✅ Datos.gov proxy (fresh) - Usuario: {current_user.email}")
-            return data
+            return response.json()
+        
+        # Una sola consulta al API por query; al vencer se sirve el valor anterior mientras se refresca
+        data, origen = await async_cache_manager.obtener_o_calcular(
+            cache_key,
+            consultar_api,
+            ttl_seconds=CACHE_CONFIGS["datos_gov_proxy"]["ttl"],
+            stale_seconds=CACHE_CONFIGS["datos_gov_proxy"]["stale"]
+        )
+        
+        logger.info(f"{'✅' if origen == 'fresh' else '📦'} Datos.gov proxy ({origen}) - Usuario: {current_user.email}")
+        return data
             
     except httpx.HTTPStatusError as e:
         logger.error(f"❌ HTTP Error {e.response.status_code} - Usuario: {current_user.email}")
@@ -127,12 +128,6 @@ async def proxy_datos_gov_secop1(
         # Generar clave de caché
         cache_key = f"datos_gov_secop1:{query}"
         
-        # Intentar obtener del caché
-        cached_data = cache_manager.get(cache_key)
-        if cached_data:
-            logger.info(f"📦 Datos.gov SECOP I proxy (cached) - Usuario: {current_user.email}")
-            return cached_data
-        
         params = {}
         if query:
             params["$query"] = query
@@ -142,18 +137,22 @@ async def proxy_datos_gov_secop1(
         if params:
             url = f"{url}?{urlencode(params)}"
         
-        # Hacer petición al API externo
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url)
+        async def consultar_api():
+            # Hacer petición al API externo (cliente compartido, con reintentos)
+            response = await request_con_reintentos("datos_gov", "GET", url)
             response.raise_for_status()
-            
-            data = response.json()
-            
-            # Cachear resultado (1 hora)
-            cache_manager.set(cache_key, data, ttl_seconds=3600)
-            
-            logger.info(f"✅ Datos.gov SECOP I proxy (fresh) - Usuario: {current_user.email}")
-            return data
+            return response.json()
+        
+        # Una sola consulta al API por query; al vencer se sirve el valor anterior mientras se refresca
+        data, origen = await async_cache_manager.obtener_o_calcular(
+            cache_key,
+            consultar_api,
+            ttl_seconds=CACHE_CONFIGS["datos_gov_proxy"]["ttl"],
+            stale_seconds=CACHE_CONFIGS["datos_gov_proxy"]["stale"]
+        )
+        
+        logger.info(f"{'✅' if origen == 'fresh' else '📦'} Datos.gov SECOP I proxy ({origen}) - Usuario: {current_user.email}")
+        return data
             
     except httpx.HTTPStatusError as e:
         logger.error(f"❌ HTTP Error {e.response.status_code} - Usuario: {current_user.email}")
@@ -201,12 +200,6 @@ async def proxy_datos_gov_secop2_procesos(
         # Generar clave de caché
         cache_key = f"datos_gov_secop2_procesos:{query}"
         
-        # Intentar obtener del caché
-        cached_data = cache_manager.get(cache_key)
-        if cached_data:
-            logger.info(f"📦 Datos.gov SECOP II Procesos proxy (cached) - Usuario: {current_user.email}")
-            return cached_data
-        
         params = {}
         if query:
             params["$query"] = query
@@ -216,18 +209,22 @@ async def proxy_datos_gov_secop2_procesos(
         if params:
             url = f"{url}?{urlencode(params)}"
         
-        # Hacer petición al API externo
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url)
+        async def consultar_api():
+            # Hacer petición al API externo (cliente compartido, con reintentos)
+            response = await request_con_reintentos("datos_gov", "GET", url)
             response.raise_for_status()
-            
-            data = response.json()
-            
-            # Cachear resultado (1 hora)
-            cache_manager.set(cache_key, data, ttl_seconds=3600)
-            
-            logger.info(f"✅ Datos.gov SECOP II Procesos proxy (fresh) - Usuario: {current_user.email}")
-            return data
+            return response.json()
+        
+        # Una sola consulta al API por query; al vencer se sirve el valor anterior mientras se refresca
+        data, origen = await async_cache_manager.obtener_o_calcular(
+            cache_key,
+            consultar_api,
+            ttl_seconds=CACHE_CONFIGS["datos_gov_proxy"]["ttl"],
+            stale_seconds=CACHE_CONFIGS["datos_gov_proxy"]["stale"]
+        )
+        
+        logger.info(f"{'✅' if origen == 'fresh' else '📦'} Datos.gov SECOP II Procesos proxy ({origen}) - Usuario: {current_user.email}")
+        return data
             
     except httpx.HTTPStatusError as e:
         logger.error(f"❌ HTTP Error {e.response.status_code} - Usuario: {current_user.email}")
@@ -332,19 +329,16 @@ async def resumen_con_ia(
         if top_estado:
             base_summary += f" Estado más frecuente: {top_estado[0]} ({top_estado[1]} procesos)."
 
-    # Si no hay API Key, devolver el heurístico
-    if not settings.openai_api_key:
+    # Si no hay API Key, devolver el heurístico (el backend stub no la necesita)
+    if not settings.openai_api_key and settings.ai_backend != "stub":
         logger.info(f"📋 Resumen sin IA - Usuario: {current_user.email}, Entidad: {payload.entity_name}")
         return {
             "configured": False,
             "summary": base_summary + " Nota: Para habilitar el resumen con IA, configure OPENAI_API_KEY en el backend."
         }
 
-    # Llamada a OpenAI (opcional) - manejo defensivo si la librería no está instalada
+    # Llamada a OpenAI vía gateway de IA (no bloquea el event loop)
     try:
-        from openai import OpenAI  # type: ignore
-
-        client = OpenAI(api_key=settings.openai_api_key)
         system = (
             "Eres un analista de compras públicas. Redacta un resumen ejecutivo claro, en español, "
             "con 2-3 párrafos y 3-5 bullet points de hallazgos y recomendaciones. Evita jerga innecesaria."
@@ -353,44 +347,46 @@ async def resumen_con_ia(
         user_prompt = (
             "Genera un informe ejecutivo de contratación pública con los siguientes datos en JSON. "
             "Enfatiza tendencias, riesgos (p. ej. concentración de proveedores, procesos desiertos) y oportunidades.\n\n"
-            f"Datos: {payload.model_dump()}\n\n"
+            f"Datos: {json.dumps(payload.model_dump(), ensure_ascii=False, sort_keys=True)}\n\n"
             f"Resumen base: {base_summary}"
         )
 
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=0.3,
-            max_tokens=500,
-            messages=[
+        resp = await ai_gateway.completar(
+            [
                 {"role": "system", "content": system},
                 {"role": "user", "content": user_prompt}
             ],
+            backend="openai",
+            model="gpt-4o-mini",
+            temperature=0.3,
+            max_tokens=500,
+            cache="contratacion_summary",
         )
         
-        content = resp.choices[0].message.content if resp and resp.choices else base_summary
+        content = resp["texto"] or base_summary
         
-        # 📊 LOGGING DE COSTOS
-        if resp and resp.usage:
+        # 📊 LOGGING DE COSTOS (los aciertos de caché los registra el gateway como ahorro)
+        if resp["total_tokens"] and not resp["cache"]:
             cost_data = CostAnalyzer.calculate_cost(
                 model="gpt-4o-mini",
-                prompt_tokens=resp.usage.prompt_tokens,
-                completion_tokens=resp.usage.completion_tokens
+                prompt_tokens=resp["prompt_tokens"],
+                completion_tokens=resp["completion_tokens"]
             )
             
             openai_logger.log_api_call(
                 user_id=current_user.email,
                 entity_name=payload.entity_name,
                 model="gpt-4o-mini",
-                prompt_tokens=resp.usage.prompt_tokens,
-                completion_tokens=resp.usage.completion_tokens,
-                total_tokens=resp.usage.total_tokens,
+                prompt_tokens=resp["prompt_tokens"],
+                completion_tokens=resp["completion_tokens"],
+                total_tokens=resp["total_tokens"],
                 cost_usd=cost_data["total_cost"],
                 status="success"
             )
             
             logger.info(
                 f"💰 OpenAI API - Usuario: {current_user.email} | "
-                f"Tokens: {resp.usage.total_tokens} | "
+                f"Tokens: {resp['total_tokens']} | "
                 f"Costo: ${cost_data['total_cost']:.6f}"
             )
         
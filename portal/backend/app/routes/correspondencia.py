@@ -19,7 +19,7 @@ from app.schemas.correspondencia import (
     CorrespondenciaWithDetails
 )
 from app.utils.auth import get_current_active_user, require_admin
-from app.utils.helpers import generate_radicado
+from app.utils.helpers import generate_radicado, preview_radicado
 from app.config.settings import settings
 
 router = APIRouter(prefix="/correspondencia", tags=["Correspondencia"])
@@ -40,24 +40,6 @@ async def create_correspondencia(
     """Crear nueva correspondencia"""
     
     try:
-        # Generar número de radicado único
-        numero_radicado = generate_radicado(db, entity_id=current_user.entity_id, prefix="CORR")
-        
-        # Verificar unicidad
-        max_intentos = 10
-        intentos = 0
-        while db.query(Correspondencia).filter(
-            Correspondencia.numero_radicado == numero_radicado
-        ).first() and intentos < max_intentos:
-            numero_radicado = generate_radicado(db, entity_id=current_user.entity_id, prefix="CORR")
-            intentos += 1
-        
-        if intentos >= max_intentos:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="No se pudo generar un número de radicado único"
-            )
-        
         # Validar campos según tipo de radicación
         from app.models.correspondencia import TipoRadicacion
         if correspondencia_data.tipo_radicacion == TipoRadicacion.CORREO:
@@ -73,6 +55,9 @@ async def create_correspondencia(
                     detail="La dirección es obligatoria para radicación física"
                 )
         
+        # Generar número de radicado único (consecutivo atómico, se confirma con el commit)
+        numero_radicado = generate_radicado(db, entity_id=current_user.entity_id, prefix="CORR")
+        
         # Crear correspondencia
         nueva_correspondencia = Correspondencia(
             numero_radicado=numero_radicado,
@@ -311,7 +296,7 @@ async def preview_next_radicado(
     """Vista previa del siguiente número de radicado"""
     
     try:
-        next_radicado = generate_radicado(db, entity_id=current_user.entity_id, prefix="CORR")
+        next_radicado = preview_radicado(db, entity_id=current_user.entity_id, prefix="CORR")
         return {"numero_radicado": next_radicado}
     except Exception as e:
         raise HTTPException(
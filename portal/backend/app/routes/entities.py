@@ -10,6 +10,7 @@ from app.models.entity import Entity
 from app.models.user import User, UserRole
 from app.schemas.entity import EntityCreate, EntityUpdate, EntityResponse, EntityWithAdmin
 from app.utils.auth import require_superadmin, get_current_active_user
+from app.services.plantillas_pdf import invalidar_plantilla
 
 router = APIRouter(prefix="/entities", tags=["Entidades"])
 
@@ -504,6 +505,7 @@ async def upload_pdf_template(
         file_url = f"https://{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/{file_key}"
         entity.pdf_template_url = file_url
         db.commit()
+        invalidar_plantilla(entity.id)
         
         print(f"✅ Template PDF subido exitosamente")
         
@@ -561,6 +563,7 @@ async def delete_pdf_template(
         # Limpiar URL en BD
         entity.pdf_template_url = None
         db.commit()
+        invalidar_plantilla(entity.id)
         
         return {
             "message": "Template PDF eliminado exitosamente",
@@ -573,6 +576,7 @@ async def delete_pdf_template(
         # Aunque falle S3, limpiar la BD
         entity.pdf_template_url = None
         db.commit()
+        invalidar_plantilla(entity.id)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al eliminar el archivo: {str(e)}"
@@ -3,19 +3,18 @@ Rutas API para PDM - Versión 2
 Alineadas con la estructura del frontend
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, joinedload, defer, noload, selectinload
-from sqlalchemy import func
+from sqlalchemy import func, or_, and_
 from typing import List
 from datetime import datetime
-import base64
+import json
 import re
-import uuid
 
-from app.config.database import get_db
+from app.config.database import get_db, SessionLocal
 from app.models.entity import Entity
 from app.models.user import User, UserRole
 from app.models.secretaria import Secretaria
-from app.models.alert import Alert
 from app.models.pdm import (
     PdmProducto,
     PdmActividad,
@@ -23,19 +22,16 @@ from app.models.pdm import (
     PdmIniciativaSGR
 )
 from app.schemas import pdm_v2 as schemas
+from app.services.pdm_avance_service import (
+    asegurar_avance_entidad,
+    calcular_metricas_avance,
+    obtener_avance_por_producto,
+    refrescar_avance_producto
+)
+from app.services.evidencias_s3 import S3_AVAILABLE, subir_imagenes_a_s3
+from app.services.alertas import notificar_usuarios
 from app.utils.auth import get_current_active_user
 
-# S3 para almacenamiento de imágenes
-try:
-    import boto3
-    from botocore.exceptions import ClientError
-    S3_AVAILABLE = True
-    S3_BUCKET = 'softone-pdm-evidencias'
-    S3_REGION = 'us-east-1'
-except ImportError:
-    S3_AVAILABLE = False
-    print("⚠️ boto3 no disponible - imágenes se guardarán en DB")
-
 router = APIRouter(prefix="/pdm/v2", tags=["PDM V2 "])
 
 
@@ -43,82 +39,6 @@ router = APIRouter(prefix="/pdm/v2", tags=["PDM V2 "])
 # Helpers
 # ==============================================
 
-def subir_imagenes_a_s3(imagenes_base64: List[str], entity_id: int, evidencia_id: int) -> List[str]:
-    """
-    Sube imágenes Base64 a S3 y retorna lista de URLs.
-    
-    Args:
-        imagenes_base64: Lista de strings Base64
-        entity_id: ID de la entidad
-        evidencia_id: ID de la evidencia
-    
-    Returns:
-        Lista de URLs S3
-    
-    Raises:
-        HTTPException: Si falla la subida a S3
-    """
-    if not S3_AVAILABLE:
-        raise HTTPException(
-            status_code=500,
-            detail="Servicio S3 no disponible - contacte al administrador"
-        )
-    
-    if not imagenes_base64:
-        return []
-    
-    try:
-        s3_client = boto3.client('s3', region_name=S3_REGION)
-        urls = []
-        
-        for idx, imagen_base64 in enumerate(imagenes_base64):
-            # Decodificar Base64
-            try:
-                imagen_data = base64.b64decode(imagen_base64)
-            except Exception as e:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Imagen {idx + 1} tiene formato Base64 inválido"
-                )
-            
-            # Determinar extensión (por defecto jpg)
-            extension = 'jpg'
-            if imagen_base64.startswith('/9j/'):
-                extension = 'jpg'
-            elif imagen_base64.startswith('iVBORw0KGgo'):
-                extension = 'png'
-            
-            # Generar key S3 única
-            unique_id = str(uuid.uuid4())[:8]
-            s3_key = f"entity_{entity_id}/evidencia_{evidencia_id}/imagen_{idx}_{unique_id}.{extension}"
-            
-            # Subir a S3
-            s3_client.put_object(
-                Bucket=S3_BUCKET,
-                Key=s3_key,
-                Body=imagen_data,
-                ContentType=f'image/{extension}',
-                CacheControl='max-age=31536000'  # Cache 1 año
-            )
-            
-            # Generar URL pública
-            url = f"https://{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/{s3_key}"
-            urls.append(url)
-        
-        return urls
-        
-    except ClientError as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error subiendo imágenes a S3: {str(e)}"
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error inesperado: {str(e)}"
-        )
-
-
 def validar_imagenes_evidencia(imagenes: List[str]) -> None:
     """
     Valida las imágenes de evidencia en formato Base64.
@@ -172,7 +92,6 @@ def validar_imagenes_evidencia(imagenes: List[str]) -> None:
             
             # ✅ OPTIMIZADO: Validar Base64 solo con regex (sin decodificar)
             # Base64 solo contiene: A-Z, a-z, 0-9, +, /, = (padding)
-            import re
             if not re.match(r'^[A-Za-z0-9+/]*={0,2}$', imagen_data):
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -389,262 +308,258 @@ async def upload_pdm_data(
 # Obtener todos los datos del PDM
 # ==============================================
 
+# Tamaño de lote para recorrer productos con cursor keyset (codigo_producto, id)
+PDM_DATA_BATCH_SIZE = 50
+
+
+def _query_productos_visibles(db: Session, entity_id: int, role, secretaria_id):
+    """Query base de productos visibles según el rol del usuario.
+
+    - ADMIN: ve TODOS los productos
+    - SECRETARIO: ve SOLO los productos asignados a su secretaría
+    """
+    query = db.query(PdmProducto).options(
+        defer(PdmProducto.presupuesto_2024),
+        defer(PdmProducto.presupuesto_2025),
+        defer(PdmProducto.presupuesto_2026),
+        defer(PdmProducto.presupuesto_2027),
+        selectinload(PdmProducto.responsable_secretaria)  # Precarga secretarías
+    ).filter(PdmProducto.entity_id == entity_id)
+
+    if role == UserRole.SECRETARIO:
+        if secretaria_id:
+            query = query.filter(PdmProducto.responsable_secretaria_id == secretaria_id)
+        else:
+            # Si no tiene secretaría asignada, no ver productos
+            query = query.filter(PdmProducto.id == -1)
+
+    return query
+
+
+def _cargar_actividades_batch(db: Session, entity_id: int, codigos: List[str]) -> dict:
+    """Carga las actividades de un lote de productos agrupadas por código (sin evidencias completas)"""
+    actividades_batch = db.query(PdmActividad).options(
+        selectinload(PdmActividad.responsable_secretaria)
+        # NO cargar evidencias aquí - se cargan bajo demanda para evitar OOM
+    ).filter(
+        PdmActividad.entity_id == entity_id,
+        PdmActividad.codigo_producto.in_(codigos)
+    ).all()
+
+    # Obtener IDs de actividades con evidencia (eficiente con SQL)
+    actividad_ids = [act.id for act in actividades_batch]
+    evidencias_existentes = set()
+    if actividad_ids:
+        evidencias_query = db.query(PdmActividadEvidencia.actividad_id).filter(
+            PdmActividadEvidencia.actividad_id.in_(actividad_ids)
+        ).all()
+        evidencias_existentes = {ev.actividad_id for ev in evidencias_query}
+
+    actividades_dict_por_codigo = {}
+    for act in actividades_batch:
+        act_dict = {
+            'id': act.id,
+            'entity_id': act.entity_id,
+            'codigo_producto': act.codigo_producto,
+            'anio': act.anio,
+            'nombre': act.nombre,
+            'descripcion': act.descripcion,
+            'responsable_secretaria_id': act.responsable_secretaria_id,
+            'responsable_secretaria_nombre': act.responsable_secretaria.nombre if act.responsable_secretaria else None,
+            'fecha_inicio': act.fecha_inicio,
+            'fecha_fin': act.fecha_fin,
+            'meta_ejecutar': act.meta_ejecutar,
+            'estado': act.estado,
+            'tiene_evidencia': act.id in evidencias_existentes,  # ✅ Basado en query eficiente
+            # NO incluir evidencia completa aquí - se carga bajo demanda
+            'created_at': act.created_at,
+            'updated_at': act.updated_at
+        }
+        actividades_dict_por_codigo.setdefault(act.codigo_producto, []).append(act_dict)
+
+    return actividades_dict_por_codigo
+
+
+def _build_producto_response(p: PdmProducto, actividades_dicts: List[dict], avance_por_anio: dict) -> schemas.ProductoResponse:
+    """Construye el ProductoResponse de un producto con sus actividades y el avance materializado"""
+    actividades_validadas = [schemas.ActividadResponse(**act_dict) for act_dict in actividades_dicts]
+
+    # ✅ OPTIMIZACIÓN: No enviar presupuesto_XXXX (JSON pesado), solo totales
+    p.presupuesto_2024 = None
+    p.presupuesto_2025 = None
+    p.presupuesto_2026 = None
+    p.presupuesto_2027 = None
+
+    # Validar el producto SIN las actividades Pydantic y asignarlas después
+    prod_response = schemas.ProductoResponse.model_validate(p)
+    prod_response.actividades = actividades_validadas
+
+    # ✅ Mostrar SECRETARÍA como responsable (no usuario)
+    prod_response.responsable_nombre = p.responsable_secretaria_nombre or None
+
+    for campo, valor in calcular_metricas_avance(p, avance_por_anio).items():
+        setattr(prod_response, campo, valor)
+
+    return prod_response
+
+
+def iter_productos_response(
+    db: Session,
+    entity_id: int,
+    role,
+    secretaria_id,
+    batch_size: int = PDM_DATA_BATCH_SIZE
+):
+    """Recorre los productos visibles en lotes con cursor keyset y genera cada ProductoResponse.
+
+    El cursor avanza sobre (codigo_producto, id), de modo que cada lote es una
+    búsqueda por índice en lugar de un OFFSET que re-escanea las filas previas.
+    Solo un lote de productos/actividades vive en memoria a la vez.
+    """
+    asegurar_avance_entidad(db, entity_id)
+    base_query = _query_productos_visibles(db, entity_id, role, secretaria_id)
+    ultimo_codigo = None
+    ultimo_id = None
+
+    while True:
+        query = base_query
+        if ultimo_id is not None:
+            query = query.filter(or_(
+                PdmProducto.codigo_producto > ultimo_codigo,
+                and_(PdmProducto.codigo_producto == ultimo_codigo, PdmProducto.id > ultimo_id)
+            ))
+        batch_productos = query.order_by(
+            PdmProducto.codigo_producto, PdmProducto.id
+        ).limit(batch_size).all()
+
+        if not batch_productos:
+            break
+
+        ultimo_codigo = batch_productos[-1].codigo_producto
+        ultimo_id = batch_productos[-1].id
+
+        codigos_batch = [p.codigo_producto for p in batch_productos]
+        actividades_dict_por_codigo = _cargar_actividades_batch(db, entity_id, codigos_batch)
+        avance_por_codigo = obtener_avance_por_producto(db, entity_id, codigos_batch)
+
+        for p in batch_productos:
+            try:
+                yield _build_producto_response(
+                    p,
+                    actividades_dict_por_codigo.get(p.codigo_producto, []),
+                    avance_por_codigo.get(p.codigo_producto, {})
+                )
+            except Exception as e:
+                print(f"⚠️ Error validando producto {p.id}: {str(e)}")
+                import traceback
+                traceback.print_exc()
+                continue  # Continuar con el siguiente producto
+
+        # Liberar memoria después de procesar el lote
+        db.expire_all()
+
+        if len(batch_productos) < batch_size:
+            break
+
+
+def _iniciativas_sgr_dicts(db: Session, entity_id: int) -> List[dict]:
+    """Iniciativas SGR desde la tabla separada (no del BPIN de productos)"""
+    iniciativas_sgr_db = db.query(PdmIniciativaSGR).filter(
+        PdmIniciativaSGR.entity_id == entity_id
+    ).all()
+    return [
+        {
+            "consecutivo": i.consecutivo,
+            "iniciativa_sgr": i.iniciativa_sgr,
+            "recursos_sgr_indicativos": i.recursos_sgr_indicativos,
+            "bpin": i.bpin
+        }
+        for i in iniciativas_sgr_db
+    ]
+
+
+def _stream_pdm_data_ndjson(entity_id: int, role, secretaria_id):
+    """Genera el PDM como NDJSON: una línea por producto y una línea final de resumen.
+
+    Usa su propia sesión porque el generador se consume después de que el
+    endpoint retorna.
+    """
+    db = SessionLocal()
+    try:
+        lineas_set = set()
+        total = 0
+        for prod_response in iter_productos_response(db, entity_id, role, secretaria_id):
+            if prod_response.linea_estrategica:
+                lineas_set.add(prod_response.linea_estrategica)
+            total += 1
+            yield '{"tipo": "producto", "data": ' + prod_response.model_dump_json() + '}\n'
+
+        resumen = {
+            "tipo": "resumen",
+            "data": {
+                "lineas_estrategicas": [{"nombre": linea} for linea in sorted(lineas_set)],
+                "indicadores_resultado": [],
+                "iniciativas_sgr": _iniciativas_sgr_dicts(db, entity_id),
+                "total_productos": total,
+            }
+        }
+        yield json.dumps(resumen, default=str) + '\n'
+        print(f"✅ Stream PDM entity_id={entity_id}: {total} productos enviados")
+    except Exception as e:
+        print(f"❌ Error en stream PDM entity_id={entity_id}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        yield json.dumps({"tipo": "error", "detail": f"Error cargando datos PDM: {str(e)}"}) + '\n'
+    finally:
+        db.close()
+
+
 @router.get("/{slug}/data")
 async def get_pdm_data(
     slug: str,
+    stream: bool = Query(False, description="Si es true, responde NDJSON producto a producto"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Obtiene los productos del PDM cargados con sus actividades y otros arrays del frontend
     
-    OPTIMIZACIÓN: Carga productos en lotes internos de 50 para evitar OOM
-    pero retorna todos en una sola respuesta
+    OPTIMIZACIÓN: Recorre productos con cursor keyset (codigo_producto, id) en
+    lotes de PDM_DATA_BATCH_SIZE.
+    
+    MODO STREAMING (?stream=true): responde application/x-ndjson con una línea
+    {"tipo": "producto", "data": ProductoResponse} por producto, emitida en cuanto
+    se calcula su lote, y una línea final {"tipo": "resumen", "data": {...}} con
+    líneas estratégicas, iniciativas SGR y total.
     
     FILTRADO POR ROL EN BACKEND:
     - ADMIN: ve TODOS los productos
     - SECRETARIO: ve SOLO sus productos asignados
     """
     try:
-        print(f"\n📊 GET /pdm/v2/{slug}/data - Usuario: {current_user.username}")
+        print(f"\n📊 GET /pdm/v2/{slug}/data - Usuario: {current_user.username} (stream={stream})")
         
         entity = get_entity_or_404(db, slug)
         ensure_user_can_manage_entity(current_user, entity)
         
-        # ✅ OPTIMIZADO: Construir query con defer + selectinload para evitar N+1
-        query = db.query(PdmProducto).options(
-            defer(PdmProducto.presupuesto_2024),
-            defer(PdmProducto.presupuesto_2025),
-            defer(PdmProducto.presupuesto_2026),
-            defer(PdmProducto.presupuesto_2027),
-            selectinload(PdmProducto.responsable_secretaria)  # Precarga secretarías
-        ).filter(PdmProducto.entity_id == entity.id)
-        
-        # FILTRADO POR ROL: Secretarios solo ven productos asignados a SU secretaría
-        if current_user.role == UserRole.SECRETARIO:
-            # ✅ Si el usuario es secretario, ver productos asignados a su secretaría
-            if current_user.secretaria_id:
-                query = query.filter(PdmProducto.responsable_secretaria_id == current_user.secretaria_id)
-                print(f"🔐 Usuario SECRETARIO {current_user.username} (secretaria_id={current_user.secretaria_id}) - filtrando por productos de su secretaría")
-            else:
-                # Si no tiene secretaría asignada, no ver productos
-                query = query.filter(PdmProducto.id == -1)  # Query que no retorna nada
-                print(f"🔐 Usuario SECRETARIO {current_user.username} sin secretaría asignada - sin acceso a productos")
-        else:
-            print(f"👨‍💼 Usuario {current_user.role} - viendo TODOS los productos")
-        
-        # Ordenar por código para resultados consistentes
-        query = query.order_by(PdmProducto.codigo_producto)
+        if current_user.role == UserRole.SECRETARIO and not current_user.secretaria_id:
+            print(f"🔐 Usuario SECRETARIO {current_user.username} sin secretaría asignada - sin acceso a productos")
         
-        # Contar total
-        total_productos = query.count()
-        print(f"📊 Total de productos en DB: {total_productos}")
+        if stream:
+            return StreamingResponse(
+                _stream_pdm_data_ndjson(entity.id, current_user.role, current_user.secretaria_id),
+                media_type="application/x-ndjson"
+            )
         
-        # ✅ OPTIMIZACIÓN CRÍTICA: Procesar en lotes de 10 para evitar OOM
-        # Cada lote se procesa COMPLETAMENTE antes de cargar el siguiente
-        BATCH_SIZE = 10
         productos_validos = []
         lineas_set = set()
-        offset = 0
-        
-        while offset < total_productos:
-            # Cargar lote de productos
-            batch_productos = query.limit(BATCH_SIZE).offset(offset).all()
-            if not batch_productos:
-                break
-            
-            print(f"📦 Procesando lote {offset//BATCH_SIZE + 1}: {len(batch_productos)} productos")
-            
-            # ✅ OPTIMIZADO: Cargar actividades con selectinload de secretaría (SIN evidencias para no causar OOM)
-            codigos_batch = [p.codigo_producto for p in batch_productos]
-            actividades_batch = db.query(PdmActividad).options(
-                selectinload(PdmActividad.responsable_secretaria)
-                # NO cargar evidencias aquí - se cargan bajo demanda para evitar OOM
-            ).filter(
-                PdmActividad.entity_id == entity.id,
-                PdmActividad.codigo_producto.in_(codigos_batch)
-            ).all()
-            
-            # Obtener IDs de actividades con evidencia (eficiente con SQL)
-            actividad_ids = [act.id for act in actividades_batch]
-            evidencias_existentes = set()
-            if actividad_ids:
-                evidencias_query = db.query(PdmActividadEvidencia.actividad_id).filter(
-                    PdmActividadEvidencia.actividad_id.in_(actividad_ids)
-                ).all()
-                evidencias_existentes = {ev.actividad_id for ev in evidencias_query}
-            
-            # Convertir actividades a dict (SIN evidencias completas para evitar OOM)
-            actividades_dict_por_codigo = {}
-            for act in actividades_batch:
-                # Crear dict desde el objeto ORM con TODOS los campos del schema
-                act_dict = {
-                    'id': act.id,
-                    'entity_id': act.entity_id,
-                    'codigo_producto': act.codigo_producto,
-                    'anio': act.anio,
-                    'nombre': act.nombre,
-                    'descripcion': act.descripcion,
-                    'responsable_secretaria_id': act.responsable_secretaria_id,
-                    'responsable_secretaria_nombre': act.responsable_secretaria.nombre if act.responsable_secretaria else None,
-                    'fecha_inicio': act.fecha_inicio,
-                    'fecha_fin': act.fecha_fin,
-                    'meta_ejecutar': act.meta_ejecutar,
-                    'estado': act.estado,
-                    'tiene_evidencia': act.id in evidencias_existentes,  # ✅ Basado en query eficiente
-                    # NO incluir evidencia completa aquí - se carga bajo demanda
-                    'created_at': act.created_at,
-                    'updated_at': act.updated_at
-                }
-                
-                if act.codigo_producto not in actividades_dict_por_codigo:
-                    actividades_dict_por_codigo[act.codigo_producto] = []
-                actividades_dict_por_codigo[act.codigo_producto].append(act_dict)
-            
-            print(f"   ├─ Actividades: {len(actividades_batch)}")
-            
-            # Procesar productos del lote
-            for p in batch_productos:
-                try:
-                    # Obtener actividades del diccionario (ahora son dicts con tiene_evidencia)
-                    actividades_dicts = actividades_dict_por_codigo.get(p.codigo_producto, [])
-                    
-                    # Convertir dicts a objetos Pydantic para validación
-                    actividades_validadas = [schemas.ActividadResponse(**act_dict) for act_dict in actividades_dicts]
-                    
-                    # Enriquecer con nombre del responsable (SECRETARÍA) si existe
-                    responsable_nombre = None
-                    
-                    # ✅ Mostrar SECRETARÍA como responsable (no usuario)
-                    if p.responsable_secretaria_nombre:
-                        responsable_nombre = p.responsable_secretaria_nombre
-                    
-                    # ✅ OPTIMIZACIÓN: No cargar presupuesto_XXXX (JSON pesado), solo totales
-                    # Esto reduce payload de ~300KB a ~60KB por cada 100 productos
-                    p.presupuesto_2024 = None
-                    p.presupuesto_2025 = None
-                    p.presupuesto_2026 = None
-                    p.presupuesto_2027 = None
-                    
-                    # Validar el producto SIN las actividades Pydantic (que causarían error)
-                    prod_response = schemas.ProductoResponse.model_validate(p)
-                    
-                    # DESPUÉS de validar, asignar las actividades al response
-                    prod_response.actividades = actividades_validadas
-                    
-                    # Agregar el nombre de la secretaría responsable al response
-                    prod_response.responsable_nombre = responsable_nombre
-
-                    # ===============================
-                    # Cálculo de avance de metas del cuatrienio
-                    # Cada año con programacion_X > 0 se considera una meta.
-                    # Una meta anual se cumple si suma(meta_ejecutar de actividades COMPLETADAS del año) >= programacion_X.
-                    # Avance general = metas_cumplidas / metas_totales * 100.
-                    # ===============================
-                    programaciones_por_anio = {
-                        2024: p.programacion_2024 or 0,
-                        2025: p.programacion_2025 or 0,
-                        2026: p.programacion_2026 or 0,
-                        2027: p.programacion_2027 or 0,
-                    }
-
-                    detalle_metas = []
-                    metas_totales = 0
-                    metas_cumplidas = 0
-                    puede_agregar_actividad_anio = {}
-
-                    actividades_por_anio = {}
-                    # Agrupar actividades por año
-                    for act_dict in actividades_dicts:
-                        anio = act_dict['anio']
-                        actividades_por_anio.setdefault(anio, []).append(act_dict)
-
-                    for anio, programado in programaciones_por_anio.items():
-                        if programado and programado > 0:
-                            metas_totales += 1
-                            lista_acts = actividades_por_anio.get(anio, [])
-                            ejecutado = sum(a['meta_ejecutar'] for a in lista_acts if a['estado'] == 'COMPLETADA')
-                            cumplida = ejecutado >= programado and ejecutado > 0
-                            if cumplida:
-                                metas_cumplidas += 1
-                            detalle_metas.append({
-                                "anio": anio,
-                                "programado": programado,
-                                "ejecutado": ejecutado,
-                                "cumplida": cumplida
-                            })
-                            # Puede agregar actividad si la meta del año no está cumplida
-                            puede_agregar_actividad_anio[str(anio)] = not cumplida
-                        else:
-                            lista_acts = actividades_por_anio.get(anio, [])
-                            ejecutado = sum(a['meta_ejecutar'] for a in lista_acts if a['estado'] == 'COMPLETADA') if lista_acts else 0
-                            detalle_metas.append({
-                                "anio": anio,
-                                "programado": 0,
-                                "ejecutado": ejecutado,
-                                "cumplida": False
-                            })
-                            puede_agregar_actividad_anio[str(anio)] = False
-
-                    avance_general_porcentaje = (metas_cumplidas / metas_totales * 100) if metas_totales > 0 else 0
-                    prod_response.metas_totales = metas_totales
-                    prod_response.metas_cumplidas = metas_cumplidas
-                    prod_response.avance_general_porcentaje = round(avance_general_porcentaje, 2)
-                    prod_response.detalle_metas = detalle_metas
-                    prod_response.puede_agregar_actividad_anio = puede_agregar_actividad_anio
-                    
-                    # ✅ OPTIMIZACIÓN: Calcular porcentaje_ejecucion en backend
-                    # Esto evita que el frontend tenga que recalcular para cada producto
-                    # Cálculo: promedio de avance por año basado en metas ejecutadas
-                    sum_avances_anuales = 0
-                    anios_con_meta = 0
-                    
-                    for detalle in detalle_metas:
-                        programado = detalle['programado']
-                        ejecutado = detalle['ejecutado']
-                        if programado > 0:
-                            avance_anual = min(100, (ejecutado / programado) * 100)
-                            sum_avances_anuales += avance_anual
-                            anios_con_meta += 1
-                    
-                    porcentaje_ejecucion = (sum_avances_anuales / anios_con_meta) if anios_con_meta > 0 else 0
-                    prod_response.porcentaje_ejecucion = round(porcentaje_ejecucion, 2)
-
-                    productos_validos.append(prod_response)
-                    
-                    # Recolectar líneas estratégicas únicas
-                    if p.linea_estrategica:
-                        lineas_set.add(p.linea_estrategica)
-                    
-                except Exception as e:
-                    print(f"⚠️ Error validando producto {p.id}: {str(e)}")
-                    import traceback
-                    traceback.print_exc()
-                    continue  # Continuar con el siguiente producto
-            
-            # Liberar memoria después de procesar el lote
-            db.expire_all()
-            print(f"   └─ Procesados: {len(batch_productos)} productos del lote")
-            
-            offset += BATCH_SIZE
-        
-        print(f"✅ Total productos procesados: {len(productos_validos)}")
-        
-        # ✅ Cargar iniciativas SGR desde la tabla separada (no del BPIN de productos)
-        iniciativas_sgr_db = db.query(PdmIniciativaSGR).filter(
-            PdmIniciativaSGR.entity_id == entity.id
-        ).all()
+        for prod_response in iter_productos_response(db, entity.id, current_user.role, current_user.secretaria_id):
+            productos_validos.append(prod_response)
+            # Recolectar líneas estratégicas únicas
+            if prod_response.linea_estrategica:
+                lineas_set.add(prod_response.linea_estrategica)
         
-        # Convertir sets a listas de diccionarios
         lineas_estrategicas = [{"nombre": linea} for linea in sorted(lineas_set)]
-        iniciativas_sgr = [
-            {
-                "consecutivo": i.consecutivo,
-                "iniciativa_sgr": i.iniciativa_sgr,
-                "recursos_sgr_indicativos": i.recursos_sgr_indicativos,
-                "bpin": i.bpin
-            }
-            for i in iniciativas_sgr_db
-        ]
+        iniciativas_sgr = _iniciativas_sgr_dicts(db, entity.id)
         
         print(f"✅ Retornando {len(productos_validos)} productos + {len(lineas_estrategicas)} líneas + {len(iniciativas_sgr)} iniciativas SGR")
         return schemas.PDMDataResponse(
@@ -703,6 +618,8 @@ async def create_actividad(
         **actividad_data
     )
     db.add(nueva_actividad)
+    db.flush()
+    refrescar_avance_producto(db, entity.id, nueva_actividad.codigo_producto, nueva_actividad.anio)
     db.commit()
     db.refresh(nueva_actividad)
     
@@ -710,23 +627,16 @@ async def create_actividad(
     if nueva_actividad.responsable_secretaria_id:
         secretaria = db.query(Secretaria).filter(Secretaria.id == nueva_actividad.responsable_secretaria_id).first()
         if secretaria:
-            # Obtener todos los usuarios de esa secretaría
-            usuarios_secretaria = db.query(User).filter(
-                User.secretaria_id == secretaria.id,
-                User.is_active == True,
-                User.entity_id == entity.id
-            ).all()
-            
-            for usuario in usuarios_secretaria:
-                alerta = Alert(
-                    entity_id=entity.id,
-                    recipient_user_id=usuario.id,
-                    type="PDM_ACTIVIDAD_ASIGNADA",
-                    title=f"Nueva actividad en {secretaria.nombre}: {nueva_actividad.nombre}",
-                    message=f"Se ha asignado la actividad '{nueva_actividad.nombre}' a la Secretaría {secretaria.nombre} para el año {nueva_actividad.anio}.",
-                    data=f'{{"actividad_id": {nueva_actividad.id}, "codigo_producto": "{nueva_actividad.codigo_producto}", "responsable_secretaria": "{secretaria.nombre}"}}'
-                )
-                db.add(alerta)
+            # Todos los usuarios de esa secretaría (un solo INSERT)
+            notificar_usuarios(
+                db,
+                entity_id=entity.id,
+                type="PDM_ACTIVIDAD_ASIGNADA",
+                title=f"Nueva actividad en {secretaria.nombre}: {nueva_actividad.nombre}",
+                message=f"Se ha asignado la actividad '{nueva_actividad.nombre}' a la Secretaría {secretaria.nombre} para el año {nueva_actividad.anio}.",
+                data={"actividad_id": nueva_actividad.id, "codigo_producto": nueva_actividad.codigo_producto, "responsable_secretaria": secretaria.nombre},
+                secretaria_id=secretaria.id,
+            )
             db.commit()
     
     return schemas.ActividadResponse.model_validate(nueva_actividad)
@@ -841,6 +751,8 @@ async def update_actividad(
     for key, value in update_dict.items():
         setattr(actividad, key, value)
     
+    db.flush()
+    refrescar_avance_producto(db, entity.id, actividad.codigo_producto, actividad.anio)
     db.commit()
     db.refresh(actividad)
     
@@ -848,22 +760,15 @@ async def update_actividad(
     if actividad.responsable_secretaria_id and 'responsable_secretaria_id' in update_dict:
         secretaria = db.query(Secretaria).filter(Secretaria.id == actividad.responsable_secretaria_id).first()
         if secretaria:
-            usuarios_secretaria = db.query(User).filter(
-                User.secretaria_id == secretaria.id,
-                User.is_active == True,
-                User.entity_id == entity.id
-            ).all()
-            
-            for usuario in usuarios_secretaria:
-                alerta = Alert(
-                    entity_id=entity.id,
-                    recipient_user_id=usuario.id,
-                    type="PDM_ACTIVIDAD_REASIGNADA",
-                    title=f"Actividad reasignada en {secretaria.nombre}: {actividad.nombre}",
-                    message=f"La actividad '{actividad.nombre}' ha sido reasignada a la Secretaría {secretaria.nombre} para el año {actividad.anio}.",
-                    data=f'{{"actividad_id": {actividad.id}, "codigo_producto": "{actividad.codigo_producto}", "responsable_secretaria": "{secretaria.nombre}"}}'
-                )
-                db.add(alerta)
+            notificar_usuarios(
+                db,
+                entity_id=entity.id,
+                type="PDM_ACTIVIDAD_REASIGNADA",
+                title=f"Actividad reasignada en {secretaria.nombre}: {actividad.nombre}",
+                message=f"La actividad '{actividad.nombre}' ha sido reasignada a la Secretaría {secretaria.nombre} para el año {actividad.anio}.",
+                data={"actividad_id": actividad.id, "codigo_producto": actividad.codigo_producto, "responsable_secretaria": secretaria.nombre},
+                secretaria_id=secretaria.id,
+            )
             db.commit()
     
     return schemas.ActividadResponse.model_validate(actividad)
@@ -888,7 +793,10 @@ async def delete_actividad(
     if not actividad:
         raise HTTPException(status_code=404, detail="Actividad no encontrada")
     
+    codigo_producto, anio = actividad.codigo_producto, actividad.anio
     db.delete(actividad)
+    db.flush()
+    refrescar_avance_producto(db, entity.id, codigo_producto, anio)
     db.commit()
 
 
@@ -992,6 +900,8 @@ async def create_evidencia(
     # Actualizar estado de la actividad a COMPLETADA
     actividad.estado = 'COMPLETADA'
     
+    db.flush()
+    refrescar_avance_producto(db, entity.id, actividad.codigo_producto, actividad.anio)
     db.commit()
     db.refresh(nueva_evidencia)
     
@@ -1059,6 +969,10 @@ async def update_evidencia(
     update_dict = evidencia_update.model_dump(exclude_unset=True)
     if 'imagenes' in update_dict and update_dict['imagenes']:
         validar_imagenes_evidencia(update_dict['imagenes'])
+        # Las nuevas imágenes llegan en Base64: las URLs S3 anteriores dejan de ser
+        # válidas y la migración 012 las volverá a subir
+        evidencia.imagenes_s3_urls = None
+        evidencia.migrated_to_s3 = False
     
     for key, value in update_dict.items():
         setattr(evidencia, key, value)
@@ -1127,29 +1041,21 @@ async def asignar_responsable_producto(
     db.commit()
     db.refresh(producto)
     
-    # ✅ Crear alertas para TODOS los usuarios de esta secretaría
-    usuarios_en_secretaria = db.query(User).filter(
-        User.secretaria_id == responsable_secretaria_id,
-        User.entity_id == entity.id,
-        User.is_active == True
-    ).all()
-    
-    for usuario in usuarios_en_secretaria:
-        alerta = Alert(
-            entity_id=entity.id,
-            recipient_user_id=usuario.id,
-            type="PDM_PRODUCT_ASSIGNED",
-            title=f"Producto asignado a tu secretaría: {producto.codigo_producto}",
-            message=f"El producto '{producto.indicador_producto_mga or producto.personalizacion_indicador}' ha sido asignado a la Secretaría {secretaria.nombre} para seguimiento en el PDM.",
-            data=f'{{"producto_codigo": "{producto.codigo_producto}", "slug": "{slug}", "secretaria_id": {responsable_secretaria_id}}}',
-            created_at=datetime.utcnow()
-        )
-        db.add(alerta)
+    # ✅ Crear alertas para TODOS los usuarios de esta secretaría (un solo INSERT)
+    creadas = notificar_usuarios(
+        db,
+        entity_id=entity.id,
+        type="PDM_PRODUCT_ASSIGNED",
+        title=f"Producto asignado a tu secretaría: {producto.codigo_producto}",
+        message=f"El producto '{producto.indicador_producto_mga or producto.personalizacion_indicador}' ha sido asignado a la Secretaría {secretaria.nombre} para seguimiento en el PDM.",
+        data={"producto_codigo": producto.codigo_producto, "slug": slug, "secretaria_id": responsable_secretaria_id},
+        secretaria_id=responsable_secretaria_id,
+    )
     
     db.commit()
     
     print(f"✅ Producto asignado a secretaría {secretaria.nombre}")
-    print(f"✅ Alertas creadas para {len(usuarios_en_secretaria)} usuario(s)")
+    print(f"✅ Alertas creadas para {creadas} usuario(s)")
     
     return {
         "success": True,
@@ -1157,7 +1063,7 @@ async def asignar_responsable_producto(
         "producto_codigo": producto.codigo_producto,
         "responsable_secretaria_id": producto.responsable_secretaria_id,
         "responsable_secretaria_nombre": producto.responsable_secretaria_nombre,
-        "usuarios_notificados": len(usuarios_en_secretaria)
+        "usuarios_notificados": creadas
     }
 
 
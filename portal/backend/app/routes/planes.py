@@ -8,7 +8,6 @@ from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 from decimal import Decimal
 from datetime import date
-import json
 
 from app.config.database import get_db
 from app.models.plan import (
@@ -16,8 +15,8 @@ from app.models.plan import (
     EstadoPlan, EstadoComponente
 )
 from app.models.user import User, UserRole
-from app.models.alert import Alert
 from app.models.secretaria import Secretaria
+from app.services.alertas import crear_alerta_entidad, notificar_usuarios
 from app.schemas import plan as plan_schemas
 from app.utils.auth import get_current_user, require_feature_enabled
 
@@ -706,48 +705,35 @@ def crear_actividad(
             ).first()
             
             if secretaria:
-                # Buscar usuarios de esa secretaría
-                secretarios = db.query(User).filter(
-                    User.role == UserRole.SECRETARIO,
-                    User.entity_id == plan.entity_id,
-                    User.secretaria_id == secretaria.id,
-                    User.is_active == True
-                ).all()
-                
-                for secretario in secretarios:
-                    db.add(Alert(
-                        entity_id=plan.entity_id,
-                        recipient_user_id=secretario.id,
-                        type="PLAN_NEW_ACTIVITY",
-                        title="Nueva actividad asignada en Plan Institucional",
-                        message=f"Se te ha asignado una nueva actividad en el componente '{componente.nombre}'",
-                        data=json.dumps({
-                            "plan_id": componente.plan_id,
-                            "componente_id": componente_id,
+                notificar_usuarios(
+                    db,
+                    entity_id=plan.entity_id,
+                    type="PLAN_NEW_ACTIVITY",
+                    title="Nueva actividad asignada en Plan Institucional",
+                    message=f"Se te ha asignado una nueva actividad en el componente '{componente.nombre}'",
+                    data={
+                        "plan_id": componente.plan_id,
+                        "componente_id": componente_id,
                         "actividad_id": nueva_actividad.id
-                    }),
-                ))
-
-        # 2. Alertas para administradores de la entidad
-        admins = db.query(User).filter(
-            User.role == UserRole.ADMIN,
-            User.entity_id == plan.entity_id,
-            User.is_active == True
-        ).all()
-        
-        for admin in admins:
-            db.add(Alert(
-                entity_id=plan.entity_id,
-                recipient_user_id=admin.id,
-                type="PLAN_NEW_ACTIVITY",
-                title="Nueva actividad en Plan Institucional",
-                message=f"Se creó una nueva actividad en el componente '{componente.nombre}'",
-                data=json.dumps({
-                    "plan_id": componente.plan_id,
-                    "componente_id": componente_id,
-                    "actividad_id": nueva_actividad.id
-                }),
-            ))
+                    },
+                    roles=[UserRole.SECRETARIO],
+                    secretaria_id=secretaria.id,
+                )
+
+        # 2. Alerta de entidad para los administradores (una sola fila)
+        crear_alerta_entidad(
+            db,
+            entity_id=plan.entity_id,
+            type="PLAN_NEW_ACTIVITY",
+            title="Nueva actividad en Plan Institucional",
+            message=f"Se creó una nueva actividad en el componente '{componente.nombre}'",
+            data={
+                "plan_id": componente.plan_id,
+                "componente_id": componente_id,
+                "actividad_id": nueva_actividad.id
+            },
+            rol=UserRole.ADMIN,
+        )
         
         db.commit()
         
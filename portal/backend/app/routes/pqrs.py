@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile
 from pydantic import BaseModel
 import asyncio
 import gc
-import json
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 from datetime import datetime
@@ -20,11 +20,13 @@ from app.models.pqrs import PQRS, EstadoPQRS, AsignacionAuditoria
 from app.models.user import User, UserRole
 from app.models.entity import Entity
 from app.models.informe import InformeEstado
-from app.schemas.pqrs import PQRSCreate, PQRSUpdate, PQRS as PQRSSchema, PQRSWithDetails, PQRSResponse
-from app.models.alert import Alert
+from app.schemas.pqrs import PQRSCreate, PQRSUpdate, PQRS as PQRSSchema, PQRSWithDetails, PQRSResponse, PQRSPagina
 from app.utils.auth import get_current_active_user, require_admin
-from app.utils.helpers import generate_radicado
+from app.utils.helpers import generate_radicado, preview_radicado
+from app.utils.paginacion import codificar_cursor, decodificar_cursor, estimar_total
 from app.utils.email_service import email_service
+from app.services.email_outbox import encolar_email, notificar_email_pendiente
+from app.services.alertas import crear_alertas, crear_alerta_entidad
 from app.config.settings import settings
 
 router = APIRouter(prefix="/pqrs", tags=["PQRS"])
@@ -91,13 +93,8 @@ async def create_pqrs(
     # Generar número de radicado único (ignorar el del frontend para evitar duplicados)
     try:
         # Siempre generar un nuevo radicado único con formato ENT-YYYYMMDDNNN
+        # (consecutivo atómico: queda reservado hasta el commit de esta transacción)
         numero_radicado = generate_radicado(db, entity_id=current_user.entity_id)
-        # Verificar unicidad por si acaso (aunque la función ya maneja esto)
-        max_intentos = 10
-        intentos = 0
-        while db.query(PQRS).filter(PQRS.numero_radicado == numero_radicado).first() and intentos < max_intentos:
-            numero_radicado = generate_radicado(db, entity_id=current_user.entity_id)
-            intentos += 1
         
         # Determinar asignación automática:
         # - Si el creador es SECRETARIO, asignar automáticamente a él y fijar fecha_delegacion.
@@ -133,10 +130,10 @@ async def create_pqrs(
         )
         
         db.add(db_pqrs)
-        db.commit()
-        db.refresh(db_pqrs)
+        db.flush()
 
-        # Enviar correo de confirmación al ciudadano si tiene email y no se indicó skip_email
+        # Correo de confirmación al ciudadano si tiene email y no se indicó skip_email.
+        # Se encola en la misma transacción; lo entrega el worker de email_outbox.
         if pqrs_data.email_ciudadano and not skip_email:
             try:
                 # Obtener información de la entidad para el correo
@@ -145,8 +142,8 @@ async def create_pqrs(
                 entity_email = entity.email if entity and entity.email else None
                 entity_slug = entity.slug if entity else "portal"
 
-                # Enviar correo de radicación (sin archivo adjunto, se sube después)
-                email_service.send_pqrs_radicada_notification(
+                # Correo de radicación (sin archivo adjunto, se sube después)
+                mensaje = email_service.build_pqrs_radicada_message(
                     to_email=pqrs_data.email_ciudadano,
                     numero_radicado=numero_radicado,
                     tipo_solicitud=pqrs_data.tipo_solicitud.value,
@@ -158,35 +155,38 @@ async def create_pqrs(
                     archivo_adjunto_url=None,
                     entity_email=entity_email
                 )
-                print(f"✅ Correo de radicación enviado a {pqrs_data.email_ciudadano}")
+                encolar_email(db, mensaje, tipo='pqrs_radicada', entity_id=db_pqrs.entity_id, pqrs_id=db_pqrs.id)
             except Exception as email_error:
-                # No interrumpir el flujo si falla el envío del correo
+                # No interrumpir el flujo si falla la preparación del correo
                 import traceback
-                print(f"⚠️ Error enviando correo de radicación: {email_error}")
+                print(f"⚠️ Error preparando correo de radicación: {email_error}")
                 print(f"Traceback completo: {traceback.format_exc()}")
 
-        # Crear alertas: nueva PQRS para admins de la entidad
+        db.commit()
+        db.refresh(db_pqrs)
+        notificar_email_pendiente()
+
+        # Crear alertas: nueva PQRS para los admins de la entidad (una sola alerta de entidad)
         try:
-            admins = db.query(User).filter(User.role == UserRole.ADMIN, User.entity_id == pqrs_data.entity_id).all()
-            for admin in admins:
-                db.add(Alert(
-                    entity_id=pqrs_data.entity_id,
-                    recipient_user_id=admin.id,
-                    type="NEW_PQRS",
-                    title=f"Nueva PQRS {db_pqrs.numero_radicado}",
-                    message=f"Asunto: {db_pqrs.asunto}",
-                    data=json.dumps({"pqrs_id": db_pqrs.id}),
-                ))
+            crear_alerta_entidad(
+                db,
+                entity_id=pqrs_data.entity_id,
+                type="NEW_PQRS",
+                title=f"Nueva PQRS {db_pqrs.numero_radicado}",
+                message=f"Asunto: {db_pqrs.asunto}",
+                data={"pqrs_id": db_pqrs.id},
+                rol=UserRole.ADMIN,
+            )
             # Si se auto-asignó al secretario creador
             if assigned_to_id:
-                db.add(Alert(
+                crear_alertas(
+                    db, [assigned_to_id],
                     entity_id=pqrs_data.entity_id,
-                    recipient_user_id=assigned_to_id,
                     type="PQRS_ASSIGNED",
                     title=f"Te asignaron la PQRS {db_pqrs.numero_radicado}",
                     message=f"Asunto: {db_pqrs.asunto}",
-                    data=json.dumps({"pqrs_id": db_pqrs.id}),
-                ))
+                    data={"pqrs_id": db_pqrs.id},
+                )
             db.commit()
         except Exception as _:
             db.rollback()
@@ -206,6 +206,108 @@ async def create_pqrs(
             detail=f"Error creando PQRS: {str(e)}"
         )
 
+def _filtrar_por_rol(query, current_user: User, assigned_to_me: bool = False):
+    """Restringe la consulta a las PQRS que el usuario puede ver según su rol"""
+    if current_user.role == UserRole.ADMIN:
+        # Admin ve solo las PQRS de su entidad
+        query = query.filter(PQRS.entity_id == current_user.entity_id)
+        if assigned_to_me:
+            query = query.filter(PQRS.assigned_to_id == current_user.id)
+    elif current_user.role == UserRole.SECRETARIO:
+        # Secretarios solo ven PQRS asignadas a ellos
+        query = query.filter(PQRS.assigned_to_id == current_user.id)
+    elif current_user.role == UserRole.CIUDADANO:
+        # Ciudadanos ven PQRS que ellos crearon (basándose en created_by_id o email)
+        query = query.filter(
+            (PQRS.created_by_id == current_user.id) |
+            (PQRS.email_ciudadano == current_user.email)
+        )
+    return query
+
+# Columnas de los JOIN que se entregan anidadas (assigned_to / entity)
+_COLUMNAS_JOIN = ('assigned_to_username', 'assigned_to_name', 'entity_name', 'entity_slug')
+
+def _query_resumen(db: Session, con_entidad: bool = False):
+    """
+    Proyección de columnas para listados (PQRSResumen): sin cargar objetos ORM
+    completos; el responsable (y la entidad, si se pide) llegan en el mismo JOIN.
+    """
+    columnas = [
+        PQRS.id,
+        PQRS.numero_radicado,
+        PQRS.tipo_solicitud,
+        PQRS.estado,
+        PQRS.canal_llegada,
+        PQRS.tipo_identificacion,
+        PQRS.asunto,
+        PQRS.nombre_ciudadano,
+        PQRS.fecha_solicitud,
+        PQRS.fecha_respuesta,
+        PQRS.dias_respuesta,
+        PQRS.email_enviado,
+        PQRS.entity_id,
+        PQRS.assigned_to_id,
+        PQRS.created_at,
+        User.username.label('assigned_to_username'),
+        User.full_name.label('assigned_to_name'),
+    ]
+    if con_entidad:
+        columnas += [Entity.name.label('entity_name'), Entity.slug.label('entity_slug')]
+    query = db.query(*columnas).outerjoin(User, User.id == PQRS.assigned_to_id)
+    if con_entidad:
+        query = query.outerjoin(Entity, Entity.id == PQRS.entity_id)
+    return query
+
+def _paginar_resumen(
+    db: Session,
+    query,
+    cursor: Optional[str],
+    limit: int,
+    con_total: bool
+) -> dict:
+    """
+    Página de PQRS ordenada por (created_at, id) descendente, por cursor.
+    Se pide una fila de más para saber si existe página siguiente sin contar.
+    """
+    # Conteo sobre la consulta filtrada, antes de aplicar el cursor
+    total_estimado = estimar_total(db, query) if con_total and not cursor else None
+
+    if cursor:
+        llave = decodificar_cursor(cursor, fechas=('created_at',))
+        query = query.filter(or_(
+            PQRS.created_at < llave['created_at'],
+            and_(PQRS.created_at == llave['created_at'], PQRS.id < llave['id'])
+        ))
+
+    filas = query.order_by(PQRS.created_at.desc(), PQRS.id.desc()).limit(limit + 1).all()
+    hay_mas = len(filas) > limit
+    filas = filas[:limit]
+
+    items = []
+    for fila in filas:
+        item = {
+            **{k: v for k, v in fila._mapping.items() if k not in _COLUMNAS_JOIN},
+            "assigned_to": {
+                "id": fila.assigned_to_id,
+                "username": fila.assigned_to_username,
+                "full_name": fila.assigned_to_name
+            } if fila.assigned_to_id and fila.assigned_to_username is not None else None,
+        }
+        if 'entity_slug' in fila._mapping:
+            item["entity"] = {
+                "id": fila.entity_id,
+                "name": fila.entity_name,
+                "slug": fila.entity_slug
+            } if fila.entity_slug is not None else None
+        items.append(item)
+
+    ultima = filas[-1] if filas else None
+    return {
+        "items": items,
+        "next_cursor": codificar_cursor({"created_at": ultima.created_at, "id": ultima.id}) if hay_mas else None,
+        "total_estimado": total_estimado,
+    }
+
 @router.get("/", response_model=List[PQRSWithDetails])
 async def get_pqrs(
     skip: int = Query(0, ge=0),
@@ -222,20 +324,7 @@ async def get_pqrs(
     )
     
     # Filtrar según rol
-    if current_user.role == UserRole.ADMIN:
-        # Admin ve solo las PQRS de su entidad
-        query = query.filter(PQRS.entity_id == current_user.entity_id)
-        if assigned_to_me:
-            query = query.filter(PQRS.assigned_to_id == current_user.id)
-    elif current_user.role == UserRole.SECRETARIO:
-        # Secretarios solo ven PQRS asignadas a ellos
-        query = query.filter(PQRS.assigned_to_id == current_user.id)
-    elif current_user.role == UserRole.CIUDADANO:
-        # Ciudadanos ven PQRS que ellos crearon (basándose en created_by_id o email)
-        query = query.filter(
-            (PQRS.created_by_id == current_user.id) |
-            (PQRS.email_ciudadano == current_user.email)
-        )
+    query = _filtrar_por_rol(query, current_user, assigned_to_me)
     
     # Filtrar por estado si se especifica
     if estado:
@@ -318,6 +407,47 @@ async def get_mis_pqrs(
     
     return result
 
+@router.get("/paginado", response_model=PQRSPagina)
+async def get_pqrs_paginado(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    estado: Optional[EstadoPQRS] = None,
+    assigned_to_me: bool = False,
+    con_total: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Listado de PQRS paginado por cursor (bandeja de administración).
+    Para la página siguiente se envía el next_cursor de la respuesta anterior;
+    con_total=true agrega un total estimado en la primera página.
+    """
+    query = _filtrar_por_rol(_query_resumen(db), current_user, assigned_to_me)
+    if estado:
+        query = query.filter(PQRS.estado == estado)
+    return _paginar_resumen(db, query, cursor, limit, con_total)
+
+@router.get("/mis-pqrs/paginado", response_model=PQRSPagina)
+async def get_mis_pqrs_paginado(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    con_total: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """PQRS del ciudadano autenticado, paginadas por cursor"""
+    if current_user.role != UserRole.CIUDADANO:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Este endpoint es solo para ciudadanos"
+        )
+    
+    query = _query_resumen(db, con_entidad=True).filter(
+        (PQRS.created_by_id == current_user.id) |
+        (PQRS.email_ciudadano == current_user.email)
+    )
+    return _paginar_resumen(db, query, cursor, limit, con_total)
+
 @router.get("/next-radicado", response_model=dict)
 async def get_next_radicado(
     db: Session = Depends(get_db),
@@ -328,7 +458,7 @@ async def get_next_radicado(
     Este es solo un preview - el radicado real se genera al crear la PQRS.
     """
     try:
-        next_radicado = generate_radicado(db, entity_id=current_user.entity_id)
+        next_radicado = preview_radicado(db, entity_id=current_user.entity_id)
         return {
             "next_radicado": next_radicado,
             "format": "YYYYMMDDNNN",
@@ -343,26 +473,35 @@ async def get_next_radicado(
 
 @router.get("/informes", response_model=list)
 async def listar_informes_pqrs(
+    incluir_en_curso: bool = Query(False, description="Incluir informes en cola, en generación o fallidos"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Lista todos los informes PQRS generados para la entidad del usuario.
-    Solo muestra informes no expirados (últimos 7 días).
+    Solo muestra informes no expirados (últimos 7 días). Con incluir_en_curso
+    también lista los solicitados en modo asíncrono que aún no terminan o fallaron.
     """
     if current_user.role not in [UserRole.ADMIN, UserRole.SUPERADMIN]:
         raise HTTPException(status_code=403, detail="No tienes permisos para ver informes")
 
-    from datetime import timezone
+    from datetime import timezone, timedelta
+    from sqlalchemy import and_, or_
     ahora = datetime.now(timezone.utc).replace(tzinfo=None)
 
+    vigentes = and_(InformeEstado.estado == 'completed', InformeEstado.expires_at > ahora)
+    if incluir_en_curso:
+        vigentes = or_(vigentes, and_(
+            InformeEstado.estado.in_(('pending', 'processing', 'failed')),
+            InformeEstado.created_at > ahora - timedelta(days=7)
+        ))
+
     informes = (
         db.query(InformeEstado)
         .filter(
             InformeEstado.entity_id == current_user.entity_id,
             InformeEstado.tipo == 'pqrs',
-            InformeEstado.estado == 'completed',
-            InformeEstado.expires_at > ahora
+            vigentes
         )
         .order_by(InformeEstado.created_at.desc())
         .limit(50)
@@ -389,6 +528,9 @@ async def listar_informes_pqrs(
 
         result.append({
             "id": inf.id,
+            "estado": inf.estado,
+            "progreso": inf.progreso,
+            "error_message": inf.error_message if inf.estado == 'failed' else None,
             "filename": inf.filename,
             "fecha_inicio": inf.fecha_inicio,
             "fecha_fin": inf.fecha_fin,
@@ -404,6 +546,56 @@ async def listar_informes_pqrs(
 
     return result
 
+@router.get("/informes/{informe_id}", response_model=dict)
+async def consultar_estado_informe_pqrs(
+    informe_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Estado de un informe PQRS solicitado en modo asíncrono.
+    Estados: pending, processing, completed, failed.
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.SUPERADMIN]:
+        raise HTTPException(status_code=403, detail="No tienes permisos para ver informes")
+
+    informe = db.query(InformeEstado).filter(
+        InformeEstado.id == informe_id,
+        InformeEstado.entity_id == current_user.entity_id,
+        InformeEstado.tipo == 'pqrs'
+    ).first()
+    if not informe:
+        raise HTTPException(status_code=404, detail="Informe no encontrado")
+
+    download_url = None
+    if informe.estado == 'completed' and informe.s3_key:
+        try:
+            download_url = s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': S3_BUCKET, 'Key': informe.s3_key},
+                ExpiresIn=604800
+            )
+        except Exception:
+            download_url = informe.s3_url
+
+    return {
+        "informe_id": informe.id,
+        "estado": informe.estado,
+        "progreso": informe.progreso,
+        "fecha_inicio": informe.fecha_inicio,
+        "fecha_fin": informe.fecha_fin,
+        "total_pqrs": informe.total_pqrs,
+        "tasa_resolucion": informe.tasa_resolucion,
+        "used_ai": informe.used_ai,
+        "filename": informe.filename,
+        "file_size_mb": round((informe.file_size or 0) / (1024 * 1024), 2),
+        "download_url": download_url,
+        "error_message": informe.error_message if informe.estado == 'failed' else None,
+        # Añadir 'Z' para indicar UTC explícitamente
+        "created_at": informe.created_at.isoformat() + 'Z' if informe.created_at else None,
+        "completed_at": informe.completed_at.isoformat() + 'Z' if informe.completed_at else None
+    }
+
 @router.get("/{pqrs_id}", response_model=PQRSWithDetails)
 async def get_pqrs_by_id(
     pqrs_id: int, 
@@ -508,14 +700,14 @@ async def update_pqrs(
         if "assigned_to_id" in update_data:
             new_assigned = update_data.get("assigned_to_id")
             if new_assigned and new_assigned != original_assigned_to_id:
-                db.add(Alert(
+                crear_alertas(
+                    db, [new_assigned],
                     entity_id=pqrs.entity_id,
-                    recipient_user_id=new_assigned,
                     type="PQRS_ASSIGNED",
                     title=f"Te asignaron la PQRS {pqrs.numero_radicado}",
                     message=f"Asunto: {pqrs.asunto}",
-                    data=json.dumps({"pqrs_id": pqrs.id}),
-                ))
+                    data={"pqrs_id": pqrs.id},
+                )
                 db.commit()
     except Exception:
         db.rollback()
@@ -590,14 +782,14 @@ async def assign_pqrs(
 
     # Crear alerta para el usuario asignado
     try:
-        db.add(Alert(
+        crear_alertas(
+            db, [payload.assigned_to_id],
             entity_id=pqrs.entity_id,
-            recipient_user_id=payload.assigned_to_id,
             type="PQRS_ASSIGNED",
             title=f"Te asignaron la PQRS {pqrs.numero_radicado}",
             message=f"Asunto: {pqrs.asunto}",
-            data=json.dumps({"pqrs_id": pqrs.id}),
-        ))
+            data={"pqrs_id": pqrs.id},
+        )
         db.commit()
     except Exception as _:
         db.rollback()
@@ -673,72 +865,71 @@ async def respond_pqrs(
     pqrs.estado = EstadoPQRS.RESUELTO
     pqrs.fecha_respuesta = datetime.utcnow()
     
-    db.commit()
-    db.refresh(pqrs)
+    # Sin email de ciudadano: no aplica seguimiento de correo.
+    # Con email: queda pendiente (None) hasta que el worker de email_outbox lo entregue.
+    pqrs.email_enviado = None
+    pqrs.email_error = None
     
-    # Enviar correo de respuesta al ciudadano si tiene email
+    # Encolar correo de respuesta al ciudadano en la misma transacción
     if pqrs.email_ciudadano:
         try:
-            # Obtener información de la entidad
-            entity = db.query(Entity).filter(Entity.id == pqrs.entity_id).first()
-            entity_name = entity.name if entity else "Sistema PQRS"
-            entity_email = entity.email if entity and entity.email else None
-            entity_slug = entity.slug if entity else "portal"
-            
-            # Generar URL pre-firmada para archivo de respuesta si existe
-            archivo_url = None
-            if pqrs.archivo_respuesta:
-                try:
-                    file_key = pqrs.archivo_respuesta.split(f"{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/")[1]
-                    archivo_url = s3_client.generate_presigned_url(
-                        'get_object',
-                        Params={'Bucket': S3_BUCKET, 'Key': file_key},
-                        ExpiresIn=604800  # 7 días en segundos
-                    )
-                    print(f"📎 URL pre-firmada generada para archivo de respuesta (válida por 7 días)")
-                except Exception as e:
-                    print(f"⚠️ Error generando URL pre-firmada: {e}")
-                    archivo_url = pqrs.archivo_respuesta
-            
-            # Enviar correo y registrar resultado
-            sent = email_service.send_pqrs_respuesta_notification(
-                to_email=pqrs.email_ciudadano,
-                numero_radicado=pqrs.numero_radicado,
-                asunto=pqrs.asunto,
-                nombre_ciudadano=pqrs.nombre_ciudadano or "Ciudadano",
-                respuesta=response_data.respuesta,
-                entity_name=entity_name,
-                entity_slug=entity_slug,
-                fecha_respuesta=format_colombia_datetime(pqrs.fecha_respuesta),
-                archivo_adjunto_url=archivo_url,
-                entity_email=entity_email
+            encolar_email(
+                db,
+                _mensaje_respuesta(db, pqrs),
+                tipo='pqrs_respuesta',
+                entity_id=pqrs.entity_id,
+                pqrs_id=pqrs.id
             )
-            if sent:
-                pqrs.email_enviado = True
-                pqrs.email_error = None
-                print(f"✅ Correo de respuesta enviado a {pqrs.email_ciudadano}")
-            else:
-                pqrs.email_enviado = False
-                pqrs.email_error = "El proveedor de correo rechazó el envío. Verifique el correo del ciudadano."
-                print(f"⚠️ El proveedor rechazó el correo a {pqrs.email_ciudadano}")
         except Exception as email_exc:
             import traceback
             pqrs.email_enviado = False
             pqrs.email_error = str(email_exc)[:500]
-            print(f"⚠️ Error enviando correo de respuesta: {email_exc}")
+            print(f"⚠️ Error preparando correo de respuesta: {email_exc}")
             print(f"Traceback completo: {traceback.format_exc()}")
-        db.commit()
-        db.refresh(pqrs)
-    else:
-        # Sin email de ciudadano: no aplica seguimiento de correo
-        pqrs.email_enviado = None
-        pqrs.email_error = None
-        db.commit()
-        db.refresh(pqrs)
+    
+    db.commit()
+    db.refresh(pqrs)
+    notificar_email_pendiente()
     
     return pqrs
 
 
+def _mensaje_respuesta(db: Session, pqrs: PQRS) -> dict:
+    """Correo de respuesta al ciudadano (kwargs de send_email) con link pre-firmado al archivo de respuesta"""
+    entity = db.query(Entity).filter(Entity.id == pqrs.entity_id).first()
+    entity_name = entity.name if entity else "Sistema PQRS"
+    entity_email = entity.email if entity and entity.email else None
+    entity_slug = entity.slug if entity else "portal"
+    
+    # Generar URL pre-firmada para archivo de respuesta si existe
+    archivo_url = None
+    if pqrs.archivo_respuesta:
+        try:
+            file_key = pqrs.archivo_respuesta.split(f"{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/")[1]
+            archivo_url = s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': S3_BUCKET, 'Key': file_key},
+                ExpiresIn=604800  # 7 días en segundos
+            )
+            print(f"📎 URL pre-firmada generada para archivo de respuesta (válida por 7 días)")
+        except Exception as e:
+            print(f"⚠️ Error generando URL pre-firmada: {e}")
+            archivo_url = pqrs.archivo_respuesta
+    
+    return email_service.build_pqrs_respuesta_message(
+        to_email=pqrs.email_ciudadano,
+        numero_radicado=pqrs.numero_radicado,
+        asunto=pqrs.asunto,
+        nombre_ciudadano=pqrs.nombre_ciudadano or "Ciudadano",
+        respuesta=pqrs.respuesta,
+        entity_name=entity_name,
+        entity_slug=entity_slug,
+        fecha_respuesta=format_colombia_datetime(pqrs.fecha_respuesta),
+        archivo_adjunto_url=archivo_url,
+        entity_email=entity_email
+    )
+
+
 @router.post("/{pqrs_id}/retry-email", response_model=dict)
 async def retry_email_pqrs(
     pqrs_id: int,
@@ -759,43 +950,21 @@ async def retry_email_pqrs(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tienes permisos para reintentar el envío")
 
     try:
-        entity = db.query(Entity).filter(Entity.id == pqrs.entity_id).first()
-        entity_name = entity.name if entity else "Sistema PQRS"
-        entity_email = entity.email if entity and entity.email else None
-        entity_slug = entity.slug if entity else "portal"
-
-        archivo_url = None
-        if pqrs.archivo_respuesta:
-            try:
-                file_key = pqrs.archivo_respuesta.split(f"{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/")[1]
-                archivo_url = s3_client.generate_presigned_url(
-                    'get_object',
-                    Params={'Bucket': S3_BUCKET, 'Key': file_key},
-                    ExpiresIn=604800
-                )
-            except Exception:
-                archivo_url = pqrs.archivo_respuesta
-
-        sent = email_service.send_pqrs_respuesta_notification(
-            to_email=pqrs.email_ciudadano,
-            numero_radicado=pqrs.numero_radicado,
-            asunto=pqrs.asunto,
-            nombre_ciudadano=pqrs.nombre_ciudadano or "Ciudadano",
-            respuesta=pqrs.respuesta,
-            entity_name=entity_name,
-            entity_slug=entity_slug,
-            fecha_respuesta=format_colombia_datetime(pqrs.fecha_respuesta),
-            archivo_adjunto_url=archivo_url,
-            entity_email=entity_email
+        encolar_email(
+            db,
+            _mensaje_respuesta(db, pqrs),
+            tipo='pqrs_respuesta',
+            entity_id=pqrs.entity_id,
+            pqrs_id=pqrs.id
         )
-        pqrs.email_enviado = sent
-        pqrs.email_error = None if sent else "Reintento fallido. Verifique el correo del ciudadano."
+        # Pendiente hasta que el worker de email_outbox informe el resultado
+        pqrs.email_enviado = None
+        pqrs.email_error = None
         db.commit()
-        return {"success": sent, "message": "Correo enviado exitosamente" if sent else "Error al reenviar el correo"}
+        notificar_email_pendiente()
+        return {"success": True, "message": "Correo encolado para reenvío"}
     except Exception as e:
-        pqrs.email_enviado = False
-        pqrs.email_error = str(e)[:500]
-        db.commit()
+        db.rollback()
         return {"success": False, "message": f"Error al reenviar: {str(e)[:200]}"}
 
 @router.delete("/{pqrs_id}")
@@ -935,9 +1104,8 @@ async def upload_archivo_pqrs(
         file_url = f"https://{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/{file_key}"
         archivo_adjunto_previo = pqrs.archivo_adjunto  # guardar antes de actualizar
         pqrs.archivo_adjunto = file_url
-        db.commit()
 
-        # Si es el primer archivo adjunto en una PQRS PENDIENTE con email, enviar el correo con el link
+        # Si es el primer archivo adjunto en una PQRS PENDIENTE con email, encolar el correo con el link
         if archivo_adjunto_previo is None and pqrs.estado == EstadoPQRS.PENDIENTE and pqrs.email_ciudadano:
             try:
                 entity = db.query(Entity).filter(Entity.id == pqrs.entity_id).first()
@@ -949,7 +1117,7 @@ async def upload_archivo_pqrs(
                     Params={'Bucket': S3_BUCKET, 'Key': file_key},
                     ExpiresIn=604800  # 7 días
                 )
-                email_service.send_pqrs_radicada_notification(
+                mensaje = email_service.build_pqrs_radicada_message(
                     to_email=pqrs.email_ciudadano,
                     numero_radicado=pqrs.numero_radicado,
                     tipo_solicitud=pqrs.tipo_solicitud.value,
@@ -961,12 +1129,15 @@ async def upload_archivo_pqrs(
                     archivo_adjunto_url=archivo_adjunto_url,
                     entity_email=entity_email
                 )
-                print(f"✅ Correo de radicación (con adjunto) enviado a {pqrs.email_ciudadano}")
+                encolar_email(db, mensaje, tipo='pqrs_radicada', entity_id=pqrs.entity_id, pqrs_id=pqrs.id)
             except Exception as email_error:
                 import traceback
-                print(f"⚠️ Error enviando correo con adjunto: {email_error}")
+                print(f"⚠️ Error preparando correo con adjunto: {email_error}")
                 print(f"Traceback completo: {traceback.format_exc()}")
 
+        db.commit()
+        notificar_email_pendiente()
+
         return {
             "message": "Archivo subido exitosamente",
             "archivo_url": file_url,
@@ -1231,88 +1402,29 @@ async def generar_informe_pdf(
                 detail="Formato de fecha inválido. Use YYYY-MM-DD"
             )
         
-        # Construir query de PQRS
-        query = db.query(PQRS).filter(
-            PQRS.entity_id == current_user.entity_id,
-            PQRS.fecha_solicitud >= fecha_inicio_dt,
-            PQRS.fecha_solicitud <= fecha_fin_dt
+        # Indicadores agregados en la BD (GROUP BY) y solo las PQRS del detalle
+        from app.services.pqrs_analytics import calcular_analytics, listar_recientes
+        from app.services.informe_pqrs_service import analisis_por_defecto
+        filtros_informe = dict(
+            entity_id=current_user.entity_id,
+            fecha_inicio=fecha_inicio_dt,
+            fecha_fin=fecha_fin_dt,
+            estado=request.estado,
+            tipo=request.tipo
         )
+        analytics = calcular_analytics(db, **filtros_informe)
+        total = analytics['totalPqrs']
         
-        # Aplicar filtros opcionales
-        if request.estado:
-            query = query.filter(PQRS.estado == request.estado)
-        if request.tipo:
-            query = query.filter(PQRS.tipo_solicitud == request.tipo)
-        
-        # Obtener PQRS
-        pqrs_query_result = query.order_by(PQRS.fecha_solicitud.desc()).all()
-        
-        if not pqrs_query_result:
+        if not total:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No se encontraron PQRS en el rango de fechas seleccionado"
             )
         
-        print(f"✅ PQRS encontradas: {len(pqrs_query_result)}")
+        print(f"✅ PQRS encontradas: {total}")
         
-        # Convertir a diccionarios para el generador
-        pqrs_list = []
-        for pqrs in pqrs_query_result:
-            # Calcular días de respuesta si existe fecha_respuesta
-            dias_respuesta = None
-            if pqrs.fecha_respuesta and pqrs.fecha_solicitud:
-                dias_respuesta = (pqrs.fecha_respuesta - pqrs.fecha_solicitud).days
-            
-            pqrs_dict = {
-                'id': pqrs.id,
-                'numero_radicado': pqrs.numero_radicado,
-                'tipo_solicitud': pqrs.tipo_solicitud.value if hasattr(pqrs.tipo_solicitud, 'value') else str(pqrs.tipo_solicitud),
-                'estado': pqrs.estado.value if hasattr(pqrs.estado, 'value') else str(pqrs.estado),
-                'fecha_solicitud': pqrs.fecha_solicitud.isoformat() if pqrs.fecha_solicitud else None,
-                'fecha_respuesta': pqrs.fecha_respuesta.isoformat() if pqrs.fecha_respuesta else None,
-                'dias_respuesta': dias_respuesta,
-                'asunto': pqrs.asunto,
-                'assigned_to': {
-                    'full_name': pqrs.assigned_to.full_name
-                } if pqrs.assigned_to else None
-            }
-            pqrs_list.append(pqrs_dict)
-        
-        # Calcular analytics
-        total = len(pqrs_list)
-        pendientes = len([p for p in pqrs_list if p['estado'] == 'pendiente'])
-        en_proceso = len([p for p in pqrs_list if p['estado'] == 'en_proceso'])
-        resueltas = len([p for p in pqrs_list if p['estado'] == 'resuelto'])
-        cerradas = len([p for p in pqrs_list if p['estado'] == 'cerrado'])
-        
-        # Tipos de PQRS
-        tipos_pqrs = {}
-        for pqrs in pqrs_list:
-            tipo = pqrs['tipo_solicitud']
-            tipos_pqrs[tipo] = tipos_pqrs.get(tipo, 0) + 1
-        
-        # Tiempo promedio de respuesta
-        pqrs_con_respuesta = [p for p in pqrs_list if p['fecha_respuesta']]
-        tiempo_promedio = 0
-        if pqrs_con_respuesta:
-            tiempos = []
-            for p in pqrs_con_respuesta:
-                inicio = datetime.fromisoformat(p['fecha_solicitud'])
-                fin = datetime.fromisoformat(p['fecha_respuesta'])
-                dias = (fin - inicio).days
-                tiempos.append(dias)
-            tiempo_promedio = round(sum(tiempos) / len(tiempos))
-        
-        analytics = {
-            'totalPqrs': total,
-            'pendientes': pendientes,
-            'enProceso': en_proceso,
-            'resueltas': resueltas,
-            'cerradas': cerradas,
-            'tasaResolucion': round(((resueltas + cerradas) / total * 100), 1) if total > 0 else 0,
-            'tiempoPromedioRespuesta': tiempo_promedio,
-            'tiposPqrs': tipos_pqrs
-        }
+        # Detalle para el generador (tabla de PQRS recientes)
+        pqrs_list = listar_recientes(db, **filtros_informe)
         
         logger.info(f"📈 Analytics calculadas: {analytics['totalPqrs']} total, {analytics['tasaResolucion']}% resolución")
         
@@ -1328,7 +1440,7 @@ async def generar_informe_pdf(
                 from app.services.openai_ai_service import get_openai_service
                 
                 openai_service = get_openai_service()
-                ai_analysis = openai_service.analizar_pqrs(
+                ai_analysis = await openai_service.analizar_pqrs(
                     analytics=analytics,
                     entity_name=entity.name,
                     fecha_inicio=request.fecha_inicio,
@@ -1345,87 +1457,10 @@ async def generar_informe_pdf(
                 ai_analysis = None
         
         # Si no hay IA o falló, usar análisis por defecto
+        usado_ia = ai_analysis is not None
         if not ai_analysis:
             logger.warning(f"⚠️ Usando análisis por defecto (IA no disponible)")
-            
-            # Calcular métricas adicionales para análisis más rico
-            tipos_ordenados = sorted(analytics['tiposPqrs'].items(), key=lambda x: x[1], reverse=True)
-            tipo_principal = tipos_ordenados[0] if tipos_ordenados else ('N/A', 0)
-            
-            ai_analysis = {
-                'introduccion': (
-                    f"El presente informe corresponde a la gestión de Peticiones, Quejas, Reclamos, Solicitudes y Denuncias (PQRS) "
-                    f"del {entity.name} durante el período comprendido entre {request.fecha_inicio} y {request.fecha_fin}. "
-                    f"Durante este período se registró un total de {total} solicitudes ciudadanas, las cuales han sido atendidas "
-                    f"a través de los diferentes canales de atención dispuestos por la entidad. "
-                    f"Este informe presenta un análisis detallado de los indicadores de gestión, tiempos de respuesta, "
-                    f"distribución por tipo y estado, así como recomendaciones orientadas a la mejora continua del servicio. "
-                    f"La gestión de PQRS constituye un mecanismo fundamental para garantizar el derecho fundamental de petición "
-                    f"consagrado en la Constitución Política y desarrollado en la Ley 1755 de 2015."
-                ),
-                'analisisGeneral': (
-                    f"Durante el período analizado se registraron {total} PQRS, alcanzando una tasa de resolución del "
-                    f"{analytics['tasaResolucion']:.1f}%, lo que refleja un desempeño "
-                    f"{'satisfactorio y acorde con los estándares de calidad esperados' if analytics['tasaResolucion'] >= 70 else 'que requiere fortalecimiento para alcanzar niveles óptimos de gestión'}. "
-                    f"Del total de solicitudes, {pendientes} se encuentran pendientes, {en_proceso} en proceso de atención, "
-                    f"{resueltas} han sido resueltas satisfactoriamente y {cerradas} fueron cerradas. "
-                    f"Estos indicadores permiten evidenciar el compromiso institucional con la atención oportuna y eficaz de las "
-                    f"solicitudes ciudadanas. La distribución por estado refleja el flujo operativo del proceso de gestión de PQRS "
-                    f"y permite identificar las etapas que requieren mayor atención o recursos. Es fundamental mantener un equilibrio "
-                    f"adecuado entre las solicitudes en proceso y las resueltas para garantizar tiempos de respuesta óptimos. "
-                    f"La gestión eficiente de PQRS no solo cumple con el marco normativo vigente, sino que además fortalece "
-                    f"la confianza ciudadana en las instituciones públicas."
-                ),
-                'analisisTendencias': (
-                    f"El análisis del período muestra un total de {total} solicitudes distribuidas en {len(analytics['tiposPqrs'])} "
-                    f"tipos diferentes de PQRS. El tipo de solicitud más frecuente corresponde a "
-                    f"{tipo_principal[0].replace('_', ' ').title()} con {tipo_principal[1]} casos, representando el "
-                    f"{(tipo_principal[1]/total*100):.1f}% del total. Esta distribución permite identificar las principales "
-                    f"necesidades y preocupaciones de la ciudadanía, orientando la toma de decisiones institucionales. "
-                    f"Los tipos más frecuentes reflejan las prioridades y problemáticas que requieren atención por parte de la entidad. "
-                    f"Es importante analizar si estos patrones son consistentes con períodos anteriores o si representan nuevas "
-                    f"tendencias que requieran respuestas específicas. El comportamiento temporal de las solicitudes permite "
-                    f"identificar posibles estacionalidades o eventos específicos que incrementan la demanda en determinados momentos. "
-                    f"Este análisis debe orientar la planificación de recursos humanos y técnicos para garantizar una atención "
-                    f"oportuna y de calidad en todo momento."
-                ),
-                'analisisTiempos': (
-                    f"El tiempo promedio de respuesta registrado durante el período fue de {tiempo_promedio:.1f} días. "
-                    f"De acuerdo con la Ley 1755 de 2015, el término legal general para responder PQRS es de 15 días hábiles, "
-                    f"pudiendo prorrogarse por 10 días más cuando existan circunstancias excepcionales debidamente justificadas. "
-                    f"{'El tiempo promedio se encuentra dentro de los parámetros legales establecidos, lo que evidencia el cumplimiento normativo de la entidad' if tiempo_promedio <= 15 else 'Se recomienda implementar acciones de mejora para optimizar los tiempos de respuesta y garantizar el cumplimiento de los plazos legales establecidos'}. "
-                    f"Los tiempos de respuesta constituyen un indicador crítico de la eficiencia operativa y del compromiso "
-                    f"institucional con la satisfacción ciudadana. Es fundamental mantener un monitoreo constante de este indicador "
-                    f"e identificar oportunamente aquellos casos que puedan estar próximos al vencimiento de términos. "
-                    f"La implementación de alertas tempranas y la asignación eficiente de responsables son estrategias clave "
-                    f"para mantener y mejorar los tiempos de respuesta. Adicionalmente, es importante analizar las causas "
-                    f"de demoras cuando estas se presenten, con el fin de implementar acciones correctivas específicas."
-                ),
-                'recomendaciones': [
-                    "FORTALECIMIENTO DEL SEGUIMIENTO: Implementar un sistema de seguimiento periódico y automatizado de las PQRS para garantizar el cumplimiento de términos legales establecidos en la Ley 1755 de 2015. Este sistema debe incluir alertas tempranas para casos próximos al vencimiento, asignación clara de responsables y mecanismos de escalamiento cuando sea necesario. El seguimiento debe ser documentado y reportado mensualmente a la alta dirección.",
-                    
-                    "OPTIMIZACIÓN DE PROCESOS: Realizar una revisión exhaustiva de los procesos internos de gestión de PQRS con el objetivo de identificar cuellos de botella, tiempos muertos y actividades redundantes. Implementar mejoras basadas en principios de eficiencia operativa, simplificación de trámites y automatización de tareas repetitivas. Esta optimización debe buscar reducir los tiempos de respuesta sin comprometer la calidad de las mismas.",
-                    
-                    "FORTALECIMIENTO DE CANALES: Ampliar y fortalecer los canales de atención ciudadana (presencial, virtual, telefónico y escrito) para mejorar la accesibilidad al sistema de PQRS. Garantizar que todos los canales cuenten con personal capacitado, infraestructura tecnológica adecuada y procedimientos estandarizados. Implementar mecanismos de medición de satisfacción ciudadana en cada canal de atención.",
-                    
-                    "SISTEMA DE INDICADORES: Desarrollar e implementar un tablero integral de indicadores de gestión que permita el monitoreo continuo y en tiempo real del proceso de PQRS. Este debe incluir métricas de volumen, tiempos de respuesta, tasas de resolución, satisfacción ciudadana y cumplimiento normativo. Los indicadores deben ser revisados periódicamente en comités de gestión y desempeño.",
-                    
-                    "CAPACITACIÓN Y CULTURA: Diseñar e implementar un programa permanente de capacitación para funcionarios y contratistas sobre la normativa vigente (Ley 1755/2015, Decreto 1166/2016, Resolución 001519/2020) y mejores prácticas en atención ciudadana. Fomentar una cultura institucional orientada al servicio, la transparencia y el respeto por los derechos de los ciudadanos. La capacitación debe ser continua y evaluada en su efectividad."
-                ],
-                'conclusiones': (
-                    f"La gestión de PQRS del {entity.name} durante el período analizado demuestra el compromiso institucional "
-                    f"con la atención oportuna y eficaz de las solicitudes ciudadanas. Con un total de {total} PQRS gestionadas "
-                    f"y una tasa de resolución del {analytics['tasaResolucion']:.1f}%, se evidencia un sistema funcional que "
-                    f"responde a las necesidades de los ciudadanos. Sin embargo, como en todo proceso de mejora continua, existen "
-                    f"oportunidades de fortalecimiento que han sido identificadas en este análisis. "
-                    f"Es fundamental mantener el enfoque en la calidad de las respuestas, no solo en su oportunidad, garantizando "
-                    f"que cada solicitud reciba una atención integral que resuelva efectivamente la situación planteada. "
-                    f"La implementación de las recomendaciones formuladas permitirá elevar los estándares de gestión y consolidar "
-                    f"un sistema de PQRS que sea referente de buenas prácticas en la administración pública. "
-                    f"Se recomienda continuar con el monitoreo constante de los indicadores y la evaluación periódica del proceso, "
-                    f"así como la socialización de resultados con todos los actores involucrados."
-                )
-            }
+            ai_analysis = analisis_por_defecto(entity.name, request.fecha_inicio, request.fecha_fin, analytics)
         
         # Generar PDF en executor (no bloquea el event loop)
         print(f"📄 Generando PDF...")
@@ -1515,7 +1550,7 @@ async def generar_informe_pdf(
             fecha_fin=request.fecha_fin,
             total_pqrs=total,
             tasa_resolucion=int(analytics['tasaResolucion']),
-            used_ai=(ai_analysis is not None),
+            used_ai=usado_ia,
             started_at=datetime.utcnow(),
             completed_at=datetime.utcnow(),
             expires_at=expires_at
@@ -1535,7 +1570,7 @@ async def generar_informe_pdf(
             "tasa_resolucion": analytics['tasaResolucion'],
             "expires_in_days": 7,
             "used_template": entity.pdf_template_url is not None,
-            "used_ai": ai_analysis is not None
+            "used_ai": usado_ia
         }
         
     except HTTPException:
@@ -1550,3 +1585,60 @@ async def generar_informe_pdf(
         )
 
 
+
+
+@router.post("/generar-informe-pdf/async", response_model=dict)
+async def generar_informe_pdf_async(
+    request: GenerarInformeRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Encola la generación del informe PDF de PQRS (mismo contenido que
+    /generar-informe-pdf) y responde de inmediato.
+    
+    El worker de informes construye el PDF, lo sube a S3 y crea una alerta
+    INFORME_PQRS_READY. El estado se consulta en /pqrs/informes/{informe_id}
+    y el informe aparece en /pqrs/informes al completarse.
+    
+    Permisos: Admin y Superadmin
+    """
+    if current_user.role not in [UserRole.ADMIN, UserRole.SUPERADMIN]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permisos para generar informes"
+        )
+    
+    try:
+        datetime.strptime(request.fecha_inicio, '%Y-%m-%d')
+        datetime.strptime(request.fecha_fin, '%Y-%m-%d')
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Formato de fecha inválido. Use YYYY-MM-DD"
+        )
+    
+    from app.services.informe_pqrs_service import informe_pqrs_service
+    
+    informe = informe_pqrs_service.iniciar_generacion(
+        db=db,
+        entity_id=current_user.entity_id,
+        user_id=current_user.id,
+        fecha_inicio=request.fecha_inicio,
+        fecha_fin=request.fecha_fin,
+        filtros={
+            'estado': request.estado,
+            'tipo': request.tipo,
+            'usar_ia': request.usar_ia,
+            'usuario_firmante_id': request.usuario_firmante_id
+        }
+    )
+    
+    print(f"✅ Informe PQRS {informe.id} solicitado por {current_user.username} ({request.fecha_inicio} - {request.fecha_fin})")
+    
+    return {
+        "informe_id": informe.id,
+        "estado": informe.estado,
+        "progreso": informe.progreso,
+        "mensaje": "Tu informe de PQRS se está generando. Recibirás una notificación cuando esté listo."
+    }
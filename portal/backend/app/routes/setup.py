@@ -13,6 +13,16 @@ from app.models.secretaria import Secretaria
 from passlib.context import CryptContext
 from app.utils.migration_005 import run_migration_005
 from app.utils.migration_006 import run_migration_006
+from app.utils.migration_009_pdm_avance import run_migration_009
+from app.utils.migration_010_informes_cola import run_migration_010
+from app.utils.migration_011_informes_dedup import run_migration_011
+from app.utils.migration_012_evidencias_s3 import iniciar_migration_012_background, obtener_progreso as progreso_migration_012
+from app.utils.migration_013_email_outbox import run_migration_013
+from app.utils.migration_014_radicado_secuencias import run_migration_014
+from app.utils.migration_015_alertas_entidad import run_migration_015
+from app.utils.migration_016_alertas_indices import run_migration_016
+from app.utils.migration_017_indices_consultas import run_migration_017
+from app.utils.auditoria_planes import auditar_planes
 
 router = APIRouter(prefix="/setup", tags=["Setup"])
 
@@ -242,6 +252,182 @@ async def execute_migration_006():
             detail=f"Error ejecutando migración 006: {str(e)}"
         )
 
+@router.post("/run-migration-009")
+async def execute_migration_009():
+    """
+    Ejecuta la migración 009 para crear y llenar la tabla pdm_producto_avance.
+    """
+    try:
+        result = run_migration_009()
+        return {
+            "status": "success",
+            **result
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error ejecutando migración 009: {str(e)}"
+        )
+
+@router.post("/run-migration-010")
+async def execute_migration_010():
+    """
+    Ejecuta la migración 010 para agregar las columnas de la cola de informes.
+    """
+    try:
+        result = run_migration_010()
+        return {
+            "status": "success",
+            **result
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error ejecutando migración 010: {str(e)}"
+        )
+
+@router.post("/run-migration-011")
+async def execute_migration_011():
+    """
+    Ejecuta la migración 011 para agregar las columnas de deduplicación de informes.
+    """
+    try:
+        result = run_migration_011()
+        return {
+            "status": "success",
+            **result
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error ejecutando migración 011: {str(e)}"
+        )
+
+@router.post("/run-migration-012")
+async def execute_migration_012(batch_size: int = 20, pausa_segundos: float = 1.0):
+    """
+    Inicia en background la migración 012 (imágenes Base64 de evidencias → S3).
+    Es reanudable: si se interrumpe, volver a ejecutarla continúa donde quedó.
+    """
+    if batch_size < 1 or batch_size > 500 or pausa_segundos < 0:
+        raise HTTPException(status_code=400, detail="Parámetros de lote/pausa inválidos")
+
+    iniciada = iniciar_migration_012_background(batch_size, pausa_segundos)
+    return {
+        "status": "started" if iniciada else "running",
+        "message": "Migración 012 iniciada" if iniciada else "La migración 012 ya está en curso",
+        "progreso": progreso_migration_012()
+    }
+
+@router.get("/migration-012/progreso")
+async def get_progreso_migration_012():
+    """Progreso de la migración 012 en este proceso"""
+    return progreso_migration_012()
+
+@router.post("/run-migration-013")
+async def execute_migration_013():
+    """
+    Ejecuta la migración 013 para crear la bandeja de salida de correos.
+    """
+    try:
+        result = run_migration_013()
+        return {
+            "status": "success",
+            **result
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error ejecutando migración 013: {str(e)}"
+        )
+
+@router.post("/run-migration-014")
+async def execute_migration_014():
+    """
+    Ejecuta la migración 014 para crear la tabla de consecutivos de radicado.
+    """
+    try:
+        result = run_migration_014()
+        return {
+            "status": "success",
+            **result
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error ejecutando migración 014: {str(e)}"
+        )
+
+@router.post("/run-migration-015")
+async def execute_migration_015():
+    """
+    Ejecuta la migración 015 para alertas de entidad con lectura por usuario.
+    """
+    try:
+        result = run_migration_015()
+        return {
+            "status": "success",
+            **result
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error ejecutando migración 015: {str(e)}"
+        )
+
+@router.post("/run-migration-016")
+async def execute_migration_016():
+    """
+    Ejecuta la migración 016 para crear los índices compuestos de alertas.
+    """
+    try:
+        result = run_migration_016()
+        return {
+            "status": "success",
+            **result
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error ejecutando migración 016: {str(e)}"
+        )
+
+@router.post("/run-migration-017")
+async def execute_migration_017():
+    """
+    Ejecuta la migración 017 para crear los índices de consultas frecuentes
+    (PQRS, auditoría de asignaciones, asistencia y correspondencia).
+    """
+    try:
+        result = run_migration_017()
+        return {
+            "status": "success",
+            **result
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error ejecutando migración 017: {str(e)}"
+        )
+
+@router.get("/auditar-planes")
+async def auditar_planes_consultas():
+    """
+    Revisa con EXPLAIN que las consultas frecuentes usen índices.
+    status "error" si alguna recorre la tabla completa.
+    """
+    try:
+        result = auditar_planes()
+        return {
+            "status": "success" if result["ok"] else "error",
+            **result
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error auditando planes de consulta: {str(e)}"
+        )
+
 @router.get("/check-database")
 async def check_database_status(db: Session = Depends(get_db)):
     """
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, model_validator, field_validator
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from app.models.pqrs import TipoSolicitud, EstadoPQRS, TipoIdentificacion, MedioRespuesta, CanalLlegada, TipoPersona, Genero
 import re
@@ -158,4 +158,31 @@ class PQRS(PQRSBase):
 
 class PQRSWithDetails(PQRS):
     created_by: Optional[dict] = None
-    assigned_to: Optional[dict] = None
\ No newline at end of file
+    assigned_to: Optional[dict] = None
+
+
+class PQRSResumen(BaseModel):
+    """Proyección liviana para listados (bandeja de PQRS, portal ciudadano)"""
+    id: int
+    numero_radicado: str
+    tipo_solicitud: TipoSolicitud
+    estado: EstadoPQRS
+    canal_llegada: Optional[CanalLlegada] = None
+    tipo_identificacion: Optional[TipoIdentificacion] = None
+    asunto: Optional[str] = None
+    nombre_ciudadano: Optional[str] = None
+    fecha_solicitud: Optional[datetime] = None
+    fecha_respuesta: Optional[datetime] = None
+    dias_respuesta: Optional[int] = None
+    email_enviado: Optional[bool] = None
+    entity_id: int
+    assigned_to_id: Optional[int] = None
+    assigned_to: Optional[dict] = None
+    entity: Optional[dict] = None
+    created_at: datetime
+
+
+class PQRSPagina(BaseModel):
+    items: List[PQRSResumen]
+    next_cursor: Optional[str] = None  # None = no hay más páginas
+    total_estimado: Optional[int] = None  # Solo si se pidió con_total en la primera página
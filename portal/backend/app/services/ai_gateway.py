@@ -0,0 +1,320 @@
+"""
+Gateway async para llamadas a modelos de IA (OpenAI, Bedrock y stub local).
+
+Todas las llamadas corren en un event loop propio del gateway (un hilo
+daemon), así lo comparten los handlers async de FastAPI y el código síncrono
+que corre en threads (generadores de informes):
+
+    resp = await ai_gateway.completar(mensajes, max_tokens=500)        # async
+    resp = ai_gateway.completar_sync(mensajes, max_tokens=500)         # threads
+
+- Un solo cliente AsyncOpenAI con pool de conexiones (límites de UPSTREAMS['openai']).
+- Bedrock: boto3 es bloqueante; invoke_model corre en el pool de threads del
+  loop del gateway, sin bloquear a quien llama.
+- Concurrencia acotada por backend (AI_MAX_CONCURRENCIA) y timeout por llamada.
+- Backend 'stub' (AI_BACKEND=stub): respuesta determinista sin red, para
+  pruebas y desarrollo local.
+- Caché de resultados opcional (cache='<caso>' de CACHE_CONFIGS): la clave es
+  el hash de backend, modelo, parámetros y mensajes normalizados, así el mismo
+  informe regenerado no vuelve a pagar tokens. Los aciertos se registran como
+  ahorro en CostAnalyzer.
+
+Cada respuesta es un dict: texto, backend, modelo, prompt_tokens,
+completion_tokens, total_tokens, cache (True si vino del caché).
+"""
+import asyncio
+import hashlib
+import json
+import re
+import threading
+from typing import Any, Awaitable, Dict, List, Optional
+
+from app.config.settings import settings
+from app.utils.cache_manager import cache_manager, CACHE_CONFIGS
+from app.utils.http_clients import UPSTREAMS, crear_async_client
+from app.utils.openai_logger import CostAnalyzer
+
+
+MODELOS_DEFECTO = {
+    "openai": "gpt-4o-mini",
+    "bedrock": "us.anthropic.claude-3-haiku-20240307-v1:0",
+    "stub": "stub-1",
+}
+
+
+def clave_semantica(
+    prefijo: str,
+    backend: str,
+    model: str,
+    mensajes: List[Dict[str, str]],
+    max_tokens: int,
+    temperature: float
+) -> str:
+    """
+    Clave de caché de una llamada: mismo modelo, parámetros y contenido
+    (espacios normalizados) → misma clave.
+    """
+    canonico = json.dumps({
+        "backend": backend,
+        "model": model,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "mensajes": [
+            {"role": m["role"], "content": " ".join(m["content"].split())}
+            for m in mensajes
+        ],
+    }, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return f"{prefijo}:{hashlib.sha256(canonico.encode('utf-8')).hexdigest()}"
+
+
+class AIGateway:
+    """Cliente único de IA con su propio event loop"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._semaforos: Dict[str, asyncio.Semaphore] = {}
+        self._en_vuelo: Dict[str, asyncio.Future] = {}
+        self._openai = None
+        self._http_openai = None
+        self._bedrock = None
+
+    # ------------------------------------------------------------------ loop
+
+    def _asegurar_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._hilo = threading.Thread(target=self._loop.run_forever, daemon=True, name="ai-gateway")
+                self._hilo.start()
+            return self._loop
+
+    def _enviar(self, coro: Awaitable) -> "asyncio.Future":
+        return asyncio.run_coroutine_threadsafe(coro, self._asegurar_loop())
+
+    def ejecutar_sync(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """Ejecuta una corrutina en el loop del gateway y espera el resultado (desde threads)"""
+        return self._enviar(coro).result(timeout)
+
+    async def ejecutar(self, coro: Awaitable) -> Any:
+        """Ejecuta una corrutina en el loop del gateway desde otro event loop"""
+        return await asyncio.wrap_future(self._enviar(coro))
+
+    # ------------------------------------------------------------------ API
+
+    async def completar(self, mensajes: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        """
+        Completar un chat.
+
+        Args:
+            mensajes: [{"role": "system"|"user"|"assistant", "content": str}]
+            backend: 'openai', 'bedrock' o 'stub' (defecto settings.ai_backend); debe
+                coincidir con el proveedor del model indicado
+            model, max_tokens, temperature, timeout
+            cache: caso de CACHE_CONFIGS para reutilizar el resultado (opcional)
+        """
+        return await self.ejecutar(self._completar(mensajes, **kwargs))
+
+    def completar_sync(self, mensajes: List[Dict[str, str]], **kwargs) -> Dict[str, Any]:
+        """Versión bloqueante de completar() para código que corre en threads"""
+        return self.ejecutar_sync(self._completar(mensajes, **kwargs))
+
+    async def _completar(
+        self,
+        mensajes: List[Dict[str, str]],
+        backend: Optional[str] = None,
+        model: Optional[str] = None,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        timeout: Optional[float] = None,
+        cache: Optional[str] = None
+    ) -> Dict[str, Any]:
+        # AI_BACKEND=stub fuerza el stub en todas las llamadas
+        if settings.ai_backend == "stub":
+            backend = "stub"
+        backend = backend or settings.ai_backend or "openai"
+        model = model or MODELOS_DEFECTO[backend]
+        llamada = {
+            "openai": self._openai_chat,
+            "bedrock": self._bedrock_chat,
+            "stub": self._stub_chat,
+        }[backend]
+
+        async def _llamar() -> Dict[str, Any]:
+            async with self._semaforo(backend):
+                resp = await asyncio.wait_for(
+                    llamada(mensajes, model, max_tokens, temperature),
+                    timeout=timeout or settings.ai_timeout_segundos
+                )
+            return {**resp, "cache": False}
+
+        if not cache:
+            return await _llamar()
+        config = CACHE_CONFIGS[cache]
+        key = clave_semantica(config["prefix"], backend, model, mensajes, max_tokens, temperature)
+        return await self._con_cache(key, config["ttl"], _llamar)
+
+    async def _con_cache(self, key: str, ttl_seconds: int, llamar) -> Dict[str, Any]:
+        """Resultado cacheado o una sola llamada al modelo por clave (single-flight)"""
+        loop = asyncio.get_running_loop()
+        # CacheManager síncrono: el pool async de Redis pertenece al loop de la app
+        guardado = await loop.run_in_executor(None, cache_manager.get, key)
+        if isinstance(guardado, dict) and guardado.get("texto"):
+            ahorro = CostAnalyzer.registrar_cache_hit(
+                guardado["modelo"], guardado["prompt_tokens"], guardado["completion_tokens"]
+            )
+            print(f"📦 IA desde caché ({guardado['modelo']}): {guardado['total_tokens']} tokens, "
+                  f"${ahorro['total_cost']:.6f} ahorrados")
+            return {**guardado, "cache": True}
+
+        tarea = self._en_vuelo.get(key)
+        if tarea is None:
+            tarea = asyncio.ensure_future(self._llamar_y_guardar(key, ttl_seconds, llamar))
+            self._en_vuelo[key] = tarea
+
+            def _fin(t: asyncio.Future):
+                self._en_vuelo.pop(key, None)
+                # Marcar la excepción como recuperada aunque nadie la espere
+                if not t.cancelled():
+                    t.exception()
+
+            tarea.add_done_callback(_fin)
+        return await asyncio.shield(tarea)
+
+    async def _llamar_y_guardar(self, key: str, ttl_seconds: int, llamar) -> Dict[str, Any]:
+        resp = await llamar()
+        if resp["texto"]:
+            await asyncio.get_running_loop().run_in_executor(
+                None, cache_manager.set, key, {k: v for k, v in resp.items() if k != "cache"}, ttl_seconds
+            )
+        return resp
+
+    def _semaforo(self, backend: str) -> asyncio.Semaphore:
+        # Solo se usa dentro del loop del gateway
+        if backend not in self._semaforos:
+            self._semaforos[backend] = asyncio.Semaphore(max(1, settings.ai_max_concurrencia))
+        return self._semaforos[backend]
+
+    # -------------------------------------------------------------- backends
+
+    async def _openai_chat(self, mensajes, model, max_tokens, temperature) -> Dict[str, Any]:
+        if self._openai is None:
+            from openai import AsyncOpenAI
+            if not settings.openai_api_key:
+                raise ValueError("OPENAI_API_KEY no configurada en variables de entorno")
+            self._http_openai = crear_async_client("openai")
+            self._openai = AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                http_client=self._http_openai,
+                max_retries=UPSTREAMS["openai"]["reintentos"],
+            )
+
+        resp = await self._openai.chat.completions.create(
+            model=model,
+            messages=mensajes,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        texto = resp.choices[0].message.content if resp and resp.choices else ""
+        uso = resp.usage
+        return {
+            "texto": texto or "",
+            "backend": "openai",
+            "modelo": model,
+            "prompt_tokens": uso.prompt_tokens if uso else 0,
+            "completion_tokens": uso.completion_tokens if uso else 0,
+            "total_tokens": uso.total_tokens if uso else 0,
+        }
+
+    async def _bedrock_chat(self, mensajes, model, max_tokens, temperature) -> Dict[str, Any]:
+        if self._bedrock is None:
+            import boto3
+            self._bedrock = boto3.client('bedrock-runtime', region_name='us-east-1')
+
+        # Anthropic en Bedrock recibe el system aparte
+        system = "\n\n".join(m["content"] for m in mensajes if m["role"] == "system")
+        cuerpo = {
+            'anthropic_version': 'bedrock-2023-06-01',
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            'messages': [m for m in mensajes if m["role"] != "system"],
+        }
+        if system:
+            cuerpo['system'] = system
+
+        def _invocar():
+            response = self._bedrock.invoke_model(
+                modelId=model,
+                contentType='application/json',
+                accept='application/json',
+                body=json.dumps(cuerpo)
+            )
+            return json.loads(response['body'].read())
+
+        result = await asyncio.get_running_loop().run_in_executor(None, _invocar)
+        uso = result.get('usage', {})
+        return {
+            "texto": result['content'][0]['text'],
+            "backend": "bedrock",
+            "modelo": model,
+            "prompt_tokens": uso.get('input_tokens', 0),
+            "completion_tokens": uso.get('output_tokens', 0),
+            "total_tokens": uso.get('input_tokens', 0) + uso.get('output_tokens', 0),
+        }
+
+    async def _stub_chat(self, mensajes, model, max_tokens, temperature) -> Dict[str, Any]:
+        """
+        Respuesta determinista: misma entrada → mismo texto. Repite los
+        encabezados '**SECCIÓN**' que pida el prompt para que los parsers de
+        secciones funcionen igual que con un modelo real.
+        """
+        entrada = json.dumps(mensajes, ensure_ascii=False, sort_keys=True)
+        huella = hashlib.sha256(entrada.encode('utf-8')).hexdigest()[:12]
+        prompt = mensajes[-1]["content"] if mensajes else ""
+        secciones = re.findall(r'^\s*\d+\.\s+\*\*([^*]+)\*\*', prompt, flags=re.MULTILINE)
+
+        if secciones:
+            texto = "\n\n".join(
+                f"**{seccion.strip()}**\n- Contenido de prueba {huella}-{i}."
+                for i, seccion in enumerate(secciones, 1)
+            )
+        else:
+            texto = f"Respuesta de prueba {huella}."
+
+        prompt_tokens = len(entrada) // 4
+        completion_tokens = len(texto) // 4
+        return {
+            "texto": texto,
+            "backend": "stub",
+            "modelo": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    # -------------------------------------------------------------- shutdown
+
+    async def _cerrar_clientes(self):
+        if self._http_openai is not None:
+            await self._http_openai.aclose()
+        self._openai = None
+        self._http_openai = None
+
+    def cerrar(self, timeout: float = 10):
+        """Cierra el cliente HTTP y detiene el loop del gateway (shutdown de la app)"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._cerrar_clientes(), loop).result(timeout)
+        except Exception as e:
+            print(f"⚠️ Error cerrando clientes del gateway de IA: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._semaforos = {}
+        self._en_vuelo = {}
+
+
+# Instancia global
+ai_gateway = AIGateway()
@@ -0,0 +1,234 @@
+"""
+Despacho de alertas (campana de notificaciones).
+
+- crear_alertas(): una fila por destinatario, escritas con un solo INSERT
+  multi-fila en vez de un db.add() por usuario.
+- notificar_usuarios(): resuelve los destinatarios (rol, secretaría) con una
+  sola consulta de ids y llama a crear_alertas().
+- crear_alerta_entidad(): difusión a toda la entidad (o a un rol de ella) con
+  UNA fila sin destinatario; cada usuario marca su lectura en alert_reads.
+- contar_no_leidas(): contador de la campana, cacheado por usuario en Redis.
+
+Ninguna función hace commit: las alertas se confirman con la transacción del
+llamador. Los contadores de los destinatarios se invalidan después del commit
+(evento after_commit de la sesión), así una lectura concurrente no vuelve a
+cachear el valor anterior a la alerta.
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from sqlalchemy import and_, event, func, insert, or_
+from sqlalchemy.orm import Session
+
+from app.models.alert import Alert, AlertRead
+from app.models.user import User, UserRole
+from app.utils.cache_manager import cache_manager, CACHE_CONFIGS
+
+
+def filtros_visibles(user: User) -> list:
+    """Alertas del usuario y alertas de entidad dirigidas a todos o a su rol"""
+    filtros = [or_(
+        Alert.recipient_user_id == user.id,
+        and_(
+            Alert.recipient_user_id.is_(None),
+            or_(Alert.recipient_role.is_(None), Alert.recipient_role == user.role.value)
+        )
+    )]
+    if user.entity_id is not None:
+        filtros.append(_de_entidad(user))
+    return filtros
+
+
+def _de_entidad(user: User):
+    return (Alert.entity_id == user.entity_id) | (Alert.entity_id.is_(None))
+
+
+def recibo_lectura(user: User):
+    """Condición del LEFT JOIN con la confirmación de lectura del usuario"""
+    return and_(AlertRead.alert_id == Alert.id, AlertRead.user_id == user.id)
+
+
+# Sin leer: ni read_at propio (alertas con destinatario) ni recibo del usuario (alertas de entidad)
+SIN_LEER = and_(Alert.read_at.is_(None), AlertRead.id.is_(None))
+
+
+def _serializar(data: Union[Dict[str, Any], str, None]) -> Optional[str]:
+    if data is None or isinstance(data, str):
+        return data
+    return json.dumps(data)
+
+
+def destinatarios(
+    db: Session,
+    entity_id: int,
+    roles: Optional[Iterable[UserRole]] = None,
+    secretaria_id: Optional[int] = None,
+    solo_activos: bool = True
+) -> List[int]:
+    """Ids de los usuarios de la entidad que cumplen los filtros (una consulta)"""
+    query = db.query(User.id).filter(User.entity_id == entity_id)
+    if roles:
+        query = query.filter(User.role.in_(list(roles)))
+    if secretaria_id is not None:
+        query = query.filter(User.secretaria_id == secretaria_id)
+    if solo_activos:
+        query = query.filter(User.is_active == True)
+    return [fila.id for fila in query]
+
+
+def crear_alertas(
+    db: Session,
+    user_ids: Iterable[int],
+    entity_id: Optional[int],
+    type: str,
+    title: str,
+    message: Optional[str] = None,
+    data: Union[Dict[str, Any], str, None] = None
+) -> int:
+    """Inserta la misma alerta para cada usuario en un solo INSERT. Retorna cuántas creó."""
+    ids = list(dict.fromkeys(uid for uid in user_ids if uid))
+    if not ids:
+        return 0
+    ahora = datetime.utcnow()
+    data = _serializar(data)
+    db.execute(insert(Alert).values([{
+        "entity_id": entity_id,
+        "recipient_user_id": uid,
+        "type": type,
+        "title": title,
+        "message": message,
+        "data": data,
+        "created_at": ahora,
+    } for uid in ids]))
+    invalidar_no_leidas(db, ids)
+    return len(ids)
+
+
+def notificar_usuarios(
+    db: Session,
+    entity_id: int,
+    type: str,
+    title: str,
+    message: Optional[str] = None,
+    data: Union[Dict[str, Any], str, None] = None,
+    roles: Optional[Iterable[UserRole]] = None,
+    secretaria_id: Optional[int] = None
+) -> int:
+    """Alerta individual para cada usuario de la entidad que cumple los filtros"""
+    ids = destinatarios(db, entity_id, roles=roles, secretaria_id=secretaria_id)
+    return crear_alertas(db, ids, entity_id, type, title, message, data)
+
+
+def crear_alerta_entidad(
+    db: Session,
+    entity_id: int,
+    type: str,
+    title: str,
+    message: Optional[str] = None,
+    data: Union[Dict[str, Any], str, None] = None,
+    rol: Optional[UserRole] = None
+) -> None:
+    """
+    Una sola alerta visible para todos los usuarios de la entidad (o solo los
+    del rol indicado). La lectura es por usuario (AlertRead).
+    """
+    db.execute(insert(Alert).values(
+        entity_id=entity_id,
+        recipient_user_id=None,
+        recipient_role=rol.value if rol else None,
+        type=type,
+        title=title,
+        message=message,
+        data=_serializar(data),
+        created_at=datetime.utcnow(),
+    ))
+    if cache_manager.connected:
+        roles = [rol] if rol else None
+        invalidar_no_leidas(db, destinatarios(db, entity_id, roles=roles, solo_activos=False))
+
+
+# ---------------------------------------------------------------------------
+# Contador de no leídas
+# ---------------------------------------------------------------------------
+
+def _clave_no_leidas(user_id: int) -> str:
+    return f"{CACHE_CONFIGS['alertas_no_leidas']['prefix']}:{user_id}"
+
+
+def _redis():
+    # Directo a Redis, sin el nivel local: el contador cambia en cualquier worker
+    return cache_manager.redis_client if cache_manager.connected else None
+
+
+def _contar_en_bd(db: Session, user: User) -> int:
+    """
+    Dos conteos que usan índice en una sola consulta, en vez de un OR sobre
+    recipient_user_id NULL que obliga a recorrer las alertas de la entidad.
+    """
+    directas = db.query(func.count(Alert.id)).filter(
+        Alert.recipient_user_id == user.id,
+        Alert.read_at.is_(None)
+    )
+    de_entidad = db.query(func.count(Alert.id)).outerjoin(AlertRead, recibo_lectura(user)).filter(
+        Alert.recipient_user_id.is_(None),
+        or_(Alert.recipient_role.is_(None), Alert.recipient_role == user.role.value),
+        SIN_LEER
+    )
+    if user.entity_id is not None:
+        directas = directas.filter(_de_entidad(user))
+        de_entidad = de_entidad.filter(_de_entidad(user))
+    return db.query(directas.scalar_subquery() + de_entidad.scalar_subquery()).scalar() or 0
+
+
+def contar_no_leidas(db: Session, user: User) -> int:
+    """Alertas sin leer del usuario (Redis; si no está o expiró, se cuenta en la BD)"""
+    redis_client = _redis()
+    clave = _clave_no_leidas(user.id)
+    if redis_client is not None:
+        try:
+            valor = redis_client.get(clave)
+            if valor is not None:
+                return int(valor)
+        except Exception:
+            redis_client = None
+
+    total = _contar_en_bd(db, user)
+    if redis_client is not None:
+        try:
+            redis_client.setex(clave, CACHE_CONFIGS['alertas_no_leidas']['ttl'], total)
+        except Exception:
+            pass
+    return total
+
+
+def fijar_no_leidas(user_id: int, total: int):
+    """Fija el contador (p. ej. 0 después de marcar todas como leídas y hacer commit)"""
+    redis_client = _redis()
+    if redis_client is not None:
+        try:
+            redis_client.setex(_clave_no_leidas(user_id), CACHE_CONFIGS['alertas_no_leidas']['ttl'], total)
+        except Exception:
+            pass
+
+
+def invalidar_no_leidas(db: Session, user_ids: Iterable[int]):
+    """Descarta los contadores de estos usuarios cuando la transacción haga commit"""
+    db.info.setdefault("alertas_no_leidas", set()).update(user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_tras_commit(session: Session):
+    user_ids = session.info.pop("alertas_no_leidas", None)
+    redis_client = _redis()
+    if not user_ids or redis_client is None:
+        return
+    try:
+        redis_client.delete(*[_clave_no_leidas(uid) for uid in user_ids])
+    except Exception:
+        pass
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_invalidaciones(session: Session):
+    session.info.pop("alertas_no_leidas", None)
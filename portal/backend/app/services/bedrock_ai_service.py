@@ -3,22 +3,20 @@ Servicio de IA usando Amazon Bedrock con Claude 3
 Genera análisis profesionales de PQRS sin costos de API externas
 """
 
-import boto3
-import json
 from typing import Dict, List, Any
 from botocore.exceptions import ClientError
+from app.services.ai_gateway import ai_gateway
 
 
 class BedrockAIService:
     """Servicio IA nativo en AWS usando Bedrock + Claude 3 Sonnet"""
 
-    def __init__(self, region_name: str = 'us-east-1'):
-        """Inicializar cliente Bedrock con credenciales IAM"""
-        self.client = boto3.client('bedrock-runtime', region_name=region_name)
+    def __init__(self):
+        """El cliente Bedrock (credenciales IAM) lo comparte el gateway de IA"""
         # Usar cross-region inference profile (prefijo us.) para mayor disponibilidad
         self.model_id = 'us.anthropic.claude-3-haiku-20240307-v1:0'
 
-    def analizar_pqrs(
+    async def analizar_pqrs(
         self,
         analytics: Dict[str, Any],
         entity_name: str,
@@ -48,24 +46,16 @@ class BedrockAIService:
                 analytics, entity_name, fecha_inicio, fecha_fin, pqrs_list
             )
             
-            # Invocar modelo vía Bedrock
-            response = self.client.invoke_model(
-                modelId=self.model_id,
-                contentType='application/json',
-                accept='application/json',
-                body=json.dumps({
-                    'anthropic_version': 'bedrock-2023-06-01',
-                    'max_tokens': 4096,  # Aumentado para generar textos extensos
-                    'messages': [{
-                        'role': 'user',
-                        'content': prompt
-                    }]
-                })
+            # Invocar modelo vía Bedrock (gateway de IA, sin bloquear el event loop)
+            response = await ai_gateway.completar(
+                [{'role': 'user', 'content': prompt}],
+                backend='bedrock',
+                model=self.model_id,
+                max_tokens=4096,  # Aumentado para generar textos extensos
+                temperature=1.0,
+                cache="pqrs_analisis_ia"
             )
-            
-            # Parsear respuesta
-            result = json.loads(response['body'].read())
-            content = result['content'][0]['text']
+            content = response['texto']
             
             print(f"✅ Análisis IA completado ({len(content)} caracteres)")
             print(f"📝 Primeros 500 caracteres de respuesta IA:")
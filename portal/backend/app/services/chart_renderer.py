@@ -0,0 +1,502 @@
+"""
+Renderizado de gráficas de informes (PDM y PQRS) en un pool de procesos.
+
+Los generadores de informes describen cada gráfica como una especificación
+de datos puros (dict serializable) y reciben los bytes PNG. Así las figuras
+de matplotlib se pueden dibujar en paralelo en procesos separados y el
+tiempo total queda cerca del de la gráfica más lenta.
+
+Especificación:
+    {
+        "tipo": "barh_avance" | "pie_estados" | "barh_tipos" | "linea_mensual"
+                | "barras_tiempos" | "heatmap_estado_tipo",
+        "data": {...},            # datos propios de cada tipo
+        "figsize": [ancho, alto], # pulgadas
+        "dpi": 150
+    }
+
+Workers: settings.chart_render_workers (env CHART_RENDER_WORKERS).
+0 = automático (hasta 4 según CPUs), 1 = renderizado en línea sin pool.
+
+Caché: cada especificación se identifica por el hash SHA-256 de su JSON
+canónico. Los PNG se guardan en un directorio LRU acotado
+(settings.chart_cache_max_entries) y, si Redis está disponible, también en
+CacheManager para compartirlos entre instancias. Un informe mensual que se
+vuelve a exportar sin cambios de datos no renderiza ninguna gráfica.
+"""
+import os
+import base64
+import hashlib
+import json
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Dict, Any, Optional
+import multiprocessing
+
+# Configurar matplotlib para uso en servidor (sin display)
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import matplotlib.patheffects
+import numpy as np
+plt.rcParams['font.family'] = 'DejaVu Sans'
+
+from app.config.settings import settings
+from app.utils.cache_manager import cache_manager, CACHE_CONFIGS
+
+
+DEFAULT_DPI = 150
+
+# Incrementar al cambiar el estilo de cualquier renderer para invalidar la caché
+RENDERER_VERSION = 1
+
+
+# ============================================
+# Renderers por tipo de gráfica
+# ============================================
+
+def _render_barh_avance(fig, ax, data: Dict[str, Any]):
+    """Barras horizontales de avance (%) con semáforo (líneas, sectores, ODS del PDM)"""
+    labels = data['labels']
+    avances = data['values']
+
+    colores = ['#4F9A54' if a >= 70 else '#FFA726' if a >= 50 else '#EF5350' for a in avances]
+
+    y_pos = np.arange(len(labels))
+    bars = ax.barh(y_pos, avances, color=colores, height=0.6, alpha=0.9)
+
+    # Agregar valores al final de cada barra
+    for bar, val in zip(bars, avances):
+        width = bar.get_width()
+        ax.text(width + 2, bar.get_y() + bar.get_height()/2,
+               f'{val:.1f}%', ha='left', va='center',
+               fontsize=10, fontweight='bold', color='#333')
+
+    ax.set_yticks(y_pos)
+    ax.set_yticklabels(labels, fontsize=9)
+    ax.set_xlabel('Porcentaje de Avance (%)', fontsize=11, fontweight='bold', color='#333')
+    ax.set_title(data['title'], fontsize=13, fontweight='bold', color='#003366', pad=20)
+    ax.set_xlim(0, 110)
+
+    # Estilo moderno
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.spines['left'].set_color('#CCCCCC')
+    ax.spines['bottom'].set_color('#CCCCCC')
+    ax.grid(axis='x', alpha=0.2, linestyle='--', color='#CCCCCC')
+    ax.set_axisbelow(True)
+
+    plt.tight_layout()
+
+
+def _render_pie_estados(fig, ax, data: Dict[str, Any]):
+    """Distribución por estado de PQRS (pie)"""
+    valores = data['values']
+
+    if valores:
+        # Explotar levemente el primer segmento
+        explode = [0.08 if i == 0 else 0.03 for i in range(len(valores))]
+
+        wedges, texts, autotexts = ax.pie(
+            valores,
+            explode=explode,
+            labels=data['labels'],
+            autopct='%1.1f%%',
+            colors=data['colors'],
+            startangle=45,
+            shadow=True,  # Sombra para profundidad
+            textprops={'fontsize': 11, 'weight': 'bold'},
+            wedgeprops={'edgecolor': 'white', 'linewidth': 2.5, 'antialiased': True}
+        )
+
+        # Mejorar visibilidad de porcentajes con efecto de contraste
+        for autotext in autotexts:
+            autotext.set_color('white')
+            autotext.set_fontsize(12)
+            autotext.set_weight('bold')
+            autotext.set_path_effects([
+                matplotlib.patheffects.withStroke(linewidth=2, foreground='black', alpha=0.3)
+            ])
+    else:
+        ax.text(0.5, 0.5, 'Sin datos disponibles',
+                ha='center', va='center', transform=ax.transAxes,
+                fontsize=12, color='gray')
+
+    ax.set_title(f"Distribución por Estado (Total: {data['total']})",
+                 fontsize=14, fontweight='bold', pad=25, color='#2c3e50')
+
+
+def _render_barh_tipos(fig, ax, data: Dict[str, Any]):
+    """Distribución por tipo de solicitud PQRS (barras horizontales)"""
+    tipos = data['labels']
+    cantidades = data['values']
+    if not tipos:
+        return
+
+    # Paleta de colores profesional (azul a verde)
+    colores = ['#3498db', '#5dade2', '#48c9b0', '#52be80', '#58d68d', '#7dcea0']
+    colores_chart = (colores * (len(tipos) // len(colores) + 1))[:len(tipos)]
+
+    bars = ax.barh(tipos, cantidades, color=colores_chart,
+                   edgecolor='white', linewidth=1.5, height=0.7)
+
+    # Sombra sutil en las barras
+    for bar in bars:
+        bar.set_alpha(0.85)
+
+    ax.set_xlabel('Cantidad de Solicitudes', fontsize=12, fontweight='bold', color='#2c3e50')
+    ax.set_title('Distribución por Tipo de Solicitud', fontsize=14, fontweight='bold', pad=20, color='#2c3e50')
+    ax.grid(axis='x', alpha=0.2, linestyle='--', linewidth=0.8)
+    ax.set_axisbelow(True)  # Grid detrás de las barras
+
+    # Añadir valores y porcentajes en las barras
+    total_tipos = sum(cantidades)
+    for bar, cant in zip(bars, cantidades):
+        width = bar.get_width()
+        porcentaje = (cant / total_tipos * 100) if total_tipos > 0 else 0
+        ax.text(width + max(cantidades)*0.02, bar.get_y() + bar.get_height()/2,
+                f'{int(width)} ({porcentaje:.1f}%)',
+                ha='left', va='center', fontsize=10, fontweight='bold', color='#34495e')
+
+
+def _render_linea_mensual(fig, ax, data: Dict[str, Any]):
+    """Evolución temporal mensual de PQRS (línea)"""
+    meses_labels = data['labels']
+    valores_meses = data['values']
+
+    if not meses_labels:
+        ax.text(0.5, 0.5, 'Sin datos temporales disponibles',
+                ha='center', va='center', transform=ax.transAxes,
+                fontsize=12, color='gray')
+        return
+
+    ax.plot(meses_labels, valores_meses, marker='o', linewidth=3,
+            color='#e74c3c', markersize=10, markerfacecolor='#e74c3c',
+            markeredgecolor='white', markeredgewidth=2.5, label='PQRS Recibidas',
+            zorder=3)  # Línea al frente
+
+    # Área sombreada con gradiente suave
+    ax.fill_between(range(len(meses_labels)), valores_meses, alpha=0.25,
+                    color='#e74c3c', zorder=2)
+
+    ax.set_xlabel('Período', fontsize=12, fontweight='bold', color='#2c3e50')
+    ax.set_ylabel('Cantidad de PQRS', fontsize=12, fontweight='bold', color='#2c3e50')
+    ax.set_title('Evolución Temporal de PQRS', fontsize=14, fontweight='bold', pad=20, color='#2c3e50')
+    ax.grid(True, alpha=0.2, linestyle='--', linewidth=0.8, zorder=1)
+    ax.legend(loc='upper left', fontsize=11, framealpha=0.9, edgecolor='gray')
+    ax.set_axisbelow(True)
+
+    # Añadir valores sobre cada punto con fondo
+    for x, y in zip(range(len(meses_labels)), valores_meses):
+        ax.text(x, y + max(valores_meses)*0.03, str(y),
+                ha='center', va='bottom', fontsize=10, fontweight='bold',
+                bbox=dict(boxstyle='round,pad=0.3', facecolor='white', edgecolor='gray', alpha=0.8))
+
+    plt.xticks(rotation=45, ha='right', fontsize=10)
+
+
+def _render_barras_tiempos(fig, ax, data: Dict[str, Any]):
+    """Distribución de tiempos de respuesta de PQRS por rangos"""
+    rangos = data['labels']
+    conteos = data['values']
+
+    if not rangos:
+        ax.text(0.5, 0.5, 'Datos de tiempos no disponibles',
+                ha='center', va='center', transform=ax.transAxes,
+                fontsize=12, color='gray')
+        return
+
+    # Colores semafóricos profesionales
+    colores_tiempos = ['#27ae60', '#2ecc71', '#f39c12', '#e67e22', '#c0392b']
+    bars = ax.bar(rangos, conteos, color=colores_tiempos, edgecolor='white',
+                  linewidth=2, width=0.7, alpha=0.85)
+
+    ax.set_ylabel('Cantidad de PQRS', fontsize=12, fontweight='bold', color='#2c3e50')
+    ax.set_title('Distribución de Tiempos de Respuesta', fontsize=14, fontweight='bold',
+                 pad=20, color='#2c3e50')
+    ax.grid(axis='y', alpha=0.2, linestyle='--', linewidth=0.8)
+    ax.set_axisbelow(True)
+
+    # Línea de referencia legal
+    if max(conteos) > 0:
+        ax.axhline(y=max(conteos)*0.5, color='#e74c3c', linestyle='--',
+                   linewidth=2.5, alpha=0.6, label='Referencia legal: 15 días')
+
+    # Añadir valores sobre barras con fondo
+    for bar, conteo in zip(bars, conteos):
+        if conteo > 0:
+            height = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width()/2., height + max(conteos)*0.02,
+                    f'{int(conteo)}',
+                    ha='center', va='bottom', fontsize=11, fontweight='bold',
+                    bbox=dict(boxstyle='round,pad=0.3', facecolor='white',
+                              edgecolor='gray', alpha=0.9))
+
+    ax.legend(loc='upper right', fontsize=10, framealpha=0.9, edgecolor='gray')
+    plt.xticks(rotation=20, ha='right', fontsize=10)
+
+    ax.text(0.02, 0.98, f"⏱ Promedio: {data['promedio']:.1f} días",
+            transform=ax.transAxes, fontsize=12, fontweight='bold',
+            verticalalignment='top', color='#2c3e50',
+            bbox=dict(boxstyle='round,pad=0.5', facecolor='#ecf0f1',
+                      edgecolor='#34495e', alpha=0.9, linewidth=2))
+
+
+def _render_heatmap_estado_tipo(fig, ax, data: Dict[str, Any]):
+    """Matriz estado vs tipo de solicitud de PQRS (heatmap)"""
+    matriz = data['matrix']
+    if not matriz:
+        return
+
+    matriz = np.array(matriz)
+    im = ax.imshow(matriz, cmap='RdYlGn_r', aspect='auto', alpha=0.85)
+
+    ax.set_xticks(np.arange(len(data['x_labels'])))
+    ax.set_yticks(np.arange(len(data['y_labels'])))
+    ax.set_xticklabels(data['x_labels'], rotation=45, ha='right', fontsize=10)
+    ax.set_yticklabels(data['y_labels'])
+
+    # Añadir valores en cada celda
+    for i in range(matriz.shape[0]):
+        for j in range(matriz.shape[1]):
+            ax.text(j, i, int(matriz[i, j]),
+                    ha='center', va='center', color='black',
+                    fontsize=10, fontweight='bold')
+
+    ax.set_title('Matriz: Estado vs Tipo de Solicitud', fontsize=13, fontweight='bold', pad=15)
+    plt.colorbar(im, ax=ax, label='Cantidad')
+
+
+RENDERERS = {
+    'barh_avance': _render_barh_avance,
+    'pie_estados': _render_pie_estados,
+    'barh_tipos': _render_barh_tipos,
+    'linea_mensual': _render_linea_mensual,
+    'barras_tiempos': _render_barras_tiempos,
+    'heatmap_estado_tipo': _render_heatmap_estado_tipo,
+}
+
+
+def render_chart(spec: Dict[str, Any]) -> bytes:
+    """Dibuja una gráfica a partir de su especificación y retorna los bytes PNG"""
+    renderer = RENDERERS[spec['tipo']]
+    fig, ax = plt.subplots(figsize=tuple(spec['figsize']), facecolor='white')
+    try:
+        renderer(fig, ax, spec['data'])
+        buffer = BytesIO()
+        fig.savefig(buffer, format='png', dpi=spec.get('dpi', DEFAULT_DPI),
+                    bbox_inches='tight', facecolor='white')
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
+
+
+# ============================================
+# Caché direccionada por contenido
+# ============================================
+
+_cache_lock = threading.Lock()
+
+
+def chart_cache_key(spec: Dict[str, Any]) -> str:
+    """Hash estable de la especificación (tipo, datos, tamaño, dpi)"""
+    canonico = json.dumps(
+        {'v': RENDERER_VERSION, 'spec': spec},
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str
+    )
+    return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+
+
+def _cache_dir() -> str:
+    return settings.chart_cache_dir or os.path.join(tempfile.gettempdir(), 'softone_chart_cache')
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(_cache_dir(), f'{key}.png')
+
+
+def _redis_key(key: str) -> str:
+    return f"{CACHE_CONFIGS['chart_png']['prefix']}:{key}"
+
+
+def _leer_cache(key: str) -> Optional[bytes]:
+    """Busca el PNG en disco y luego en Redis"""
+    path = _cache_path(key)
+    try:
+        with open(path, 'rb') as f:
+            png = f.read()
+        # Marcar como usado recientemente (LRU por mtime)
+        os.utime(path, None)
+        return png
+    except OSError:
+        pass
+
+    valor = cache_manager.get(_redis_key(key))
+    if valor:
+        try:
+            png = base64.b64decode(valor)
+        except Exception:
+            return None
+        _escribir_disco(key, png)
+        return png
+    return None
+
+
+def _escribir_disco(key: str, png: bytes):
+    directorio = _cache_dir()
+    try:
+        os.makedirs(directorio, exist_ok=True)
+        # Escritura atómica: otro proceso nunca lee un PNG a medias
+        fd, tmp_path = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, _cache_path(key))
+        _podar_disco(directorio)
+    except OSError as e:
+        print(f"⚠️ No se pudo guardar gráfica en caché de disco: {e}")
+
+
+def _podar_disco(directorio: str):
+    """Elimina los PNG menos usados cuando se supera el máximo de entradas"""
+    maximo = settings.chart_cache_max_entries
+    with _cache_lock:
+        try:
+            entradas = [e for e in os.scandir(directorio) if e.name.endswith('.png')]
+        except OSError:
+            return
+        exceso = len(entradas) - maximo
+        if exceso <= 0:
+            return
+        entradas.sort(key=lambda e: e.stat().st_mtime)
+        for entrada in entradas[:exceso]:
+            try:
+                os.remove(entrada.path)
+            except OSError:
+                pass
+
+
+def _guardar_cache(key: str, png: bytes):
+    _escribir_disco(key, png)
+    cache_manager.set(
+        _redis_key(key),
+        base64.b64encode(png).decode('ascii'),
+        CACHE_CONFIGS['chart_png']['ttl']
+    )
+
+
+# ============================================
+# Pool de procesos
+# ============================================
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _num_workers() -> int:
+    configurado = settings.chart_render_workers
+    if configurado and configurado > 0:
+        return configurado
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    """Pool compartido por el proceso (None si se renderiza en línea)"""
+    global _pool
+    workers = _num_workers()
+    if workers <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn: el worker web tiene hilos (informes en background) y
+            # fork con hilos activos puede dejar locks tomados en el hijo
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            print(f"🎨 Pool de renderizado de gráficas iniciado con {workers} procesos")
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def render_charts(specs: Dict[str, Dict[str, Any]]) -> Dict[str, bytes]:
+    """
+    Renderiza varias gráficas en paralelo, reutilizando las que ya están en caché.
+
+    Args:
+        specs: {nombre: especificación}
+
+    Returns:
+        {nombre: bytes PNG}. Una gráfica que falla se omite del resultado.
+    """
+    if not specs:
+        return {}
+
+    if not settings.chart_cache_enabled:
+        return _render_sin_cache(specs)
+
+    claves = {nombre: chart_cache_key(spec) for nombre, spec in specs.items()}
+    resultados: Dict[str, bytes] = {}
+    pendientes: Dict[str, Dict[str, Any]] = {}
+    for nombre, spec in specs.items():
+        png = _leer_cache(claves[nombre])
+        if png is not None:
+            resultados[nombre] = png
+        else:
+            pendientes[nombre] = spec
+
+    if resultados:
+        print(f"   ⚡ {len(resultados)}/{len(specs)} gráficas desde caché")
+
+    nuevas = _render_sin_cache(pendientes)
+    for nombre, png in nuevas.items():
+        _guardar_cache(claves[nombre], png)
+    resultados.update(nuevas)
+    return resultados
+
+
+def _render_sin_cache(specs: Dict[str, Dict[str, Any]]) -> Dict[str, bytes]:
+    if not specs:
+        return {}
+
+    pool = _get_pool() if len(specs) > 1 else None
+    resultados: Dict[str, bytes] = {}
+
+    if pool is not None:
+        try:
+            futures = {nombre: pool.submit(render_chart, spec) for nombre, spec in specs.items()}
+            for nombre, future in futures.items():
+                try:
+                    resultados[nombre] = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    print(f"   ❌ Error renderizando gráfica '{nombre}': {e}")
+            return resultados
+        except BrokenProcessPool as e:
+            # Un worker murió (p.ej. OOM): reiniciar el pool y renderizar en línea
+            print(f"⚠️ Pool de gráficas roto ({e}), renderizando en línea")
+            _reset_pool()
+
+    for nombre, spec in specs.items():
+        if nombre in resultados:
+            continue
+        try:
+            resultados[nombre] = render_chart(spec)
+        except Exception as e:
+            print(f"   ❌ Error renderizando gráfica '{nombre}': {e}")
+    return resultados
+
+
+def shutdown_chart_pool():
+    """Cierra el pool de procesos (shutdown de la aplicación)"""
+    _reset_pool()
@@ -0,0 +1,319 @@
+"""
+Bandeja de salida de correos respaldada en la tabla email_outbox.
+
+Los handlers no llaman a Zeptomail: agregan el mensaje ya renderizado a la
+sesión con encolar_email() y lo confirman en la misma transacción que el
+cambio que lo origina (radicación, respuesta). Un worker async en el event
+loop de la app reclama lotes, los envía en paralelo con el cliente HTTP
+compartido y reintenta con backoff los errores transitorios.
+
+Al terminar la entrega de una respuesta se actualizan PQRS.email_enviado y
+PQRS.email_error.
+
+Modos de ejecución (como la cola de informes):
+- Embebido (EMAIL_OUTBOX_WORKER_EMBEBIDO=true, por defecto): en cada proceso web.
+- Dedicado: python -m app.services.email_outbox
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.config.database import SessionLocal
+from app.config.settings import settings
+from app.models.email_outbox import EmailOutbox
+from app.models.pqrs import PQRS
+from app.utils.email_service import email_service
+
+
+# Tipos cuyo resultado se refleja en PQRS.email_enviado / email_error
+TIPOS_CON_SEGUIMIENTO = {'pqrs_respuesta'}
+
+BACKOFF_BASE_SEGUNDOS = 30
+BACKOFF_MAX_SEGUNDOS = 3600
+
+
+def encolar_email(
+    db: Session,
+    mensaje: Dict[str, Any],
+    tipo: str,
+    entity_id: Optional[int] = None,
+    pqrs_id: Optional[int] = None
+) -> EmailOutbox:
+    """
+    Agrega un correo a la bandeja de salida. No hace commit: el correo se
+    confirma (o descarta) junto con la transacción del llamador.
+    Después del commit llamar a notificar_email_pendiente().
+
+    Args:
+        mensaje: kwargs de EmailService.send_email (ver build_pqrs_*_message)
+        tipo: 'pqrs_radicada', 'pqrs_respuesta'
+    """
+    item = EmailOutbox(
+        entity_id=entity_id,
+        pqrs_id=pqrs_id,
+        tipo=tipo,
+        to_emails=list(mensaje["to_emails"]),
+        subject=mensaje["subject"],
+        html_body=mensaje["html_body"],
+        text_body=mensaje.get("text_body"),
+        from_name=mensaje.get("from_name"),
+        reply_to=mensaje.get("reply_to"),
+        estado='pending',
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.add(item)
+    return item
+
+
+def _disponible(ahora: datetime):
+    """Filtro de correos que un worker puede reclamar"""
+    return and_(
+        EmailOutbox.intentos < EmailOutbox.max_intentos,
+        or_(
+            and_(EmailOutbox.estado == 'pending', EmailOutbox.next_attempt_at <= ahora),
+            # Worker caído a mitad del envío
+            and_(EmailOutbox.estado == 'sending', EmailOutbox.lease_expires_at < ahora)
+        )
+    )
+
+
+def marcar_abandonados(db: Session) -> int:
+    """Marca como fallidos los correos cuyo lease venció sin intentos restantes"""
+    ahora = datetime.utcnow()
+    abandonados = db.query(EmailOutbox).filter(
+        EmailOutbox.estado == 'sending',
+        EmailOutbox.lease_expires_at < ahora,
+        EmailOutbox.intentos >= EmailOutbox.max_intentos
+    ).all()
+    for item in abandonados:
+        item.estado = 'failed'
+        item.lease_token = None
+        item.lease_expires_at = None
+        item.last_error = 'El envío se interrumpió repetidamente'
+        _actualizar_pqrs(db, item, False, "No se pudo entregar el correo. Reintente el envío.")
+    db.commit()
+    return len(abandonados)
+
+
+def reclamar_lote(limite: int) -> List[Dict[str, Any]]:
+    """
+    Reclama hasta `limite` correos. En PostgreSQL usa FOR UPDATE SKIP LOCKED;
+    en todos los motores el UPDATE condicional con lease_token asegura que
+    cada correo lo tome un solo worker.
+    """
+    db = SessionLocal()
+    try:
+        marcar_abandonados(db)
+        ahora = datetime.utcnow()
+        query = db.query(EmailOutbox.id).filter(_disponible(ahora)).order_by(
+            EmailOutbox.next_attempt_at, EmailOutbox.id
+        ).limit(limite)
+        if db.get_bind().dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+
+        ids = [fila.id for fila in query.all()]
+        if not ids:
+            db.rollback()
+            return []
+
+        token = uuid.uuid4().hex
+        db.query(EmailOutbox).filter(
+            EmailOutbox.id.in_(ids),
+            _disponible(ahora)
+        ).update({
+            EmailOutbox.estado: 'sending',
+            EmailOutbox.lease_token: token,
+            EmailOutbox.lease_expires_at: ahora + timedelta(seconds=settings.email_outbox_lease_segundos),
+            EmailOutbox.intentos: EmailOutbox.intentos + 1,
+        }, synchronize_session=False)
+        db.commit()
+
+        return [{
+            "id": item.id,
+            "lease_token": token,
+            "intentos": item.intentos,
+            "max_intentos": item.max_intentos,
+            "mensaje": {
+                "to_emails": item.to_emails,
+                "subject": item.subject,
+                "html_body": item.html_body,
+                "text_body": item.text_body,
+                "from_name": item.from_name,
+                "reply_to": item.reply_to,
+            },
+        } for item in db.query(EmailOutbox).filter(EmailOutbox.lease_token == token).all()]
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _actualizar_pqrs(db: Session, item: EmailOutbox, enviado: bool, error: Optional[str]):
+    """Refleja la entrega en la PQRS si este es su correo de seguimiento más reciente"""
+    if item.tipo not in TIPOS_CON_SEGUIMIENTO or item.pqrs_id is None:
+        return
+    mas_reciente = db.query(EmailOutbox.id).filter(
+        EmailOutbox.pqrs_id == item.pqrs_id,
+        EmailOutbox.tipo == item.tipo,
+        EmailOutbox.id > item.id
+    ).first()
+    if mas_reciente:
+        return
+    db.query(PQRS).filter(PQRS.id == item.pqrs_id).update({
+        PQRS.email_enviado: enviado,
+        PQRS.email_error: error,
+    }, synchronize_session=False)
+
+
+def registrar_resultado(item_id: int, lease_token: str, resultado: Dict[str, Any]):
+    """Guarda el resultado de un envío: enviado, reprogramado con backoff o fallido"""
+    db = SessionLocal()
+    try:
+        # Si el lease venció y otro worker lo reclamó, el resultado ya no es nuestro
+        item = db.query(EmailOutbox).filter(
+            EmailOutbox.id == item_id,
+            EmailOutbox.lease_token == lease_token
+        ).first()
+        if item is None:
+            return
+        ahora = datetime.utcnow()
+        item.lease_token = None
+        item.lease_expires_at = None
+
+        if resultado["ok"]:
+            item.estado = 'sent'
+            item.sent_at = ahora
+            item.message_id = resultado.get("message_id")
+            item.last_error = None
+            _actualizar_pqrs(db, item, True, None)
+        elif resultado.get("reintentable") and item.intentos < item.max_intentos:
+            espera = min(BACKOFF_BASE_SEGUNDOS * (2 ** (item.intentos - 1)), BACKOFF_MAX_SEGUNDOS)
+            item.estado = 'pending'
+            item.next_attempt_at = ahora + timedelta(seconds=espera)
+            item.last_error = (resultado.get("error") or "")[:500]
+            print(f"🔁 Correo {item.id} reprogramado en {espera}s (intento {item.intentos}/{item.max_intentos})")
+        else:
+            item.estado = 'failed'
+            item.last_error = (resultado.get("error") or "")[:500]
+            _actualizar_pqrs(
+                db, item, False,
+                "El proveedor de correo rechazó el envío. Verifique el correo del ciudadano."
+                if not resultado.get("reintentable") else f"No se pudo entregar el correo: {item.last_error}"[:500]
+            )
+            print(f"❌ Correo {item.id} fallido definitivamente: {item.last_error}")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class EmailOutboxWorker:
+    """Consume la bandeja de salida en el event loop: lotes y envíos concurrentes acotados"""
+
+    def __init__(self):
+        self._despertar: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._tarea is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._despertar = asyncio.Event()
+        self._tarea = asyncio.create_task(self._run())
+        print(f"📬 Worker de correos iniciado (lotes de {settings.email_outbox_lote}, "
+              f"{settings.email_outbox_concurrencia} envíos simultáneos)", flush=True)
+
+    async def stop(self):
+        if self._tarea is None:
+            return
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._tarea = None
+
+    def despertar(self):
+        """Atiende de inmediato un correo recién encolado (seguro desde otros threads)"""
+        if self._loop is not None and self._despertar is not None:
+            self._loop.call_soon_threadsafe(self._despertar.set)
+
+    async def _run(self):
+        semaforo = asyncio.Semaphore(max(1, settings.email_outbox_concurrencia))
+        while True:
+            try:
+                lote = await asyncio.to_thread(reclamar_lote, settings.email_outbox_lote)
+            except Exception as e:
+                print(f"⚠️ Error reclamando correos de la bandeja de salida: {e}", flush=True)
+                lote = []
+
+            if not lote:
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), timeout=settings.email_outbox_poll_segundos)
+                except asyncio.TimeoutError:
+                    pass
+                self._despertar.clear()
+                continue
+
+            await asyncio.gather(*(self._entregar(item, semaforo) for item in lote))
+
+    async def _entregar(self, item: Dict[str, Any], semaforo: asyncio.Semaphore):
+        async with semaforo:
+            try:
+                resultado = await email_service.send_email_async(**item["mensaje"])
+            except Exception as e:
+                resultado = {"ok": False, "error": str(e), "reintentable": True}
+        try:
+            await asyncio.to_thread(registrar_resultado, item["id"], item["lease_token"], resultado)
+        except Exception as e:
+            # El lease vence y otro ciclo lo retoma
+            print(f"⚠️ Error registrando resultado del correo {item['id']}: {e}", flush=True)
+
+
+# Worker del proceso actual (modo embebido o proceso dedicado)
+_worker: Optional[EmailOutboxWorker] = None
+
+
+def iniciar_worker() -> EmailOutboxWorker:
+    """Arranca el worker en el event loop actual"""
+    global _worker
+    if _worker is None:
+        _worker = EmailOutboxWorker()
+        _worker.start()
+    return _worker
+
+
+async def detener_worker():
+    global _worker
+    if _worker is not None:
+        await _worker.stop()
+        _worker = None
+
+
+def notificar_email_pendiente():
+    """Despierta al worker local si existe (en modo dedicado el poll lo recoge)"""
+    if _worker is not None:
+        _worker.despertar()
+
+
+async def _main():
+    iniciar_worker()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await detener_worker()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        print("🛑 Deteniendo worker de correos...", flush=True)
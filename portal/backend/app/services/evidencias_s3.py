@@ -0,0 +1,233 @@
+"""
+Almacenamiento de imágenes de evidencias PDM en S3.
+Subida desde Base64 (creación de evidencias y migración de datos legacy)
+y lectura de las imágenes para los generadores de informes.
+
+Cada original se guarda con una miniatura JPEG de tamaño informe en
+<carpeta>/thumbs/; los informes solo descargan las miniaturas.
+"""
+import base64
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from app.utils.imagenes import clave_miniatura, generar_miniatura
+
+# S3 para almacenamiento de imágenes
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+    S3_AVAILABLE = True
+    S3_BUCKET = 'softone-pdm-evidencias'
+    S3_REGION = 'us-east-1'
+except ImportError:
+    S3_AVAILABLE = False
+    print("⚠️ boto3 no disponible - imágenes se guardarán en DB")
+
+S3_URL_PREFIX = f"https://{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/" if S3_AVAILABLE else ""
+
+
+def _limpiar_base64(imagen_base64: str) -> str:
+    """Quita el prefijo data URL (data:image/...;base64,) si existe"""
+    if imagen_base64.startswith('data:image') and ',' in imagen_base64:
+        return imagen_base64.split(',', 1)[1]
+    return imagen_base64
+
+
+def subir_imagenes_a_s3(imagenes_base64: List[str], entity_id: int, evidencia_id: int) -> List[str]:
+    """
+    Sube imágenes Base64 a S3 y retorna lista de URLs.
+
+    Args:
+        imagenes_base64: Lista de strings Base64
+        entity_id: ID de la entidad
+        evidencia_id: ID de la evidencia
+
+    Returns:
+        Lista de URLs S3
+
+    Raises:
+        HTTPException: Si falla la subida a S3
+    """
+    if not S3_AVAILABLE:
+        raise HTTPException(
+            status_code=500,
+            detail="Servicio S3 no disponible - contacte al administrador"
+        )
+
+    if not imagenes_base64:
+        return []
+
+    try:
+        s3_client = boto3.client('s3', region_name=S3_REGION)
+        urls = []
+
+        for idx, imagen_base64 in enumerate(imagenes_base64):
+            imagen_base64 = _limpiar_base64(imagen_base64)
+
+            # Decodificar Base64
+            try:
+                imagen_data = base64.b64decode(imagen_base64)
+            except Exception:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Imagen {idx + 1} tiene formato Base64 inválido"
+                )
+
+            # Determinar extensión (por defecto jpg)
+            extension = 'jpg'
+            if imagen_base64.startswith('/9j/'):
+                extension = 'jpg'
+            elif imagen_base64.startswith('iVBORw0KGgo'):
+                extension = 'png'
+
+            # Generar key S3 única
+            unique_id = str(uuid.uuid4())[:8]
+            s3_key = f"entity_{entity_id}/evidencia_{evidencia_id}/imagen_{idx}_{unique_id}.{extension}"
+
+            # Subir a S3
+            s3_client.put_object(
+                Bucket=S3_BUCKET,
+                Key=s3_key,
+                Body=imagen_data,
+                ContentType=f'image/{extension}',
+                CacheControl='max-age=31536000'  # Cache 1 año
+            )
+
+            # Miniatura de tamaño informe junto al original (best effort:
+            # si falla, los informes la generan al vuelo)
+            _subir_miniatura(s3_client, s3_key, imagen_data)
+
+            # Generar URL pública
+            url = f"{S3_URL_PREFIX}{s3_key}"
+            urls.append(url)
+
+        return urls
+
+    except HTTPException:
+        raise
+    except ClientError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error subiendo imágenes a S3: {str(e)}"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error inesperado: {str(e)}"
+        )
+
+
+def _subir_miniatura(s3_client, s3_key: str, imagen_data: bytes) -> Optional[bytes]:
+    """Genera y sube la miniatura de una imagen. Retorna sus bytes (None si falla)"""
+    miniatura = generar_miniatura(imagen_data)
+    if miniatura is None:
+        return None
+    try:
+        s3_client.put_object(
+            Bucket=S3_BUCKET,
+            Key=clave_miniatura(s3_key),
+            Body=miniatura,
+            ContentType='image/jpeg',
+            CacheControl='max-age=31536000'
+        )
+    except Exception as e:
+        print(f"      ⚠️ Error subiendo miniatura de {s3_key}: {e}")
+    return miniatura
+
+
+def s3_key_desde_url(url: str) -> Optional[str]:
+    """Extrae la key S3 de una URL pública del bucket de evidencias"""
+    if S3_URL_PREFIX and url and url.startswith(S3_URL_PREFIX):
+        return url[len(S3_URL_PREFIX):]
+    return None
+
+
+def descargar_imagenes_s3(urls: List[str], max_workers: int = 8) -> List[Optional[bytes]]:
+    """Descarga en paralelo imágenes del bucket de evidencias (None si alguna falla)"""
+    if not urls or not S3_AVAILABLE:
+        return [None] * len(urls or [])
+
+    s3_client = boto3.client('s3', region_name=S3_REGION)
+
+    def _descargar(url: str) -> Optional[bytes]:
+        key = s3_key_desde_url(url)
+        if not key:
+            return None
+        try:
+            return s3_client.get_object(Bucket=S3_BUCKET, Key=key)['Body'].read()
+        except Exception as e:
+            print(f"      ⚠️ Error descargando imagen {key}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        return list(executor.map(_descargar, urls))
+
+
+def tiene_imagenes(evidencia) -> bool:
+    """True si la evidencia tiene imágenes en S3 o Base64 legacy"""
+    return bool(evidencia.imagenes_s3_urls) or bool(evidencia.imagenes)
+
+
+def cargar_imagenes_evidencia(evidencia) -> List[Optional[bytes]]:
+    """
+    Bytes de las imágenes de una evidencia: desde S3 si está migrada,
+    si no decodificando el Base64 legacy. None en las que no se pudieron leer.
+    """
+    if evidencia.migrated_to_s3 and evidencia.imagenes_s3_urls:
+        return descargar_imagenes_s3(evidencia.imagenes_s3_urls)
+
+    imagenes = []
+    for img_base64 in evidencia.imagenes or []:
+        try:
+            imagenes.append(base64.b64decode(_limpiar_base64(img_base64)))
+        except Exception:
+            imagenes.append(None)
+    return imagenes
+
+
+def _descargar_miniatura(s3_client, url: str) -> Optional[bytes]:
+    """
+    Miniatura de una imagen en S3. Si no existe (imágenes subidas antes del
+    pipeline de miniaturas), la genera desde el original y la deja subida.
+    """
+    key = s3_key_desde_url(url)
+    if not key:
+        return None
+    try:
+        return s3_client.get_object(Bucket=S3_BUCKET, Key=clave_miniatura(key))['Body'].read()
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+            print(f"      ⚠️ Error descargando miniatura de {key}: {e}")
+    except Exception as e:
+        print(f"      ⚠️ Error descargando miniatura de {key}: {e}")
+
+    try:
+        original = s3_client.get_object(Bucket=S3_BUCKET, Key=key)['Body'].read()
+    except Exception as e:
+        print(f"      ⚠️ Error descargando imagen {key}: {e}")
+        return None
+    return _subir_miniatura(s3_client, key, original)
+
+
+def cargar_miniaturas_evidencia(evidencia, max_workers: int = 8) -> List[Optional[bytes]]:
+    """
+    Miniaturas JPEG (tamaño informe) de las imágenes de una evidencia.
+    Es lo que deben embeber los generadores de PDF/DOCX en lugar de los originales.
+    None en las que no se pudieron leer.
+    """
+    if evidencia.migrated_to_s3 and evidencia.imagenes_s3_urls:
+        urls = evidencia.imagenes_s3_urls
+        if not S3_AVAILABLE:
+            return [None] * len(urls)
+        s3_client = boto3.client('s3', region_name=S3_REGION)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+            return list(executor.map(lambda url: _descargar_miniatura(s3_client, url), urls))
+
+    # Base64 legacy: reducir en memoria
+    return [
+        generar_miniatura(imagen) if imagen else None
+        for imagen in cargar_imagenes_evidencia(evidencia)
+    ]
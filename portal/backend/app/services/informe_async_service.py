@@ -1,21 +1,24 @@
 """
 Servicio de generación asíncrona de informes PDM.
 Maneja generación en background, almacenamiento en S3 y notificaciones.
+La ejecución la hace la cola de app.services.informe_queue.
 """
-import threading
 import traceback
+import hashlib
+import json
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 import boto3
 from botocore.exceptions import ClientError
+from sqlalchemy import func, or_, and_
 from sqlalchemy.orm import Session
-from app.config.database import SessionLocal, get_db
+from app.config.database import get_db
 from app.models.informe import InformeEstado
-from app.models.alert import Alert
+from app.services.alertas import crear_alertas
 from app.services.pdm_report_generator import PDMReportGenerator
+from app.services.informe_queue import registrar_handler, prioridad_para, notificar_nuevo_trabajo
 import os
 import tempfile
-import sys
 
 
 class InformeGeneratorService:
@@ -23,8 +26,8 @@ class InformeGeneratorService:
     Servicio para generar informes PDM de forma asíncrona.
     
     Flujo:
-    1. Usuario solicita informe → Se crea registro en DB (estado=pending)
-    2. Background thread inicia generación → estado=processing
+    1. Usuario solicita informe → Se encola registro en DB (estado=pending)
+    2. Un worker de la cola lo reclama con lease → estado=processing
     3. Genera PDF/DOCX/Excel con lógica existente
     4. Sube archivo a S3
     5. Actualiza estado=completed y crea notificación
@@ -53,16 +56,29 @@ class InformeGeneratorService:
         filtros: Optional[Dict[str, Any]] = None
     ) -> InformeEstado:
         """
-        Inicia la generación asíncrona de un informe.
+        Encola la generación asíncrona de un informe.
         Retorna el objeto InformeEstado inmediatamente.
+        
+        Si ya existe un informe idéntico (mismo fingerprint) en curso o
+        completado y vigente, se reutiliza en lugar de generar otro.
         """
-        # Crear registro en DB
+        fingerprint = self.calcular_fingerprint(db, entity_id, anio, formato, filtros)
+        
+        existente = self._buscar_reutilizable(db, entity_id, fingerprint)
+        if existente is not None:
+            return self._reutilizar(db, existente, user_id, fingerprint)
+        
+        # Crear registro en DB (la fila es el trabajo de la cola)
         informe = InformeEstado(
             entity_id=entity_id,
             user_id=user_id,
+            tipo='pdm',
             anio=anio,
             formato=formato,
             filtros=filtros,
+            params={'slug': slug},
+            prioridad=prioridad_para(formato),
+            fingerprint=fingerprint,
             estado='pending',
             progreso=0
         )
@@ -70,321 +86,442 @@ class InformeGeneratorService:
         db.commit()
         db.refresh(informe)
         
-        print(f"🚀 Iniciando generación async del informe {informe.id}...", flush=True)
+        print(f"🚀 Informe {informe.id} encolado (prioridad {informe.prioridad})", flush=True)
+        notificar_nuevo_trabajo()
+        
+        return informe
+    
+    # ============================================
+    # Deduplicación de solicitudes
+    # ============================================
+    
+    @staticmethod
+    def _filtros_canonicos(filtros: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Normaliza filtros: sin valores vacíos y con listas ordenadas"""
+        canonicos = {}
+        for clave, valor in (filtros or {}).items():
+            if valor in (None, '', [], False):
+                continue
+            if isinstance(valor, (list, tuple, set)):
+                valor = sorted(valor, key=str)
+            canonicos[clave] = valor
+        return canonicos
+    
+    def version_datos_pdm(self, db: Session, entity_id: int) -> str:
+        """
+        Versión de los datos PDM de la entidad: (cantidad, último cambio) por tabla.
+        La cantidad detecta eliminaciones, que no dejan updated_at.
+        """
+        from app.models.entity import Entity
+        from app.models.pdm import PdmProducto, PdmActividad, PdmActividadEvidencia
+        from app.models.pdm_ejecucion import PDMEjecucionPresupuestal
+        from app.models.secretaria import Secretaria
+        
+        partes = []
+        for modelo in (PdmProducto, PdmActividad, PdmActividadEvidencia, PDMEjecucionPresupuestal, Secretaria):
+            total, ultimo = db.query(
+                func.count(modelo.id),
+                func.max(func.coalesce(modelo.updated_at, modelo.created_at))
+            ).filter(modelo.entity_id == entity_id).one()
+            partes.append(f"{modelo.__tablename__}:{total}:{ultimo}")
         
-        # Iniciar generación en background (daemon=True para no bloquear shutdown del worker)
-        thread = threading.Thread(
-            target=self._generar_informe_background,
-            args=(informe.id, slug),
-            daemon=True,
-            name=f"informe-{informe.id}"
+        entidad = db.query(
+            func.coalesce(Entity.updated_at, Entity.created_at)
+        ).filter(Entity.id == entity_id).scalar()
+        partes.append(f"entities:{entidad}")
+        return '|'.join(partes)
+    
+    def calcular_fingerprint(
+        self,
+        db: Session,
+        entity_id: int,
+        anio: int,
+        formato: str,
+        filtros: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Hash canónico de la solicitud más la versión de los datos de la entidad"""
+        solicitud = {
+            'tipo': 'pdm',
+            'entity_id': entity_id,
+            'anio': anio,
+            'formato': 'xlsx' if formato == 'excel' else formato,
+            'filtros': self._filtros_canonicos(filtros),
+            'datos': self.version_datos_pdm(db, entity_id),
+        }
+        canonico = json.dumps(solicitud, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+    
+    def _buscar_reutilizable(self, db: Session, entity_id: int, fingerprint: str) -> Optional[InformeEstado]:
+        """Informe idéntico en curso (no adjunto) o completado sin expirar"""
+        ahora = datetime.utcnow()
+        return db.query(InformeEstado).filter(
+            InformeEstado.entity_id == entity_id,
+            InformeEstado.fingerprint == fingerprint,
+            or_(
+                and_(
+                    InformeEstado.estado.in_(('pending', 'processing')),
+                    InformeEstado.duplicado_de.is_(None)
+                ),
+                and_(
+                    InformeEstado.estado == 'completed',
+                    InformeEstado.s3_key.isnot(None),
+                    InformeEstado.expires_at > ahora
+                )
+            )
+        ).order_by(InformeEstado.created_at.desc()).first()
+    
+    def _reutilizar(self, db: Session, existente: InformeEstado, user_id: int, fingerprint: str) -> InformeEstado:
+        """
+        Mismo usuario: se retorna el informe existente.
+        Otro usuario: si está completado se le entrega el mismo objeto S3; si está
+        en curso se crea un registro adjunto que se resuelve al terminar el original.
+        """
+        if existente.user_id == user_id:
+            print(f"♻️ Solicitud duplicada: se reutiliza el informe {existente.id} ({existente.estado})", flush=True)
+            return existente
+        
+        informe = InformeEstado(
+            entity_id=existente.entity_id,
+            user_id=user_id,
+            tipo=existente.tipo,
+            anio=existente.anio,
+            formato=existente.formato,
+            filtros=existente.filtros,
+            params=existente.params,
+            fecha_inicio=existente.fecha_inicio,
+            fecha_fin=existente.fecha_fin,
+            prioridad=existente.prioridad,
+            fingerprint=fingerprint,
+            estado='pending',
+            progreso=0
         )
-        thread.start()
         
-        print(f"✅ Thread '{thread.name}' lanzado para informe {informe.id}, is_alive={thread.is_alive()}", flush=True)
+        if existente.estado == 'completed':
+            self._copiar_resultado(existente, informe)
+            db.add(informe)
+            db.commit()
+            db.refresh(informe)
+            print(f"♻️ Informe {informe.id} servido desde el resultado de {existente.id} (sin regenerar)", flush=True)
+            self._crear_notificacion_exito(db, informe)
+            return informe
         
+        informe.duplicado_de = existente.id
+        db.add(informe)
+        db.commit()
+        db.refresh(informe)
+        print(f"♻️ Informe {informe.id} adjunto al informe en curso {existente.id}", flush=True)
         return informe
     
-    def _generar_informe_background(self, informe_id: int, slug: str):
+    @staticmethod
+    def _copiar_resultado(origen: InformeEstado, destino: InformeEstado):
+        ahora = datetime.utcnow()
+        destino.s3_url = origen.s3_url
+        destino.s3_key = origen.s3_key
+        destino.filename = origen.filename
+        destino.file_size = origen.file_size
+        destino.expires_at = origen.expires_at
+        destino.estado = 'completed'
+        destino.progreso = 100
+        destino.started_at = destino.started_at or ahora
+        destino.completed_at = ahora
+    
+    def _resolver_adjuntos(self, db: Session, informe: InformeEstado):
         """
-        Función que se ejecuta en background thread para generar el informe.
+        Al terminar un informe, completa los registros adjuntos con su resultado.
+        Si el original no se completó, los adjuntos vuelven a la cola por su cuenta.
         """
-        try:
-            print(f"🔵 Thread iniciado para informe {informe_id}", flush=True)
-            print(f"🔍 Intentando crear SessionLocal()...", flush=True)
-            
-            db = SessionLocal()
-            
-            print(f"✅ SessionLocal() creado exitosamente", flush=True)
-            print(f"🔍 Buscando informe {informe_id} en DB...", flush=True)
-            
-        except Exception as e:
-            print(f"❌ ERROR FATAL al inicio del thread para informe {informe_id}: {type(e).__name__}: {e}", flush=True)
-            print(f"❌ Traceback completo:", flush=True)
-            traceback.print_exc(file=sys.stdout)
-            sys.stdout.flush()
+        if not db.is_active:
+            db.rollback()
+        db.refresh(informe)
+        
+        adjuntos = db.query(InformeEstado).filter(
+            InformeEstado.duplicado_de == informe.id,
+            InformeEstado.estado == 'pending'
+        ).all()
+        if not adjuntos:
             return
         
+        if informe.estado == 'completed':
+            for adjunto in adjuntos:
+                self._copiar_resultado(informe, adjunto)
+            db.commit()
+            for adjunto in adjuntos:
+                self._crear_notificacion_exito(db, adjunto)
+            print(f"♻️ Resultado del informe {informe.id} entregado a {len(adjuntos)} solicitud(es) adjunta(s)", flush=True)
+        else:
+            for adjunto in adjuntos:
+                adjunto.duplicado_de = None
+            db.commit()
+            notificar_nuevo_trabajo()
+    
+    # ============================================
+    # Generación (handler de la cola)
+    # ============================================
+    
+    def procesar_informe(self, db: Session, informe: InformeEstado):
+        """
+        Handler de la cola para informes tipo 'pdm'.
+        El worker ya reclamó la fila (estado=processing, lease vigente).
+        """
+        try:
+            self._generar_informe(db, informe)
+        finally:
+            try:
+                self._resolver_adjuntos(db, informe)
+            except Exception as e:
+                db.rollback()
+                print(f"⚠️ Error resolviendo solicitudes adjuntas al informe {informe.id}: {e}", flush=True)
+    
+    def _generar_informe(self, db: Session, informe: InformeEstado):
+        """Genera el archivo, lo sube a S3 y notifica al usuario"""
+        slug = (informe.params or {}).get('slug')
+        
+        informe.progreso = 10
+        informe.error_message = None
+        db.commit()
+        
+        print(f"📊 Generando informe {informe.id} para año {informe.anio}, formato {informe.formato}", flush=True)
+        
+        # Generar informe usando lógica existente
         try:
-            # Obtener informe
-            informe = db.query(InformeEstado).filter(InformeEstado.id == informe_id).first()
-            if not informe:
-                print(f"❌ Informe {informe_id} no encontrado", flush=True)
-                return
+            # Importar modelos necesarios
+            from app.models.entity import Entity
+            from app.models.pdm import PdmProducto, PdmActividad, PdmActividadEvidencia
+            from app.models.secretaria import Secretaria
+            from sqlalchemy import or_
+            from sqlalchemy.orm import defer, selectinload, noload
             
-            print(f"✅ Informe {informe_id} encontrado, actualizando a 'processing'...", flush=True)
-            # Actualizar estado a processing
-            informe.estado = 'processing'
-            informe.started_at = datetime.utcnow()
-            informe.progreso = 10
-            db.commit()
+            # Obtener entidad
+            entity = db.query(Entity).filter(Entity.id == informe.entity_id).first()
+            if not entity:
+                raise Exception(f"Entidad '{slug}' no encontrada")
+            slug = entity.slug
             
-            print(f"📊 Generando informe {informe_id} para año {informe.anio}, formato {informe.formato}", flush=True)
+            # Procesar filtros
+            secretaria_ids = informe.filtros.get('secretaria_ids') if informe.filtros else None
+            fecha_inicio = informe.filtros.get('fecha_inicio') if informe.filtros else None
+            fecha_fin = informe.filtros.get('fecha_fin') if informe.filtros else None
+            estados = informe.filtros.get('estados') if informe.filtros else None  
+            usar_ia = informe.filtros.get('usar_ia', False) if informe.filtros else False
             
-            # Generar informe usando lógica existente
-            try:
-                # Importar modelos necesarios
-                from app.models.entity import Entity
-                from app.models.pdm import PdmProducto, PdmActividad, PdmActividadEvidencia
-                from app.models.secretaria import Secretaria
-                from sqlalchemy import or_
-                from sqlalchemy.orm import defer, selectinload, noload
-                
-                # Obtener entidad
-                entity = db.query(Entity).filter(Entity.slug == slug).first()
-                if not entity:
-                    raise Exception(f"Entidad '{slug}' no encontrada")
-                
-                # Procesar filtros
-                secretaria_ids = informe.filtros.get('secretaria_ids') if informe.filtros else None
-                fecha_inicio = informe.filtros.get('fecha_inicio') if informe.filtros else None
-                fecha_fin = informe.filtros.get('fecha_fin') if informe.filtros else None
-                estados = informe.filtros.get('estados') if informe.filtros else None  
-                usar_ia = informe.filtros.get('usar_ia', False) if informe.filtros else False
-                
-                # Obtener productos con filtros
-                productos_query = db.query(PdmProducto).options(
-                    defer(PdmProducto.presupuesto_2024),
-                    defer(PdmProducto.presupuesto_2025),
-                    defer(PdmProducto.presupuesto_2026),
-                    defer(PdmProducto.presupuesto_2027),
-                    selectinload(PdmProducto.responsable_secretaria)
-                ).filter(
-                    PdmProducto.entity_id == entity.id
+            # Obtener productos con filtros
+            productos_query = db.query(PdmProducto).options(
+                defer(PdmProducto.presupuesto_2024),
+                defer(PdmProducto.presupuesto_2025),
+                defer(PdmProducto.presupuesto_2026),
+                defer(PdmProducto.presupuesto_2027),
+                selectinload(PdmProducto.responsable_secretaria)
+            ).filter(
+                PdmProducto.entity_id == entity.id
+            )
+            
+            # Filtrar por secretarías
+            if secretaria_ids:
+                productos_query = productos_query.filter(
+                    PdmProducto.responsable_secretaria_id.in_(secretaria_ids)
                 )
-                
-                # Filtrar por secretarías
-                if secretaria_ids:
-                    productos_query = productos_query.filter(
-                        PdmProducto.responsable_secretaria_id.in_(secretaria_ids)
-                    )
-                
-                # Filtrar por año
-                if informe.anio > 0:
-                    campo_meta = f"programacion_{informe.anio}"
-                    productos_query = productos_query.filter(
-                        getattr(PdmProducto, campo_meta, 0) > 0
-                    )
-                else:
-                    productos_query = productos_query.filter(
-                        or_(
-                            PdmProducto.programacion_2024 > 0,
-                            PdmProducto.programacion_2025 > 0,
-                            PdmProducto.programacion_2026 > 0,
-                            PdmProducto.programacion_2027 > 0  
-                        )
+            
+            # Filtrar por año
+            if informe.anio > 0:
+                campo_meta = f"programacion_{informe.anio}"
+                productos_query = productos_query.filter(
+                    getattr(PdmProducto, campo_meta, 0) > 0
+                )
+            else:
+                productos_query = productos_query.filter(
+                    or_(
+                        PdmProducto.programacion_2024 > 0,
+                        PdmProducto.programacion_2025 > 0,
+                        PdmProducto.programacion_2026 > 0,
+                        PdmProducto.programacion_2027 > 0  
                     )
-                
-                productos = productos_query.all()
-                
-                if not productos:
-                    raise Exception(f"No hay productos para los filtros especificados")
-                
-                print(f"   Productos encontrados: {len(productos)}")
-                
-                # Obtener actividades con filtros
-                actividades_query = db.query(PdmActividad).options(
-                    selectinload(PdmActividad.responsable_secretaria),
-                    noload(PdmActividad.evidencia)
-                ).filter(
-                    PdmActividad.entity_id == entity.id
                 )
-                
-                # Filtrar por año
-                if informe.anio > 0:
-                    actividades_query = actividades_query.filter(PdmActividad.anio == informe.anio)
-                
-                # Filtrar por secretarías
-                if secretaria_ids:
+            
+            productos = productos_query.all()
+            
+            if not productos:
+                raise Exception(f"No hay productos para los filtros especificados")
+            
+            print(f"   Productos encontrados: {len(productos)}")
+            
+            # Obtener actividades con filtros
+            actividades_query = db.query(PdmActividad).options(
+                selectinload(PdmActividad.responsable_secretaria),
+                noload(PdmActividad.evidencia)
+            ).filter(
+                PdmActividad.entity_id == entity.id
+            )
+            
+            # Filtrar por año
+            if informe.anio > 0:
+                actividades_query = actividades_query.filter(PdmActividad.anio == informe.anio)
+            
+            # Filtrar por secretarías
+            if secretaria_ids:
+                actividades_query = actividades_query.filter(
+                    PdmActividad.responsable_secretaria_id.in_(secretaria_ids)
+                )
+            
+            # Filtrar por fechas
+            if fecha_inicio:
+                try:
+                    fecha_inicio_dt = datetime.strptime(fecha_inicio, "%Y-%m-%d")
                     actividades_query = actividades_query.filter(
-                        PdmActividad.responsable_secretaria_id.in_(secretaria_ids)
+                        PdmActividad.fecha_inicio >= fecha_inicio_dt
                     )
-                
-                # Filtrar por fechas
-                if fecha_inicio:
-                    try:
-                        fecha_inicio_dt = datetime.strptime(fecha_inicio, "%Y-%m-%d")
-                        actividades_query = actividades_query.filter(
-                            PdmActividad.fecha_inicio >= fecha_inicio_dt
-                        )
-                    except ValueError:
-                        pass
-                
-                if fecha_fin:
-                    try:
-                        fecha_fin_dt = datetime.strptime(fecha_fin, "%Y-%m-%d")
-                        actividades_query = actividades_query.filter(
-                            PdmActividad.fecha_fin <= fecha_fin_dt
-                        )
-                    except ValueError:
-                        pass
-                
-                # Filtrar por estados
-                if estados:
+                except ValueError:
+                    pass
+            
+            if fecha_fin:
+                try:
+                    fecha_fin_dt = datetime.strptime(fecha_fin, "%Y-%m-%d")
                     actividades_query = actividades_query.filter(
-                        PdmActividad.estado.in_(estados)
+                        PdmActividad.fecha_fin <= fecha_fin_dt
                     )
-                
-                actividades = actividades_query.all()
-                print(f"   Actividades encontradas: {len(actividades)}")
-                
-                # Marcar actividades con evidencia
-                actividades_ids = [act.id for act in actividades]
-                evidencias_existentes = db.query(PdmActividadEvidencia.actividad_id).filter(
-                    PdmActividadEvidencia.actividad_id.in_(actividades_ids)
-                ).all()
-                evidencias_ids_set = {ev[0] for ev in evidencias_existentes}
-                
-                for act in actividades:
-                    act.tiene_evidencia = act.id in evidencias_ids_set
-                
-                # Obtener nombres de secretarías
-                secretarias_nombres = []
-                if secretaria_ids:
-                    secretarias = db.query(Secretaria).filter(
-                        Secretaria.id.in_(secretaria_ids)
-                    ).all()
-                    secretarias_nombres = [s.nombre for s in secretarias]
-                
-                # Generar informe
-                generator = PDMReportGenerator(
-                    entity=entity,
-                    productos=productos,
-                    actividades=actividades,
-                    anio=informe.anio,
-                    db=db,
-                    filtros={
-                        'secretarias': secretarias_nombres,
-                        'fecha_inicio': fecha_inicio,
-                        'fecha_fin': fecha_fin,
-                        'estados': estados
-                    },
-                    usar_ia=usar_ia
-                )
-                
-                # Generar según formato
-                if informe.formato == "pdf":
-                    file_content = generator.generate()
-                elif informe.formato == "docx":
-                    file_content = generator.generate_docx()
-                elif informe.formato in ["excel", "xlsx"]:
-                    file_content = generator.generate_excel()
-                else:
-                    raise Exception(f"Formato '{informe.formato}' no soportado")
-                
-                informe.progreso = 70
-                db.commit()
-                
-            except Exception as e:
-                print(f"❌ Error generando informe: {e}")
-                traceback.print_exc()
-                informe.estado = 'failed'
-                informe.error_message = str(e)
-                informe.completed_at = datetime.utcnow()
-                db.commit()
-                
-                # Crear notificación de error
-                self._crear_notificacion_error(db, informe)
-                return
+                except ValueError:
+                    pass
             
-            # Subir a S3
-            try:
-                extension = self._get_extension(informe.formato)
-                filename = f"informe-pdm-{slug}-{informe.anio}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}"
-                s3_key = f"informes/{slug}/{filename}"
-                
-                content_type = self._get_content_type(informe.formato)
-                
-                self.s3_client.put_object(
-                    Bucket=self.bucket_name,
-                    Key=s3_key,
-                    Body=file_content,
-                    ContentType=content_type,
-                    ContentDisposition=f'attachment; filename="{filename}"'
+            # Filtrar por estados
+            if estados:
+                actividades_query = actividades_query.filter(
+                    PdmActividad.estado.in_(estados)
                 )
-                
-                # Generar URL pública (bucket debe tener public read)
-                s3_url = f"https://{self.bucket_name}.s3.{self.bucket_region}.amazonaws.com/{s3_key}"
-                
-                informe.s3_url = s3_url
-                informe.s3_key = s3_key
-                informe.filename = filename
-                informe.file_size = len(file_content)
-                informe.progreso = 100
-                informe.estado = 'completed'
-                informe.completed_at = datetime.utcnow()
-                informe.expires_at = datetime.utcnow() + timedelta(days=7)  # Expira en 7 días
-                
-                db.commit()
-                
-                print(f"✅ Informe {informe_id} generado y subido a S3: {s3_url}")
-                
-            except Exception as e:
-                print(f"❌ Error subiendo a S3: {e}")
-                traceback.print_exc()
-                informe.estado = 'failed'
-                informe.error_message = f"Error subiendo a S3: {str(e)}"
-                informe.completed_at = datetime.utcnow()
-                db.commit()
-                
-                # Crear notificación de error
-                self._crear_notificacion_error(db, informe)
-                return
             
-            # Crear notificación de éxito
-            self._crear_notificacion_exito(db, informe)
+            actividades = actividades_query.all()
+            print(f"   Actividades encontradas: {len(actividades)}")
+            
+            # Marcar actividades con evidencia
+            actividades_ids = [act.id for act in actividades]
+            evidencias_existentes = db.query(PdmActividadEvidencia.actividad_id).filter(
+                PdmActividadEvidencia.actividad_id.in_(actividades_ids)
+            ).all()
+            evidencias_ids_set = {ev[0] for ev in evidencias_existentes}
+            
+            for act in actividades:
+                act.tiene_evidencia = act.id in evidencias_ids_set
+            
+            # Obtener nombres de secretarías
+            secretarias_nombres = []
+            if secretaria_ids:
+                secretarias = db.query(Secretaria).filter(
+                    Secretaria.id.in_(secretaria_ids)
+                ).all()
+                secretarias_nombres = [s.nombre for s in secretarias]
+            
+            # Generar informe
+            generator = PDMReportGenerator(
+                entity=entity,
+                productos=productos,
+                actividades=actividades,
+                anio=informe.anio,
+                db=db,
+                filtros={
+                    'secretarias': secretarias_nombres,
+                    'fecha_inicio': fecha_inicio,
+                    'fecha_fin': fecha_fin,
+                    'estados': estados
+                },
+                usar_ia=usar_ia
+            )
+            
+            # Generar según formato
+            if informe.formato == "pdf":
+                file_content = generator.generate()
+            elif informe.formato == "docx":
+                file_content = generator.generate_docx()
+            elif informe.formato in ["excel", "xlsx"]:
+                file_content = generator.generate_excel()
+            else:
+                raise Exception(f"Formato '{informe.formato}' no soportado")
+            
+            informe.progreso = 70
+            db.commit()
             
         except Exception as e:
-            print(f"❌ Error inesperado generando informe {informe_id}: {type(e).__name__}: {e}", flush=True)
-            print(f"❌ Traceback completo:", flush=True)
-            traceback.print_exc(file=sys.stdout)
-            sys.stdout.flush()
+            print(f"❌ Error generando informe: {e}")
+            traceback.print_exc()
+            informe.estado = 'failed'
+            informe.error_message = str(e)
+            informe.completed_at = datetime.utcnow()
+            db.commit()
             
-            try:
-                informe.estado = 'failed'
-                informe.error_message = str(e)[:500]  # Truncar mensaje si es muy largo
-                informe.completed_at = datetime.utcnow()
-                db.commit()
-                print(f"✅ Estado actualizado a 'failed' para informe {informe_id}", flush=True)
-            except Exception as e2:
-                print(f"❌ Error al actualizar estado a failed: {e2}", flush=True)
-                pass
+            # Crear notificación de error
+            self._crear_notificacion_error(db, informe)
+            return
         
-        finally:
-            try:
-                db.close()
-                print(f"✅ Sesión DB cerrada para informe {informe_id}", flush=True)
-            except Exception as e:
-                print(f"❌ Error cerrando sesión: {e}", flush=True)
+        # Subir a S3
+        try:
+            extension = self._get_extension(informe.formato)
+            filename = f"informe-pdm-{slug}-{informe.anio}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}"
+            s3_key = f"informes/{slug}/{filename}"
+            
+            content_type = self._get_content_type(informe.formato)
+            
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                Body=file_content,
+                ContentType=content_type,
+                ContentDisposition=f'attachment; filename="{filename}"'
+            )
+            
+            # Generar URL pública (bucket debe tener public read)
+            s3_url = f"https://{self.bucket_name}.s3.{self.bucket_region}.amazonaws.com/{s3_key}"
+            
+            informe.s3_url = s3_url
+            informe.s3_key = s3_key
+            informe.filename = filename
+            informe.file_size = len(file_content)
+            informe.progreso = 100
+            informe.estado = 'completed'
+            informe.completed_at = datetime.utcnow()
+            informe.expires_at = datetime.utcnow() + timedelta(days=7)  # Expira en 7 días
+            
+            db.commit()
+            
+            print(f"✅ Informe {informe.id} generado y subido a S3: {s3_url}")
+            
+        except Exception as e:
+            print(f"❌ Error subiendo a S3: {e}")
+            traceback.print_exc()
+            informe.estado = 'failed'
+            informe.error_message = f"Error subiendo a S3: {str(e)}"
+            informe.completed_at = datetime.utcnow()
+            db.commit()
+            
+            # Crear notificación de error
+            self._crear_notificacion_error(db, informe)
+            return
+        
+        # Crear notificación de éxito
+        self._crear_notificacion_exito(db, informe)
     
     def _crear_notificacion_exito(self, db: Session, informe: InformeEstado):
         """Crea notificación cuando el informe está listo."""
         formato_nombre = informe.formato.upper()
         
-        alert = Alert(
+        crear_alertas(
+            db, [informe.user_id],
             entity_id=informe.entity_id,
-            recipient_user_id=informe.user_id,
             type='INFORME_PDM_READY',
             title=f'Informe PDM {formato_nombre} listo',
             message=f'Tu informe del año {informe.anio} en formato {formato_nombre} está listo para descargar.',
-            data=f'{{"informe_id": {informe.id}, "filename": "{informe.filename}", "formato": "{informe.formato}"}}'
+            data={"informe_id": informe.id, "filename": informe.filename, "formato": informe.formato}
         )
-        db.add(alert)
         db.commit()
         
         print(f"✅ Notificación creada para usuario {informe.user_id}")
     
     def _crear_notificacion_error(self, db: Session, informe: InformeEstado):
         """Crea notificación cuando falla la generación."""
-        alert = Alert(
+        crear_alertas(
+            db, [informe.user_id],
             entity_id=informe.entity_id,
-            recipient_user_id=informe.user_id,
             type='INFORME_PDM_ERROR',
             title='Error generando informe PDM',
             message=f'Hubo un error al generar tu informe del año {informe.anio}. Por favor intenta nuevamente.',
-            data=f'{{"informe_id": {informe.id}, "error": "{informe.error_message}"}}'
+            data={"informe_id": informe.id, "error": informe.error_message}
         )
-        db.add(alert)
         db.commit()
     
     def _get_extension(self, formato: str) -> str:
@@ -450,3 +587,4 @@ class InformeGeneratorService:
 
 # Singleton instance
 informe_service = InformeGeneratorService()
+registrar_handler('pdm', informe_service.procesar_informe)
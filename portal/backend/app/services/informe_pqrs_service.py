@@ -0,0 +1,414 @@
+"""
+Generación asíncrona de informes PQRS.
+Usa la misma cola que los informes PDM (app.services.informe_queue): la
+solicitud crea una fila tipo='pqrs' en informes_estado y un worker construye
+el PDF (analítica, IA, gráficas y membrete), lo sube a S3 y deja una alerta
+al usuario. Los informes se listan en /pqrs/informes.
+"""
+import traceback
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+import boto3
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models.entity import Entity
+from app.models.informe import InformeEstado
+from app.models.pqrs import PQRS
+from app.models.user import User
+from app.services.alertas import crear_alertas
+from app.services.ai_gateway import ai_gateway
+from app.services.informe_async_service import InformeGeneratorService
+from app.services.informe_queue import registrar_handler, prioridad_para, notificar_nuevo_trabajo
+from app.services.pqrs_analytics import calcular_analytics, listar_recientes
+
+
+S3_BUCKET = "softone360-pqrs-archivos"
+S3_REGION = "us-east-1"
+URL_EXPIRA_SEGUNDOS = 604800  # 7 días
+
+
+def analisis_por_defecto(
+    entity_name: str,
+    fecha_inicio: str,
+    fecha_fin: str,
+    analytics: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Análisis del informe cuando la IA no está habilitada o falla"""
+    total = analytics['totalPqrs']
+    pendientes = analytics['pendientes']
+    en_proceso = analytics['enProceso']
+    resueltas = analytics['resueltas']
+    cerradas = analytics['cerradas']
+    tiempo_promedio = analytics['tiempoPromedioRespuesta']
+    
+    # Calcular métricas adicionales para análisis más rico
+    tipos_ordenados = sorted(analytics['tiposPqrs'].items(), key=lambda x: x[1], reverse=True)
+    tipo_principal = tipos_ordenados[0] if tipos_ordenados else ('N/A', 0)
+
+    return {
+        'introduccion': (
+            f"El presente informe corresponde a la gestión de Peticiones, Quejas, Reclamos, Solicitudes y Denuncias (PQRS) "
+            f"del {entity_name} durante el período comprendido entre {fecha_inicio} y {fecha_fin}. "
+            f"Durante este período se registró un total de {total} solicitudes ciudadanas, las cuales han sido atendidas "
+            f"a través de los diferentes canales de atención dispuestos por la entidad. "
+            f"Este informe presenta un análisis detallado de los indicadores de gestión, tiempos de respuesta, "
+            f"distribución por tipo y estado, así como recomendaciones orientadas a la mejora continua del servicio. "
+            f"La gestión de PQRS constituye un mecanismo fundamental para garantizar el derecho fundamental de petición "
+            f"consagrado en la Constitución Política y desarrollado en la Ley 1755 de 2015."
+        ),
+        'analisisGeneral': (
+            f"Durante el período analizado se registraron {total} PQRS, alcanzando una tasa de resolución del "
+            f"{analytics['tasaResolucion']:.1f}%, lo que refleja un desempeño "
+            f"{'satisfactorio y acorde con los estándares de calidad esperados' if analytics['tasaResolucion'] >= 70 else 'que requiere fortalecimiento para alcanzar niveles óptimos de gestión'}. "
+            f"Del total de solicitudes, {pendientes} se encuentran pendientes, {en_proceso} en proceso de atención, "
+            f"{resueltas} han sido resueltas satisfactoriamente y {cerradas} fueron cerradas. "
+            f"Estos indicadores permiten evidenciar el compromiso institucional con la atención oportuna y eficaz de las "
+            f"solicitudes ciudadanas. La distribución por estado refleja el flujo operativo del proceso de gestión de PQRS "
+            f"y permite identificar las etapas que requieren mayor atención o recursos. Es fundamental mantener un equilibrio "
+            f"adecuado entre las solicitudes en proceso y las resueltas para garantizar tiempos de respuesta óptimos. "
+            f"La gestión eficiente de PQRS no solo cumple con el marco normativo vigente, sino que además fortalece "
+            f"la confianza ciudadana en las instituciones públicas."
+        ),
+        'analisisTendencias': (
+            f"El análisis del período muestra un total de {total} solicitudes distribuidas en {len(analytics['tiposPqrs'])} "
+            f"tipos diferentes de PQRS. El tipo de solicitud más frecuente corresponde a "
+            f"{tipo_principal[0].replace('_', ' ').title()} con {tipo_principal[1]} casos, representando el "
+            f"{(tipo_principal[1]/total*100):.1f}% del total. Esta distribución permite identificar las principales "
+            f"necesidades y preocupaciones de la ciudadanía, orientando la toma de decisiones institucionales. "
+            f"Los tipos más frecuentes reflejan las prioridades y problemáticas que requieren atención por parte de la entidad. "
+            f"Es importante analizar si estos patrones son consistentes con períodos anteriores o si representan nuevas "
+            f"tendencias que requieran respuestas específicas. El comportamiento temporal de las solicitudes permite "
+            f"identificar posibles estacionalidades o eventos específicos que incrementan la demanda en determinados momentos. "
+            f"Este análisis debe orientar la planificación de recursos humanos y técnicos para garantizar una atención "
+            f"oportuna y de calidad en todo momento."
+        ),
+        'analisisTiempos': (
+            f"El tiempo promedio de respuesta registrado durante el período fue de {tiempo_promedio:.1f} días. "
+            f"De acuerdo con la Ley 1755 de 2015, el término legal general para responder PQRS es de 15 días hábiles, "
+            f"pudiendo prorrogarse por 10 días más cuando existan circunstancias excepcionales debidamente justificadas. "
+            f"{'El tiempo promedio se encuentra dentro de los parámetros legales establecidos, lo que evidencia el cumplimiento normativo de la entidad' if tiempo_promedio <= 15 else 'Se recomienda implementar acciones de mejora para optimizar los tiempos de respuesta y garantizar el cumplimiento de los plazos legales establecidos'}. "
+            f"Los tiempos de respuesta constituyen un indicador crítico de la eficiencia operativa y del compromiso "
+            f"institucional con la satisfacción ciudadana. Es fundamental mantener un monitoreo constante de este indicador "
+            f"e identificar oportunamente aquellos casos que puedan estar próximos al vencimiento de términos. "
+            f"La implementación de alertas tempranas y la asignación eficiente de responsables son estrategias clave "
+            f"para mantener y mejorar los tiempos de respuesta. Adicionalmente, es importante analizar las causas "
+            f"de demoras cuando estas se presenten, con el fin de implementar acciones correctivas específicas."
+        ),
+        'recomendaciones': [
+            "FORTALECIMIENTO DEL SEGUIMIENTO: Implementar un sistema de seguimiento periódico y automatizado de las PQRS para garantizar el cumplimiento de términos legales establecidos en la Ley 1755 de 2015. Este sistema debe incluir alertas tempranas para casos próximos al vencimiento, asignación clara de responsables y mecanismos de escalamiento cuando sea necesario. El seguimiento debe ser documentado y reportado mensualmente a la alta dirección.",
+
+            "OPTIMIZACIÓN DE PROCESOS: Realizar una revisión exhaustiva de los procesos internos de gestión de PQRS con el objetivo de identificar cuellos de botella, tiempos muertos y actividades redundantes. Implementar mejoras basadas en principios de eficiencia operativa, simplificación de trámites y automatización de tareas repetitivas. Esta optimización debe buscar reducir los tiempos de respuesta sin comprometer la calidad de las mismas.",
+
+            "FORTALECIMIENTO DE CANALES: Ampliar y fortalecer los canales de atención ciudadana (presencial, virtual, telefónico y escrito) para mejorar la accesibilidad al sistema de PQRS. Garantizar que todos los canales cuenten con personal capacitado, infraestructura tecnológica adecuada y procedimientos estandarizados. Implementar mecanismos de medición de satisfacción ciudadana en cada canal de atención.",
+
+            "SISTEMA DE INDICADORES: Desarrollar e implementar un tablero integral de indicadores de gestión que permita el monitoreo continuo y en tiempo real del proceso de PQRS. Este debe incluir métricas de volumen, tiempos de respuesta, tasas de resolución, satisfacción ciudadana y cumplimiento normativo. Los indicadores deben ser revisados periódicamente en comités de gestión y desempeño.",
+
+            "CAPACITACIÓN Y CULTURA: Diseñar e implementar un programa permanente de capacitación para funcionarios y contratistas sobre la normativa vigente (Ley 1755/2015, Decreto 1166/2016, Resolución 001519/2020) y mejores prácticas en atención ciudadana. Fomentar una cultura institucional orientada al servicio, la transparencia y el respeto por los derechos de los ciudadanos. La capacitación debe ser continua y evaluada en su efectividad."
+        ],
+        'conclusiones': (
+            f"La gestión de PQRS del {entity_name} durante el período analizado demuestra el compromiso institucional "
+            f"con la atención oportuna y eficaz de las solicitudes ciudadanas. Con un total de {total} PQRS gestionadas "
+            f"y una tasa de resolución del {analytics['tasaResolucion']:.1f}%, se evidencia un sistema funcional que "
+            f"responde a las necesidades de los ciudadanos. Sin embargo, como en todo proceso de mejora continua, existen "
+            f"oportunidades de fortalecimiento que han sido identificadas en este análisis. "
+            f"Es fundamental mantener el enfoque en la calidad de las respuestas, no solo en su oportunidad, garantizando "
+            f"que cada solicitud reciba una atención integral que resuelva efectivamente la situación planteada. "
+            f"La implementación de las recomendaciones formuladas permitirá elevar los estándares de gestión y consolidar "
+            f"un sistema de PQRS que sea referente de buenas prácticas en la administración pública. "
+            f"Se recomienda continuar con el monitoreo constante de los indicadores y la evaluación periódica del proceso, "
+            f"así como la socialización de resultados con todos los actores involucrados."
+        )
+    }
+
+
+
+def analizar_con_ia(
+    entity: Entity,
+    fecha_inicio: str,
+    fecha_fin: str,
+    analytics: Dict[str, Any],
+    pqrs_list: List[Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """
+    Análisis IA del informe desde un thread (worker de la cola). La llamada
+    corre en el event loop del gateway. Retorna None si falla.
+    """
+    try:
+        from app.services.openai_ai_service import get_openai_service
+        
+        servicio = get_openai_service()
+        return ai_gateway.ejecutar_sync(servicio.analizar_pqrs(
+            analytics=analytics,
+            entity_name=entity.name,
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            pqrs_list=pqrs_list
+        ))
+    except Exception as e:
+        print(f"⚠️ Error generando análisis de IA: {e}", flush=True)
+        return None
+
+
+class InformePQRSService(InformeGeneratorService):
+    """
+    Informes PQRS asíncronos. Hereda del servicio PDM la deduplicación por
+    fingerprint y la entrega del resultado a solicitudes adjuntas; cambia la
+    generación, el bucket y las notificaciones.
+    """
+    
+    def __init__(self):
+        self.s3_client = boto3.client('s3', region_name=S3_REGION)
+        self.bucket_name = S3_BUCKET
+        self.bucket_region = S3_REGION
+    
+    def iniciar_generacion(
+        self,
+        db: Session,
+        entity_id: int,
+        user_id: int,
+        fecha_inicio: str,
+        fecha_fin: str,
+        filtros: Optional[Dict[str, Any]] = None
+    ) -> InformeEstado:
+        """
+        Encola un informe PQRS (siempre PDF) y retorna el registro de inmediato.
+        
+        Args:
+            fecha_inicio, fecha_fin: período YYYY-MM-DD
+            filtros: estado, tipo, usar_ia, usuario_firmante_id
+        """
+        filtros = self._filtros_canonicos(filtros)
+        fingerprint = self.calcular_fingerprint(db, entity_id, fecha_inicio, fecha_fin, filtros)
+        
+        existente = self._buscar_reutilizable(db, entity_id, fingerprint)
+        if existente is not None:
+            return self._reutilizar(db, existente, user_id, fingerprint)
+        
+        informe = InformeEstado(
+            entity_id=entity_id,
+            user_id=user_id,
+            tipo='pqrs',
+            formato='pdf',
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            filtros=filtros or None,
+            prioridad=prioridad_para('pdf'),
+            fingerprint=fingerprint,
+            estado='pending',
+            progreso=0
+        )
+        db.add(informe)
+        db.commit()
+        db.refresh(informe)
+        
+        print(f"🚀 Informe PQRS {informe.id} encolado ({fecha_inicio} - {fecha_fin})", flush=True)
+        notificar_nuevo_trabajo()
+        
+        return informe
+    
+    def version_datos_pqrs(self, db: Session, entity_id: int) -> str:
+        """Versión de las PQRS de la entidad y de la entidad (membrete, IA habilitada)"""
+        total, ultimo = db.query(
+            func.count(PQRS.id),
+            func.max(func.coalesce(PQRS.updated_at, PQRS.created_at))
+        ).filter(PQRS.entity_id == entity_id).one()
+        entidad = db.query(
+            func.coalesce(Entity.updated_at, Entity.created_at)
+        ).filter(Entity.id == entity_id).scalar()
+        return f"pqrs:{total}:{ultimo}|entities:{entidad}"
+    
+    def calcular_fingerprint(
+        self,
+        db: Session,
+        entity_id: int,
+        fecha_inicio: str,
+        fecha_fin: str,
+        filtros: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Hash canónico de la solicitud más la versión de las PQRS de la entidad"""
+        solicitud = {
+            'tipo': 'pqrs',
+            'entity_id': entity_id,
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin,
+            'filtros': self._filtros_canonicos(filtros),
+            'datos': self.version_datos_pqrs(db, entity_id),
+        }
+        canonico = json.dumps(solicitud, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _copiar_resultado(origen: InformeEstado, destino: InformeEstado):
+        InformeGeneratorService._copiar_resultado(origen, destino)
+        destino.total_pqrs = origen.total_pqrs
+        destino.tasa_resolucion = origen.tasa_resolucion
+        destino.used_ai = origen.used_ai
+    
+    # ============================================
+    # Generación (handler de la cola)
+    # ============================================
+    
+    def _generar_informe(self, db: Session, informe: InformeEstado):
+        """Construye el PDF, lo sube a S3 y notifica al usuario"""
+        filtros = informe.filtros or {}
+        
+        informe.progreso = 10
+        informe.error_message = None
+        db.commit()
+        
+        print(f"📊 Generando informe PQRS {informe.id} ({informe.fecha_inicio} - {informe.fecha_fin})", flush=True)
+        
+        try:
+            from app.services.pqrs_report_generator import PQRSReportGenerator
+            
+            entity = db.query(Entity).filter(Entity.id == informe.entity_id).first()
+            if not entity:
+                raise Exception(f"Entidad {informe.entity_id} no encontrada")
+            
+            filtros_informe = dict(
+                entity_id=entity.id,
+                fecha_inicio=datetime.strptime(informe.fecha_inicio, '%Y-%m-%d'),
+                fecha_fin=datetime.strptime(informe.fecha_fin, '%Y-%m-%d'),
+                estado=filtros.get('estado'),
+                tipo=filtros.get('tipo')
+            )
+            analytics = calcular_analytics(db, **filtros_informe)
+            if not analytics['totalPqrs']:
+                raise Exception("No se encontraron PQRS en el rango de fechas seleccionado")
+            pqrs_list = listar_recientes(db, **filtros_informe)
+            
+            informe.total_pqrs = analytics['totalPqrs']
+            informe.tasa_resolucion = int(analytics['tasaResolucion'])
+            informe.progreso = 30
+            db.commit()
+            
+            ai_analysis = None
+            if filtros.get('usar_ia') and entity.enable_ai_reports:
+                ai_analysis = analizar_con_ia(entity, informe.fecha_inicio, informe.fecha_fin, analytics, pqrs_list)
+            informe.used_ai = ai_analysis is not None
+            if not ai_analysis:
+                ai_analysis = analisis_por_defecto(entity.name, informe.fecha_inicio, informe.fecha_fin, analytics)
+            informe.progreso = 50
+            db.commit()
+            
+            usuario_firmante = None
+            if filtros.get('usuario_firmante_id'):
+                usuario_firmante = db.query(User).filter(
+                    User.id == filtros['usuario_firmante_id'],
+                    User.entity_id == entity.id
+                ).first()
+            
+            generator = PQRSReportGenerator(
+                entity=entity,
+                pqrs_list=pqrs_list,
+                analytics=analytics,
+                ai_analysis=ai_analysis,
+                fecha_inicio=informe.fecha_inicio,
+                fecha_fin=informe.fecha_fin,
+                usuario_firmante=usuario_firmante
+            )
+            file_content = generator.generate_pdf().read()
+            del generator
+            
+            informe.progreso = 80
+            db.commit()
+            
+        except Exception as e:
+            print(f"❌ Error generando informe PQRS: {e}")
+            traceback.print_exc()
+            informe.estado = 'failed'
+            informe.error_message = str(e)
+            informe.completed_at = datetime.utcnow()
+            db.commit()
+            
+            self._crear_notificacion_error(db, informe)
+            return
+        
+        # Subir a S3 (bucket privado: se entrega URL pre-firmada)
+        try:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"informe_pqrs_{informe.fecha_inicio}_{informe.fecha_fin}.pdf"
+            s3_key = f"informes-pqrs/{entity.slug}/informe_{informe.fecha_inicio}_{informe.fecha_fin}_{timestamp}.pdf"
+            
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                Body=file_content,
+                ContentType='application/pdf',
+                Metadata={
+                    "entity_id": str(entity.id),
+                    "entity_slug": entity.slug,
+                    "fecha_inicio": informe.fecha_inicio,
+                    "fecha_fin": informe.fecha_fin,
+                    "total_pqrs": str(informe.total_pqrs),
+                    "informe_id": str(informe.id),
+                    "timestamp": timestamp
+                }
+            )
+            
+            informe.s3_url = self.url_descarga(s3_key)
+            informe.s3_key = s3_key
+            informe.filename = filename
+            informe.file_size = len(file_content)
+            informe.progreso = 100
+            informe.estado = 'completed'
+            informe.completed_at = datetime.utcnow()
+            informe.expires_at = datetime.utcnow() + timedelta(seconds=URL_EXPIRA_SEGUNDOS)
+            
+            db.commit()
+            
+            print(f"✅ Informe PQRS {informe.id} generado y subido a S3: {s3_key}")
+            
+        except Exception as e:
+            print(f"❌ Error subiendo a S3: {e}")
+            traceback.print_exc()
+            informe.estado = 'failed'
+            informe.error_message = f"Error subiendo a S3: {str(e)}"
+            informe.completed_at = datetime.utcnow()
+            db.commit()
+            
+            self._crear_notificacion_error(db, informe)
+            return
+        
+        self._crear_notificacion_exito(db, informe)
+    
+    def url_descarga(self, s3_key: str) -> str:
+        """URL pre-firmada del PDF (válida 7 días)"""
+        return self.s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket_name, 'Key': s3_key},
+            ExpiresIn=URL_EXPIRA_SEGUNDOS
+        )
+    
+    def _crear_notificacion_exito(self, db: Session, informe: InformeEstado):
+        """Crea notificación cuando el informe está listo."""
+        crear_alertas(
+            db, [informe.user_id],
+            entity_id=informe.entity_id,
+            type='INFORME_PQRS_READY',
+            title='Informe PQRS listo',
+            message=f'Tu informe de PQRS del {informe.fecha_inicio} al {informe.fecha_fin} está listo para descargar.',
+            data={"informe_id": informe.id, "filename": informe.filename, "formato": informe.formato}
+        )
+        db.commit()
+        
+        print(f"✅ Notificación creada para usuario {informe.user_id}")
+    
+    def _crear_notificacion_error(self, db: Session, informe: InformeEstado):
+        """Crea notificación cuando falla la generación."""
+        crear_alertas(
+            db, [informe.user_id],
+            entity_id=informe.entity_id,
+            type='INFORME_PQRS_ERROR',
+            title='Error generando informe PQRS',
+            message=f'Hubo un error al generar tu informe de PQRS del {informe.fecha_inicio} al {informe.fecha_fin}. Por favor intenta nuevamente.',
+            data={"informe_id": informe.id, "error": informe.error_message}
+        )
+        db.commit()
+
+
+# Singleton instance
+informe_pqrs_service = InformePQRSService()
+registrar_handler('pqrs', informe_pqrs_service.procesar_informe)
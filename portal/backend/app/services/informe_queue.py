@@ -0,0 +1,336 @@
+"""
+Cola de trabajos de informes respaldada en la tabla informes_estado.
+
+Cada solicitud de informe es una fila con estado='pending'. Los workers
+reclaman filas con un lease (worker_id + lease_expires_at) que renuevan
+mediante heartbeat mientras generan. Si un proceso muere (deploy, OOM), el
+lease vence y otro worker reintenta el trabajo hasta max_intentos.
+
+Modos de ejecución:
+- Dedicado (por defecto, ver Procfile): un proceso aparte genera los informes
+  y la concurrencia queda acotada por nodo:
+      python -m app.services.informe_queue
+- Embebido (INFORMES_WORKER_EMBEBIDO=true): cada proceso web arranca un
+  InformeWorker, solo para despliegues sin el proceso worker. Los procesos
+  web se reciclan (--max-requests) y los informes en curso se retoman al
+  vencer su lease.
+"""
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Set
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.config.database import SessionLocal
+from app.config.settings import settings
+from app.models.informe import InformeEstado
+
+
+# Prioridad por formato (menor = antes): los formatos livianos no esperan
+# detrás de PDFs grandes con gráficas e imágenes
+PRIORIDAD_POR_FORMATO = {
+    'xlsx': 10,
+    'excel': 10,
+    'docx': 20,
+    'pdf': 30,
+}
+PRIORIDAD_DEFECTO = 50
+
+# Handlers por tipo de informe: fn(db, informe) genera, sube y marca el estado final
+HANDLERS: Dict[str, Callable[[Session, InformeEstado], None]] = {}
+
+
+def registrar_handler(tipo: str, handler: Callable[[Session, InformeEstado], None]):
+    """Registra la función que procesa los informes de un tipo ('pdm', 'pqrs')"""
+    HANDLERS[tipo] = handler
+
+
+def prioridad_para(formato: Optional[str]) -> int:
+    return PRIORIDAD_POR_FORMATO.get((formato or '').lower(), PRIORIDAD_DEFECTO)
+
+
+def _disponible(ahora: datetime):
+    """Filtro de filas que un worker puede reclamar"""
+    lease_vencido = or_(
+        InformeEstado.lease_expires_at < ahora,
+        and_(
+            # Filas 'processing' sin lease (p.ej. previas a la cola)
+            InformeEstado.lease_expires_at.is_(None),
+            InformeEstado.started_at < ahora - timedelta(seconds=settings.informes_lease_segundos)
+        )
+    )
+    return and_(
+        InformeEstado.duplicado_de.is_(None),
+        InformeEstado.intentos < InformeEstado.max_intentos,
+        or_(
+            InformeEstado.estado == 'pending',
+            and_(InformeEstado.estado == 'processing', lease_vencido)
+        )
+    )
+
+
+def reclamar_siguiente(db: Session, worker_id: str) -> Optional[int]:
+    """
+    Reclama el siguiente informe por (prioridad, created_at).
+    En PostgreSQL usa FOR UPDATE SKIP LOCKED; en todos los motores el UPDATE
+    condicional garantiza que solo un worker gane la fila.
+    Retorna el id reclamado o None.
+    """
+    ahora = datetime.utcnow()
+    query = db.query(InformeEstado.id).filter(_disponible(ahora)).order_by(
+        InformeEstado.prioridad, InformeEstado.created_at, InformeEstado.id
+    ).limit(1)
+    if db.get_bind().dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+
+    fila = query.first()
+    if fila is None:
+        db.rollback()
+        return None
+
+    actualizadas = db.query(InformeEstado).filter(
+        InformeEstado.id == fila.id,
+        _disponible(ahora)
+    ).update({
+        InformeEstado.estado: 'processing',
+        InformeEstado.worker_id: worker_id,
+        InformeEstado.intentos: InformeEstado.intentos + 1,
+        InformeEstado.started_at: ahora,
+        InformeEstado.heartbeat_at: ahora,
+        InformeEstado.lease_expires_at: ahora + timedelta(seconds=settings.informes_lease_segundos),
+    }, synchronize_session=False)
+    db.commit()
+
+    return fila.id if actualizadas == 1 else None
+
+
+def renovar_leases(db: Session, worker_id: str, informe_ids: Set[int]) -> int:
+    """Heartbeat: extiende el lease de los informes que este worker tiene en curso"""
+    if not informe_ids:
+        return 0
+    ahora = datetime.utcnow()
+    renovadas = db.query(InformeEstado).filter(
+        InformeEstado.id.in_(list(informe_ids)),
+        InformeEstado.worker_id == worker_id,
+        InformeEstado.estado == 'processing'
+    ).update({
+        InformeEstado.heartbeat_at: ahora,
+        InformeEstado.lease_expires_at: ahora + timedelta(seconds=settings.informes_lease_segundos),
+    }, synchronize_session=False)
+    db.commit()
+    return renovadas
+
+
+def marcar_abandonados(db: Session) -> int:
+    """
+    Marca como fallidos los informes cuyo lease venció sin intentos restantes.
+    Las solicitudes adjuntas a ellos (duplicado_de) se encolan por su cuenta.
+    """
+    ahora = datetime.utcnow()
+    condiciones = (
+        InformeEstado.estado == 'processing',
+        InformeEstado.lease_expires_at < ahora,
+        InformeEstado.intentos >= InformeEstado.max_intentos
+    )
+    abandonados = [fila.id for fila in db.query(InformeEstado.id).filter(*condiciones).all()]
+    if not abandonados:
+        db.rollback()
+        return 0
+
+    db.query(InformeEstado).filter(
+        InformeEstado.duplicado_de.in_(abandonados),
+        InformeEstado.estado == 'pending'
+    ).update({InformeEstado.duplicado_de: None}, synchronize_session=False)
+
+    fallidas = db.query(InformeEstado).filter(
+        InformeEstado.id.in_(abandonados),
+        *condiciones
+    ).update({
+        InformeEstado.estado: 'failed',
+        InformeEstado.error_message: 'El proceso de generación se interrumpió repetidamente',
+        InformeEstado.completed_at: ahora,
+        InformeEstado.worker_id: None,
+        InformeEstado.lease_expires_at: None,
+    }, synchronize_session=False)
+    db.commit()
+    return fallidas
+
+
+def _liberar_lease(db: Session, informe_id: int, worker_id: str):
+    db.query(InformeEstado).filter(
+        InformeEstado.id == informe_id,
+        InformeEstado.worker_id == worker_id
+    ).update({
+        InformeEstado.worker_id: None,
+        InformeEstado.lease_expires_at: None,
+    }, synchronize_session=False)
+    db.commit()
+
+
+class InformeWorker:
+    """
+    Pool acotado de slots que consumen la cola de informes.
+    Un hilo de heartbeat renueva los leases de los trabajos en curso.
+    """
+
+    def __init__(self, concurrencia: Optional[int] = None):
+        self.concurrencia = max(1, concurrencia or settings.informes_worker_concurrencia)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._en_curso: Set[int] = set()
+        self._lock = threading.Lock()
+        self._hilos = []
+
+    def start(self):
+        if self._hilos:
+            return
+        for slot in range(self.concurrencia):
+            hilo = threading.Thread(target=self._loop, daemon=True, name=f"informe-worker-{slot}")
+            hilo.start()
+            self._hilos.append(hilo)
+        hilo = threading.Thread(target=self._heartbeat_loop, daemon=True, name="informe-heartbeat")
+        hilo.start()
+        self._hilos.append(hilo)
+        print(f"🧵 Worker de informes {self.worker_id} iniciado ({self.concurrencia} slots)", flush=True)
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Deja de reclamar trabajos; los que no terminen se retoman al vencer su lease.
+        `timeout` es la espera total (no por hilo), para no pasar el graceful
+        timeout de gunicorn cuando el worker está embebido.
+        """
+        self._detener.set()
+        self._despertar.set()
+        limite = time.monotonic() + (settings.informes_stop_segundos if timeout is None else timeout)
+        for hilo in self._hilos:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            hilo.join(timeout=restante)
+        self._hilos = []
+
+    def despertar(self):
+        """Atiende de inmediato un trabajo recién encolado"""
+        self._despertar.set()
+
+    def _loop(self):
+        while not self._detener.is_set():
+            informe_id = None
+            db = SessionLocal()
+            try:
+                marcar_abandonados(db)
+                informe_id = reclamar_siguiente(db, self.worker_id)
+            except Exception as e:
+                print(f"⚠️ Error reclamando informe de la cola: {e}", flush=True)
+                db.rollback()
+            finally:
+                db.close()
+
+            if informe_id is None:
+                self._despertar.wait(settings.informes_poll_segundos)
+                self._despertar.clear()
+                continue
+
+            self._ejecutar(informe_id)
+
+    def _ejecutar(self, informe_id: int):
+        with self._lock:
+            self._en_curso.add(informe_id)
+        db = SessionLocal()
+        try:
+            informe = db.query(InformeEstado).filter(InformeEstado.id == informe_id).first()
+            handler = HANDLERS.get(informe.tipo or 'pdm')
+            if handler is None:
+                raise Exception(f"No hay handler registrado para informes tipo '{informe.tipo}'")
+
+            print(f"🔵 Worker {self.worker_id} procesando informe {informe_id} "
+                  f"(tipo={informe.tipo}, formato={informe.formato}, intento {informe.intentos})", flush=True)
+            handler(db, informe)
+        except Exception as e:
+            print(f"❌ Error inesperado procesando informe {informe_id}: {type(e).__name__}: {e}", flush=True)
+            traceback.print_exc(file=sys.stdout)
+            try:
+                db.rollback()
+                db.query(InformeEstado).filter(InformeEstado.id == informe_id).update({
+                    InformeEstado.estado: 'failed',
+                    InformeEstado.error_message: str(e)[:500],
+                    InformeEstado.completed_at: datetime.utcnow(),
+                }, synchronize_session=False)
+                db.commit()
+            except Exception as e2:
+                print(f"❌ Error al actualizar estado a failed: {e2}", flush=True)
+        finally:
+            try:
+                _liberar_lease(db, informe_id, self.worker_id)
+            except Exception:
+                db.rollback()
+            db.close()
+            with self._lock:
+                self._en_curso.discard(informe_id)
+
+    def _heartbeat_loop(self):
+        intervalo = max(5, settings.informes_lease_segundos // 3)
+        while not self._detener.wait(intervalo):
+            with self._lock:
+                en_curso = set(self._en_curso)
+            if not en_curso:
+                continue
+            db = SessionLocal()
+            try:
+                renovar_leases(db, self.worker_id, en_curso)
+            except Exception as e:
+                print(f"⚠️ Error renovando leases de informes: {e}", flush=True)
+                db.rollback()
+            finally:
+                db.close()
+
+
+# Worker del proceso actual (solo en modo embebido o en el proceso dedicado)
+_worker: Optional[InformeWorker] = None
+
+
+def iniciar_worker(concurrencia: Optional[int] = None) -> InformeWorker:
+    global _worker
+    if _worker is None:
+        # Registrar handlers de los tipos de informe
+        import app.services.informe_async_service  # noqa: F401
+        import app.services.informe_pqrs_service  # noqa: F401
+        _worker = InformeWorker(concurrencia)
+        _worker.start()
+    return _worker
+
+
+def detener_worker():
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker = None
+
+
+def notificar_nuevo_trabajo():
+    """Despierta al worker local si existe (en modo dedicado el poll lo recoge)"""
+    if _worker is not None:
+        _worker.despertar()
+
+
+def main():
+    """Punto de entrada del proceso worker dedicado"""
+    worker = iniciar_worker()
+    try:
+        while True:
+            threading.Event().wait(3600)
+    except KeyboardInterrupt:
+        print("🛑 Deteniendo worker de informes...", flush=True)
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,8 @@ Genera análisis profesionales de PQRS
 import os
 import json
 from typing import Dict, List, Any
-from openai import OpenAI
+from app.config.settings import settings
+from app.services.ai_gateway import ai_gateway
 
 
 class OpenAIService:
@@ -14,16 +15,15 @@ class OpenAIService:
 
     def __init__(self):
         api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
+        if not api_key and settings.ai_backend != "stub":
             raise ValueError("OPENAI_API_KEY no configurada en variables de entorno")
-        self.client = OpenAI(api_key=api_key)
         # Configurable via OPENAI_MODEL env var. Opciones (de más barato a más caro):
         # gpt-4o-mini    → $0.15/$0.60 por 1M tokens  (recomendado, muy buena relación costo/calidad)
         # gpt-4o         → $5.0/$15.0 por 1M tokens   (más potente)
         # gpt-4-turbo    → $10.0/$30.0 por 1M tokens  (máxima calidad)
         self.model = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
 
-    def analizar_pqrs(
+    async def analizar_pqrs(
         self,
         analytics: Dict[str, Any],
         entity_name: str,
@@ -45,9 +45,8 @@ class OpenAIService:
                 analytics, entity_name, fecha_inicio, fecha_fin, pqrs_list
             )
 
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
+            response = await ai_gateway.completar(
+                [
                     {
                         "role": "system",
                         "content": (
@@ -62,11 +61,14 @@ class OpenAIService:
                         "content": prompt
                     }
                 ],
+                backend="openai",
+                model=self.model,
                 max_tokens=4096,
-                temperature=0.7
+                temperature=0.7,
+                cache="pqrs_analisis_ia"
             )
 
-            content = response.choices[0].message.content
+            content = response["texto"]
             print(f"✅ Análisis IA con OpenAI completado ({len(content)} caracteres)")
 
             return self._parse_response(content)
@@ -0,0 +1,242 @@
+"""
+Servicio de avance materializado del PDM.
+Mantiene la tabla pdm_producto_avance (entity_id, codigo_producto, anio)
+actualizada desde las escrituras de actividades y evidencias, y expone
+lecturas agregadas para dashboards e informes.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, func, case, distinct
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.models.pdm import PdmActividad, PdmActividadEvidencia, PdmProductoAvance
+
+
+ANIOS_PDM = (2024, 2025, 2026, 2027)
+
+# Entidades cuyo resumen ya se verificó completo en este proceso. Desde ahí las
+# escrituras lo mantienen al día, así que la verificación no se repite.
+_entidades_verificadas = set()
+_verificadas_lock = threading.Lock()
+
+
+def _agregar_actividades(db: Session, entity_id: int, codigo_producto: Optional[str] = None, anio: Optional[int] = None):
+    """Agregado SQL de actividades por (codigo_producto, anio)"""
+    completada = PdmActividad.estado == 'COMPLETADA'
+    con_evidencia = PdmActividadEvidencia.id.isnot(None)
+
+    query = db.query(
+        PdmActividad.codigo_producto,
+        PdmActividad.anio,
+        func.count(distinct(PdmActividad.id)).label('total_actividades'),
+        func.coalesce(func.sum(case((completada, 1), else_=0)), 0).label('actividades_completadas'),
+        func.coalesce(func.sum(case((con_evidencia, 1), else_=0)), 0).label('actividades_con_evidencia'),
+        func.coalesce(func.sum(case((completada, PdmActividad.meta_ejecutar), else_=0)), 0).label('meta_ejecutada'),
+        func.coalesce(func.sum(case((con_evidencia, PdmActividad.meta_ejecutar), else_=0)), 0).label('meta_ejecutada_con_evidencia'),
+    ).outerjoin(
+        PdmActividadEvidencia, PdmActividadEvidencia.actividad_id == PdmActividad.id
+    ).filter(
+        PdmActividad.entity_id == entity_id
+    )
+
+    if codigo_producto is not None:
+        query = query.filter(PdmActividad.codigo_producto == codigo_producto)
+    if anio is not None:
+        query = query.filter(PdmActividad.anio == anio)
+
+    return query.group_by(PdmActividad.codigo_producto, PdmActividad.anio).all()
+
+
+def _upsert(db: Session, valores: List[dict]) -> None:
+    """INSERT ... ON CONFLICT DO UPDATE sobre (entity_id, codigo_producto, anio)"""
+    if not valores:
+        return
+
+    dialecto = db.get_bind().dialect.name
+    insert_fn = pg_insert if dialecto == 'postgresql' else sqlite_insert
+
+    stmt = insert_fn(PdmProductoAvance).values(valores)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['entity_id', 'codigo_producto', 'anio'],
+        set_={
+            'total_actividades': stmt.excluded.total_actividades,
+            'actividades_completadas': stmt.excluded.actividades_completadas,
+            'actividades_con_evidencia': stmt.excluded.actividades_con_evidencia,
+            'meta_ejecutada': stmt.excluded.meta_ejecutada,
+            'meta_ejecutada_con_evidencia': stmt.excluded.meta_ejecutada_con_evidencia,
+            'updated_at': func.now(),
+        }
+    )
+    db.execute(stmt)
+
+
+def _fila_a_valores(entity_id: int, fila) -> dict:
+    return {
+        'entity_id': entity_id,
+        'codigo_producto': fila.codigo_producto,
+        'anio': fila.anio,
+        'total_actividades': int(fila.total_actividades or 0),
+        'actividades_completadas': int(fila.actividades_completadas or 0),
+        'actividades_con_evidencia': int(fila.actividades_con_evidencia or 0),
+        'meta_ejecutada': float(fila.meta_ejecutada or 0),
+        'meta_ejecutada_con_evidencia': float(fila.meta_ejecutada_con_evidencia or 0),
+    }
+
+
+def refrescar_avance_producto(db: Session, entity_id: int, codigo_producto: str, anio: int) -> None:
+    """
+    Recalcula la fila de resumen de un (producto, año) tras una escritura.
+
+    Solo agrega las actividades de ese producto/año, así que el costo no
+    depende del tamaño del plan. Debe llamarse después de db.flush() y antes
+    del commit para que el resumen quede en la misma transacción.
+    """
+    filas = _agregar_actividades(db, entity_id, codigo_producto, anio)
+    if filas:
+        _upsert(db, [_fila_a_valores(entity_id, filas[0])])
+    else:
+        # Sin actividades: eliminar la fila para no dejar resúmenes huérfanos
+        db.query(PdmProductoAvance).filter(
+            PdmProductoAvance.entity_id == entity_id,
+            PdmProductoAvance.codigo_producto == codigo_producto,
+            PdmProductoAvance.anio == anio
+        ).delete(synchronize_session=False)
+
+
+def recalcular_avance_entidad(db: Session, entity_id: int) -> int:
+    """
+    Reconstruye todo el resumen de una entidad con un solo GROUP BY.
+    Usado para backfill y como reparación. Retorna el número de filas escritas.
+    """
+    db.query(PdmProductoAvance).filter(
+        PdmProductoAvance.entity_id == entity_id
+    ).delete(synchronize_session=False)
+
+    valores = [_fila_a_valores(entity_id, fila) for fila in _agregar_actividades(db, entity_id)]
+    _upsert(db, valores)
+    return len(valores)
+
+
+def obtener_avance_por_producto(
+    db: Session,
+    entity_id: int,
+    codigos: Optional[Iterable[str]] = None
+) -> Dict[str, Dict[int, PdmProductoAvance]]:
+    """Lee el resumen como {codigo_producto: {anio: PdmProductoAvance}}"""
+    query = db.query(PdmProductoAvance).filter(PdmProductoAvance.entity_id == entity_id)
+    if codigos is not None:
+        codigos = list(codigos)
+        if not codigos:
+            return {}
+        query = query.filter(PdmProductoAvance.codigo_producto.in_(codigos))
+
+    resultado: Dict[str, Dict[int, PdmProductoAvance]] = {}
+    for fila in query.all():
+        resultado.setdefault(fila.codigo_producto, {})[fila.anio] = fila
+    return resultado
+
+
+def calcular_metricas_avance(producto, avance_por_anio: Dict[int, PdmProductoAvance]) -> dict:
+    """
+    Calcula los campos de avance del cuatrienio de un producto a partir de su
+    resumen materializado (una fila por año).
+
+    Cada año con programacion_X > 0 se considera una meta.
+    Una meta anual se cumple si la meta ejecutada (actividades COMPLETADAS) >= programacion_X.
+    Avance general = metas_cumplidas / metas_totales * 100.
+    Porcentaje de ejecución = promedio del avance anual (topado en 100%).
+    """
+    detalle_metas = []
+    metas_totales = 0
+    metas_cumplidas = 0
+    puede_agregar_actividad_anio = {}
+    sum_avances_anuales = 0
+
+    for anio in ANIOS_PDM:
+        programado = getattr(producto, f'programacion_{anio}', 0) or 0
+        resumen = avance_por_anio.get(anio)
+        ejecutado = resumen.meta_ejecutada if resumen else 0
+
+        if programado > 0:
+            metas_totales += 1
+            cumplida = ejecutado >= programado and ejecutado > 0
+            if cumplida:
+                metas_cumplidas += 1
+            sum_avances_anuales += min(100, (ejecutado / programado) * 100)
+            detalle_metas.append({
+                "anio": anio,
+                "programado": programado,
+                "ejecutado": ejecutado,
+                "cumplida": cumplida
+            })
+            # Puede agregar actividad si la meta del año no está cumplida
+            puede_agregar_actividad_anio[str(anio)] = not cumplida
+        else:
+            detalle_metas.append({
+                "anio": anio,
+                "programado": 0,
+                "ejecutado": ejecutado,
+                "cumplida": False
+            })
+            puede_agregar_actividad_anio[str(anio)] = False
+
+    avance_general_porcentaje = (metas_cumplidas / metas_totales * 100) if metas_totales > 0 else 0
+    porcentaje_ejecucion = (sum_avances_anuales / metas_totales) if metas_totales > 0 else 0
+
+    return {
+        "metas_totales": metas_totales,
+        "metas_cumplidas": metas_cumplidas,
+        "avance_general_porcentaje": round(avance_general_porcentaje, 2),
+        "detalle_metas": detalle_metas,
+        "puede_agregar_actividad_anio": puede_agregar_actividad_anio,
+        "porcentaje_ejecucion": round(porcentaje_ejecucion, 2),
+    }
+
+
+def resumen_completo(db: Session, entity_id: int) -> bool:
+    """
+    True si cada (codigo_producto, anio) con actividades tiene su fila de resumen.
+
+    No basta con que exista alguna fila: si la primera acción sobre una entidad
+    con actividades previas a la tabla es una escritura, refrescar_avance_producto
+    crea solo la fila de ese producto/año y el resto quedaría en 0%. La
+    verificación (anti-join) se hace una vez por entidad y proceso.
+    """
+    if entity_id in _entidades_verificadas:
+        return True
+
+    faltante = db.query(PdmActividad.id).outerjoin(
+        PdmProductoAvance,
+        and_(
+            PdmProductoAvance.entity_id == PdmActividad.entity_id,
+            PdmProductoAvance.codigo_producto == PdmActividad.codigo_producto,
+            PdmProductoAvance.anio == PdmActividad.anio
+        )
+    ).filter(
+        PdmActividad.entity_id == entity_id,
+        PdmProductoAvance.id.is_(None)
+    ).first()
+    if faltante is not None:
+        return False
+
+    with _verificadas_lock:
+        _entidades_verificadas.add(entity_id)
+    return True
+
+
+def asegurar_avance_entidad(db: Session, entity_id: int) -> None:
+    """
+    Backfill perezoso: si hay actividades sin fila de resumen (datos previos a
+    la tabla), reconstruye el resumen de la entidad y hace commit.
+    """
+    if resumen_completo(db, entity_id):
+        return
+
+    filas = recalcular_avance_entidad(db, entity_id)
+    db.commit()
+    with _verificadas_lock:
+        _entidades_verificadas.add(entity_id)
+    print(f"📈 Resumen de avance PDM reconstruido para entity_id={entity_id}: {filas} filas")
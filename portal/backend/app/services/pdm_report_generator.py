@@ -32,23 +32,21 @@ from reportlab.platypus import (
 )
 from io import BytesIO
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import os
-import base64
 from collections import defaultdict
 
-# Configurar matplotlib para uso en servidor (sin display)
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib import patches
-import numpy as np
-plt.rcParams['font.family'] = 'DejaVu Sans'
-
+from sqlalchemy import func, or_
 from sqlalchemy.orm import Session
 from app.models.pdm import PdmActividadEvidencia
 from app.models.pdm_ejecucion import PDMEjecucionPresupuestal
 from app.models.user import User
+from app.services.chart_renderer import render_charts
+from app.services.evidencias_s3 import cargar_miniaturas_evidencia, tiene_imagenes
+from app.services.pdm_avance_service import ANIOS_PDM, obtener_avance_por_producto, resumen_completo
+
+# Filtros que restringen las actividades del informe (el resumen materializado no aplica)
+FILTROS_ACTIVIDADES = ('secretarias', 'fecha_inicio', 'fecha_fin', 'estados')
 
 class PDMReportGenerator:
     """Generador de informes PDF con estructura general con mejoras de rendimiento y contenido"""
@@ -66,7 +64,94 @@ class PDMReportGenerator:
         self.styles = None
         self.story = []
         self.page_number = 0
-        self._cache_graficas = {}  # Caché para evitar regenerar gráficas
+        self._cache_graficas = {}  # Caché de PNG para evitar regenerar gráficas
+        self._filas_graficas = {}  # Número de barras por gráfica (alto de la imagen)
+        
+        # Índice de actividades por (codigo_producto, anio) construido una sola vez
+        # y avances memoizados por producto, compartidos por todas las secciones
+        self._actividades_por_producto_anio = None
+        self._cache_avance_fisico = {}
+        self._cache_avance_financiero = {}
+        self._ejecucion_por_codigo = None  # {codigo_producto: (pto_definitivo, pagos)}
+        # Resumen pdm_producto_avance: {codigo_producto: {anio: fila}} o None si no aplica
+        self._avance_materializado = None
+        self._avance_precargado = False
+        
+    def _indice_actividades(self) -> Dict[tuple, List]:
+        """Agrupa self.actividades por (codigo_producto, anio) en una sola pasada"""
+        if self._actividades_por_producto_anio is None:
+            indice = defaultdict(list)
+            for act in self.actividades:
+                indice[(act.codigo_producto, act.anio)].append(act)
+            self._actividades_por_producto_anio = indice
+            print(f"   🗂️ Índice de actividades: {len(self.actividades)} actividades en {len(indice)} grupos producto/año")
+        return self._actividades_por_producto_anio
+    
+    def actividades_de_producto(self, codigo_producto: str) -> List:
+        """Actividades de un producto respetando el año seleccionado (self.anio)"""
+        indice = self._indice_actividades()
+        anios = [2024, 2025, 2026, 2027] if self.anio == 0 else [self.anio]
+        resultado = []
+        for anio in anios:
+            resultado.extend(indice.get((codigo_producto, anio), []))
+        return resultado
+    
+    def precargar_avance_materializado(self) -> Optional[Dict[str, Dict[int, Any]]]:
+        """
+        Carga el resumen pdm_producto_avance de la entidad (una fila por
+        producto/año) con una sola consulta.
+        
+        Retorna None si el informe filtra actividades (secretarías, fechas o
+        estados): el resumen agrega todas las actividades del producto, así que
+        en ese caso el avance se calcula sobre las actividades filtradas.
+        """
+        if self._avance_precargado:
+            return self._avance_materializado
+        self._avance_precargado = True
+        
+        if not self.db or any(self.filtros.get(filtro) for filtro in FILTROS_ACTIVIDADES):
+            return None
+        
+        try:
+            if not resumen_completo(self.db, self.entity.id):
+                # Actividades sin fila de resumen (el dashboard lo reconstruye en su primera consulta)
+                print("   ⚠️ Resumen de avance incompleto, se calcula desde actividades")
+                return None
+            avance = obtener_avance_por_producto(self.db, self.entity.id)
+        except Exception as e:
+            print(f"   ⚠️ No se pudo leer el resumen de avance, se calcula desde actividades: {e}")
+            return None
+        
+        self._avance_materializado = avance
+        print(f"   📈 Resumen de avance precargado: {len(avance)} productos")
+        return avance
+    
+    def totales_actividades(self) -> Tuple[int, int, int]:
+        """
+        (total, completadas, con evidencia) de las actividades del año
+        seleccionado (todos si anio=0), desde el resumen si está disponible.
+        """
+        avance = self.precargar_avance_materializado()
+        if avance is not None:
+            anios = ANIOS_PDM if self.anio == 0 else (self.anio,)
+            filas = [fila for por_anio in avance.values() for anio, fila in por_anio.items() if anio in anios]
+            return (
+                sum(fila.total_actividades for fila in filas),
+                sum(fila.actividades_completadas for fila in filas),
+                sum(fila.actividades_con_evidencia for fila in filas),
+            )
+        
+        actividades = [a for a in self.actividades if self.anio == 0 or a.anio == self.anio]
+        return (
+            len(actividades),
+            sum(1 for a in actividades if a.estado == 'COMPLETADA'),
+            sum(1 for a in actividades if getattr(a, 'tiene_evidencia', False)),
+        )
+    
+    @staticmethod
+    def _clave_producto(producto):
+        """Clave de memoización: id del producto si existe, si no su código"""
+        return getattr(producto, 'id', None) or producto.codigo_producto
         
     def get_justify_style(self, fontSize=8):
         """Helper para crear estilos justificados reutilizables"""
@@ -464,8 +549,7 @@ class PDMReportGenerator:
         Mejora implementada: análisis inteligente opcional
         """
         try:
-            import os
-            from openai import OpenAI
+            from app.services.ai_gateway import ai_gateway
             
             title_style = ParagraphStyle(
                 'AITitle',
@@ -481,8 +565,7 @@ class PDMReportGenerator:
             
             # Preparar datos para el prompt
             total_productos = len(self.productos)
-            total_actividades = len([a for a in self.actividades if self.anio == 0 or a.anio == self.anio])
-            actividades_completadas = len([a for a in self.actividades if (self.anio == 0 or a.anio == self.anio) and a.estado == 'COMPLETADA'])
+            total_actividades, actividades_completadas, _ = self.totales_actividades()
             
             suma_avances = sum(self.calcular_avance_producto(p) for p in self.productos)
             avance_promedio = suma_avances / total_productos if total_productos > 0 else 0
@@ -510,20 +593,20 @@ El análisis debe:
 
 Límite: 250 palabras. Usa lenguaje formal y técnico apropiado para gestión pública."""
 
-            # Llamar a OpenAI
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
+            # Llamar a OpenAI (el generador corre en un thread: versión bloqueante del gateway)
+            response = ai_gateway.completar_sync(
+                [
                     {"role": "system", "content": "Eres un experto en análisis de gestión pública territorial en Colombia."},
                     {"role": "user", "content": prompt}
                 ],
+                backend="openai",
+                model="gpt-4o-mini",
                 max_tokens=500,
-                temperature=0.7
+                temperature=0.7,
+                cache="pdm_resumen_ia"
             )
             
-            resumen_ia = response.choices[0].message.content
+            resumen_ia = response["texto"]
             
             # Agregar resumen al informe
             ia_style = ParagraphStyle(
@@ -569,357 +652,203 @@ Límite: 250 palabras. Usa lenguaje formal y técnico apropiado para gestión p
         """
         Calcula el avance de un producto basado en meta ejecutada vs meta programada
         Respeta el año seleccionado (self.anio). Si anio=0, calcula promedio de todos los años.
+        
+        La meta ejecutada sale del resumen materializado (meta_ejecutada_con_evidencia)
+        cuando aplica; si no, del índice (codigo_producto, anio) de actividades.
+        El resultado se memoiza por producto.
         """
+        clave = self._clave_producto(producto)
+        if clave in self._cache_avance_fisico:
+            return self._cache_avance_fisico[clave]
+        
         try:
             # Determinar años a calcular según self.anio
-            if self.anio == 0:
-                # Todos los años del cuatrienio
-                anios = [2024, 2025, 2026, 2027]
-            else:
-                # Solo el año seleccionado
-                anios = [self.anio]
+            anios = ANIOS_PDM if self.anio == 0 else [self.anio]
+            avance = self.precargar_avance_materializado()
+            avance_producto = avance.get(producto.codigo_producto, {}) if avance is not None else None
             
             suma_avances = 0
             total_anios_con_meta = 0
             
-            print(f"\n🔍 Calculando avance para producto: {producto.codigo_producto}")
-            print(f"   Año(s) a calcular: {anios}")
-            print(f"   Total actividades disponibles: {len(self.actividades)}")
-            
             for anio in anios:
                 # Obtener meta programada del año
                 meta_programada = getattr(producto, f'programacion_{anio}', 0) or 0
                 
                 if meta_programada > 0:
-                    # Calcular meta ejecutada: suma de meta_ejecutar de actividades con evidencia
-                    actividades_anio = [
-                        act for act in self.actividades 
-                        if act.codigo_producto == producto.codigo_producto and act.anio == anio
-                    ]
-                    
-                    print(f"   Año {anio}: meta_programada={meta_programada}, actividades={len(actividades_anio)}")
-                    
-                    # Sumar meta_ejecutar de actividades que tienen evidencia
-                    # Usar el flag tiene_evidencia agregado en el router (optimización para no cargar objetos)
-                    meta_ejecutada = sum(
-                        act.meta_ejecutar for act in actividades_anio 
-                        if hasattr(act, 'tiene_evidencia') and act.tiene_evidencia
-                    )
-                    
-                    actividades_con_evidencia = sum(
-                        1 for act in actividades_anio 
-                        if hasattr(act, 'tiene_evidencia') and act.tiene_evidencia
-                    )
-                    print(f"   Año {anio}: meta_ejecutada={meta_ejecutada}, actividades_con_evidencia={actividades_con_evidencia}")
+                    if avance_producto is not None:
+                        resumen = avance_producto.get(anio)
+                        meta_ejecutada = resumen.meta_ejecutada_con_evidencia if resumen else 0
+                    else:
+                        # Sumar meta_ejecutar de actividades que tienen evidencia
+                        # Usar el flag tiene_evidencia agregado en el router (optimización para no cargar objetos)
+                        meta_ejecutada = sum(
+                            act.meta_ejecutar for act in self._indice_actividades().get((producto.codigo_producto, anio), [])
+                            if getattr(act, 'tiene_evidencia', False)
+                        )
                     
                     # Calcular porcentaje de avance (topar en 100%)
-                    porcentaje_avance = min(100, (meta_ejecutada / meta_programada) * 100)
-                    print(f"   Año {anio}: porcentaje_avance={porcentaje_avance:.1f}%")
-                    suma_avances += porcentaje_avance
+                    suma_avances += min(100, (meta_ejecutada / meta_programada) * 100)
                     total_anios_con_meta += 1
             
             resultado = suma_avances / total_anios_con_meta if total_anios_con_meta > 0 else 0
-            print(f"   ✅ Avance promedio final: {resultado:.1f}%\n")
-            return resultado
             
         except Exception as e:
             print(f"      ⚠️ Error calculando avance para {producto.codigo_producto}: {e}")
             import traceback
             traceback.print_exc()
-            return 0
+            resultado = 0
+        
+        self._cache_avance_fisico[clave] = resultado
+        return resultado
     
     def calcular_avance_financiero(self, producto) -> float:
         """
         Calcula el avance financiero real basado en la ejecución presupuestal
         Formula: (Pagos / Presupuesto Definitivo) * 100
         
-        Si no hay datos de ejecución, retorna el avance físico como estimación
+        Si no hay datos de ejecución, retorna el avance físico como estimación.
+        El resultado se memoiza por producto.
         """
+        clave = self._clave_producto(producto)
+        if clave not in self._cache_avance_financiero:
+            self._cache_avance_financiero[clave] = self._calcular_avance_financiero(producto)
+        return self._cache_avance_financiero[clave]
+    
+    def precargar_ejecucion_presupuestal(self) -> Dict[str, tuple]:
+        """
+        Precarga la ejecución presupuestal de la entidad/año con un solo GROUP BY
+        (suma de pto_definitivo y pagos por codigo_producto) y la deja en memoria.
+        Retorna {codigo_producto: (total_definitivo, total_pagos)}.
+        """
+        if self._ejecucion_por_codigo is not None:
+            return self._ejecucion_por_codigo
+        
+        self._ejecucion_por_codigo = {}
+        if not self.db:
+            return self._ejecucion_por_codigo
+        
         try:
-            if not self.db:
-                # Sin acceso a DB, usar avance físico
-                return self.calcular_avance_producto(producto)
-            
-            # Consultar ejecución presupuestal para este producto y año
-            if self.anio == 0:
-                # Todos los años del cuatrienio
-                ejecuciones = self.db.query(PDMEjecucionPresupuestal).filter(
-                    PDMEjecucionPresupuestal.entity_id == self.entity.id,
-                    PDMEjecucionPresupuestal.codigo_producto == producto.codigo_producto
-                ).all()
-            else:
-                # Solo año específico
-                ejecuciones = self.db.query(PDMEjecucionPresupuestal).filter(
-                    PDMEjecucionPresupuestal.entity_id == self.entity.id,
-                    PDMEjecucionPresupuestal.codigo_producto == producto.codigo_producto,
-                    PDMEjecucionPresupuestal.anio == self.anio
-                ).all()
-            
-            if not ejecuciones:
-                anio_texto = "todos los años" if self.anio == 0 else str(self.anio)
-                print(f"      ℹ️ No hay ejecución presupuestal para {producto.codigo_producto} en {anio_texto}")
-                # Sin datos de ejecución, usar avance físico como estimación
-                return self.calcular_avance_producto(producto)
-            
-            # Sumar totales de todas las fuentes
-            total_definitivo = 0
-            total_pagos = 0
-            
-            for ejecucion in ejecuciones:
-                total_definitivo += float(ejecucion.pto_definitivo or 0)
-                total_pagos += float(ejecucion.pagos or 0)
-            
-            # Calcular porcentaje
-            if total_definitivo == 0:
-                print(f"      ⚠️ Presupuesto definitivo = 0 para {producto.codigo_producto}")
-                return self.calcular_avance_producto(producto)
-            
-            avance_financiero = (total_pagos / total_definitivo) * 100
-            print(f"      💰 Avance financiero {producto.codigo_producto}: {avance_financiero:.1f}% (Pagos: ${total_pagos:,.0f} / Definitivo: ${total_definitivo:,.0f})")
+            query = self.db.query(
+                PDMEjecucionPresupuestal.codigo_producto,
+                func.sum(PDMEjecucionPresupuestal.pto_definitivo),
+                func.sum(PDMEjecucionPresupuestal.pagos)
+            ).filter(
+                PDMEjecucionPresupuestal.entity_id == self.entity.id
+            )
+            # Si anio es 0 se incluyen todos los años del cuatrienio
+            if self.anio != 0:
+                query = query.filter(PDMEjecucionPresupuestal.anio == self.anio)
             
-            return min(100, max(0, avance_financiero))  # Entre 0 y 100%
+            for codigo, total_definitivo, total_pagos in query.group_by(PDMEjecucionPresupuestal.codigo_producto).all():
+                self._ejecucion_por_codigo[codigo] = (float(total_definitivo or 0), float(total_pagos or 0))
             
+            print(f"   💰 Ejecución presupuestal precargada: {len(self._ejecucion_por_codigo)} productos")
         except Exception as e:
-            print(f"      ❌ Error calculando avance financiero para {producto.codigo_producto}: {e}")
+            print(f"   ❌ Error precargando ejecución presupuestal: {e}")
             import traceback
             traceback.print_exc()
-            # En caso de error, usar avance físico
-            return self.calcular_avance_producto(producto)
+        
+        return self._ejecucion_por_codigo
     
-    def generate_grafica_moderna_lineas(self):
-        """Genera gráfica moderna de avance por líneas estratégicas con caché"""
-        # Verificar caché (incluir año en la key)
-        cache_key = f'grafica_lineas_{self.anio}'
-        if cache_key in self._cache_graficas:
-            print(f"   ⚡ Usando gráfica en caché: {cache_key}")
-            self.story.append(self._cache_graficas[cache_key])
-            self.story.append(Spacer(1, 0.3*inch))
-            return
+    def _calcular_avance_financiero(self, producto) -> float:
+        """Cálculo sin memoizar de calcular_avance_financiero"""
+        if not self.db:
+            # Sin acceso a DB, usar avance físico
+            return self.calcular_avance_producto(producto)
         
-        # Calcular avance por línea (ya respeta self.anio por calcular_avance_producto)
-        lineas_data = {}
-        for prod in self.productos:
-            linea = prod.linea_estrategica or 'Sin Línea'
-            if linea not in lineas_data:
-                lineas_data[linea] = {'total': 0, 'suma_avance': 0}
-            lineas_data[linea]['total'] += 1
-            avance = self.calcular_avance_producto(prod)
-            lineas_data[linea]['suma_avance'] += avance
-        
-        lineas = []
-        avances = []
-        for linea, data in lineas_data.items():
-            if data['total'] > 0:
-                promedio = data['suma_avance'] / data['total']
-                lineas.append(linea[:40])
-                avances.append(promedio)
+        ejecucion = self.precargar_ejecucion_presupuestal().get(producto.codigo_producto)
+        if ejecucion is None:
+            # Sin datos de ejecución, usar avance físico como estimación
+            return self.calcular_avance_producto(producto)
         
-        if not lineas:
-            return
+        total_definitivo, total_pagos = ejecucion
+        if total_definitivo == 0:
+            return self.calcular_avance_producto(producto)
         
-        try:
-            # Diseño moderno con colores institucionales
-            fig, ax = plt.subplots(figsize=(9, max(len(lineas) * 0.6, 4)))
-            fig.patch.set_facecolor('white')
-            
-            # Colores: verde institucional y gradientes
-            colors = ['#4F9A54' if a >= 70 else '#FFA726' if a >= 50 else '#EF5350' for a in avances]
-            
-            y_pos = np.arange(len(lineas))
-            bars = ax.barh(y_pos, avances, color=colors, height=0.6, alpha=0.9)
-            
-            # Agregar valores al final de cada barra
-            for i, (bar, val) in enumerate(zip(bars, avances)):
-                width = bar.get_width()
-                ax.text(width + 2, bar.get_y() + bar.get_height()/2, 
-                       f'{val:.1f}%', ha='left', va='center', 
-                       fontsize=10, fontweight='bold', color='#333')
-            
-            ax.set_yticks(y_pos)
-            ax.set_yticklabels(lineas, fontsize=9)
-            ax.set_xlabel('Porcentaje de Avance (%)', fontsize=11, fontweight='bold', color='#333')
-            ax.set_title('Avance por Línea Estratégica', fontsize=13, fontweight='bold', 
-                        color='#003366', pad=20)
-            ax.set_xlim(0, 110)
-            
-            # Estilo moderno
-            ax.spines['top'].set_visible(False)
-            ax.spines['right'].set_visible(False)
-            ax.spines['left'].set_color('#CCCCCC')
-            ax.spines['bottom'].set_color('#CCCCCC')
-            ax.grid(axis='x', alpha=0.2, linestyle='--', color='#CCCCCC')
-            ax.set_axisbelow(True)
-            
-            plt.tight_layout()
-            
-            img_buffer = BytesIO()
-            plt.savefig(img_buffer, format='png', dpi=150, bbox_inches='tight', facecolor='white')
-            img_buffer.seek(0)
-            plt.close(fig)
-            
-            img = RLImage(img_buffer, width=7*inch, height=max(len(lineas) * 0.6*inch, 3.5*inch))
-            
-            # Guardar en caché
-            self._cache_graficas[cache_key] = img
-            print(f"   💾 Gráfica guardada en caché: {cache_key}")
-            
-            self.story.append(img)
-            self.story.append(Spacer(1, 0.3*inch))
-            
-        except Exception as e:
-            print(f"   ❌ Error generando gráfica de líneas: {str(e)}")
-        finally:
-            plt.close('all')
+        avance_financiero = (total_pagos / total_definitivo) * 100
+        return min(100, max(0, avance_financiero))  # Entre 0 y 100%
     
-    def generate_grafica_moderna_sectores(self):
-        """Genera gráfica moderna de avance por sectores MGA"""
-        sectores_data = defaultdict(lambda: {'total': 0, 'suma_avance': 0})
+    # Gráficas de avance: (atributo del producto, valor por defecto, largo máx. de etiqueta, título)
+    GRAFICAS_AVANCE = {
+        'lineas': ('linea_estrategica', 'Sin Línea', 40, 'Avance por Línea Estratégica'),
+        'sectores': ('sector_mga', 'Sin Sector', 40, 'Avance por Sector MGA'),
+        'ods': ('ods', 'Sin ODS', 45, 'Avance por Objetivos de Desarrollo Sostenible'),
+    }
+    
+    def _spec_grafica_avance(self, nombre: str):
+        """Especificación (datos puros) de una gráfica de avance agrupada, o None si no hay datos"""
+        atributo, defecto, max_len, titulo = self.GRAFICAS_AVANCE[nombre]
         
+        # Promedio de avance por grupo (ya respeta self.anio por calcular_avance_producto)
+        grupos = defaultdict(lambda: {'total': 0, 'suma_avance': 0})
         for prod in self.productos:
-            sector = prod.sector_mga or 'Sin Sector'
-            sectores_data[sector]['total'] += 1
-            avance = self.calcular_avance_producto(prod)
-            sectores_data[sector]['suma_avance'] += avance
+            grupo = getattr(prod, atributo) or defecto
+            grupos[grupo]['total'] += 1
+            grupos[grupo]['suma_avance'] += self.calcular_avance_producto(prod)
         
-        sectores = []
+        etiquetas = []
         avances = []
-        for sector, data in sectores_data.items():
+        for grupo, data in grupos.items():
             if data['total'] > 0:
-                promedio = data['suma_avance'] / data['total']
-                sectores.append(sector[:40])
-                avances.append(promedio)
-        
-        if not sectores:
+                etiquetas.append(grupo[:max_len])
+                avances.append(data['suma_avance'] / data['total'])
+        
+        if not etiquetas:
+            return None
+        
+        return {
+            'tipo': 'barh_avance',
+            'data': {'labels': etiquetas, 'values': avances, 'title': titulo},
+            'figsize': [9, max(len(etiquetas) * 0.6, 4)],
+            'dpi': 150,
+        }
+    
+    def precargar_graficas(self) -> Dict[str, bytes]:
+        """
+        Renderiza en paralelo las gráficas de líneas, sectores y ODS y guarda
+        los PNG en self._cache_graficas (clave: grafica_<nombre>_<anio>).
+        """
+        specs = {}
+        for nombre in self.GRAFICAS_AVANCE:
+            cache_key = f'grafica_{nombre}_{self.anio}'
+            if cache_key in self._cache_graficas:
+                continue
+            spec = self._spec_grafica_avance(nombre)
+            if spec is not None:
+                specs[cache_key] = spec
+                self._filas_graficas[cache_key] = len(spec['data']['labels'])
+        
+        if specs:
+            self._cache_graficas.update(render_charts(specs))
+        return self._cache_graficas
+    
+    def _agregar_grafica_avance(self, nombre: str):
+        """Agrega al story la gráfica de avance (renderizándola si no está en caché)"""
+        cache_key = f'grafica_{nombre}_{self.anio}'
+        if cache_key not in self._cache_graficas:
+            self.precargar_graficas()
+        
+        png = self._cache_graficas.get(cache_key)
+        if png is None:
             return
         
-        try:
-            fig, ax = plt.subplots(figsize=(9, max(len(sectores) * 0.6, 4)))
-            fig.patch.set_facecolor('white')
-            
-            colors = ['#4F9A54' if a >= 70 else '#FFA726' if a >= 50 else '#EF5350' for a in avances]
-            
-            y_pos = np.arange(len(sectores))
-            bars = ax.barh(y_pos, avances, color=colors, height=0.6, alpha=0.9)
-            
-            for i, (bar, val) in enumerate(zip(bars, avances)):
-                width = bar.get_width()
-                ax.text(width + 2, bar.get_y() + bar.get_height()/2, 
-                       f'{val:.1f}%', ha='left', va='center', 
-                       fontsize=10, fontweight='bold', color='#333')
-            
-            ax.set_yticks(y_pos)
-            ax.set_yticklabels(sectores, fontsize=9)
-            ax.set_xlabel('Porcentaje de Avance (%)', fontsize=11, fontweight='bold', color='#333')
-            ax.set_title('Avance por Sector MGA', fontsize=13, fontweight='bold', 
-                        color='#003366', pad=20)
-            ax.set_xlim(0, 110)
-            
-            ax.spines['top'].set_visible(False)
-            ax.spines['right'].set_visible(False)
-            ax.spines['left'].set_color('#CCCCCC')
-            ax.spines['bottom'].set_color('#CCCCCC')
-            ax.grid(axis='x', alpha=0.2, linestyle='--', color='#CCCCCC')
-            ax.set_axisbelow(True)
-            
-            plt.tight_layout()
-            
-            img_buffer = BytesIO()
-            plt.savefig(img_buffer, format='png', dpi=150, bbox_inches='tight', facecolor='white')
-            img_buffer.seek(0)
-            plt.close(fig)
-            
-            img = RLImage(img_buffer, width=7*inch, height=max(len(sectores) * 0.6*inch, 3.5*inch))
-            
-            # Guardar en caché
-            self._cache_graficas[cache_key] = img
-            print(f"   💾 Gráfica guardada en caché: {cache_key}")
-            
-            self.story.append(img)
-            self.story.append(Spacer(1, 0.3*inch))
-            
-        except Exception as e:
-            print(f"   ❌ Error generando gráfica de sectores: {str(e)}")
-        finally:
-            plt.close('all')
+        filas = self._filas_graficas[cache_key]
+        # RLImage consume el buffer al construir el PDF: crear uno nuevo por uso
+        img = RLImage(BytesIO(png), width=7*inch, height=max(filas * 0.6*inch, 3.5*inch))
+        self.story.append(img)
+        self.story.append(Spacer(1, 0.3*inch))
+    
+    def generate_grafica_moderna_lineas(self):
+        """Genera gráfica moderna de avance por líneas estratégicas con caché"""
+        self._agregar_grafica_avance('lineas')
+    
+    def generate_grafica_moderna_sectores(self):
+        """Genera gráfica moderna de avance por sectores MGA con caché"""
+        self._agregar_grafica_avance('sectores')
     
     def generate_grafica_moderna_ods(self):
         """Genera gráfica moderna de avance por ODS con caché"""
-        # Verificar caché (incluir año en la key)
-        cache_key = f'grafica_ods_{self.anio}'
-        if cache_key in self._cache_graficas:
-            print(f"   ⚡ Usando gráfica en caché: {cache_key}")
-            self.story.append(self._cache_graficas[cache_key])
-            self.story.append(Spacer(1, 0.3*inch))
-            return
-        
-        ods_data = defaultdict(lambda: {'total': 0, 'suma_avance': 0})
-        
-        for prod in self.productos:
-            ods = prod.ods or 'Sin ODS'
-            ods_data[ods]['total'] += 1
-            avance = self.calcular_avance_producto(prod)
-            ods_data[ods]['suma_avance'] += avance
-        
-        ods_list = []
-        avances = []
-        for ods, data in ods_data.items():
-            if data['total'] > 0:
-                promedio = data['suma_avance'] / data['total']
-                ods_list.append(ods[:45])
-                avances.append(promedio)
-        
-        if not ods_list:
-            return
-        
-        try:
-            fig, ax = plt.subplots(figsize=(9, max(len(ods_list) * 0.6, 4)))
-            fig.patch.set_facecolor('white')
-            
-            colors = ['#4F9A54' if a >= 70 else '#FFA726' if a >= 50 else '#EF5350' for a in avances]
-            
-            y_pos = np.arange(len(ods_list))
-            bars = ax.barh(y_pos, avances, color=colors, height=0.6, alpha=0.9)
-            
-            for i, (bar, val) in enumerate(zip(bars, avances)):
-                width = bar.get_width()
-                ax.text(width + 2, bar.get_y() + bar.get_height()/2, 
-                       f'{val:.1f}%', ha='left', va='center', 
-                       fontsize=10, fontweight='bold', color='#333')
-            
-            ax.set_yticks(y_pos)
-            ax.set_yticklabels(ods_list, fontsize=9)
-            ax.set_xlabel('Porcentaje de Avance (%)', fontsize=11, fontweight='bold', color='#333')
-            ax.set_title('Avance por Objetivos de Desarrollo Sostenible', fontsize=13, 
-                        fontweight='bold', color='#003366', pad=20)
-            ax.set_xlim(0, 110)
-            
-            ax.spines['top'].set_visible(False)
-            ax.spines['right'].set_visible(False)
-            ax.spines['left'].set_color('#CCCCCC')
-            ax.spines['bottom'].set_color('#CCCCCC')
-            ax.grid(axis='x', alpha=0.2, linestyle='--', color='#CCCCCC')
-            ax.set_axisbelow(True)
-            
-            plt.tight_layout()
-            
-            img_buffer = BytesIO()
-            plt.savefig(img_buffer, format='png', dpi=150, bbox_inches='tight', facecolor='white')
-            img_buffer.seek(0)
-            plt.close(fig)
-            
-            img = RLImage(img_buffer, width=7*inch, height=max(len(ods_list) * 0.6*inch, 3.5*inch))
-            
-            # Guardar en caché
-            self._cache_graficas[cache_key] = img
-            print(f"   💾 Gráfica guardada en caché: {cache_key}")
-            
-            self.story.append(img)
-            self.story.append(Spacer(1, 0.3*inch))
-            
-        except Exception as e:
-            print(f"   ❌ Error generando gráfica de ODS: {str(e)}")
-        finally:
-            plt.close('all')
+        self._agregar_grafica_avance('ods')
     
     def generate_seccion_lineas(self):
         """Genera sección de avance por líneas estratégicas"""
@@ -1436,7 +1365,6 @@ Límite: 250 palabras. Usa lenguaje formal y técnico apropiado para gestión p
     
     def generate_tabla_productos_detallada(self):
         """Genera tabla institucional por producto (formato oficial Sora-Boyacá)"""
-        from app.models.pdm import PdmActividadEvidencia
         
         title_style = ParagraphStyle(
             'SectionTitle',
@@ -1456,12 +1384,6 @@ Límite: 250 palabras. Usa lenguaje formal y técnico apropiado para gestión p
         ))
         self.story.append(Spacer(1, 0.3*inch))
         
-        # Agrupar actividades por producto
-        actividades_por_producto = defaultdict(list)
-        for act in self.actividades:
-            if self.anio == 0 or act.anio == self.anio:
-                actividades_por_producto[act.codigo_producto].append(act)
-        
         # Procesar cada producto (SIN LÍMITE - mejora implementada)
         white_style = ParagraphStyle('WhiteText', parent=self.styles['Normal'], textColor=colors.white, fontName='Helvetica-Bold', fontSize=10)
         
@@ -1522,7 +1444,7 @@ Límite: 250 palabras. Usa lenguaje formal y técnico apropiado para gestión p
             self.story.append(Spacer(1, 0.02*inch))
             
             # 3. EJECUCIÓN PLAN DE ACCIÓN VIGENCIA
-            actividades = actividades_por_producto.get(prod.codigo_producto, [])
+            actividades = self.actividades_de_producto(prod.codigo_producto)
             anio_vigencia = "2025" if self.anio == 2025 else str(self.anio) if self.anio > 0 else "2024-2027"
             
             ejecucion_header = [[Paragraph(f'<b>EJECUCIÓN PLAN DE ACCIÓN VIGENCIA {anio_vigencia}</b>', white_style)]]
@@ -1656,13 +1578,15 @@ Límite: 250 palabras. Usa lenguaje formal y técnico apropiado para gestión p
             
             if actividades_con_evidencia and self.db:
                 # Cargar imágenes SOLO de las actividades con evidencia (query selectiva)
-                from app.models.pdm import PdmActividadEvidencia
                 actividades_ids_con_evidencia = [act.id for act in actividades_con_evidencia]
                 
-                # Query selectiva: solo imagenes de actividades con evidencia
+                # Query selectiva: solo evidencias con imágenes (S3 o Base64 legacy)
                 evidencias_completas = self.db.query(PdmActividadEvidencia).filter(
                     PdmActividadEvidencia.actividad_id.in_(actividades_ids_con_evidencia),
-                    PdmActividadEvidencia.imagenes.isnot(None)
+                    or_(
+                        PdmActividadEvidencia.imagenes.isnot(None),
+                        PdmActividadEvidencia.imagenes_s3_urls.isnot(None)
+                    )
                 ).all()
                 
                 # Crear diccionario de evidencias por actividad_id
@@ -1671,7 +1595,7 @@ Límite: 250 palabras. Usa lenguaje formal y técnico apropiado para gestión p
                 # Filtrar actividades que tienen imágenes
                 evidencias_con_imagenes = [
                     act for act in actividades_con_evidencia 
-                    if act.id in evidencias_dict and evidencias_dict[act.id].imagenes
+                    if act.id in evidencias_dict and tiene_imagenes(evidencias_dict[act.id])
                 ]
                 
                 if evidencias_con_imagenes:
@@ -1704,21 +1628,19 @@ Límite: 250 palabras. Usa lenguaje formal y técnico apropiado para gestión p
                         self.story.append(Spacer(1, 0.05*inch))
                         
                         # Imágenes en grid 2x2 (sin límite de 4, pero paginadas)
-                        if evidencia.imagenes and isinstance(evidencia.imagenes, list):
-                            imagenes_cargadas = []
-                            for idx, img_base64 in enumerate(evidencia.imagenes):  # SIN LÍMITE
-                                try:
-                                    if img_base64.startswith('data:image'):
-                                        img_base64 = img_base64.split(',')[1]
-                                    
-                                    img_data = base64.b64decode(img_base64)
-                                    
-                                    # Tamaño optimizado: 3.3x3.3 pulgadas para grid 2x2
-                                    img = RLImage(BytesIO(img_data), width=3.3*inch, height=3.3*inch, kind='proportional')
-                                    imagenes_cargadas.append(img)
-                                    print(f"      ✅ Evidencia {num_evidencia} - Imagen {idx+1} agregada")
-                                except Exception as e:
-                                    print(f"      ⚠️ Error evidencia {num_evidencia} imagen {idx+1}: {e}")
+                        # Desde S3 si la evidencia está migrada, si no desde Base64 legacy
+                        imagenes_cargadas = []
+                        for idx, img_data in enumerate(cargar_miniaturas_evidencia(evidencia)):  # SIN LÍMITE
+                            try:
+                                if img_data is None:
+                                    raise ValueError("imagen no disponible")
+                                
+                                # Tamaño optimizado: 3.3x3.3 pulgadas para grid 2x2
+                                img = RLImage(BytesIO(img_data), width=3.3*inch, height=3.3*inch, kind='proportional')
+                                imagenes_cargadas.append(img)
+                                print(f"      ✅ Evidencia {num_evidencia} - Imagen {idx+1} agregada")
+                            except Exception as e:
+                                print(f"      ⚠️ Error evidencia {num_evidencia} imagen {idx+1}: {e}")
                         
                         
                         # Organizar imágenes en grid 2x2
@@ -1778,6 +1700,13 @@ Límite: 250 palabras. Usa lenguaje formal y técnico apropiado para gestión p
             # Estilos
             self.styles = getSampleStyleSheet()
             
+            # 0. Precarga de datos compartidos por todas las secciones
+            print("  ├─ Precarga de ejecución presupuestal")
+            self.precargar_ejecucion_presupuestal()
+            
+            print("  ├─ Renderizado de gráficas")
+            self.precargar_graficas()
+            
             # 1. Portada
             print("  ├─ Portada")
             self.generate_portada()
@@ -1902,15 +1831,8 @@ Límite: 250 palabras. Usa lenguaje formal y técnico apropiado para gestión p
             # SECCIÓN DE ACTIVIDADES POR PRODUCTO (nueva)
             doc.add_heading('ACTIVIDADES POR PRODUCTO', 1)
             
-            actividades_por_producto = {}
-            for act in self.actividades:
-                if self.anio == 0 or act.anio == self.anio:
-                    if act.codigo_producto not in actividades_por_producto:
-                        actividades_por_producto[act.codigo_producto] = []
-                    actividades_por_producto[act.codigo_producto].append(act)
-            
             for prod in self.productos[:20]:  # Primeros 20 para no sobrecargar
-                actividades = actividades_por_producto.get(prod.codigo_producto, [])
+                actividades = self.actividades_de_producto(prod.codigo_producto)
                 if actividades:
                     doc.add_heading(f'{prod.codigo_producto} - {(prod.producto_mga or "")[:80]}', 2)
                     
@@ -2067,8 +1989,7 @@ Límite: 250 palabras. Usa lenguaje formal y técnico apropiado para gestión p
             ws4['A3'].font = Font(bold=True)
             ws4['B3'].font = Font(bold=True)
             
-            total_actividades = len([a for a in self.actividades if self.anio == 0 or a.anio == self.anio])
-            actividades_con_evidencia = len([a for a in self.actividades if (self.anio == 0 or a.anio == self.anio) and a.evidencia])
+            total_actividades, _, actividades_con_evidencia = self.totales_actividades()
             porcentaje_evidencia = (actividades_con_evidencia / total_actividades * 100) if total_actividades > 0 else 0
             
             ws4['A4'] = 'Total Actividades'
@@ -0,0 +1,195 @@
+"""
+Caché de plantillas PDF institucionales (membrete) por entidad.
+
+Cada informe PQRS con membrete descargaba entity.pdf_template_url de S3 y
+volvía a analizar la página con PyMuPDF para detectar márgenes. La plantilla
+preparada se guarda ahora por (entidad, versión):
+
+- En memoria del proceso (LRU): bytes originales, márgenes detectados y la
+  página 0 ya extraída y compactada, que es lo que show_pdf_page convierte en
+  Form XObject en cada página del informe.
+- En Redis (metadatos): URL, ETag y márgenes, para que otros procesos no
+  repitan el análisis aunque tengan que descargar los bytes una vez.
+
+La versión es la URL (cada carga usa una key nueva) más el ETag de S3. Las
+rutas de carga y eliminación llaman a invalidar_plantilla(), que publica la
+invalidación a los demás workers; aun sin ella, una copia en memoria nunca
+se usa si la URL de la entidad cambió.
+
+Los documentos de PyMuPDF no son seguros entre threads: se comparten bytes
+y cada informe abre su propio documento (una página, sin costo apreciable).
+"""
+import threading
+from typing import Optional, Tuple
+
+import boto3
+
+from app.config.settings import settings
+from app.utils.cache_manager import cache_manager, CacheLocal, CACHE_CONFIGS, registrar_nivel_local
+
+
+S3_BUCKET = "softone360-pqrs-archivos"
+S3_REGION = "us-east-1"
+_MARCADOR_URL = f"{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/"
+
+_s3_client = None
+_s3_lock = threading.Lock()
+
+# Misma clave que los metadatos en Redis: cache_manager.delete la descarta en todos los workers
+_memoria = registrar_nivel_local(CacheLocal(settings.plantillas_pdf_cache_max))
+
+
+class PlantillaPDF:
+    """Membrete listo para superponer: márgenes y página preparada"""
+
+    def __init__(self, url: str, etag: str, contenido: bytes, margen_superior: float, margen_inferior: float):
+        self.url = url
+        self.etag = etag
+        self.contenido = contenido
+        self.margen_superior = margen_superior
+        self.margen_inferior = margen_inferior
+        self.pagina = _preparar_pagina(contenido)
+
+    def abrir(self):
+        """Documento PyMuPDF de una página para show_pdf_page (uno por informe)"""
+        import fitz
+        return fitz.open(stream=self.pagina, filetype="pdf")
+
+
+def _s3():
+    global _s3_client
+    with _s3_lock:
+        if _s3_client is None:
+            _s3_client = boto3.client('s3', region_name=S3_REGION)
+        return _s3_client
+
+
+def _clave(entity_id: int) -> str:
+    return f"{CACHE_CONFIGS['plantilla_pdf']['prefix']}:{entity_id}"
+
+
+def _s3_key(url: str) -> Optional[str]:
+    if _MARCADOR_URL not in url:
+        return None
+    return url.split(_MARCADOR_URL)[1]
+
+
+def _preparar_pagina(contenido: bytes) -> bytes:
+    """Extrae la página 0 sin objetos huérfanos y comprimida"""
+    import fitz
+    origen = fitz.open(stream=contenido, filetype="pdf")
+    try:
+        pagina = fitz.open()
+        try:
+            pagina.insert_pdf(origen, from_page=0, to_page=0)
+            return pagina.tobytes(garbage=4, deflate=True)
+        finally:
+            pagina.close()
+    finally:
+        origen.close()
+
+
+def detectar_margenes(contenido: bytes) -> Tuple[float, float]:
+    """
+    Analiza el template PDF y detecta automáticamente el espacio
+    que ocupan el encabezado (arriba) y el pie de página (abajo),
+    sin importar la posición exacta en cada entidad.
+    Retorna (top_margin_inches, bottom_margin_inches).
+    """
+    import fitz
+    doc = fitz.open(stream=contenido, filetype="pdf")
+    page = doc[0]
+    page_height = page.rect.height   # puntos PDF
+    mid_y = page_height / 2
+    PADDING_PT = 14  # margen extra de seguridad en puntos
+
+    header_bottom = 0.0   # borde inferior del encabezado
+    footer_top    = page_height  # borde superior del pie
+
+    # Bloques de texto
+    for block in page.get_text("blocks"):
+        x0, y0, x1, y1 = block[:4]
+        if y1 < mid_y:
+            header_bottom = max(header_bottom, y1)
+        elif y0 > mid_y:
+            footer_top = min(footer_top, y0)
+
+    # Trazados vectoriales (líneas, rectángulos, etc.)
+    for draw in page.get_drawings():
+        r = draw.get("rect")
+        if r:
+            if r.y1 < mid_y:
+                header_bottom = max(header_bottom, r.y1)
+            elif r.y0 > mid_y:
+                footer_top = min(footer_top, r.y0)
+
+    # Imágenes incrustadas (p.ej. logo)
+    for img in page.get_image_info(xrefs=True):
+        bbox = img.get("bbox")
+        if bbox:
+            y0, y1 = bbox[1], bbox[3]
+            if y1 < mid_y:
+                header_bottom = max(header_bottom, y1)
+            elif y0 > mid_y:
+                footer_top = min(footer_top, y0)
+
+    doc.close()
+
+    top_in    = (header_bottom + PADDING_PT) / 72.0
+    bottom_in = (page_height - footer_top + PADDING_PT) / 72.0
+
+    # Límites razonables
+    top_in    = round(max(0.75, min(3.5, top_in)), 3)
+    bottom_in = round(max(0.5,  min(2.5, bottom_in)), 3)
+
+    print(f"📐 Márgenes detectados → top: {top_in}in  bottom: {bottom_in}in")
+    return top_in, bottom_in
+
+
+def obtener_plantilla(entity) -> Optional[PlantillaPDF]:
+    """
+    Plantilla preparada de la entidad, o None si no tiene o no se pudo leer.
+    Solo va a S3 si este proceso no la tiene en memoria, y solo analiza
+    márgenes si ningún proceso lo hizo para esta versión.
+    """
+    url = entity.pdf_template_url
+    if not url:
+        return None
+
+    plantilla = _memoria.get(_clave(entity.id))
+    if plantilla is not None and plantilla.url == url:
+        print(f"♻️ Template de '{entity.slug}' desde caché (ETag {plantilla.etag})")
+        return plantilla
+
+    s3_key = _s3_key(url)
+    if s3_key is None:
+        print(f"⚠️ URL de template inesperada: {url}")
+        return None
+
+    print(f"📥 Descargando template S3: {s3_key}")
+    s3_resp = _s3().get_object(Bucket=S3_BUCKET, Key=s3_key)
+    contenido = s3_resp['Body'].read()
+    etag = (s3_resp.get('ETag') or '').strip('"')
+    print(f"✅ Template descargado: {len(contenido)} bytes")
+
+    meta = cache_manager.get(_clave(entity.id))
+    if meta and meta.get('url') == url and meta.get('etag') == etag:
+        margenes = (meta['margen_superior'], meta['margen_inferior'])
+    else:
+        margenes = detectar_margenes(contenido)
+        cache_manager.set(_clave(entity.id), {
+            'url': url,
+            'etag': etag,
+            'margen_superior': margenes[0],
+            'margen_inferior': margenes[1],
+        }, CACHE_CONFIGS['plantilla_pdf']['ttl'])
+
+    plantilla = PlantillaPDF(url, etag, contenido, *margenes)
+    _memoria.set(_clave(entity.id), plantilla, CACHE_CONFIGS['plantilla_pdf']['ttl'])
+    return plantilla
+
+
+def invalidar_plantilla(entity_id: int):
+    """Descarta la plantilla de la entidad (carga o eliminación del membrete)"""
+    _memoria.delete(_clave(entity_id))
+    cache_manager.delete(_clave(entity_id))
@@ -0,0 +1,202 @@
+"""
+Analítica de PQRS para informes.
+Los indicadores del informe (conteos por estado y tipo, tiempo promedio de
+respuesta, tendencia mensual, rangos de tiempos y matriz estado/tipo) se
+agregan en la base de datos con GROUP BY, en vez de cargar todas las PQRS del
+período como objetos ORM y recorrerlas en Python. Del detalle solo se traen
+las columnas que usa el generador y únicamente las PQRS más recientes.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Integer, case, cast, func
+from sqlalchemy.orm import Session
+
+from app.models.pqrs import PQRS
+from app.models.user import User
+
+
+# (etiqueta, mínimo, máximo) en días; None = sin límite superior
+RANGOS_TIEMPO = (
+    ('0-5 días', 0, 5),
+    ('6-10 días', 6, 10),
+    ('11-15 días', 11, 15),
+    ('16-20 días', 16, 20),
+    ('>20 días', 21, None),
+)
+
+
+def _valor(enum_o_texto) -> Optional[str]:
+    if enum_o_texto is None:
+        return None
+    return enum_o_texto.value if hasattr(enum_o_texto, 'value') else str(enum_o_texto)
+
+
+def _filtros(
+    entity_id: int,
+    fecha_inicio: datetime,
+    fecha_fin: datetime,
+    estado: Optional[str] = None,
+    tipo: Optional[str] = None
+) -> list:
+    """Filtros comunes del informe: entidad, período y filtros opcionales"""
+    filtros = [
+        PQRS.entity_id == entity_id,
+        PQRS.fecha_solicitud >= fecha_inicio,
+        PQRS.fecha_solicitud <= fecha_fin,
+    ]
+    if estado:
+        filtros.append(PQRS.estado == estado)
+    if tipo:
+        filtros.append(PQRS.tipo_solicitud == tipo)
+    return filtros
+
+
+def _dias_respuesta(dialecto: str):
+    """Días completos entre solicitud y respuesta (equivale a timedelta.days)"""
+    if dialecto == 'postgresql':
+        return func.floor(
+            func.extract('epoch', PQRS.fecha_respuesta - PQRS.fecha_solicitud) / 86400
+        )
+    return cast(func.julianday(PQRS.fecha_respuesta) - func.julianday(PQRS.fecha_solicitud), Integer)
+
+
+def _mes_solicitud(dialecto: str):
+    """Mes de la solicitud como 'YYYY-MM'"""
+    if dialecto == 'postgresql':
+        return func.to_char(PQRS.fecha_solicitud, 'YYYY-MM')
+    return func.strftime('%Y-%m', PQRS.fecha_solicitud)
+
+
+def calcular_analytics(
+    db: Session,
+    entity_id: int,
+    fecha_inicio: datetime,
+    fecha_fin: datetime,
+    estado: Optional[str] = None,
+    tipo: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Indicadores del informe en tres consultas agregadas.
+
+    Retorna las llaves que consumen el generador y los servicios de IA
+    (totalPqrs, pendientes, enProceso, resueltas, cerradas, tasaResolucion,
+    tiempoPromedioRespuesta, tiposPqrs) más las distribuciones de las
+    gráficas (porMes, rangosTiempo, matrizEstadoTipo).
+    """
+    dialecto = db.get_bind().dialect.name
+    filtros = _filtros(entity_id, fecha_inicio, fecha_fin, estado, tipo)
+
+    # 1. Conteo por estado y tipo (de aquí salen totales, tipos y la matriz)
+    por_estado: Dict[str, int] = {}
+    tipos_pqrs: Dict[str, int] = {}
+    matriz: Dict[str, Dict[str, int]] = {}
+    filas = db.query(
+        PQRS.estado, PQRS.tipo_solicitud, func.count(PQRS.id).label('cantidad')
+    ).filter(*filtros).group_by(PQRS.estado, PQRS.tipo_solicitud).all()
+    for fila in filas:
+        # Filas antiguas con el nombre del miembro en mayúsculas caen en otro grupo; se suman
+        estado_fila, tipo_fila = _valor(fila.estado), _valor(fila.tipo_solicitud)
+        por_estado[estado_fila] = por_estado.get(estado_fila, 0) + fila.cantidad
+        tipos_pqrs[tipo_fila] = tipos_pqrs.get(tipo_fila, 0) + fila.cantidad
+        celdas = matriz.setdefault(estado_fila, {})
+        celdas[tipo_fila] = celdas.get(tipo_fila, 0) + fila.cantidad
+    tipos_pqrs = dict(sorted(tipos_pqrs.items(), key=lambda x: x[1], reverse=True))
+
+    total = sum(por_estado.values())
+    resueltas = por_estado.get('resuelto', 0)
+    cerradas = por_estado.get('cerrado', 0)
+
+    # 2. Tiempos de respuesta: promedio general y rangos de la gráfica (solo días > 0)
+    dias = _dias_respuesta(dialecto)
+    positivo = dias > 0
+    rangos = []
+    for _, minimo, maximo in RANGOS_TIEMPO:
+        en_rango = positivo & (dias >= minimo)
+        if maximo is not None:
+            en_rango = en_rango & (dias <= maximo)
+        rangos.append(func.sum(case((en_rango, 1), else_=0)))
+    tiempos = db.query(
+        func.avg(dias).label('promedio'),
+        func.avg(case((positivo, dias))).label('promedio_positivos'),
+        func.count(case((positivo, 1))).label('con_tiempo'),
+        *rangos
+    ).filter(*filtros, PQRS.fecha_respuesta.isnot(None)).one()
+
+    tiempo_promedio = round(float(tiempos.promedio)) if tiempos.promedio is not None else 0
+    rangos_tiempo = {'labels': [], 'values': [], 'promedio': 0}
+    if tiempos.con_tiempo:
+        rangos_tiempo = {
+            'labels': [etiqueta for etiqueta, _, _ in RANGOS_TIEMPO],
+            'values': [int(v or 0) for v in tiempos[3:]],
+            'promedio': float(tiempos.promedio_positivos),
+        }
+
+    # 3. Tendencia mensual
+    mes = _mes_solicitud(dialecto).label('mes')
+    por_mes = {
+        fila.mes: fila.cantidad
+        for fila in db.query(mes, func.count(PQRS.id).label('cantidad')).filter(*filtros).group_by(mes).order_by(mes)
+        if fila.mes
+    }
+
+    return {
+        'totalPqrs': total,
+        'pendientes': por_estado.get('pendiente', 0),
+        'enProceso': por_estado.get('en_proceso', 0),
+        'resueltas': resueltas,
+        'cerradas': cerradas,
+        'tasaResolucion': round(((resueltas + cerradas) / total * 100), 1) if total > 0 else 0,
+        'tiempoPromedioRespuesta': tiempo_promedio,
+        'tiposPqrs': tipos_pqrs,
+        'porMes': por_mes,
+        'rangosTiempo': rangos_tiempo,
+        'matrizEstadoTipo': matriz,
+    }
+
+
+def listar_recientes(
+    db: Session,
+    entity_id: int,
+    fecha_inicio: datetime,
+    fecha_fin: datetime,
+    estado: Optional[str] = None,
+    tipo: Optional[str] = None,
+    limite: int = 20
+) -> List[Dict[str, Any]]:
+    """
+    PQRS más recientes del período para la tabla de detalle del informe.
+    Solo columnas proyectadas; el responsable llega en el mismo JOIN.
+    """
+    filas = db.query(
+        PQRS.id,
+        PQRS.numero_radicado,
+        PQRS.tipo_solicitud,
+        PQRS.estado,
+        PQRS.fecha_solicitud,
+        PQRS.fecha_respuesta,
+        PQRS.asunto,
+        PQRS.assigned_to_id,
+        User.full_name.label('assigned_to_name'),
+    ).outerjoin(
+        User, User.id == PQRS.assigned_to_id
+    ).filter(
+        *_filtros(entity_id, fecha_inicio, fecha_fin, estado, tipo)
+    ).order_by(
+        PQRS.fecha_solicitud.desc(), PQRS.id.desc()
+    ).limit(limite).all()
+
+    return [{
+        'id': fila.id,
+        'numero_radicado': fila.numero_radicado,
+        'tipo_solicitud': _valor(fila.tipo_solicitud),
+        'estado': _valor(fila.estado),
+        'fecha_solicitud': fila.fecha_solicitud.isoformat() if fila.fecha_solicitud else None,
+        'fecha_respuesta': fila.fecha_respuesta.isoformat() if fila.fecha_respuesta else None,
+        'dias_respuesta': (
+            (fila.fecha_respuesta - fila.fecha_solicitud).days
+            if fila.fecha_respuesta and fila.fecha_solicitud else None
+        ),
+        'asunto': fila.asunto,
+        'assigned_to': {'full_name': fila.assigned_to_name} if fila.assigned_to_id and fila.assigned_to_name is not None else None,
+    } for fila in filas]
@@ -27,14 +27,7 @@ from typing import List, Dict, Any, Optional
 import tempfile
 import os
 
-# Configurar matplotlib para uso en servidor
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.patheffects
-import numpy as np
-from matplotlib import patches
-plt.rcParams['font.family'] = 'DejaVu Sans'
+from app.services.chart_renderer import render_charts
 
 class PQRSReportGenerator:
     """Generador de informes PQRS con overlay de template institucional"""
@@ -142,16 +135,14 @@ class PQRSReportGenerator:
             'año': str(año)
         }
     
-    def generate_charts(self) -> Dict[str, BytesIO]:
+    def chart_specs(self) -> Dict[str, Dict[str, Any]]:
         """
-        Genera gráficos estadísticos avanzados con matplotlib
-        Retorna diccionario con buffers de imágenes PNG
+        Construye las especificaciones (datos puros) de las 5 gráficas del informe.
+        El dibujo con matplotlib lo hace app.services.chart_renderer.
         """
-        charts = {}
-        print(f"📊 Generando gráficas con {len(self.pqrs_list)} PQRS...")
+        specs = {}
         
-        # Gráfico 1: Distribución por Estado (Pie Chart mejorado)
-        fig1, ax1 = plt.subplots(figsize=(8, 6), facecolor='white')
+        # Gráfico 1: Distribución por Estado (Pie Chart)
         estados_labels = []
         valores_estados = []
         colores_estados = []
@@ -171,94 +162,37 @@ class PQRSReportGenerator:
                 valores_estados.append(valor)
                 colores_estados.append(color)
         
-        if valores_estados:
-            # Explotar levemente el primer segmento
-            explode = [0.08 if i == 0 else 0.03 for i in range(len(valores_estados))]
-            
-            wedges, texts, autotexts = ax1.pie(
-                valores_estados, 
-                explode=explode,
-                labels=estados_labels, 
-                autopct='%1.1f%%',
-                colors=colores_estados, 
-                startangle=45,
-                shadow=True,  # Sombra para profundidad
-                textprops={'fontsize': 11, 'weight': 'bold'},
-                wedgeprops={'edgecolor': 'white', 'linewidth': 2.5, 'antialiased': True}
-            )
-            
-            # Mejorar visibilidad de porcentajes con efecto de contraste
-            for autotext in autotexts:
-                autotext.set_color('white')
-                autotext.set_fontsize(12)
-                autotext.set_weight('bold')
-                autotext.set_path_effects([
-                    matplotlib.patheffects.withStroke(linewidth=2, foreground='black', alpha=0.3)
-                ])
-        else:
-            ax1.text(0.5, 0.5, 'Sin datos disponibles', 
-                    ha='center', va='center', transform=ax1.transAxes,
-                    fontsize=12, color='gray')
-        
-        ax1.set_title(f"Distribución por Estado (Total: {self.analytics.get('totalPqrs', 0)})", 
-                     fontsize=14, fontweight='bold', pad=25, color='#2c3e50')
-        
-        buffer1 = BytesIO()
-        plt.savefig(buffer1, format='png', dpi=150, bbox_inches='tight')
-        buffer1.seek(0)
-        charts['estados'] = buffer1
-        plt.close(fig1)
+        specs['estados'] = {
+            'tipo': 'pie_estados',
+            'data': {
+                'labels': estados_labels,
+                'values': valores_estados,
+                'colors': colores_estados,
+                'total': self.analytics.get('totalPqrs', 0)
+            },
+            'figsize': [8, 6],
+            'dpi': 150
+        }
         
-        # Gráfico 2: Distribución por Tipo (Bar Chart mejorado)
-        fig2, ax2 = plt.subplots(figsize=(10, 6), facecolor='white')
+        # Gráfico 2: Distribución por Tipo (Bar Chart)
         tipos_pqrs = self.analytics.get('tiposPqrs', {})
         
-        if tipos_pqrs:
-            # Ordenar por cantidad (mayor a menor)
-            tipos_sorted = sorted(tipos_pqrs.items(), key=lambda x: x[1], reverse=True)
-            tipos = [t[0] for t in tipos_sorted]
-            cantidades = [t[1] for t in tipos_sorted]
-            
-            # Capitalizar y formatear tipos
-            tipos_capitalizados = [t.replace('_', ' ').title() for t in tipos]
-            
-            # Paleta de colores profesional (azul a verde)
-            colores = ['#3498db', '#5dade2', '#48c9b0', '#52be80', '#58d68d', '#7dcea0']
-            colores_chart = (colores * (len(tipos) // len(colores) + 1))[:len(tipos)]
-            
-            bars = ax2.barh(tipos_capitalizados, cantidades, color=colores_chart, 
-                          edgecolor='white', linewidth=1.5, height=0.7)
-            
-            # Sombra sutil en las barras
-            for bar in bars:
-                bar.set_alpha(0.85)
-            
-            ax2.set_xlabel('Cantidad de Solicitudes', fontsize=12, fontweight='bold', color='#2c3e50')
-            ax2.set_title('Distribución por Tipo de Solicitud', fontsize=14, fontweight='bold', pad=20, color='#2c3e50')
-            ax2.grid(axis='x', alpha=0.2, linestyle='--', linewidth=0.8)
-            ax2.set_axisbelow(True)  # Grid detrás de las barras
-            
-            # Añadir valores y porcentajes en las barras
-            total_tipos = sum(cantidades)
-            for i, (bar, cant) in enumerate(zip(bars, cantidades)):
-                width = bar.get_width()
-                porcentaje = (cant / total_tipos * 100) if total_tipos > 0 else 0
-                ax2.text(width + max(cantidades)*0.02, bar.get_y() + bar.get_height()/2, 
-                        f'{int(width)} ({porcentaje:.1f}%)', 
-                        ha='left', va='center', fontsize=10, fontweight='bold', color='#34495e')
-        
-        buffer2 = BytesIO()
-        plt.savefig(buffer2, format='png', dpi=150, bbox_inches='tight')
-        buffer2.seek(0)
-        charts['tipos'] = buffer2
-        plt.close(fig2)
-        
-        # Gráfico 3: Tendencia Mensual (Line Chart mejorado)
-        fig3, ax3 = plt.subplots(figsize=(10, 6), facecolor='white')
-        
-        # Agrupar PQRS por mes con conteo real
-        meses_dict = {}
-        for pqrs in self.pqrs_list:
+        # Ordenar por cantidad (mayor a menor) y capitalizar tipos
+        tipos_sorted = sorted(tipos_pqrs.items(), key=lambda x: x[1], reverse=True)
+        specs['tipos'] = {
+            'tipo': 'barh_tipos',
+            'data': {
+                'labels': [t[0].replace('_', ' ').title() for t in tipos_sorted],
+                'values': [t[1] for t in tipos_sorted]
+            },
+            'figsize': [10, 6],
+            'dpi': 150
+        }
+        
+        # Gráfico 3: Tendencia Mensual (Line Chart)
+        # Conteo por mes agregado en la BD (pqrs_analytics); si no viene, agrupar la lista
+        meses_dict = dict(self.analytics.get('porMes') or {})
+        for pqrs in ([] if 'porMes' in self.analytics else self.pqrs_list):
             try:
                 fecha_str = str(pqrs.get('fecha_solicitud', ''))
                 if fecha_str:
@@ -268,235 +202,117 @@ class PQRSReportGenerator:
             except:
                 continue
         
-        if meses_dict and len(meses_dict) > 0:
-            meses_ordenados = sorted(meses_dict.keys())
-            valores_meses = [meses_dict[m] for m in meses_ordenados]
-            
-            # Formatear etiquetas de meses en español
-            meses_es = {
-                'Jan': 'Ene', 'Feb': 'Feb', 'Mar': 'Mar', 'Apr': 'Abr',
-                'May': 'May', 'Jun': 'Jun', 'Jul': 'Jul', 'Aug': 'Ago',
-                'Sep': 'Sep', 'Oct': 'Oct', 'Nov': 'Nov', 'Dec': 'Dic'
-            }
-            meses_labels = []
-            for m in meses_ordenados:
-                fecha_temp = datetime.strptime(m, '%Y-%m')
-                label_en = fecha_temp.strftime('%b %Y')
-                mes_abr = label_en.split()[0]
-                label_es = meses_es.get(mes_abr, mes_abr) + ' ' + label_en.split()[1]
-                meses_labels.append(label_es)
-            
-            # Gráfica de línea elegante con gradiente
-            ax3.plot(meses_labels, valores_meses, marker='o', linewidth=3, 
-                    color='#e74c3c', markersize=10, markerfacecolor='#e74c3c', 
-                    markeredgecolor='white', markeredgewidth=2.5, label='PQRS Recibidas',
-                    zorder=3)  # Línea al frente
-            
-            # Área sombreada con gradiente suave
-            ax3.fill_between(range(len(meses_labels)), valores_meses, alpha=0.25, 
-                           color='#e74c3c', zorder=2)
-            
-            ax3.set_xlabel('Período', fontsize=12, fontweight='bold', color='#2c3e50')
-            ax3.set_ylabel('Cantidad de PQRS', fontsize=12, fontweight='bold', color='#2c3e50')
-            ax3.set_title('Evolución Temporal de PQRS', fontsize=14, fontweight='bold', pad=20, color='#2c3e50')
-            ax3.grid(True, alpha=0.2, linestyle='--', linewidth=0.8, zorder=1)
-            ax3.legend(loc='upper left', fontsize=11, framealpha=0.9, edgecolor='gray')
-            ax3.set_axisbelow(True)
-            
-            # Añadir valores sobre cada punto con fondo
-            for i, (x, y) in enumerate(zip(range(len(meses_labels)), valores_meses)):
-                ax3.text(x, y + max(valores_meses)*0.03, str(y), 
-                        ha='center', va='bottom', fontsize=10, fontweight='bold',
-                        bbox=dict(boxstyle='round,pad=0.3', facecolor='white', edgecolor='gray', alpha=0.8))
-            
-            plt.xticks(rotation=45, ha='right', fontsize=10)
-        else:
-            # Sin datos temporales
-            ax3.text(0.5, 0.5, 'Sin datos temporales disponibles', 
-                    ha='center', va='center', transform=ax3.transAxes, 
-                    fontsize=12, color='gray')
-        
-        buffer3 = BytesIO()
-        plt.savefig(buffer3, format='png', dpi=150, bbox_inches='tight')
-        buffer3.seek(0)
-        charts['tendencias'] = buffer3
-        plt.close(fig3)
+        meses_ordenados = sorted(meses_dict.keys())
         
-        # Gráfico 4: Tiempos de Respuesta (Nuevo)
-        fig4, ax4 = plt.subplots(figsize=(10, 6), facecolor='white')
+        # Formatear etiquetas de meses en español
+        meses_es = {
+            'Jan': 'Ene', 'Feb': 'Feb', 'Mar': 'Mar', 'Apr': 'Abr',
+            'May': 'May', 'Jun': 'Jun', 'Jul': 'Jul', 'Aug': 'Ago',
+            'Sep': 'Sep', 'Oct': 'Oct', 'Nov': 'Nov', 'Dec': 'Dic'
+        }
+        meses_labels = []
+        for m in meses_ordenados:
+            fecha_temp = datetime.strptime(m, '%Y-%m')
+            label_en = fecha_temp.strftime('%b %Y')
+            mes_abr = label_en.split()[0]
+            label_es = meses_es.get(mes_abr, mes_abr) + ' ' + label_en.split()[1]
+            meses_labels.append(label_es)
+        
+        specs['tendencias'] = {
+            'tipo': 'linea_mensual',
+            'data': {
+                'labels': meses_labels,
+                'values': [meses_dict[m] for m in meses_ordenados]
+            },
+            'figsize': [10, 6],
+            'dpi': 150
+        }
         
-        # Calcular distribución de tiempos
+        # Gráfico 4: Tiempos de Respuesta
         tiempos = []
-        for pqrs in self.pqrs_list:
+        for pqrs in ([] if 'rangosTiempo' in self.analytics else self.pqrs_list):
             if pqrs.get('dias_respuesta') and pqrs['dias_respuesta'] > 0:
                 tiempos.append(pqrs['dias_respuesta'])
         
+        datos_tiempos = {'labels': [], 'values': [], 'promedio': 0}
         if tiempos:
             # Crear rangos de tiempo
-            rangos = ['0-5 días', '6-10 días', '11-15 días', '16-20 días', '>20 días']
-            conteos = [
-                len([t for t in tiempos if 0 <= t <= 5]),
-                len([t for t in tiempos if 6 <= t <= 10]),
-                len([t for t in tiempos if 11 <= t <= 15]),
-                len([t for t in tiempos if 16 <= t <= 20]),
-                len([t for t in tiempos if t > 20])
-            ]
-            
-            # Colores semafóricos profesionales
-            colores_tiempos = ['#27ae60', '#2ecc71', '#f39c12', '#e67e22', '#c0392b']
-            bars = ax4.bar(rangos, conteos, color=colores_tiempos, edgecolor='white', 
-                          linewidth=2, width=0.7, alpha=0.85)
-            
-            ax4.set_ylabel('Cantidad de PQRS', fontsize=12, fontweight='bold', color='#2c3e50')
-            ax4.set_title('Distribución de Tiempos de Respuesta', fontsize=14, fontweight='bold', 
-                         pad=20, color='#2c3e50')
-            ax4.grid(axis='y', alpha=0.2, linestyle='--', linewidth=0.8)
-            ax4.set_axisbelow(True)
-            
-            # Línea de referencia legal elegante
-            if max(conteos) > 0:
-                ax4.axhline(y=max(conteos)*0.5, color='#e74c3c', linestyle='--', 
-                           linewidth=2.5, alpha=0.6, label='Referencia legal: 15 días')
-            
-            # Añadir valores sobre barras con fondo
-            for bar, conteo in zip(bars, conteos):
-                if conteo > 0:
-                    height = bar.get_height()
-                    ax4.text(bar.get_x() + bar.get_width()/2., height + max(conteos)*0.02,
-                            f'{int(conteo)}',
-                            ha='center', va='bottom', fontsize=11, fontweight='bold',
-                            bbox=dict(boxstyle='round,pad=0.3', facecolor='white', 
-                                    edgecolor='gray', alpha=0.9))
-            
-            ax4.legend(loc='upper right', fontsize=10, framealpha=0.9, edgecolor='gray')
-            plt.xticks(rotation=20, ha='right', fontsize=10)
-            
-            # Añadir promedio con estilo profesional
-            promedio = sum(tiempos) / len(tiempos)
-            ax4.text(0.02, 0.98, f'⏱ Promedio: {promedio:.1f} días', 
-                    transform=ax4.transAxes, fontsize=12, fontweight='bold',
-                    verticalalignment='top', color='#2c3e50',
-                    bbox=dict(boxstyle='round,pad=0.5', facecolor='#ecf0f1', 
-                            edgecolor='#34495e', alpha=0.9, linewidth=2))
-        else:
-            ax4.text(0.5, 0.5, 'Datos de tiempos no disponibles', 
-                    ha='center', va='center', transform=ax4.transAxes, 
-                    fontsize=12, color='gray')
-        
-        buffer4 = BytesIO()
-        plt.savefig(buffer4, format='png', dpi=150, bbox_inches='tight')
-        buffer4.seek(0)
-        charts['tiempos'] = buffer4
-        plt.close(fig4)
+            datos_tiempos = {
+                'labels': ['0-5 días', '6-10 días', '11-15 días', '16-20 días', '>20 días'],
+                'values': [
+                    len([t for t in tiempos if 0 <= t <= 5]),
+                    len([t for t in tiempos if 6 <= t <= 10]),
+                    len([t for t in tiempos if 11 <= t <= 15]),
+                    len([t for t in tiempos if 16 <= t <= 20]),
+                    len([t for t in tiempos if t > 20])
+                ],
+                'promedio': sum(tiempos) / len(tiempos)
+            }
+        elif 'rangosTiempo' in self.analytics:
+            datos_tiempos = self.analytics['rangosTiempo']
+        
+        specs['tiempos'] = {
+            'tipo': 'barras_tiempos',
+            'data': datos_tiempos,
+            'figsize': [10, 6],
+            'dpi': 150
+        }
         
         # Gráfico 5: Comparativa Estado vs Tipo (Heatmap)
-        fig5, ax5 = plt.subplots(figsize=(11, 7), facecolor='white')
-        
-        # Crear matriz de estado vs tipo
-        if tipos_pqrs and self.pqrs_list:
+        datos_matriz = {'matrix': [], 'x_labels': [], 'y_labels': []}
+        matriz_estado_tipo = self.analytics.get('matrizEstadoTipo')
+        if tipos_pqrs and (self.pqrs_list or matriz_estado_tipo):
             estados_lista = ['pendiente', 'en_proceso', 'resuelto', 'cerrado']
             tipos_lista = list(tipos_pqrs.keys())
             
             # Matriz de conteo
-            matriz = np.zeros((len(estados_lista), len(tipos_lista)))
-            
-            for pqrs in self.pqrs_list:
-                estado = pqrs.get('estado', '').lower()
-                tipo = pqrs.get('tipo_solicitud', '').lower()
-                
-                if estado in estados_lista and tipo in tipos_lista:
-                    i = estados_lista.index(estado)
-                    j = tipos_lista.index(tipo)
-                    matriz[i, j] += 1
-            
-            # Crear heatmap con paleta profesional
-            im = ax5.imshow(matriz, cmap='RdYlGn_r', aspect='auto', alpha=0.85)
-            
-            # Etiquetas con mejor formato
-            estados_labels = [e.replace('_', ' ').title() for e in estados_lista]
-            tipos_labels = [t.replace('_', ' ').title() for t in tipos_lista]
-            
-            ax5.set_xticks(np.arange(len(tipos_labels)))
-            ax5.set_yticks(np.arange(len(estados_labels)))
-            ax5.set_xticklabels(tipos_labels, rotation=45, ha='right', fontsize=10)
-            ax5.set_yticklabels(estados_labels)
-            
-            # Añadir valores en cada celda
-            for i in range(len(estados_lista)):
-                for j in range(len(tipos_lista)):
-                    text = ax5.text(j, i, int(matriz[i, j]),
-                                   ha='center', va='center', color='black', 
-                                   fontsize=10, fontweight='bold')
+            if matriz_estado_tipo is not None:
+                matriz = [
+                    [matriz_estado_tipo.get(estado, {}).get(tipo, 0) for tipo in tipos_lista]
+                    for estado in estados_lista
+                ]
+            else:
+                matriz = [[0] * len(tipos_lista) for _ in estados_lista]
+                for pqrs in self.pqrs_list:
+                    estado = pqrs.get('estado', '').lower()
+                    tipo = pqrs.get('tipo_solicitud', '').lower()
+                    
+                    if estado in estados_lista and tipo in tipos_lista:
+                        matriz[estados_lista.index(estado)][tipos_lista.index(tipo)] += 1
             
-            ax5.set_title('Matriz: Estado vs Tipo de Solicitud', fontsize=13, fontweight='bold', pad=15)
-            plt.colorbar(im, ax=ax5, label='Cantidad')
+            datos_matriz = {
+                'matrix': matriz,
+                'x_labels': [t.replace('_', ' ').title() for t in tipos_lista],
+                'y_labels': [e.replace('_', ' ').title() for e in estados_lista]
+            }
         
-        buffer5 = BytesIO()
-        plt.savefig(buffer5, format='png', dpi=150, bbox_inches='tight')
-        buffer5.seek(0)
-        charts['matriz'] = buffer5
-        plt.close(fig5)
+        specs['matriz'] = {
+            'tipo': 'heatmap_estado_tipo',
+            'data': datos_matriz,
+            'figsize': [11, 7],
+            'dpi': 150
+        }
         
-        print(f"✅ {len(charts)} gráficas generadas exitosamente")
-        return charts
+        return specs
     
-    @staticmethod
-    def _detect_template_margins(template_pdf_bytes: bytes):
+    def generate_charts(self) -> Dict[str, BytesIO]:
         """
-        Analiza el template PDF y detecta automáticamente el espacio
-        que ocupan el encabezado (arriba) y el pie de página (abajo),
-        sin importar la posición exacta en cada entidad.
-        Retorna (top_margin_inches, bottom_margin_inches).
+        Genera gráficos estadísticos avanzados con matplotlib
+        Retorna diccionario con buffers de imágenes PNG
+        
+        Las 5 gráficas se renderizan en paralelo en el pool de procesos
+        de chart_renderer.
         """
-        import fitz
-        doc = fitz.open(stream=template_pdf_bytes, filetype="pdf")
-        page = doc[0]
-        page_height = page.rect.height   # puntos PDF
-        mid_y = page_height / 2
-        PADDING_PT = 14  # margen extra de seguridad en puntos
-
-        header_bottom = 0.0   # borde inferior del encabezado
-        footer_top    = page_height  # borde superior del pie
-
-        # Bloques de texto
-        for block in page.get_text("blocks"):
-            x0, y0, x1, y1 = block[:4]
-            if y1 < mid_y:
-                header_bottom = max(header_bottom, y1)
-            elif y0 > mid_y:
-                footer_top = min(footer_top, y0)
-
-        # Trazados vectoriales (líneas, rectángulos, etc.)
-        for draw in page.get_drawings():
-            r = draw.get("rect")
-            if r:
-                if r.y1 < mid_y:
-                    header_bottom = max(header_bottom, r.y1)
-                elif r.y0 > mid_y:
-                    footer_top = min(footer_top, r.y0)
-
-        # Imágenes incrustadas (p.ej. logo)
-        for img in page.get_image_info(xrefs=True):
-            bbox = img.get("bbox")
-            if bbox:
-                y0, y1 = bbox[1], bbox[3]
-                if y1 < mid_y:
-                    header_bottom = max(header_bottom, y1)
-                elif y0 > mid_y:
-                    footer_top = min(footer_top, y0)
-
-        doc.close()
-
-        top_in    = (header_bottom + PADDING_PT) / 72.0
-        bottom_in = (page_height - footer_top + PADDING_PT) / 72.0
-
-        # Límites razonables
-        top_in    = round(max(0.75, min(3.5, top_in)), 3)
-        bottom_in = round(max(0.5,  min(2.5, bottom_in)), 3)
-
-        print(f"📐 Márgenes detectados → top: {top_in}in  bottom: {bottom_in}in")
-        return top_in, bottom_in
-
+        print(f"📊 Generando gráficas con {self.analytics.get('totalPqrs', len(self.pqrs_list))} PQRS...")
+        
+        charts = {
+            nombre: BytesIO(png)
+            for nombre, png in render_charts(self.chart_specs()).items()
+        }
+        
+        print(f"✅ {len(charts)} gráficas generadas exitosamente")
+        return charts
+    
     def _create_content_pdf(self, top_margin: float = 1.6, bottom_margin: float = 1.0) -> BytesIO:
         """
         Crea el PDF con el contenido del informe (sin template, solo contenido).
@@ -1165,41 +981,27 @@ class PQRSReportGenerator:
     def generate_pdf(self) -> BytesIO:
         """
         Genera el PDF final.
-        Si hay template: descarga desde S3 via boto3, detecta márgenes
-        automáticamente, genera el contenido con esos márgenes y aplica
-        el template vectorial como fondo en cada página.
+        Si hay template: lo toma de la caché de plantillas (descarga de S3 y
+        detección de márgenes solo la primera vez), genera el contenido con
+        esos márgenes y aplica el template vectorial como fondo en cada página.
         """
         import fitz  # PyMuPDF
-        import boto3 as _boto3
         import traceback
+        from app.services.plantillas_pdf import obtener_plantilla
 
-        template_pdf_bytes = None
+        plantilla = None
         top_margin    = 1.6   # valores por defecto sin template
         bottom_margin = 1.0
 
         if self.entity.pdf_template_url:
             try:
-                S3_BUCKET = "softone360-pqrs-archivos"
-                S3_REGION = "us-east-1"
-
-                marker = f"{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/"
-                if marker not in self.entity.pdf_template_url:
-                    print(f"⚠️ URL de template inesperada: {self.entity.pdf_template_url}")
-                else:
-                    s3_key = self.entity.pdf_template_url.split(marker)[1]
-                    print(f"📥 Descargando template S3: {s3_key}")
-                    s3 = _boto3.client('s3', region_name=S3_REGION)
-                    s3_resp = s3.get_object(Bucket=S3_BUCKET, Key=s3_key)
-                    template_pdf_bytes = s3_resp['Body'].read()
-                    print(f"✅ Template descargado: {len(template_pdf_bytes)} bytes")
-
-                    # Detectar márgenes automáticamente según el template
-                    top_margin, bottom_margin = self._detect_template_margins(template_pdf_bytes)
-
+                plantilla = obtener_plantilla(self.entity)
+                if plantilla is not None:
+                    top_margin, bottom_margin = plantilla.margen_superior, plantilla.margen_inferior
             except Exception as e:
                 print(f"⚠️ Error descargando template: {e}")
                 traceback.print_exc()
-                template_pdf_bytes = None
+                plantilla = None
 
         # Generar contenido con los márgenes correctos para este template
         content_buffer = self._create_content_pdf(
@@ -1207,12 +1009,12 @@ class PQRSReportGenerator:
             bottom_margin=bottom_margin
         )
 
-        if not template_pdf_bytes:
+        if plantilla is None:
             return content_buffer
 
         try:
             # Abrir template PDF como documento vectorial (sin rasterizar)
-            template_doc = fitz.open(stream=template_pdf_bytes, filetype="pdf")
+            template_doc = plantilla.abrir()
             print(f"✅ Template abierto: {len(template_doc)} página(s)")
 
             # Post-procesar: insertar template como Form XObject vectorial debajo del contenido
@@ -0,0 +1,138 @@
+"""
+Auditoría de planes de consulta para las consultas más frecuentes.
+
+Ejecuta EXPLAIN sobre cada consulta crítica y reporta las que recorren una
+tabla completa (Seq Scan) en vez de usar un índice. Las consultas replican
+los filtros y el orden de las rutas (bandejas de PQRS, portal ciudadano,
+informes, alertas, asistencia y correspondencia).
+
+En PostgreSQL se desactiva enable_seqscan dentro de la transacción: con
+tablas pequeñas el planificador prefiere un Seq Scan aunque exista índice,
+pero si con enable_seqscan=off lo sigue eligiendo es porque no hay un índice
+utilizable. En SQLite se revisa EXPLAIN QUERY PLAN ("SCAN tabla" sin índice).
+
+Uso (termina con código 1 si alguna consulta hace un recorrido completo):
+    python -m app.utils.auditoria_planes
+"""
+import json
+import sys
+from typing import Any, Dict, List
+
+from sqlalchemy import text
+
+from app.config.database import engine
+
+
+# (nombre, tabla que debe resolverse por índice, SQL con valores representativos)
+CONSULTAS_CRITICAS = [
+    ("Bandeja PQRS de la entidad", "pqrs",
+     "SELECT id FROM pqrs WHERE entity_id = 1 "
+     "ORDER BY created_at DESC, id DESC LIMIT 51"),
+    ("Bandeja PQRS por estado", "pqrs",
+     "SELECT id FROM pqrs WHERE entity_id = 1 AND estado = 'pendiente' "
+     "ORDER BY created_at DESC, id DESC LIMIT 51"),
+    ("PQRS asignadas (secretario)", "pqrs",
+     "SELECT id FROM pqrs WHERE assigned_to_id = 1 "
+     "ORDER BY created_at DESC, id DESC LIMIT 51"),
+    ("PQRS del ciudadano", "pqrs",
+     "SELECT id FROM pqrs WHERE created_by_id = 1 OR email_ciudadano = 'ciudadano@correo.com' "
+     "ORDER BY created_at DESC, id DESC LIMIT 51"),
+    ("Analítica de informe PQRS por período", "pqrs",
+     "SELECT estado, tipo_solicitud, COUNT(id) FROM pqrs "
+     "WHERE entity_id = 1 AND fecha_solicitud >= '2025-01-01' AND fecha_solicitud <= '2025-12-31' "
+     "GROUP BY estado, tipo_solicitud"),
+    ("Historial de asignaciones", "asignacion_auditoria",
+     "SELECT id FROM asignacion_auditoria WHERE pqrs_id = 1 ORDER BY fecha_asignacion DESC"),
+    ("Alertas propias sin leer", "alerts",
+     "SELECT id FROM alerts WHERE recipient_user_id = 1 AND read_at IS NULL "
+     "ORDER BY created_at DESC LIMIT 20"),
+    ("Alertas de entidad", "alerts",
+     "SELECT id FROM alerts WHERE entity_id = 1 AND recipient_user_id IS NULL "
+     "ORDER BY created_at DESC LIMIT 20"),
+    ("Funcionarios de la entidad", "funcionarios",
+     "SELECT id FROM funcionarios WHERE entity_id = 1"),
+    ("Registros del día de un funcionario", "registros_asistencia",
+     "SELECT id FROM registros_asistencia WHERE funcionario_id = 1 "
+     "AND CAST(fecha_hora AS DATE) = CURRENT_DATE ORDER BY fecha_hora DESC"),
+    ("Correspondencia de la entidad", "correspondencia",
+     "SELECT id FROM correspondencia WHERE entity_id = 1 ORDER BY created_at DESC LIMIT 100"),
+    ("Correspondencia del secretario", "correspondencia",
+     "SELECT id FROM correspondencia WHERE entity_id = 1 AND (created_by_id = 1 OR assigned_to_id = 1) "
+     "ORDER BY created_at DESC LIMIT 100"),
+]
+
+
+def _recorridos_postgres(nodo: Dict[str, Any]) -> List[str]:
+    """Tablas con Seq Scan en el árbol del plan (formato JSON)"""
+    tablas = []
+    if nodo.get("Node Type") == "Seq Scan":
+        tablas.append(nodo.get("Relation Name"))
+    for hijo in nodo.get("Plans", []):
+        tablas.extend(_recorridos_postgres(hijo))
+    return tablas
+
+
+def _plan_postgres(conn, sql: str):
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    raiz = plan[0]["Plan"]
+    return _recorridos_postgres(raiz), raiz.get("Node Type")
+
+
+def _plan_sqlite(conn, sql: str):
+    filas = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+    detalles = [fila[-1] for fila in filas]
+    tablas = [
+        d.split()[1] for d in detalles
+        if d.startswith("SCAN ") and "USING" not in d
+    ]
+    return tablas, " | ".join(detalles)
+
+
+def auditar_planes() -> Dict[str, Any]:
+    """
+    Ejecuta EXPLAIN sobre CONSULTAS_CRITICAS.
+    Retorna {'ok': bool, 'consultas': [...]} con el detalle de cada consulta.
+    """
+    es_postgres = engine.dialect.name == 'postgresql'
+    resultados = []
+
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            if es_postgres:
+                conn.execute(text("SET LOCAL enable_seqscan = off"))
+            for nombre, tabla, sql in CONSULTAS_CRITICAS:
+                if es_postgres:
+                    recorridos, plan = _plan_postgres(conn, sql)
+                else:
+                    recorridos, plan = _plan_sqlite(conn, sql)
+                ok = tabla not in recorridos
+                resultados.append({
+                    "consulta": nombre,
+                    "tabla": tabla,
+                    "ok": ok,
+                    "plan": plan,
+                })
+                print(f"   {'✅' if ok else '❌'} {nombre}: {plan}")
+        finally:
+            # Solo lectura; se descarta también el SET LOCAL
+            trans.rollback()
+
+    return {
+        "ok": all(r["ok"] for r in resultados),
+        "consultas": resultados,
+    }
+
+
+if __name__ == "__main__":
+    print("="*70)
+    print("AUDITORÍA DE PLANES DE CONSULTA")
+    print("="*70)
+    resultado = auditar_planes()
+    fallidas = [r["consulta"] for r in resultado["consultas"] if not r["ok"]]
+    if fallidas:
+        print(f"❌ {len(fallidas)} consulta(s) recorren la tabla completa: {', '.join(fallidas)}")
+        sys.exit(1)
+    print("✅ Todas las consultas críticas usan índices")
@@ -1,17 +1,124 @@
 """
 Módulo de caching con Redis para optimizar llamadas a APIs externas
+
+Dos niveles:
+- L1: LRU en memoria del proceso con TTL corto (CACHE_LOCAL_TTL_SEGUNDOS).
+  Evita el round trip a Redis en claves calientes. Si Redis no está
+  disponible, pasa a ser el único nivel y usa el TTL completo.
+- L2: Redis, compartido entre workers e instancias.
+
+Las eliminaciones se publican en el canal CANAL_INVALIDACION para que los
+demás workers descarten su copia local. Todos los niveles locales del proceso
+(el de cache_manager, el de async_cache_manager y los registrados con
+registrar_nivel_local) se descartan juntos, porque una misma clave puede
+leerse desde código sync y async.
+
+AsyncCacheManager.obtener_o_calcular agrega stale-while-revalidate y
+single-flight para orígenes lentos (datos.gov.co): una sola consulta al
+origen por clave y, al vencer, se sirve el valor anterior mientras se
+refresca en segundo plano.
 """
 import redis
+import redis.asyncio as aioredis
+import asyncio
 import json
 import hashlib
-from typing import Optional, Any, Callable
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Any, Awaitable, Callable, Dict, List, Tuple
 from functools import wraps
 import logging
 import os
 from datetime import timedelta
 
+from app.config.settings import settings
+
 logger = logging.getLogger(__name__)
 
+CANAL_INVALIDACION = "cache:invalidar"
+
+# Identifica a este proceso para ignorar sus propias invalidaciones
+ORIGEN_PROCESO = uuid.uuid4().hex
+
+# Resultado de una revalidación que no produjo valor (la hizo otro worker o falló)
+_SIN_VALOR = object()
+
+
+class CacheLocal:
+    """
+    LRU en memoria con TTL por entrada y tamaño máximo.
+    Los valores se comparten entre llamadas: no deben mutarse.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._datos: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entrada = self._datos.get(key)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira <= time.monotonic():
+                del self._datos[key]
+                return None
+            self._datos.move_to_end(key)
+            return valor
+
+    def set(self, key: str, value: Any, ttl_seconds: float):
+        if ttl_seconds <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._datos[key] = (time.monotonic() + ttl_seconds, value)
+            self._datos.move_to_end(key)
+            while len(self._datos) > self.max_entries:
+                self._datos.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._datos.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+
+# Niveles locales del proceso que deben descartar las claves invalidadas
+_niveles_locales: List[CacheLocal] = []
+
+
+def registrar_nivel_local(local: CacheLocal) -> CacheLocal:
+    """Suscribe un CacheLocal a las invalidaciones (propias y de otros workers)"""
+    _niveles_locales.append(local)
+    return local
+
+
+def descartar_local(key: str):
+    """Elimina la clave de todos los niveles locales del proceso ("*" = todas)"""
+    for local in _niveles_locales:
+        if key == "*":
+            local.clear()
+        else:
+            local.delete(key)
+
+
+def _ttl_local(ttl_seconds: int, redis_disponible: bool) -> int:
+    """TTL del nivel local: corto si Redis respalda el valor, completo si no"""
+    if redis_disponible:
+        return min(ttl_seconds, settings.cache_local_ttl_segundos)
+    return ttl_seconds
+
+
+def _mensaje_invalidacion(key: str) -> str:
+    return json.dumps({"origen": ORIGEN_PROCESO, "key": key})
+
 class CacheManager:
     """Gestor de caché con Redis"""
     
@@ -25,6 +132,9 @@ class CacheManager:
             db: Base de datos Redis a usar
         """
         self.connected = False
+        self.local = registrar_nivel_local(
+            CacheLocal(settings.cache_local_max_entries if settings.cache_local_enabled else 0)
+        )
         is_production = os.getenv("ENVIRONMENT") in ["production", "prod"] or os.getenv("AWS_EXECUTION_ENV")
         
         try:
@@ -48,6 +158,9 @@ class CacheManager:
     
     def get(self, key: str) -> Optional[Any]:
         """Obtener valor del caché"""
+        value = self.local.get(key)
+        if value is not None:
+            return value
         if not self.connected:
             return None
         
@@ -55,7 +168,10 @@ class CacheManager:
             value = self.redis_client.get(key)
             if value:
                 logger.debug(f"✅ Cache hit: {key}")
-                return json.loads(value)
+                value = json.loads(value)
+                # Sin el TTL restante de Redis: el local es corto
+                self.local.set(key, value, settings.cache_local_ttl_segundos)
+                return value
             return None
         except Exception as e:
             logger.warning(f"Error al obtener del caché: {str(e)}")
@@ -70,6 +186,7 @@ class CacheManager:
             value: Valor a guardar
             ttl_seconds: Tiempo de vida en segundos (default 1 hora)
         """
+        self.local.set(key, value, _ttl_local(ttl_seconds, self.connected))
         if not self.connected:
             return False
         
@@ -86,12 +203,14 @@ class CacheManager:
             return False
     
     def delete(self, key: str) -> bool:
-        """Eliminar clave del caché"""
+        """Eliminar clave del caché (y de la copia local de los demás workers)"""
+        descartar_local(key)
         if not self.connected:
             return False
         
         try:
             self.redis_client.delete(key)
+            self.redis_client.publish(CANAL_INVALIDACION, _mensaje_invalidacion(key))
             logger.debug(f"✅ Cache deleted: {key}")
             return True
         except Exception as e:
@@ -100,20 +219,287 @@ class CacheManager:
     
     def clear(self) -> bool:
         """Limpiar todo el caché"""
+        descartar_local("*")
         if not self.connected:
             return False
         
         try:
             self.redis_client.flushdb()
+            self.redis_client.publish(CANAL_INVALIDACION, _mensaje_invalidacion("*"))
             logger.info("✅ Caché limpiado")
             return True
         except Exception as e:
             logger.warning(f"Error al limpiar caché: {str(e)}")
             return False
 
+class AsyncCacheManager:
+    """
+    Gestor de caché con Redis para handlers async (redis.asyncio).
+    No bloquea el event loop en cada acceso. Comparte un único pool de
+    conexiones por proceso. Si Redis no responde, queda solo el nivel local
+    durante REINTENTO_SEGUNDOS para no pagar el timeout de conexión en cada request.
+    """
+
+    REINTENTO_SEGUNDOS = 30
+    # Máximo que un worker retiene el lock de revalidación de una clave
+    LOCK_REVALIDACION_SEGUNDOS = 60
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0, max_connections: int = 50):
+        self._pool = aioredis.ConnectionPool(
+            host=host,
+            port=port,
+            db=db,
+            decode_responses=True,
+            socket_connect_timeout=5,
+            max_connections=max_connections
+        )
+        self.redis_client = aioredis.Redis(connection_pool=self._pool)
+        self._deshabilitado_hasta = 0.0
+        self.local = registrar_nivel_local(
+            CacheLocal(settings.cache_local_max_entries if settings.cache_local_enabled else 0)
+        )
+        self._tarea_invalidacion: Optional[asyncio.Task] = None
+        # Cálculos en curso por clave (single-flight dentro del proceso)
+        self._en_vuelo: Dict[str, asyncio.Future] = {}
+
+    @property
+    def connected(self) -> bool:
+        return time.monotonic() >= self._deshabilitado_hasta
+
+    def _fallo(self, operacion: str, error: Exception):
+        if isinstance(error, (redis.ConnectionError, redis.TimeoutError, OSError)):
+            self._deshabilitado_hasta = time.monotonic() + self.REINTENTO_SEGUNDOS
+        logger.warning(f"Error al {operacion} caché: {str(error)}")
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Obtener valor del caché"""
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        if not self.connected:
+            return None
+
+        try:
+            value = await self.redis_client.get(key)
+            if value:
+                logger.debug(f"✅ Cache hit: {key}")
+                value = json.loads(value)
+                self.local.set(key, value, settings.cache_local_ttl_segundos)
+                return value
+            return None
+        except Exception as e:
+            self._fallo("obtener del", e)
+            return None
+
+    async def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Obtener varios valores en un solo round trip (None en los que no estén)"""
+        resultado = [self.local.get(key) for key in keys or []]
+        faltantes = [i for i, value in enumerate(resultado) if value is None]
+        if not faltantes or not self.connected:
+            return resultado
+
+        try:
+            values = await self.redis_client.mget([keys[i] for i in faltantes])
+        except Exception as e:
+            self._fallo("obtener del", e)
+            return resultado
+
+        for i, value in zip(faltantes, values):
+            if value:
+                resultado[i] = json.loads(value)
+                self.local.set(keys[i], resultado[i], settings.cache_local_ttl_segundos)
+        return resultado
+
+    async def set(self, key: str, value: Any, ttl_seconds: int = 3600) -> bool:
+        """
+        Guardar valor en el caché
+
+        Args:
+            key: Clave de caché
+            value: Valor a guardar
+            ttl_seconds: Tiempo de vida en segundos (default 1 hora)
+        """
+        self.local.set(key, value, _ttl_local(ttl_seconds, self.connected))
+        if not self.connected:
+            return False
+
+        try:
+            await self.redis_client.setex(key, ttl_seconds, json.dumps(value))
+            logger.debug(f"✅ Cache set: {key} (TTL: {ttl_seconds}s)")
+            return True
+        except Exception as e:
+            self._fallo("guardar en", e)
+            return False
+
+    async def delete(self, key: str) -> bool:
+        """Eliminar clave del caché (y de la copia local de los demás workers)"""
+        descartar_local(key)
+        if not self.connected:
+            return False
+
+        try:
+            await self.redis_client.delete(key)
+            await self.redis_client.publish(CANAL_INVALIDACION, _mensaje_invalidacion(key))
+            logger.debug(f"✅ Cache deleted: {key}")
+            return True
+        except Exception as e:
+            self._fallo("eliminar del", e)
+            return False
+
+    async def obtener_o_calcular(
+        self,
+        key: str,
+        calcular: Callable[[], Awaitable[Any]],
+        ttl_seconds: int = 3600,
+        stale_seconds: int = 0
+    ) -> Tuple[Any, str]:
+        """
+        Valor de la clave, calculándolo con `calcular` si no está en caché.
+
+        - Fresco (dentro de ttl_seconds): se retorna directamente.
+        - Vencido pero dentro de stale_seconds: se retorna el valor anterior y
+          se refresca en segundo plano (un solo worker a la vez, vía lock en Redis).
+        - Ausente: las llamadas concurrentes del proceso esperan un único cálculo.
+          Si el cálculo falla, todas reciben la excepción.
+
+        Returns:
+            (valor, origen) con origen 'cache', 'stale' o 'fresh'
+        """
+        sobre = await self.get(key)
+        if isinstance(sobre, dict) and "fresco_hasta" in sobre:
+            if sobre["fresco_hasta"] > time.time():
+                return sobre["valor"], "cache"
+            if stale_seconds > 0:
+                self._revalidar(key, calcular, ttl_seconds, stale_seconds)
+                return sobre["valor"], "stale"
+
+        # shield: si el cliente cancela su request, el cálculo compartido sigue
+        tarea = self._en_vuelo.get(key)
+        if tarea is not None:
+            valor = await asyncio.shield(tarea)
+            if valor is not _SIN_VALOR:
+                return valor, "fresh"
+
+        tarea = self._en_vuelo.get(key)
+        if tarea is None or tarea.done():
+            tarea = self._registrar_en_vuelo(
+                key, self._calcular_y_guardar(key, calcular, ttl_seconds, stale_seconds)
+            )
+        return await asyncio.shield(tarea), "fresh"
+
+    def _registrar_en_vuelo(self, key: str, coro) -> asyncio.Future:
+        tarea = asyncio.ensure_future(coro)
+        self._en_vuelo[key] = tarea
+
+        def _fin(t: asyncio.Future):
+            self._en_vuelo.pop(key, None)
+            # Marcar la excepción como recuperada aunque nadie la espere
+            if not t.cancelled():
+                t.exception()
+
+        tarea.add_done_callback(_fin)
+        return tarea
+
+    async def _calcular_y_guardar(self, key: str, calcular, ttl_seconds: int, stale_seconds: int) -> Any:
+        valor = await calcular()
+        await self.set(
+            key,
+            {"valor": valor, "fresco_hasta": time.time() + ttl_seconds},
+            ttl_seconds + stale_seconds
+        )
+        return valor
+
+    def _revalidar(self, key: str, calcular, ttl_seconds: int, stale_seconds: int):
+        """Lanza el refresco en segundo plano si no hay uno en curso en este proceso"""
+        if key not in self._en_vuelo:
+            self._registrar_en_vuelo(key, self._revalidar_clave(key, calcular, ttl_seconds, stale_seconds))
+
+    async def _revalidar_clave(self, key: str, calcular, ttl_seconds: int, stale_seconds: int):
+        lock_key = f"lock:{key}"
+        tiene_lock = False
+        if self.connected:
+            try:
+                # Otro worker pudo refrescar ya: la copia local vencida no es la de Redis
+                value = await self.redis_client.get(key)
+                sobre = json.loads(value) if value else None
+                if isinstance(sobre, dict) and sobre.get("fresco_hasta", 0) > time.time():
+                    self.local.set(key, sobre, settings.cache_local_ttl_segundos)
+                    return sobre["valor"]
+                tiene_lock = bool(await self.redis_client.set(
+                    lock_key, ORIGEN_PROCESO, nx=True, ex=self.LOCK_REVALIDACION_SEGUNDOS
+                ))
+                if not tiene_lock:
+                    return _SIN_VALOR
+            except Exception as e:
+                self._fallo("revalidar en", e)
+
+        try:
+            valor = await self._calcular_y_guardar(key, calcular, ttl_seconds, stale_seconds)
+            logger.debug(f"🔄 Cache revalidado: {key}")
+            return valor
+        except Exception as e:
+            logger.warning(f"Error revalidando {key}, se sigue sirviendo el valor anterior: {str(e)}")
+            return _SIN_VALOR
+        finally:
+            if tiene_lock:
+                try:
+                    await self.redis_client.delete(lock_key)
+                except Exception:
+                    pass
+
+    def iniciar_invalidacion(self):
+        """Arranca (en el event loop actual) la suscripción a invalidaciones"""
+        if settings.cache_local_enabled and self._tarea_invalidacion is None:
+            self._tarea_invalidacion = asyncio.create_task(self._escuchar_invalidaciones())
+
+    async def _escuchar_invalidaciones(self):
+        """Descarta de los niveles locales del proceso las claves eliminadas por otros workers"""
+        while True:
+            pubsub = self.redis_client.pubsub()
+            try:
+                await pubsub.subscribe(CANAL_INVALIDACION)
+                # Lo cacheado localmente mientras no había suscripción puede estar invalidado
+                descartar_local("*")
+                async for mensaje in pubsub.listen():
+                    if mensaje.get("type") != "message":
+                        continue
+                    try:
+                        datos = json.loads(mensaje["data"])
+                    except (TypeError, ValueError):
+                        continue
+                    if datos.get("origen") == ORIGEN_PROCESO:
+                        continue
+                    if datos.get("key"):
+                        descartar_local(datos["key"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"Suscripción de invalidación de caché interrumpida: {str(e)}")
+                await asyncio.sleep(self.REINTENTO_SEGUNDOS)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    async def close(self):
+        """Detiene la suscripción y cierra las conexiones del pool (shutdown de la app)"""
+        if self._tarea_invalidacion is not None:
+            self._tarea_invalidacion.cancel()
+            try:
+                await self._tarea_invalidacion
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._tarea_invalidacion = None
+        await self._pool.disconnect()
+
+
 # Instancia global de caché
 cache_manager = CacheManager()
 
+# Instancia global para código async (handlers FastAPI)
+async_cache_manager = AsyncCacheManager()
+
 def cache_response(ttl_seconds: int = 3600, key_prefix: str = "api") -> Callable:
     """
     Decorador para cachear respuestas de funciones
@@ -129,14 +515,14 @@ def cache_response(ttl_seconds: int = 3600, key_prefix: str = "api") -> Callable
             cache_key = f"{key_prefix}:{func.__name__}:{hashlib.md5(str((args, kwargs)).encode()).hexdigest()}"
             
             # Intentar obtener del caché
-            cached_value = cache_manager.get(cache_key)
+            cached_value = await async_cache_manager.get(cache_key)
             if cached_value is not None:
                 logger.debug(f"📦 Usando valor cacheado para {func.__name__}")
                 return cached_value
             
             # Ejecutar función y cachear resultado
             result = await func(*args, **kwargs)
-            cache_manager.set(cache_key, result, ttl_seconds)
+            await async_cache_manager.set(cache_key, result, ttl_seconds)
             
             return result
         return wrapper
@@ -146,6 +532,7 @@ def cache_response(ttl_seconds: int = 3600, key_prefix: str = "api") -> Callable
 CACHE_CONFIGS = {
     "datos_gov_proxy": {
         "ttl": 3600,        # 1 hora
+        "stale": 1800,      # 30 min sirviendo el valor anterior mientras se refresca
         "prefix": "datos_gov"
     },
     "bpin_details": {
@@ -155,5 +542,26 @@ CACHE_CONFIGS = {
     "contratacion_summary": {
         "ttl": 1800,        # 30 minutos (datos más frescos por IA)
         "prefix": "resumen_ia"
+    },
+    # Resultados del gateway de IA (la clave ya incluye los datos del prompt)
+    "pqrs_analisis_ia": {
+        "ttl": 604800,      # 7 días: regenerar el informe de un periodo no vuelve a pagar tokens
+        "prefix": "ia_pqrs"
+    },
+    "pdm_resumen_ia": {
+        "ttl": 86400,       # 1 día
+        "prefix": "ia_pdm"
+    },
+    "alertas_no_leidas": {
+        "ttl": 300,         # 5 min: se invalida al crear/leer alertas; el TTL acota cualquier carrera
+        "prefix": "alertas_no_leidas"
+    },
+    "chart_png": {
+        "ttl": 2592000,     # 30 días (clave = hash de los datos de la gráfica)
+        "prefix": "chart"
+    },
+    "plantilla_pdf": {
+        "ttl": 2592000,     # 30 días: se invalida al cargar o eliminar el membrete
+        "prefix": "plantilla_pdf"
     }
 }
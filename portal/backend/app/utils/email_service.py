@@ -2,9 +2,10 @@
 Servicio de envío de correos electrónicos usando Zeptomail (Zoho).
 Incluye templates HTML para notificaciones de PQRS.
 """
-import requests
-from typing import Optional, List
+import httpx
+from typing import Any, Dict, Optional, List, Tuple
 from app.config.settings import settings
+from app.utils.http_clients import request_con_reintentos, request_con_reintentos_sync
 import urllib.parse
 
 
@@ -43,6 +44,84 @@ class EmailService:
         Returns:
             True si se envió exitosamente, False en caso contrario
         """
+        payload, headers = self._preparar_envio(to_emails, subject, html_body, text_body, from_name, reply_to)
+        sender_email = payload["from"]["address"]
+
+        try:
+            # Cliente compartido: reutiliza la conexión TLS con Zeptomail
+            response = request_con_reintentos_sync(
+                "zeptomail",
+                "POST",
+                self.ZEPTOMAIL_API_URL,
+                json=payload,
+                headers=headers
+            )
+            response.raise_for_status()
+            data = response.json()
+            message_id = data.get("data", [{}])[0].get("message_id", "N/A") if data.get("data") else "N/A"
+            print(f"✅ Correo enviado exitosamente desde {sender_email} a {to_emails}. MessageId: {message_id}")
+            return True
+        except httpx.HTTPStatusError as e:
+            print(f"❌ Error HTTP enviando correo: {e.response.status_code} - {e.response.text}")
+            return False
+        except Exception as e:
+            print(f"❌ Error inesperado enviando correo: {str(e)}")
+            return False
+
+    async def send_email_async(
+        self,
+        to_emails: List[str],
+        subject: str,
+        html_body: str,
+        text_body: Optional[str] = None,
+        from_name: Optional[str] = None,
+        reply_to: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Enviar correo sin bloquear el event loop (lo usa el worker de email_outbox).
+
+        Returns:
+            {"ok", "message_id", "error", "reintentable"}: reintentable=False si
+            el proveedor rechazó el mensaje (4xx), True si el error es transitorio
+            (red, 429, 5xx)
+        """
+        payload, headers = self._preparar_envio(to_emails, subject, html_body, text_body, from_name, reply_to)
+        try:
+            response = await request_con_reintentos(
+                "zeptomail",
+                "POST",
+                self.ZEPTOMAIL_API_URL,
+                json=payload,
+                headers=headers
+            )
+        except httpx.HTTPError as e:
+            print(f"❌ Error de conexión enviando correo: {str(e)}")
+            return {"ok": False, "message_id": None, "error": f"Error de conexión: {str(e)}"[:500], "reintentable": True}
+
+        if response.is_success:
+            data = response.json()
+            message_id = data.get("data", [{}])[0].get("message_id") if data.get("data") else None
+            print(f"✅ Correo enviado exitosamente a {to_emails}. MessageId: {message_id}")
+            return {"ok": True, "message_id": message_id, "error": None, "reintentable": False}
+
+        print(f"❌ Error HTTP enviando correo: {response.status_code} - {response.text}")
+        return {
+            "ok": False,
+            "message_id": None,
+            "error": f"HTTP {response.status_code}: {response.text}"[:500],
+            "reintentable": response.status_code == 429 or response.status_code >= 500,
+        }
+
+    def _preparar_envio(
+        self,
+        to_emails: List[str],
+        subject: str,
+        html_body: str,
+        text_body: Optional[str] = None,
+        from_name: Optional[str] = None,
+        reply_to: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """Payload y headers para la API de Zeptomail"""
         sender_name = from_name or self.default_from_name
         # Siempre enviar desde el dominio verificado (softone360.com)
         sender_email = self.default_from_email
@@ -77,26 +156,9 @@ class EmailService:
             "Authorization": f"Zoho-enczapikey {self.api_token}",
         }
 
-        try:
-            response = requests.post(
-                self.ZEPTOMAIL_API_URL,
-                json=payload,
-                headers=headers,
-                timeout=15
-            )
-            response.raise_for_status()
-            data = response.json()
-            message_id = data.get("data", [{}])[0].get("message_id", "N/A") if data.get("data") else "N/A"
-            print(f"✅ Correo enviado exitosamente desde {sender_email} a {to_emails}. MessageId: {message_id}")
-            return True
-        except requests.exceptions.HTTPError as e:
-            print(f"❌ Error HTTP enviando correo: {e.response.status_code} - {e.response.text}")
-            return False
-        except Exception as e:
-            print(f"❌ Error inesperado enviando correo: {str(e)}")
-            return False
+        return payload, headers
     
-    def send_pqrs_radicada_notification(
+    def build_pqrs_radicada_message(
         self,
         to_email: str,
         numero_radicado: str,
@@ -108,9 +170,9 @@ class EmailService:
         fecha_radicacion: str,
         archivo_adjunto_url: Optional[str] = None,
         entity_email: Optional[str] = None
-    ) -> bool:
+    ) -> Dict[str, Any]:
         """
-        Enviar notificación de PQRS radicada al ciudadano.
+        Mensaje de notificación de PQRS radicada al ciudadano (kwargs de send_email).
         
         Args:
             to_email: Correo(s) del ciudadano (puede ser múltiples separados por comas o punto y coma)
@@ -209,7 +271,7 @@ class EmailService:
         {entity_name} - Sistema de PQRS
         """
         
-        return self.send_email(
+        return dict(
             to_emails=email_list,
             subject=subject,
             html_body=html_body,
@@ -218,7 +280,7 @@ class EmailService:
             reply_to=entity_email
         )
 
-    def send_pqrs_respuesta_notification(
+    def build_pqrs_respuesta_message(
         self,
         to_email: str,
         numero_radicado: str,
@@ -230,9 +292,9 @@ class EmailService:
         fecha_respuesta: str,
         archivo_adjunto_url: Optional[str] = None,
         entity_email: Optional[str] = None
-    ) -> bool:
+    ) -> Dict[str, Any]:
         """
-        Enviar notificación de respuesta de PQRS al ciudadano.
+        Mensaje de notificación de respuesta de PQRS al ciudadano (kwargs de send_email).
         
         Args:
             to_email: Correo(s) del ciudadano (puede ser múltiples separados por comas o punto y coma)
@@ -348,7 +410,7 @@ class EmailService:
         {entity_name} - Sistema de PQRS
         """
         
-        return self.send_email(
+        return dict(
             to_emails=email_list,
             subject=subject,
             html_body=html_body,
@@ -357,6 +419,60 @@ class EmailService:
             reply_to=entity_email
         )
 
+    def send_pqrs_radicada_notification(
+        self,
+        to_email: str,
+        numero_radicado: str,
+        tipo_solicitud: str,
+        asunto: str,
+        nombre_ciudadano: str,
+        entity_name: str,
+        entity_slug: str,
+        fecha_radicacion: str,
+        archivo_adjunto_url: Optional[str] = None,
+        entity_email: Optional[str] = None
+    ) -> bool:
+        """Enviar en línea (bloqueante). En handlers async encolar con email_outbox."""
+        return self.send_email(**self.build_pqrs_radicada_message(
+            to_email=to_email,
+            numero_radicado=numero_radicado,
+            tipo_solicitud=tipo_solicitud,
+            asunto=asunto,
+            nombre_ciudadano=nombre_ciudadano,
+            entity_name=entity_name,
+            entity_slug=entity_slug,
+            fecha_radicacion=fecha_radicacion,
+            archivo_adjunto_url=archivo_adjunto_url,
+            entity_email=entity_email
+        ))
+
+    def send_pqrs_respuesta_notification(
+        self,
+        to_email: str,
+        numero_radicado: str,
+        asunto: str,
+        nombre_ciudadano: str,
+        respuesta: str,
+        entity_name: str,
+        entity_slug: str,
+        fecha_respuesta: str,
+        archivo_adjunto_url: Optional[str] = None,
+        entity_email: Optional[str] = None
+    ) -> bool:
+        """Enviar en línea (bloqueante). En handlers async encolar con email_outbox."""
+        return self.send_email(**self.build_pqrs_respuesta_message(
+            to_email=to_email,
+            numero_radicado=numero_radicado,
+            asunto=asunto,
+            nombre_ciudadano=nombre_ciudadano,
+            respuesta=respuesta,
+            entity_name=entity_name,
+            entity_slug=entity_slug,
+            fecha_respuesta=fecha_respuesta,
+            archivo_adjunto_url=archivo_adjunto_url,
+            entity_email=entity_email
+        ))
+
 
 # Instancia global del servicio de email
 email_service = EmailService()
@@ -3,6 +3,64 @@ import string
 from datetime import datetime
 from sqlalchemy.orm import Session
 
+def _ambito_radicado(entity_id: int = None, prefix: str = None):
+    """(modelo, prefijo del radicado, entidad de la secuencia, tipo) según el documento"""
+    fecha_base = datetime.now().strftime("%Y%m%d")  # YYYYMMDD
+    if prefix == "CORR":
+        from app.models.correspondencia import Correspondencia as Modelo
+        # El radicado de correspondencia no incluye la entidad: consecutivo global
+        return Modelo, f"{prefix}-{fecha_base}", 0, prefix
+    # Default: PQRS (comportamiento anterior)
+    from app.models.pqrs import PQRS as Modelo
+    entity_code = entity_id if entity_id else 0
+    return Modelo, f"{entity_code}-{fecha_base}", entity_code, "PQRS"
+
+
+def _ultimo_radicado_existente(db: Session, Modelo, prefijo: str, entity_id: int, por_entidad: bool) -> int:
+    """Mayor consecutivo ya usado hoy (semilla de la secuencia en su primer uso del día)"""
+    filtros = [Modelo.numero_radicado.like(f"{prefijo}%")]
+    if por_entidad:
+        filtros.append(Modelo.entity_id == entity_id)
+    ultimo = 0
+    for (numero,) in db.query(Modelo.numero_radicado).filter(*filtros):
+        sufijo = numero[len(prefijo):]
+        if sufijo.isdigit():
+            ultimo = max(ultimo, int(sufijo))
+    return ultimo
+
+
+def _incrementar_secuencia(db: Session, entity_id: int, tipo: str, fecha) -> int:
+    """UPDATE ... RETURNING del consecutivo; None si la fila del día aún no existe"""
+    from sqlalchemy import update
+    from app.models.radicado_secuencia import RadicadoSecuencia
+
+    return db.execute(
+        update(RadicadoSecuencia)
+        .where(
+            RadicadoSecuencia.entity_id == entity_id,
+            RadicadoSecuencia.prefijo == tipo,
+            RadicadoSecuencia.fecha == fecha
+        )
+        .values(ultimo=RadicadoSecuencia.ultimo + 1)
+        .returning(RadicadoSecuencia.ultimo)
+    ).scalar()
+
+
+def _crear_secuencia(db: Session, entity_id: int, tipo: str, fecha, ultimo: int):
+    """Crea la fila del día; si otra transacción la creó primero no hace nada"""
+    from app.models.radicado_secuencia import RadicadoSecuencia
+
+    if db.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    db.execute(
+        insert(RadicadoSecuencia)
+        .values(entity_id=entity_id, prefijo=tipo, fecha=fecha, ultimo=ultimo)
+        .on_conflict_do_nothing(index_elements=['entity_id', 'prefijo', 'fecha'])
+    )
+
+
 def generate_radicado(db: Session = None, entity_id: int = None, prefix: str = None) -> str:
     """
     Generar número de radicado único en formato PREFIX-YYYYMMDDNNN o ENT-YYYYMMDDNNN
@@ -11,45 +69,42 @@ def generate_radicado(db: Session = None, entity_id: int = None, prefix: str = N
     - ENT es el ID de la entidad (para evitar colisiones entre entidades) - sin prefix
     - YYYYMMDD es la fecha actual
     - NNN es un número consecutivo que inicia en 001 cada día
+
+    El consecutivo sale de la tabla radicado_secuencias con un UPDATE atómico
+    en la transacción de `db`: el llamador debe hacer commit (o rollback, que
+    libera el número).
     """
-    now = datetime.now()
-    fecha_base = now.strftime("%Y%m%d")  # YYYYMMDD
-    
-    # Determinar el modelo a usar basado en el prefix
-    if prefix == "CORR":
-        from app.models.correspondencia import Correspondencia as Modelo
-        prefijo = f"{prefix}-{fecha_base}"
-    else:
-        # Default: PQRS (comportamiento anterior)
-        from app.models.pqrs import PQRS as Modelo
-        entity_code = entity_id if entity_id else 0
-        prefijo = f"{entity_code}-{fecha_base}"
-    
+    Modelo, prefijo, entity_secuencia, tipo = _ambito_radicado(entity_id, prefix)
+
     if db is None:
         # Si no se pasa la sesión de BD, generar un número aleatorio de 3 dígitos
         numero = random.randint(1, 999)
         return f"{prefijo}{numero:03d}"
-    
-    # Buscar el último radicado del día actual
-    filtros = [Modelo.numero_radicado.like(f"{prefijo}%")]
-    if not prefix:  # Solo filtrar por entity_id si no hay prefix (PQRS)
-        filtros.append(Modelo.entity_id == entity_id)
-    
-    ultimo_radicado = db.query(Modelo).filter(*filtros).order_by(Modelo.numero_radicado.desc()).first()
-    
-    if ultimo_radicado:
-        # Extraer el número consecutivo y sumarle 1
-        try:
-            # El formato es PREFIX-YYYYMMDDNNN, extraer los últimos 3 dígitos
-            ultimo_numero = int(ultimo_radicado.numero_radicado[-3:])
-            nuevo_numero = ultimo_numero + 1
-        except (ValueError, IndexError):
-            nuevo_numero = 1
-    else:
-        # Primer radicado del día
-        nuevo_numero = 1
-    
-    return f"{prefijo}{nuevo_numero:03d}"
+
+    hoy = datetime.now().date()
+    numero = _incrementar_secuencia(db, entity_secuencia, tipo, hoy)
+    if numero is None:
+        # Primer radicado del día: sembrar con los ya existentes (p. ej. creados antes del despliegue)
+        ultimo = _ultimo_radicado_existente(db, Modelo, prefijo, entity_id, por_entidad=not prefix)
+        _crear_secuencia(db, entity_secuencia, tipo, hoy, ultimo)
+        numero = _incrementar_secuencia(db, entity_secuencia, tipo, hoy)
+
+    return f"{prefijo}{numero:03d}"
+
+
+def preview_radicado(db: Session, entity_id: int = None, prefix: str = None) -> str:
+    """Próximo radicado sin reservarlo (puede variar si se crean otros documentos antes)"""
+    from app.models.radicado_secuencia import RadicadoSecuencia
+
+    Modelo, prefijo, entity_secuencia, tipo = _ambito_radicado(entity_id, prefix)
+    ultimo = db.query(RadicadoSecuencia.ultimo).filter(
+        RadicadoSecuencia.entity_id == entity_secuencia,
+        RadicadoSecuencia.prefijo == tipo,
+        RadicadoSecuencia.fecha == datetime.now().date()
+    ).scalar()
+    if ultimo is None:
+        ultimo = _ultimo_radicado_existente(db, Modelo, prefijo, entity_id, por_entidad=not prefix)
+    return f"{prefijo}{ultimo + 1:03d}"
 
 def format_date(date: datetime) -> str:
     """Formatear fecha para mostrar"""
@@ -0,0 +1,192 @@
+"""
+Clientes HTTP compartidos por upstream (datos.gov.co, Zeptomail, OpenAI).
+
+Cada upstream tiene un cliente httpx con pool de conexiones que vive lo que
+vive el proceso: se crea al arrancar la app y se cierra al apagarla, así las
+llamadas reutilizan conexiones TLS abiertas en vez de negociar una por request.
+Límites, timeouts y política de reintentos se configuran en UPSTREAMS.
+
+Uso:
+    response = await request_con_reintentos("datos_gov", "GET", url)
+    response = request_con_reintentos_sync("zeptomail", "POST", url, json=...)
+
+El upstream 'openai' lo usa el gateway de IA (app/services/ai_gateway.py),
+que crea su cliente con crear_async_client() en su propio event loop.
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+
+# HTTP/2 requiere el paquete h2; sin él los clientes usan HTTP/1.1 con keep-alive
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# Configuración por upstream
+UPSTREAMS = {
+    "datos_gov": {
+        "timeout": 30.0,
+        "connect_timeout": 5.0,
+        "max_connections": 20,
+        "max_keepalive": 10,
+        "reintentos": 2,
+        "backoff": 0.5,              # segundos, se duplica en cada reintento
+    },
+    "zeptomail": {
+        "timeout": 15.0,
+        "connect_timeout": 5.0,
+        "max_connections": 10,
+        "max_keepalive": 5,
+        "reintentos": 2,
+        "backoff": 1.0,
+    },
+    "openai": {
+        "timeout": 60.0,
+        "connect_timeout": 5.0,
+        "max_connections": 10,
+        "max_keepalive": 5,
+        "reintentos": 2,             # los aplica el SDK (max_retries)
+        "backoff": 0.5,
+    },
+}
+
+# Respuestas que vale la pena reintentar
+STATUS_REINTENTABLES = {429, 502, 503, 504}
+METODOS_IDEMPOTENTES = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+_clientes_async: Dict[str, httpx.AsyncClient] = {}
+_clientes_sync: Dict[str, httpx.Client] = {}
+_lock = threading.Lock()
+
+
+def _parametros_cliente(nombre: str) -> dict:
+    config = UPSTREAMS[nombre]
+    return {
+        "timeout": httpx.Timeout(config["timeout"], connect=config["connect_timeout"]),
+        "limits": httpx.Limits(
+            max_connections=config["max_connections"],
+            max_keepalive_connections=config["max_keepalive"],
+        ),
+        "http2": HTTP2_AVAILABLE,
+    }
+
+
+def crear_async_client(nombre: str) -> httpx.AsyncClient:
+    """Cliente async nuevo con la configuración del upstream (lo cierra quien lo crea)"""
+    return httpx.AsyncClient(**_parametros_cliente(nombre))
+
+
+def get_async_client(nombre: str) -> httpx.AsyncClient:
+    """Cliente async compartido del upstream (se crea si la app no lo inició)"""
+    cliente = _clientes_async.get(nombre)
+    if cliente is None or cliente.is_closed:
+        cliente = crear_async_client(nombre)
+        _clientes_async[nombre] = cliente
+    return cliente
+
+
+def get_sync_client(nombre: str) -> httpx.Client:
+    """Cliente síncrono compartido del upstream (código que corre en threads)"""
+    with _lock:
+        cliente = _clientes_sync.get(nombre)
+        if cliente is None or cliente.is_closed:
+            cliente = httpx.Client(**_parametros_cliente(nombre))
+            _clientes_sync[nombre] = cliente
+        return cliente
+
+
+def _espera_reintento(nombre: str, intento: int, response: Optional[httpx.Response]) -> float:
+    """Backoff exponencial con jitter; respeta Retry-After si el upstream lo envía"""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), 30.0)
+    base = UPSTREAMS[nombre]["backoff"] * (2 ** intento)
+    return base + random.uniform(0, base / 2)
+
+
+def _reintentable(metodo: str, error: Optional[Exception], response: Optional[httpx.Response]) -> bool:
+    if error is not None:
+        # Sin conexión establecida el request no llegó al upstream: siempre se puede repetir
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return True
+        return metodo in METODOS_IDEMPOTENTES and isinstance(error, httpx.TransportError)
+    return metodo in METODOS_IDEMPOTENTES and response.status_code in STATUS_REINTENTABLES
+
+
+async def request_con_reintentos(nombre: str, metodo: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Request con el cliente compartido del upstream y su política de reintentos.
+    No llama raise_for_status: el llamador decide qué hacer con la respuesta.
+    """
+    metodo = metodo.upper()
+    cliente = get_async_client(nombre)
+    reintentos = UPSTREAMS[nombre]["reintentos"]
+
+    for intento in range(reintentos + 1):
+        error = response = None
+        try:
+            response = await cliente.request(metodo, url, **kwargs)
+        except httpx.TransportError as e:
+            error = e
+
+        if intento == reintentos or not _reintentable(metodo, error, response):
+            if error is not None:
+                raise error
+            return response
+
+        espera = _espera_reintento(nombre, intento, response)
+        print(f"🔁 {nombre}: reintento {intento + 1}/{reintentos} en {espera:.1f}s "
+              f"({type(error).__name__ if error else response.status_code})")
+        await asyncio.sleep(espera)
+
+
+def request_con_reintentos_sync(nombre: str, metodo: str, url: str, **kwargs) -> httpx.Response:
+    """Versión síncrona de request_con_reintentos"""
+    metodo = metodo.upper()
+    cliente = get_sync_client(nombre)
+    reintentos = UPSTREAMS[nombre]["reintentos"]
+
+    for intento in range(reintentos + 1):
+        error = response = None
+        try:
+            response = cliente.request(metodo, url, **kwargs)
+        except httpx.TransportError as e:
+            error = e
+
+        if intento == reintentos or not _reintentable(metodo, error, response):
+            if error is not None:
+                raise error
+            return response
+
+        espera = _espera_reintento(nombre, intento, response)
+        print(f"🔁 {nombre}: reintento {intento + 1}/{reintentos} en {espera:.1f}s "
+              f"({type(error).__name__ if error else response.status_code})")
+        time.sleep(espera)
+
+
+def iniciar_clientes_http():
+    """Crea los clientes async de los upstreams (startup de la app)"""
+    for nombre in UPSTREAMS:
+        # El gateway de IA crea el suyo en su propio event loop
+        if nombre != "openai":
+            get_async_client(nombre)
+    print(f"🌐 Clientes HTTP listos: {', '.join(UPSTREAMS)} (HTTP/2: {'sí' if HTTP2_AVAILABLE else 'no'})")
+
+
+async def cerrar_clientes_http():
+    """Cierra los pools de conexiones (shutdown de la app)"""
+    for cliente in list(_clientes_async.values()):
+        await cliente.aclose()
+    _clientes_async.clear()
+    with _lock:
+        for cliente in list(_clientes_sync.values()):
+            cliente.close()
+        _clientes_sync.clear()
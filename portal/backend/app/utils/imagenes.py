@@ -0,0 +1,56 @@
+"""
+Derivados de imágenes para informes.
+
+Los informes PDF/DOCX muestran las fotos de evidencia a 3.3 pulgadas; embeber
+el original de cámara (varios MB) infla el documento sin ganar calidad. Aquí
+se genera una miniatura JPEG de tamaño de informe que se guarda en S3 junto
+al original, bajo el prefijo thumbs/.
+"""
+import posixpath
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+
+# 3.3 pulgadas a 150 dpi (tamaño con el que se embeben en los informes)
+MINIATURA_INFORME_PX = 495
+MINIATURA_CALIDAD_JPEG = 80
+
+
+def generar_miniatura(
+    data: bytes,
+    max_px: int = MINIATURA_INFORME_PX,
+    calidad: int = MINIATURA_CALIDAD_JPEG
+) -> Optional[bytes]:
+    """
+    Reduce una imagen para que su lado mayor sea max_px y la retorna como JPEG.
+    Respeta la orientación EXIF y aplana transparencias sobre blanco.
+    Retorna None si los bytes no son una imagen válida.
+    """
+    try:
+        with Image.open(BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_px, max_px), Image.LANCZOS)
+
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGBA')
+                fondo = Image.new('RGB', img.size, (255, 255, 255))
+                fondo.paste(img, mask=img.split()[-1])
+                img = fondo
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+
+            salida = BytesIO()
+            img.save(salida, format='JPEG', quality=calidad, optimize=True, progressive=True)
+            return salida.getvalue()
+    except Exception as e:
+        print(f"⚠️ No se pudo generar miniatura: {e}")
+        return None
+
+
+def clave_miniatura(s3_key: str) -> str:
+    """entity_1/evidencia_2/imagen_0_ab.png → entity_1/evidencia_2/thumbs/imagen_0_ab.jpg"""
+    directorio, nombre = posixpath.split(s3_key)
+    base, _ = posixpath.splitext(nombre)
+    return posixpath.join(directorio, 'thumbs', f"{base}.jpg")
@@ -0,0 +1,46 @@
+"""
+Migración 009: Tabla pdm_producto_avance (resumen materializado de avance PDM)
+Crea la tabla si no existe y la llena para todas las entidades con actividades.
+"""
+
+from app.config.database import engine, SessionLocal
+from app.models.entity import Entity
+from app.models.pdm import PdmProductoAvance
+from app.services.pdm_avance_service import recalcular_avance_entidad
+
+
+def run_migration_009():
+    """Ejecutar migración 009"""
+    print("="*70)
+    print("MIGRACIÓN 009: Resumen materializado pdm_producto_avance")
+    print("="*70)
+
+    PdmProductoAvance.__table__.create(bind=engine, checkfirst=True)
+    print("✅ Tabla 'pdm_producto_avance' verificada/creada")
+
+    db = SessionLocal()
+    try:
+        total_filas = 0
+        entity_ids = [row[0] for row in db.query(Entity.id).all()]
+        for entity_id in entity_ids:
+            filas = recalcular_avance_entidad(db, entity_id)
+            db.commit()
+            total_filas += filas
+            print(f"   📈 entity_id={entity_id}: {filas} filas")
+
+        print(f"✅ Migración 009 completada: {total_filas} filas en {len(entity_ids)} entidades")
+        print("="*70)
+        return {
+            "message": "Migración 009 ejecutada exitosamente",
+            "entidades": len(entity_ids),
+            "filas": total_filas
+        }
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    run_migration_009()
@@ -0,0 +1,67 @@
+"""
+Migración 010: Columnas de cola de trabajos en informes_estado
+(params, prioridad, intentos, max_intentos, worker_id, lease_expires_at, heartbeat_at)
+"""
+from sqlalchemy import inspect, text
+
+from app.config.database import engine
+
+
+COLUMNAS = [
+    ("params",           "JSON NULL"),
+    ("prioridad",        "INTEGER NOT NULL DEFAULT 50"),
+    ("intentos",         "INTEGER NOT NULL DEFAULT 0"),
+    ("max_intentos",     "INTEGER NOT NULL DEFAULT 3"),
+    ("worker_id",        "VARCHAR(100) NULL"),
+    ("lease_expires_at", "TIMESTAMP NULL"),
+    ("heartbeat_at",     "TIMESTAMP NULL"),
+]
+
+INDICES = [
+    ("ix_informes_estado_cola", "informes_estado (estado, prioridad, created_at)"),
+    ("ix_informes_estado_lease_expires_at", "informes_estado (lease_expires_at)"),
+]
+
+
+def run_migration_010():
+    """Ejecutar migración 010"""
+    print("="*70)
+    print("MIGRACIÓN 010: Cola de trabajos en informes_estado")
+    print("="*70)
+
+    existentes = {c["name"] for c in inspect(engine).get_columns("informes_estado")}
+    agregadas = []
+
+    with engine.begin() as conn:
+        for nombre, definicion in COLUMNAS:
+            if nombre in existentes:
+                print(f"   ⏭️  Columna '{nombre}' ya existe, omitiendo.")
+                continue
+            conn.execute(text(f"ALTER TABLE informes_estado ADD COLUMN {nombre} {definicion}"))
+            agregadas.append(nombre)
+            print(f"   ✅ Columna '{nombre}' agregada.")
+
+        for nombre, definicion in INDICES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nombre} ON {definicion}"))
+            print(f"   ✅ Índice '{nombre}' verificado/creado.")
+
+        # Trabajos previos a la cola: los pendientes quedan encolados por formato
+        conn.execute(text("""
+            UPDATE informes_estado SET prioridad = CASE
+                WHEN formato IN ('xlsx', 'excel') THEN 10
+                WHEN formato = 'docx' THEN 20
+                WHEN formato = 'pdf' THEN 30
+                ELSE 50 END
+            WHERE estado = 'pending'
+        """))
+
+    print("✅ Migración 010 completada")
+    print("="*70)
+    return {
+        "message": "Migración 010 ejecutada exitosamente",
+        "columnas_agregadas": agregadas
+    }
+
+
+if __name__ == "__main__":
+    run_migration_010()
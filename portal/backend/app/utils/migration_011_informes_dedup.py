@@ -0,0 +1,52 @@
+"""
+Migración 011: Deduplicación de informes en informes_estado
+(fingerprint, duplicado_de)
+"""
+from sqlalchemy import inspect, text
+
+from app.config.database import engine
+
+
+COLUMNAS = [
+    ("fingerprint",  "VARCHAR(64) NULL"),
+    ("duplicado_de", "INTEGER NULL REFERENCES informes_estado(id) ON DELETE SET NULL"),
+]
+
+INDICES = [
+    ("ix_informes_estado_entity_fingerprint", "informes_estado (entity_id, fingerprint)"),
+    ("ix_informes_estado_duplicado_de", "informes_estado (duplicado_de)"),
+]
+
+
+def run_migration_011():
+    """Ejecutar migración 011"""
+    print("="*70)
+    print("MIGRACIÓN 011: Deduplicación de informes")
+    print("="*70)
+
+    existentes = {c["name"] for c in inspect(engine).get_columns("informes_estado")}
+    agregadas = []
+
+    with engine.begin() as conn:
+        for nombre, definicion in COLUMNAS:
+            if nombre in existentes:
+                print(f"   ⏭️  Columna '{nombre}' ya existe, omitiendo.")
+                continue
+            conn.execute(text(f"ALTER TABLE informes_estado ADD COLUMN {nombre} {definicion}"))
+            agregadas.append(nombre)
+            print(f"   ✅ Columna '{nombre}' agregada.")
+
+        for nombre, definicion in INDICES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nombre} ON {definicion}"))
+            print(f"   ✅ Índice '{nombre}' verificado/creado.")
+
+    print("✅ Migración 011 completada")
+    print("="*70)
+    return {
+        "message": "Migración 011 ejecutada exitosamente",
+        "columnas_agregadas": agregadas
+    }
+
+
+if __name__ == "__main__":
+    run_migration_011()
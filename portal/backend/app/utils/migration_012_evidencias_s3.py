@@ -0,0 +1,216 @@
+"""
+Migración 012: Imágenes Base64 legacy de pdm_actividades_evidencias → S3
+
+Recorre las evidencias con `imagenes` (JSON Base64) que aún no están en S3,
+sube cada imagen con subir_imagenes_a_s3, guarda las URLs en
+imagenes_s3_urls, marca migrated_to_s3 y deja `imagenes` en NULL.
+
+- Por lotes y con pausa entre lotes para no saturar RDS.
+- Cada evidencia se actualiza en su propia transacción corta; en PostgreSQL
+  con lock_timeout para saltar filas bloqueadas en vez de esperar.
+- Reanudable: las evidencias migradas salen del filtro, así que volver a
+  ejecutar continúa donde quedó.
+- Si la evidencia cambió mientras se subían sus imágenes, no se sobrescribe.
+
+Uso:
+    POST /setup/run-migration-012?batch_size=20&pausa_segundos=1
+    GET  /setup/migration-012/progreso
+    python -m app.utils.migration_012_evidencias_s3 [batch_size] [pausa_segundos]
+"""
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import or_, null, text
+
+from app.config.database import SessionLocal
+from app.models.pdm import PdmActividadEvidencia
+from app.services.evidencias_s3 import S3_AVAILABLE, subir_imagenes_a_s3
+
+
+_lock = threading.Lock()
+_hilo: Optional[threading.Thread] = None
+_progreso = {
+    "estado": "idle",  # idle, running, completed, failed
+}
+
+
+# Evidencias con Base64 legacy aún no migradas
+_PENDIENTES = (
+    PdmActividadEvidencia.imagenes.isnot(None),
+    or_(
+        PdmActividadEvidencia.migrated_to_s3.is_(None),
+        PdmActividadEvidencia.migrated_to_s3 == 0
+    )
+)
+
+
+def obtener_progreso() -> dict:
+    with _lock:
+        return dict(_progreso)
+
+
+def _actualizar_progreso(**campos):
+    with _lock:
+        _progreso.update(campos)
+
+
+def _incrementar(campo: str, cantidad: int = 1):
+    with _lock:
+        _progreso[campo] = _progreso.get(campo, 0) + cantidad
+
+
+def _migrar_evidencia(db, evidencia_id: int) -> str:
+    """Migra una evidencia. Retorna 'migrada', 'omitida' o 'fallida'."""
+    if db.get_bind().dialect.name == 'postgresql':
+        db.execute(text("SET LOCAL lock_timeout = '2s'"))
+
+    evidencia = db.query(PdmActividadEvidencia).filter(
+        PdmActividadEvidencia.id == evidencia_id,
+        *_PENDIENTES
+    ).first()
+    if evidencia is None:
+        db.rollback()
+        return "omitida"
+
+    imagenes = [img for img in (evidencia.imagenes or []) if isinstance(img, str) and img]
+    updated_at = evidencia.updated_at
+    entity_id = evidencia.entity_id
+    # Liberar la fila (y el JSON pesado) mientras se sube a S3
+    db.rollback()
+
+    try:
+        urls = subir_imagenes_a_s3(imagenes, entity_id, evidencia_id)
+    except HTTPException as e:
+        print(f"   ⚠️ Evidencia {evidencia_id}: {e.detail}")
+        return "fallida"
+
+    # Escritura condicional: no pisar cambios hechos durante la subida
+    condicion_version = (
+        PdmActividadEvidencia.updated_at.is_(None) if updated_at is None
+        else PdmActividadEvidencia.updated_at == updated_at
+    )
+    if db.get_bind().dialect.name == 'postgresql':
+        db.execute(text("SET LOCAL lock_timeout = '2s'"))
+    actualizadas = db.query(PdmActividadEvidencia).filter(
+        PdmActividadEvidencia.id == evidencia_id,
+        condicion_version,
+        *_PENDIENTES
+    ).update({
+        PdmActividadEvidencia.imagenes_s3_urls: urls,
+        PdmActividadEvidencia.migrated_to_s3: 1,
+        PdmActividadEvidencia.imagenes: null(),
+    }, synchronize_session=False)
+    db.commit()
+
+    if actualizadas != 1:
+        print(f"   ⏭️  Evidencia {evidencia_id} cambió durante la subida; se reintentará en otra ejecución")
+        return "omitida"
+
+    _incrementar("imagenes_subidas", len(urls))
+    return "migrada"
+
+
+def run_migration_012(batch_size: int = 20, pausa_segundos: float = 1.0, max_lotes: Optional[int] = None) -> dict:
+    """Ejecutar migración 012 (bloqueante)"""
+    if not S3_AVAILABLE:
+        raise Exception("boto3 no disponible: no se puede migrar a S3")
+
+    print("="*70)
+    print("MIGRACIÓN 012: Imágenes Base64 de evidencias → S3")
+    print("="*70)
+
+    db = SessionLocal()
+    try:
+        pendientes = db.query(PdmActividadEvidencia.id).filter(*_PENDIENTES).count()
+        _actualizar_progreso(
+            estado="running",
+            pendientes_inicio=pendientes,
+            procesadas=0,
+            migradas=0,
+            omitidas=0,
+            fallidas=0,
+            imagenes_subidas=0,
+            ultimo_id=0,
+            batch_size=batch_size,
+            pausa_segundos=pausa_segundos,
+            inicio=datetime.utcnow().isoformat(),
+            fin=None,
+            error=None,
+        )
+        print(f"📦 Evidencias pendientes: {pendientes} (lotes de {batch_size}, pausa {pausa_segundos}s)")
+
+        ultimo_id = 0
+        lotes = 0
+        while max_lotes is None or lotes < max_lotes:
+            # Keyset por id: solo ids, sin cargar el JSON pesado
+            ids = [fila.id for fila in db.query(PdmActividadEvidencia.id).filter(
+                PdmActividadEvidencia.id > ultimo_id,
+                *_PENDIENTES
+            ).order_by(PdmActividadEvidencia.id).limit(batch_size).all()]
+            db.rollback()
+            if not ids:
+                break
+
+            for evidencia_id in ids:
+                try:
+                    resultado = _migrar_evidencia(db, evidencia_id)
+                except Exception as e:
+                    db.rollback()
+                    print(f"   ❌ Evidencia {evidencia_id}: {e}")
+                    resultado = "fallida"
+                _incrementar("procesadas")
+                _incrementar(f"{resultado}s")
+
+            ultimo_id = ids[-1]
+            lotes += 1
+            progreso = obtener_progreso()
+            _actualizar_progreso(ultimo_id=ultimo_id)
+            print(f"   📈 Lote {lotes}: {progreso['procesadas']}/{pendientes} procesadas "
+                  f"({progreso['migradas']} migradas, {progreso['fallidas']} fallidas, "
+                  f"{progreso['omitidas']} omitidas) — último id {ultimo_id}", flush=True)
+
+            if pausa_segundos > 0:
+                time.sleep(pausa_segundos)
+
+        _actualizar_progreso(estado="completed", fin=datetime.utcnow().isoformat())
+        resultado = obtener_progreso()
+        print(f"✅ Migración 012 completada: {resultado['migradas']} evidencias, "
+              f"{resultado['imagenes_subidas']} imágenes subidas")
+        print("="*70)
+        return {
+            "message": "Migración 012 ejecutada exitosamente",
+            **resultado
+        }
+    except Exception as e:
+        _actualizar_progreso(estado="failed", error=str(e), fin=datetime.utcnow().isoformat())
+        raise
+    finally:
+        db.close()
+
+
+def iniciar_migration_012_background(batch_size: int = 20, pausa_segundos: float = 1.0) -> bool:
+    """Lanza la migración en un hilo. Retorna False si ya hay una en curso en este proceso."""
+    global _hilo
+    with _lock:
+        if _hilo is not None and _hilo.is_alive():
+            return False
+
+        def _run():
+            try:
+                run_migration_012(batch_size, pausa_segundos)
+            except Exception as e:
+                print(f"❌ Error en migración 012: {e}", flush=True)
+
+        _hilo = threading.Thread(target=_run, daemon=True, name="migration-012")
+        _hilo.start()
+        return True
+
+
+if __name__ == "__main__":
+    lote = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    pausa = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    run_migration_012(lote, pausa)
@@ -0,0 +1,34 @@
+"""
+Migración 013: Tabla email_outbox (bandeja de salida de correos)
+Crea la tabla si no existe y el índice que usa el worker para reclamar envíos.
+"""
+from sqlalchemy import text
+
+from app.config.database import engine
+from app.models.email_outbox import EmailOutbox
+
+
+def run_migration_013():
+    """Ejecutar migración 013"""
+    print("="*70)
+    print("MIGRACIÓN 013: Bandeja de salida de correos (email_outbox)")
+    print("="*70)
+
+    EmailOutbox.__table__.create(bind=engine, checkfirst=True)
+    print("✅ Tabla 'email_outbox' verificada/creada")
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_email_outbox_cola ON email_outbox (estado, next_attempt_at)"
+        ))
+    print("✅ Índice 'ix_email_outbox_cola' verificado/creado")
+
+    print("✅ Migración 013 completada")
+    print("="*70)
+    return {
+        "message": "Migración 013 ejecutada exitosamente"
+    }
+
+
+if __name__ == "__main__":
+    run_migration_013()
@@ -0,0 +1,27 @@
+"""
+Migración 014: Tabla radicado_secuencias (consecutivo diario de radicados)
+La secuencia de cada día se siembra sola con el primer radicado que se emite,
+a partir de los radicados ya existentes; no hace falta copiar datos.
+"""
+from app.config.database import engine
+from app.models.radicado_secuencia import RadicadoSecuencia
+
+
+def run_migration_014():
+    """Ejecutar migración 014"""
+    print("="*70)
+    print("MIGRACIÓN 014: Consecutivos de radicado (radicado_secuencias)")
+    print("="*70)
+
+    RadicadoSecuencia.__table__.create(bind=engine, checkfirst=True)
+    print("✅ Tabla 'radicado_secuencias' verificada/creada")
+
+    print("✅ Migración 014 completada")
+    print("="*70)
+    return {
+        "message": "Migración 014 ejecutada exitosamente"
+    }
+
+
+if __name__ == "__main__":
+    run_migration_014()
@@ -0,0 +1,37 @@
+"""
+Migración 015: Alertas de entidad con confirmación de lectura por usuario
+- alerts.recipient_role: audiencia (rol) de las alertas sin destinatario
+- alert_reads: quién leyó cada alerta de entidad
+"""
+from sqlalchemy import inspect, text
+
+from app.config.database import engine
+from app.models.alert import AlertRead
+
+
+def run_migration_015():
+    """Ejecutar migración 015"""
+    print("="*70)
+    print("MIGRACIÓN 015: Alertas de entidad (recipient_role, alert_reads)")
+    print("="*70)
+
+    existentes = {c["name"] for c in inspect(engine).get_columns("alerts")}
+    with engine.begin() as conn:
+        if "recipient_role" in existentes:
+            print("   ⏭️  Columna 'recipient_role' ya existe, omitiendo.")
+        else:
+            conn.execute(text("ALTER TABLE alerts ADD COLUMN recipient_role VARCHAR(32) NULL"))
+            print("   ✅ Columna 'recipient_role' agregada.")
+
+    AlertRead.__table__.create(bind=engine, checkfirst=True)
+    print("✅ Tabla 'alert_reads' verificada/creada")
+
+    print("✅ Migración 015 completada")
+    print("="*70)
+    return {
+        "message": "Migración 015 ejecutada exitosamente"
+    }
+
+
+if __name__ == "__main__":
+    run_migration_015()
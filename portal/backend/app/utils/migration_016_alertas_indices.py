@@ -0,0 +1,35 @@
+"""
+Migración 016: Índices compuestos de alertas para la campana de notificaciones
+(alertas propias sin leer y alertas de entidad recientes).
+"""
+from sqlalchemy import text
+
+from app.config.database import engine
+
+
+INDICES = [
+    ("ix_alerts_recipient_read_created", "alerts (recipient_user_id, read_at, created_at)"),
+    ("ix_alerts_entity_recipient_created", "alerts (entity_id, recipient_user_id, created_at)"),
+]
+
+
+def run_migration_016():
+    """Ejecutar migración 016"""
+    print("="*70)
+    print("MIGRACIÓN 016: Índices compuestos de alertas")
+    print("="*70)
+
+    with engine.begin() as conn:
+        for nombre, definicion in INDICES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nombre} ON {definicion}"))
+            print(f"   ✅ Índice '{nombre}' verificado/creado.")
+
+    print("✅ Migración 016 completada")
+    print("="*70)
+    return {
+        "message": "Migración 016 ejecutada exitosamente"
+    }
+
+
+if __name__ == "__main__":
+    run_migration_016()
@@ -0,0 +1,60 @@
+"""
+Migración 017: Índices compuestos para las consultas más frecuentes
+(bandejas de PQRS, portal ciudadano, informes por período, historial de
+asignaciones, asistencia y correspondencia).
+
+Las alertas ya quedaron cubiertas en la migración 016. Para verificar que
+las consultas usan estos índices: python -m app.utils.auditoria_planes
+"""
+from sqlalchemy import text
+
+from app.config.database import engine
+
+
+INDICES = [
+    # PQRS
+    ("ix_pqrs_entity_created", "pqrs (entity_id, created_at, id)"),
+    ("ix_pqrs_entity_estado_created", "pqrs (entity_id, estado, created_at)"),
+    ("ix_pqrs_assigned_created", "pqrs (assigned_to_id, created_at)"),
+    ("ix_pqrs_created_by_created", "pqrs (created_by_id, created_at)"),
+    ("ix_pqrs_email_created", "pqrs (email_ciudadano, created_at)"),
+    ("ix_pqrs_entity_fecha_solicitud", "pqrs (entity_id, fecha_solicitud)"),
+    # Auditoría de asignaciones
+    ("ix_asignacion_auditoria_pqrs_fecha", "asignacion_auditoria (pqrs_id, fecha_asignacion)"),
+    # Asistencia
+    ("ix_funcionarios_entity_id", "funcionarios (entity_id)"),
+    ("ix_registros_asistencia_funcionario_fecha", "registros_asistencia (funcionario_id, fecha_hora)"),
+    # Correspondencia
+    ("ix_correspondencia_entity_created", "correspondencia (entity_id, created_at)"),
+    ("ix_correspondencia_created_by", "correspondencia (created_by_id)"),
+    ("ix_correspondencia_assigned_to", "correspondencia (assigned_to_id)"),
+]
+
+
+def run_migration_017():
+    """Ejecutar migración 017"""
+    print("="*70)
+    print("MIGRACIÓN 017: Índices de consultas frecuentes")
+    print("="*70)
+
+    with engine.begin() as conn:
+        for nombre, definicion in INDICES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nombre} ON {definicion}"))
+            print(f"   ✅ Índice '{nombre}' verificado/creado.")
+
+        if engine.dialect.name == 'postgresql':
+            # Estadísticas al día para que el planificador considere los índices nuevos
+            for tabla in ("pqrs", "asignacion_auditoria", "funcionarios", "registros_asistencia", "correspondencia"):
+                conn.execute(text(f"ANALYZE {tabla}"))
+            print("   ✅ Estadísticas actualizadas (ANALYZE).")
+
+    print("✅ Migración 017 completada")
+    print("="*70)
+    return {
+        "message": "Migración 017 ejecutada exitosamente",
+        "indices": [nombre for nombre, _ in INDICES]
+    }
+
+
+if __name__ == "__main__":
+    run_migration_017()
@@ -7,6 +7,7 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 from pythonjsonlogger import jsonlogger
 import os
+import threading
 
 class OpenAIAPILogger:
     """Logger especializado para registrar uso de OpenAI API"""
@@ -98,6 +99,23 @@ class OpenAIAPILogger:
         
         self.logger.error(json.dumps(log_data))
 
+    def log_cache_hit(
+        self,
+        model: str,
+        total_tokens: int,
+        cost_saved_usd: float
+    ) -> None:
+        """Registra una respuesta de IA servida desde caché (sin llamada al proveedor)"""
+        log_data = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "model": model,
+            "tokens_saved": total_tokens,
+            "cost_saved_usd": cost_saved_usd,
+            "status": "cache_hit"
+        }
+
+        self.logger.info(json.dumps(log_data))
+
 class CostAnalyzer:
     """Analizador de costos de OpenAI API"""
     
@@ -114,8 +132,16 @@ class CostAnalyzer:
         "gpt-3.5-turbo": {
             "input": 0.0000005,    # $0.50 por 1M tokens
             "output": 0.0000015    # $1.50 por 1M tokens
+        },
+        "gpt-4o-mini": {
+            "input": 0.00000015,   # $0.15 por 1M tokens
+            "output": 0.0000006    # $0.60 por 1M tokens
         }
     }
+
+    # Ahorro acumulado por aciertos del caché de IA (por proceso)
+    _ahorro = {"hits": 0, "tokens": 0, "cost_usd": 0.0}
+    _ahorro_lock = threading.Lock()
     
     @staticmethod
     def calculate_cost(
@@ -151,5 +177,35 @@ class CostAnalyzer:
             }
         }
 
+    @staticmethod
+    def registrar_cache_hit(
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int
+    ) -> Dict[str, float]:
+        """
+        Registra una respuesta servida desde caché como costo evitado
+
+        Returns:
+            Dict con el desglose del costo que no se pagó (como calculate_cost)
+        """
+        cost = CostAnalyzer.calculate_cost(model, prompt_tokens, completion_tokens)
+        with CostAnalyzer._ahorro_lock:
+            CostAnalyzer._ahorro["hits"] += 1
+            CostAnalyzer._ahorro["tokens"] += prompt_tokens + completion_tokens
+            CostAnalyzer._ahorro["cost_usd"] += cost["total_cost"]
+        openai_logger.log_cache_hit(model, prompt_tokens + completion_tokens, cost["total_cost"])
+        return cost
+
+    @staticmethod
+    def resumen_ahorro() -> Dict[str, Any]:
+        """Aciertos, tokens y costo evitados por el caché de IA en este proceso"""
+        with CostAnalyzer._ahorro_lock:
+            return {
+                "hits": CostAnalyzer._ahorro["hits"],
+                "tokens": CostAnalyzer._ahorro["tokens"],
+                "cost_usd": round(CostAnalyzer._ahorro["cost_usd"], 6)
+            }
+
 # Instancia global
 openai_logger = OpenAIAPILogger()
@@ -0,0 +1,71 @@
+"""
+Paginación por cursor (keyset) para listados.
+
+El cursor es opaco para el cliente: base64 de la última llave de orden
+entregada. La página siguiente filtra "después de esa llave" y usa el
+índice, así que cuesta lo mismo en la primera página que en la número mil
+(OFFSET re-escanea todas las filas anteriores).
+
+estimar_total() da un conteo barato para la interfaz: en PostgreSQL toma
+la estimación de filas del planificador (EXPLAIN, sin recorrer la tabla) y
+solo cuenta exacto cuando el resultado es pequeño.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Query, Session
+
+
+# Por debajo de esta estimación se cuenta exacto (es barato y evita mostrar "~3" con 0 filas)
+UMBRAL_CONTEO_EXACTO = 1000
+
+
+def codificar_cursor(valores: Dict[str, Any]) -> str:
+    """Llave de orden de la última fila → cursor opaco"""
+    datos = {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in valores.items()}
+    crudo = json.dumps(datos, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(crudo).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor: str, fechas: tuple = ()) -> Dict[str, Any]:
+    """Cursor opaco → llave de orden. Las claves en `fechas` se convierten a datetime."""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        for clave in fechas:
+            datos[clave] = datetime.fromisoformat(datos[clave])
+        return datos
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginación inválido"
+        )
+
+
+def estimar_total(db: Session, query: Query) -> int:
+    """Total aproximado de filas de la consulta (sin orden ni límite)"""
+    query = query.order_by(None)
+    if db.get_bind().dialect.name != 'postgresql':
+        return query.count()
+
+    try:
+        sql = query.statement.compile(
+            dialect=db.get_bind().dialect,
+            compile_kwargs={"literal_binds": True}
+        )
+        # Savepoint: si EXPLAIN falla, la transacción sigue usable para el conteo exacto
+        with db.begin_nested():
+            plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}").scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimado = int(plan[0]["Plan"]["Plan Rows"])
+    except Exception as e:
+        print(f"⚠️ No se pudo estimar el total, se cuenta exacto: {e}")
+        return query.count()
+
+    if estimado < UMBRAL_CONTEO_EXACTO:
+        return query.count()
+    return estimado